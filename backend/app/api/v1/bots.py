@@ -1,12 +1,13 @@
 """
 交易机器人管理相关的API路由
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from typing import List
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 from app.dependencies import get_db, get_current_user, check_bot_ownership
 from app.models.user import User
@@ -23,6 +24,8 @@ from app.schemas.order import OrderResponse
 from app.schemas.position import PositionResponse
 from app.schemas.spread import SpreadHistoryResponse
 from app.services.bot_service import BotService
+from app.services.spread_export import EXPORT_FORMATS, iter_spread_export
+from app.services.spread_rollup import RAW_RESOLUTION, RESOLUTIONS, get_spread_series
 from app.utils.mock_data import (
     generate_mock_orders,
     generate_mock_positions,
@@ -30,7 +33,6 @@ from app.utils.mock_data import (
 )
 from app.models.order import Order
 from app.models.position import Position
-from app.models.spread_history import SpreadHistory
 
 router = APIRouter()
 
@@ -472,6 +474,9 @@ async def get_spread_history(
     bot: BotInstance = Depends(check_bot_ownership),
     start_time: str | None = None,
     end_time: str | None = None,
+    max_points: int | None = Query(None, ge=10, le=10000),
+    limit: int | None = Query(None, ge=10, le=10000),
+    resolution: str | None = None,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -480,31 +485,39 @@ async def get_spread_history(
     Query Parameters:
         - start_time: 起始时间 (ISO 8601格式, 可选)
         - end_time: 结束时间 (ISO 8601格式, 可选)
+        - max_points: 最多返回的数据点数 (默认1000, limit 为兼容别名)
+        - resolution: 指定粒度 raw/1m/5m/1h/1d (可选, 默认按范围和点数自动选择)
         - 默认返回最近24小时的数据
 
     Returns:
-        价差时间序列数据
+        价差时间序列数据; 聚合数据点额外包含 open/high/low/close/mean/sample_count
     """
-    # 解析时间参数
+    # 解析时间参数(recorded_at 以不带时区的 UTC 存储)
     if not end_time:
         end_dt = datetime.utcnow()
     else:
-        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+        end_dt = _parse_utc(end_time)
 
     if not start_time:
         start_dt = end_dt - timedelta(hours=24)
     else:
-        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+        start_dt = _parse_utc(start_time)
 
-    # 查询数据库
-    result = await db.execute(
-        select(SpreadHistory).where(
-            SpreadHistory.bot_instance_id == bot.id,
-            SpreadHistory.recorded_at >= start_dt,
-            SpreadHistory.recorded_at <= end_dt
-        ).order_by(SpreadHistory.recorded_at.asc())
+    if resolution is not None and resolution != RAW_RESOLUTION and resolution not in RESOLUTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的粒度: {resolution}"
+        )
+
+    # 查询数据库(原始数据或聚合数据)
+    history = await get_spread_series(
+        db,
+        bot.id,
+        start_dt,
+        end_dt,
+        max_points=max_points or limit or 1000,
+        resolution=resolution
     )
-    history = result.scalars().all()
 
     # 如果没有历史数据,生成模拟数据
     if not history:
@@ -516,6 +529,47 @@ async def get_spread_history(
     return history
 
 
+@router.get("/{bot_id}/spread-history/export")
+async def export_spread_history(
+    bot: BotInstance = Depends(check_bot_ownership),
+    start_time: str | None = None,
+    end_time: str | None = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    流式导出原始价差历史
+
+    Query Parameters:
+        - start_time: 起始时间 (ISO 8601格式, 可选, 默认不限)
+        - end_time: 结束时间 (ISO 8601格式, 可选, 默认当前时间)
+        - format: ndjson 或 csv
+
+    Returns:
+        分块传输的 NDJSON/CSV 内容(包含已归档的数据)
+    """
+    end_dt = _parse_utc(end_time) if end_time else datetime.utcnow()
+    start_dt = _parse_utc(start_time) if start_time else datetime(1970, 1, 1)
+
+    # 结束依赖会话的只读事务,导出期间按页借用连接
+    await db.commit()
+
+    filename = f"spread_history_bot{bot.id}.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        iter_spread_export(bot.id, start_dt, end_dt, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def _parse_utc(value: str) -> datetime:
+    """解析 ISO 8601 时间并转换为不带时区的 UTC"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
 @router.post("/{bot_id}/close-positions")
 async def close_positions(
     bot: BotInstance = Depends(check_bot_ownership),
@@ -17,6 +17,7 @@ from app.schemas.exchange import (
 )
 from app.utils.encryption import key_encryption
 from app.exchanges.exchange_factory import ExchangeFactory
+from app.exchanges.exchange_registry import exchange_registry
 
 router = APIRouter()
 
@@ -170,26 +171,9 @@ async def get_exchange_symbols(
         )
     
     try:
-        # 解密API密钥
-        api_key = key_encryption.decrypt(account.api_key)
-        api_secret = key_encryption.decrypt(account.api_secret)
-        passphrase = (
-            key_encryption.decrypt(account.passphrase)
-            if account.passphrase
-            else None
-        )
-        
-        # 创建交易所实例
-        exchange = ExchangeFactory.create(
-            exchange_name=exchange_name,
-            api_key=api_key,
-            api_secret=api_secret,
-            passphrase=passphrase,
-            is_testnet=account.is_testnet
-        )
-        
-        # 获取交易所支持的市场
-        markets = await exchange.exchange.load_markets()
+        # 获取交易所支持的市场(账户共享的交易所实例,市场信息已缓存时不再请求)
+        async with exchange_registry.lease(account) as exchange:
+            markets = await exchange.exchange.load_markets()
         
         # 筛选永续合约交易对（USDT本位）
         symbols = []
@@ -215,9 +199,6 @@ async def get_exchange_symbols(
         if len(filtered_symbols) < 10:
             filtered_symbols = symbols[:20]
         
-        # 关闭交易所连接
-        await exchange.close()
-        
         return {
             "symbols": filtered_symbols
         }
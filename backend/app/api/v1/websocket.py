@@ -2,12 +2,14 @@
 WebSocket实时数据推送相关的API路由
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Depends
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Set
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import json
 import asyncio
 
+from app.core.broadcast_backend import create_broadcast_backend
+from app.core.ws_sender import ConnectionSender, make_frame
 from app.dependencies import get_db
 from app.models.user import User
 from app.models.bot_instance import BotInstance
@@ -19,62 +21,222 @@ logger = setup_logger('websocket')
 router = APIRouter()
 
 
+# 可订阅的事件类型
+EVENT_TYPES = {"spread_update", "order_update", "position_update", "status_update"}
+# 订阅全部事件
+ALL_EVENTS = "*"
+
+
 class ConnectionManager:
-    """WebSocket连接管理器"""
+    """
+    WebSocket连接管理器
+
+    每个连接有独立的发送队列和写任务(ConnectionSender),广播只入队不等待发送,
+    慢速客户端不会阻塞机器人交易循环。
+    广播经可替换的广播后端分发(进程内或 Redis),支持多个 API 进程。
+
+    订阅按 机器人 -> 事件类型 -> 连接集合 建立索引,广播只遍历实际订阅者。
+    单机器人连接(/ws/bot/{bot_id})等价于订阅该机器人的全部事件。
+    """
     
-    def __init__(self):
-        # 按机器人ID分组的连接
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+    def __init__(self, backend=None):
+        """
+        Args:
+            backend: 广播后端,默认根据配置创建(WS_BROADCAST_BACKEND=redis 时跨进程广播)
+        """
+        self.backend = None
+        self.use_backend(backend or create_broadcast_backend())
+        # 订阅索引: 机器人ID -> 事件类型(或 ALL_EVENTS) -> 连接集合
+        self.subscriptions: Dict[int, Dict[str, Set[WebSocket]]] = {}
+        # 反向索引: 连接 -> 机器人ID -> 订阅的事件类型
+        self.connection_subscriptions: Dict[WebSocket, Dict[int, Set[str]]] = {}
         # 连接到用户和机器人的映射
         self.connection_user_map: Dict[WebSocket, Dict[str, int]] = {}
+        # 连接的发送队列
+        self.senders: Dict[WebSocket, ConnectionSender] = {}
+        self.evictions = 0
     
-    async def connect(self, websocket: WebSocket, bot_id: int, user_id: int):
-        """连接WebSocket"""
+    @property
+    def active_connections(self) -> Dict[int, List[WebSocket]]:
+        """按机器人ID分组的连接(任意事件)"""
+        result: Dict[int, List[WebSocket]] = {}
+        for bot_id, by_event in self.subscriptions.items():
+            connections = set().union(*by_event.values())
+            if connections:
+                result[bot_id] = list(connections)
+        return result
+    
+    async def accept(self, websocket: WebSocket, user_id: int):
+        """接受连接并创建发送队列(尚未订阅任何机器人)"""
         await websocket.accept()
-        if bot_id not in self.active_connections:
-            self.active_connections[bot_id] = []
-        self.active_connections[bot_id].append(websocket)
+        self.connection_user_map[websocket] = {"user_id": user_id}
+        self.connection_subscriptions[websocket] = {}
         
-        # 记录连接映射
-        self.connection_user_map[websocket] = {
-            "user_id": user_id,
-            "bot_id": bot_id
-        }
+        sender = ConnectionSender(websocket, on_evict=self._on_evict)
+        sender.start()
+        self.senders[websocket] = sender
+    
+    async def connect(self, websocket: WebSocket, bot_id: int, user_id: int):
+        """连接WebSocket(单机器人, 订阅全部事件)"""
+        await self.accept(websocket, user_id)
+        self.connection_user_map[websocket]["bot_id"] = bot_id
+        self.subscribe(websocket, [bot_id])
         
         logger.info(f"WebSocket连接建立: 用户{user_id} -> 机器人{bot_id}")
     
+    def subscribe(self, websocket: WebSocket, bot_ids: Iterable[int], events: Optional[Iterable[str]] = None):
+        """
+        订阅机器人事件
+        
+        Args:
+            bot_ids: 机器人ID(调用方负责权限校验)
+            events: 事件类型, 为空表示全部事件
+        """
+        events = {ALL_EVENTS} if not events else set(events)
+        subscribed = self.connection_subscriptions.setdefault(websocket, {})
+        for bot_id in bot_ids:
+            current = subscribed.setdefault(bot_id, set())
+            if ALL_EVENTS in current:
+                continue
+            if ALL_EVENTS in events:
+                # 订阅全部事件时替换已有的单项订阅,避免重复推送
+                self._remove_index(websocket, bot_id, current)
+                current.clear()
+                to_add = {ALL_EVENTS}
+            else:
+                to_add = events - current
+            by_event = self.subscriptions.setdefault(bot_id, {})
+            for event in to_add:
+                by_event.setdefault(event, set()).add(websocket)
+            current.update(to_add)
+    
+    def unsubscribe(self, websocket: WebSocket, bot_ids: Iterable[int], events: Optional[Iterable[str]] = None):
+        """
+        取消订阅
+        
+        Args:
+            events: 事件类型, 为空表示该机器人的全部订阅
+        """
+        subscribed = self.connection_subscriptions.get(websocket, {})
+        for bot_id in bot_ids:
+            current = subscribed.get(bot_id)
+            if not current:
+                continue
+            removed = set(current) if not events else current & set(events)
+            self._remove_index(websocket, bot_id, removed)
+            current -= removed
+            if not current:
+                del subscribed[bot_id]
+    
+    def _remove_index(self, websocket: WebSocket, bot_id: int, events: Iterable[str]):
+        by_event = self.subscriptions.get(bot_id)
+        if not by_event:
+            return
+        for event in events:
+            connections = by_event.get(event)
+            if connections is not None:
+                connections.discard(websocket)
+                if not connections:
+                    del by_event[event]
+        if not by_event:
+            del self.subscriptions[bot_id]
+    
+    def get_subscriptions(self, websocket: WebSocket) -> Dict[int, List[str]]:
+        """连接当前的订阅"""
+        return {
+            bot_id: sorted(events)
+            for bot_id, events in self.connection_subscriptions.get(websocket, {}).items()
+        }
+    
     async def disconnect(self, websocket: WebSocket):
         """断开WebSocket连接"""
-        if websocket in self.connection_user_map:
-            user_bot = self.connection_user_map[websocket]
-            bot_id = user_bot["bot_id"]
-            user_id = user_bot["user_id"]
-            
-            if bot_id in self.active_connections:
-                if websocket in self.active_connections[bot_id]:
-                    self.active_connections[bot_id].remove(websocket)
-                if not self.active_connections[bot_id]:
-                    del self.active_connections[bot_id]
-            
-            del self.connection_user_map[websocket]
-            logger.info(f"WebSocket连接断开: 用户{user_id} -> 机器人{bot_id}")
+        sender = self.senders.pop(websocket, None)
+        if sender is not None:
+            await sender.close()
+        
+        subscribed = self.connection_subscriptions.pop(websocket, {})
+        for bot_id, events in subscribed.items():
+            self._remove_index(websocket, bot_id, events)
+        
+        info = self.connection_user_map.pop(websocket, None)
+        if info is not None:
+            logger.info(
+                f"WebSocket连接断开: 用户{info['user_id']} -> 机器人{info.get('bot_id') or sorted(subscribed)}"
+            )
+    
+    async def _on_evict(self, sender: ConnectionSender, reason: str):
+        """发送队列驱逐连接或发送失败后清理"""
+        if sender.evicted_reason:
+            self.evictions += 1
+        await self.disconnect(sender.websocket)
     
     async def send_personal_message(self, websocket: WebSocket, message: dict):
-        """向特定连接发送消息"""
+        """向特定连接发送消息(入队,不等待发送)"""
+        sender = self.senders.get(websocket)
+        if sender is not None:
+            sender.enqueue(message)
+            return
+        
+        # 未登记的连接直接发送
         try:
             await websocket.send_json(message)
         except Exception as e:
             logger.error(f"发送WebSocket消息失败: {str(e)}")
-            # 连接可能已断开,尝试清理
-            await self.disconnect(websocket)
+    
+    def use_backend(self, backend):
+        """替换广播后端(需在 start() 之前调用)"""
+        self.backend = backend
+        self.backend.bind(self.deliver_local)
+    
+    async def start(self):
+        """启动广播后端"""
+        await self.backend.start()
+    
+    async def stop(self):
+        """停止广播后端"""
+        await self.backend.stop()
     
     async def broadcast_to_bot(self, bot_id: int, message: dict):
-        """向指定机器人的所有连接广播消息"""
-        if bot_id in self.active_connections:
-            # 创建副本以避免在迭代时修改列表
-            connections = self.active_connections[bot_id].copy()
+        """经广播后端向所有进程中订阅了该机器人的连接广播消息(不等待网络发送)"""
+        await self.backend.publish(bot_id, message)
+    
+    async def deliver_local(self, bot_id: int, message: dict):
+        """向本进程中订阅了该机器人和事件类型的连接分发消息(只编码一次、只入队)"""
+        by_event = self.subscriptions.get(bot_id)
+        if not by_event:
+            return
+        
+        all_events = by_event.get(ALL_EVENTS, ())
+        typed = by_event.get(message.get("type"), ())
+        if not all_events and not typed:
+            return
+        
+        frame = make_frame(message)
+        # 同一连接不会同时出现在两个集合中(见 subscribe)
+        for connections in (all_events, typed):
             for connection in connections:
-                await self.send_personal_message(connection, message)
+                sender = self.senders.get(connection)
+                if sender is not None:
+                    sender.enqueue_frame(frame)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """连接统计: 每个连接的队列深度与延迟"""
+        connections = []
+        for websocket, sender in self.senders.items():
+            info = self.connection_user_map.get(websocket, {})
+            connections.append({
+                "user_id": info.get("user_id"),
+                "bot_ids": sorted(self.connection_subscriptions.get(websocket, {})),
+                **sender.get_stats()
+            })
+        return {
+            "broadcast": self.backend.get_stats(),
+            "connections": len(self.senders),
+            "subscribed_bots": len(self.subscriptions),
+            "evictions": self.evictions,
+            "max_lag_ms": max((c["lag_ms"] for c in connections), default=0),
+            "details": connections,
+        }
     
     async def broadcast_spread_update(self, bot_id: int, spread_data: dict):
         """广播价差更新"""
@@ -225,7 +387,7 @@ async def websocket_endpoint(
 
                     # 处理心跳 - 立即响应
                     if message.get("type") == "ping":
-                        await websocket.send_json({
+                        await manager.send_personal_message(websocket, {
                             "type": "pong",
                             "timestamp": asyncio.get_event_loop().time()
                         })
@@ -265,5 +427,130 @@ async def websocket_endpoint(
         await manager.disconnect(websocket)
 
 
+def _parse_bot_ids(value: Any) -> List[int]:
+    if not isinstance(value, list):
+        raise ValueError("bot_ids 必须是数组")
+    return list(dict.fromkeys(int(bot_id) for bot_id in value))
+
+
+def _parse_events(value: Any) -> Optional[Set[str]]:
+    if value is None:
+        return None
+    if not isinstance(value, list):
+        raise ValueError("events 必须是数组")
+    unknown = set(value) - EVENT_TYPES
+    if unknown:
+        raise ValueError(f"不支持的事件类型: {sorted(unknown)}")
+    return set(value) or None
+
+
+async def _load_owned_bots(user_id: int, bot_ids: List[int]) -> Dict[int, BotInstance]:
+    """一次查询校验多个机器人的归属(短会话,不在连接期间占用数据库连接)"""
+    from app.db.session import AsyncSessionLocal
+    
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(BotInstance).where(
+                BotInstance.id.in_(bot_ids),
+                BotInstance.user_id == user_id
+            )
+        )
+        return {bot.id: bot for bot in result.scalars()}
+
+
+@router.websocket("/stream")
+async def websocket_stream(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None)
+):
+    """
+    多路复用WebSocket端点: 一个连接订阅多个机器人
+    
+    连接时认证一次,之后通过消息订阅/取消订阅:
+    {"type": "subscribe", "bot_ids": [1, 2], "events": ["spread_update", "order_update"]}
+    {"type": "unsubscribe", "bot_ids": [2], "events": ["order_update"]}
+    {"type": "ping"}
+    
+    events 省略时表示全部事件。推送的消息格式与 /ws/bot/{bot_id} 相同,
+    通过 data.bot_instance_id 区分机器人。
+    
+    查询参数:
+    - token: JWT访问令牌
+    """
+    payload = verify_token(token, "access") if token else None
+    if not payload:
+        await websocket.close(code=4002, reason="无效的访问令牌")
+        return
+    try:
+        user_id = int(payload.get("sub"))
+    except (ValueError, TypeError):
+        await websocket.close(code=4003, reason="令牌格式错误")
+        return
+    
+    await manager.accept(websocket, user_id)
+    logger.info(f"[WebSocket] 多路复用连接建立: 用户{user_id}")
+    
+    # 本连接已校验过归属的机器人
+    owned: Dict[int, BotInstance] = {}
+    
+    async def reply(message_type: str, data: dict):
+        await manager.send_personal_message(websocket, {
+            "type": message_type,
+            "timestamp": asyncio.get_event_loop().time(),
+            "data": data
+        })
+    
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                message = json.loads(data)
+                message_type = message.get("type")
+                
+                if message_type == "ping":
+                    await reply("pong", {})
+                
+                elif message_type == "subscribe":
+                    bot_ids = _parse_bot_ids(message.get("bot_ids"))
+                    events = _parse_events(message.get("events"))
+                    unchecked = [bot_id for bot_id in bot_ids if bot_id not in owned]
+                    if unchecked:
+                        owned.update(await _load_owned_bots(user_id, unchecked))
+                    allowed = [bot_id for bot_id in bot_ids if bot_id in owned]
+                    manager.subscribe(websocket, allowed, events)
+                    await reply("subscribed", {
+                        "bot_ids": allowed,
+                        "denied": [bot_id for bot_id in bot_ids if bot_id not in owned],
+                        "events": sorted(events) if events else [ALL_EVENTS],
+                        "bots": [
+                            {"bot_id": bot_id, "bot_name": owned[bot_id].bot_name, "status": owned[bot_id].status}
+                            for bot_id in allowed
+                        ],
+                        "subscriptions": manager.get_subscriptions(websocket)
+                    })
+                
+                elif message_type == "unsubscribe":
+                    bot_ids = _parse_bot_ids(message.get("bot_ids"))
+                    events = _parse_events(message.get("events"))
+                    manager.unsubscribe(websocket, bot_ids, events)
+                    await reply("unsubscribed", {
+                        "bot_ids": bot_ids,
+                        "subscriptions": manager.get_subscriptions(websocket)
+                    })
+                
+                else:
+                    await reply("error", {"message": f"未知的消息类型: {message_type}"})
+            
+            except (json.JSONDecodeError, ValueError, TypeError, AttributeError) as e:
+                await reply("error", {"message": f"无效的消息: {str(e)}"})
+    
+    except WebSocketDisconnect:
+        logger.info(f"[WebSocket] 多路复用连接断开: 用户{user_id}")
+    except Exception as e:
+        logger.error(f"[WebSocket] 多路复用连接异常: {str(e)}")
+    finally:
+        await manager.disconnect(websocket)
+
+
 # 导出管理器供其他模块使用
 __all__ = ["manager"]
\ No newline at end of file
@@ -2,7 +2,7 @@
 应用配置管理
 """
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
 
 
@@ -21,7 +21,15 @@ class Settings(BaseSettings):
     DATABASE_POOL_SIZE: int = 5
     DATABASE_MAX_OVERFLOW: int = 10
     
-    # Redis配置(可选,暂不使用)
+    # SQLite 性能配置(仅 SQLite 生效)
+    SQLITE_WAL: bool = True  # 启用 WAL 日志模式,读写互不阻塞
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # WAL 下 NORMAL 足够安全,FULL 每次提交都 fsync
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 等待写锁的最长时间(毫秒)
+    SQLITE_CACHE_SIZE_KB: int = 20000  # 页缓存大小(KiB)
+    SQLITE_MMAP_SIZE_MB: int = 256  # 内存映射读取大小(MB), 0 表示关闭
+    SQLITE_SERIALIZED_WRITER: bool = True  # 机器人写操作经单个写入任务串行执行
+    
+    # Redis配置(可选,WS_BROADCAST_BACKEND=redis 时用于跨进程广播)
     REDIS_URL: Optional[str] = None
     REDIS_PASSWORD: str = ""
     
@@ -63,6 +71,81 @@ class Settings(BaseSettings):
     OKX_PASSPHRASE: str = ""
     OKX_PROXY: str = ""
     
+    # 行情数据配置
+    MARKET_DATA_INTERVAL: float = 5.0  # 共享行情刷新间隔(秒)
+    TICKER_STREAM_ENABLED: bool = False  # 是否启用WebSocket行情推送(OKX/Binance)
+    TICKER_STREAM_MAX_AGE: float = 5.0  # 推送行情最大有效期(秒),超时回退到REST
+    ORDER_STREAM_ENABLED: bool = False  # 是否启用私有订单推送(OKX orders / Binance 用户数据流)获取成交
+    ORDER_STREAM_FILL_TIMEOUT: float = 3.0  # 等待推送成交的最长时间(秒),超时回退到查询订单
+    ORDER_FILL_POLL_TIMEOUT: float = 5.0  # 回退查询订单的总时长(秒),查询间隔从0.2秒起倍增
+    
+    # 机器人循环调度配置
+    BOT_CYCLE_MODE: str = "polling"  # polling: 固定间隔轮询; event: 新行情触发评估
+    BOT_CYCLE_INTERVAL: float = 10.0  # 轮询间隔(秒),event 模式下为无行情时的兜底间隔
+    BOT_MIN_CYCLE_INTERVAL: float = 1.0  # event 模式下两次评估的最小间隔(秒),期间行情合并
+    
+    # 价差历史写缓冲配置
+    SPREAD_RECORDER_MAX_QUEUE: int = 50000  # 队列上限(样本数),写满时丢弃最旧样本
+    SPREAD_RECORDER_BATCH_SIZE: int = 500  # 达到该数量立即批量写入
+    SPREAD_RECORDER_FLUSH_INTERVAL: float = 2.0  # 最长刷新间隔(秒)
+    
+    # 数据保留与归档配置
+    RETENTION_ENABLED: bool = False  # 默认关闭: 开启后首次清理即归档并删除已有的过期数据
+    RETENTION_INTERVAL_HOURS: float = 6.0  # 清理间隔(小时)
+    SPREAD_HISTORY_RETENTION_DAYS: int = 30  # 原始价差样本保留天数, 0 表示永久保留
+    SPREAD_ROLLUP_RETENTION_DAYS: Dict[str, int] = {"1m": 90, "5m": 365, "1h": 0, "1d": 0}  # 各粒度聚合保留天数
+    TRADE_LOG_RETENTION_DAYS: int = 90  # 交易日志保留天数(归档后接口不再返回), 0 表示永久保留
+    RETENTION_CHUNK_SIZE: int = 2000  # 每块归档/删除的行数
+    RETENTION_CHUNK_PAUSE: float = 0.05  # 块之间让出写锁的间隔(秒)
+    ARCHIVE_DIR: str = "./data/archive"  # 归档文件目录
+    
+    # 价差历史导出配置
+    SPREAD_EXPORT_PAGE_SIZE: int = 5000  # 流式导出每页行数(keyset 分页)
+    
+    # WebSocket推送配置
+    WS_SEND_QUEUE_SIZE: int = 100  # 每个连接的发送队列上限
+    WS_SEND_TIMEOUT: float = 5.0  # 单次发送超时(秒),超时的连接被驱逐
+    WS_MAX_LAG_SECONDS: float = 10.0  # 队首消息最大积压时间(秒),超过则驱逐
+    WS_BROADCAST_BACKEND: str = "memory"  # 广播后端: memory(进程内) / redis(经 REDIS_URL 跨进程广播)
+    WS_BROADCAST_CHANNEL: str = "chainmakes:ws:broadcast"  # 跨进程广播的 Redis 频道
+    WS_BROADCAST_MAX_PENDING: int = 10000  # 待发布到 Redis 的消息上限
+    
+    # 机器人运行进程配置
+    BOT_RUNNER_MODE: str = "embedded"  # embedded: 在 API 进程内运行机器人; remote: 在独立进程运行(python -m app.runner)
+    BOT_RUNNER_HOST: str = "127.0.0.1"  # 运行进程 IPC 监听地址(仅本机)
+    BOT_RUNNER_PORT: int = 8765
+    BOT_RUNNER_TIMEOUT: float = 60.0  # IPC 请求超时(秒),停止机器人需要等待平仓
+    BOT_RUNNER_SHARDS: int = 0  # 大于 1 时运行进程启动多个工作进程,按机器人 ID 一致性哈希分片
+    BOT_SHARD_HEALTH_INTERVAL: float = 5.0  # 分片健康检查间隔(秒)
+    BOT_SHARD_MAX_FAILURES: int = 3  # 连续无响应次数,超过则重启分片并迁移机器人
+    BOT_RECOVERY_CONCURRENCY: int = 8  # 启动恢复时同时处理的交易所账户数
+    BOT_RECOVERY_REQUEST_INTERVAL: float = 0.2  # 启动恢复时同一账户的交易所请求间隔(秒)
+    BOT_SHUTDOWN_TIMEOUT: float = 20.0  # 服务关闭时停止所有机器人的总截止时间(秒)
+    BOT_SHUTDOWN_CLOSE_POSITIONS: bool = True  # 服务关闭时是否平仓(False: 保留持仓,下次启动恢复)
+
+    # 交易所账户级限频(同一 API Key 的所有机器人共用令牌桶)
+    RATE_GOVERNOR_ENABLED: bool = True
+    RATE_GOVERNOR_SAFETY: float = 0.8  # 按交易所公布限频的比例使用,留出余量
+    RATE_GOVERNOR_BACKGROUND_RESERVE: float = 0.25  # 为交易请求保留的额度比例,数据同步等后台请求不能使用
+    
+    # 配对交易两腿执行配置
+    PAIR_EXECUTION_MODE: str = "concurrent"  # concurrent: 两腿同时下单; sequential: 依次下单
+    PAIR_FAILURE_ACTION: str = "unwind"  # 开仓两腿成交不一致时: unwind 回滚多出的部分; hedge 先补单,仍不一致再回滚
+    PAIR_HEDGE_RETRIES: int = 1  # 补单(平仓未完成时重试)次数
+    PAIR_BALANCE_TOLERANCE: float = 0.02  # 两腿成交比例差在此范围内视为一致
+    PAIR_BATCH_ORDERS: bool = True  # 交易所支持时(OKX)所有腿在一次批量下单请求中提交
+    PAIR_CONFIRM_RETRIES: int = 4  # 批量下单请求失败后按客户订单ID确认订单的查询次数
+    PAIR_CONFIRM_DELAY: float = 0.5  # 确认查询的首次等待秒数(之后每次加倍)
+    
+    # 交易所读请求合并配置(同一账户相同的并发查询只请求一次)
+    EXCHANGE_READ_COALESCING: bool = True
+    EXCHANGE_READ_REUSE_WINDOW: float = 0.5  # 查询完成后相同请求复用结果的时间(秒),写操作后立即失效
+    
+    # 主实例选举配置(多实例部署时只有主实例运行交易引擎)
+    LEADER_ELECTION_ENABLED: bool = False
+    LEADER_LEASE_TTL: float = 15.0  # 租约有效期(秒),主实例失联后其他实例最多等待该时间接管
+    LEADER_RENEW_INTERVAL: float = 5.0  # 续约/竞选间隔(秒),需大于实例间的时钟偏差
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -2,20 +2,27 @@
 交易机器人核心引擎
 """
 import asyncio
+import time
+from contextlib import asynccontextmanager
 from decimal import Decimal
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from app.models.bot_instance import BotInstance
 from app.models.order import Order
 from app.models.position import Position
-from app.models.spread_history import SpreadHistory
 from app.models.trade_log import TradeLog
+from app.config import settings
+from app.core.exceptions import LeadershipLostError
+from app.db.writer import db_writer
 from app.exchanges.base_exchange import BaseExchange
 from app.exchanges.exchange_factory import ExchangeFactory
 from app.services.spread_calculator import SpreadCalculator
+from app.services.market_data_service import market_data_service
+from app.services.pair_executor import PairExecution, PairExecutor, PairLeg
+from app.services.spread_recorder import spread_recorder
 from app.utils.encryption import key_encryption
 from app.utils.logger import setup_logger
 
@@ -37,7 +44,9 @@ class BotEngine:
         self,
         bot: BotInstance,
         exchange: BaseExchange,
-        bot_id: int
+        bot_id: int,
+        fencing_token: Optional[int] = None,
+        recovered_positions: Optional[List[Dict[str, Any]]] = None
     ):
         """
         初始化机器人引擎
@@ -46,28 +55,48 @@ class BotEngine:
             bot: 机器人实例
             exchange: 交易所实例
             bot_id: 机器人ID（用于创建独立会话）
+            fencing_token: 主实例防护令牌(启用主实例选举时),下单前校验
+            recovered_positions: 启动恢复时按账户预取的全部持仓
+                (已统一设置杠杆,启动时跳过启动延迟和杠杆设置)
         """
         self.bot = bot
         self.bot_id = bot_id
         self.exchange = exchange
-        self.db = None  # 将在 start() 中创建独立会话
+        self.db = None  # 仅在工作单元(_db_scope)内有效
+        self._unit_lock = asyncio.Lock()
+        self.db_commits = 0  # 工作单元提交次数(含检查点)
+        self._post_commit = []  # 提交成功后执行的推送回调
         self.is_running = False
         self.calculator = SpreadCalculator()
 
+        # 主实例选举: 令牌失效或被释放后不再下单,也不再修改机器人状态
+        self.fencing_token = fencing_token
+        self.released = False
+        self.recovered_positions = recovered_positions
+
+        # 服务关闭: 停止循环但保持 running 状态,下次启动时恢复
+        self.shutting_down = False
+        self.in_cycle = False
+
         # WebSocket推送引用(延迟导入避免循环依赖)
         self._websocket_manager = None
 
         # 性能监控
         self._init_performance_monitoring()
 
-        # 价格缓存机制（降低API请求频率）
-        self._price_cache = {}
-        self._price_cache_time = {}
-        self._price_cache_ttl = 5  # 缓存5秒
-
-        # 持仓更新频率控制
-        self._position_update_counter = 0
-        self._position_update_interval = 3  # 每3个循环更新一次持仓（30秒一次）
+        # 持仓更新频率控制（按时间间隔,事件驱动模式下循环更频繁）
+        self._last_position_update = 0.0
+        self._position_update_interval = 30  # 每30秒更新一次持仓
+
+        # 循环调度
+        # polling: 固定间隔轮询; event: 任一交易对收到新行情即触发评估
+        self.cycle_mode = settings.BOT_CYCLE_MODE
+        self.cycle_interval = settings.BOT_CYCLE_INTERVAL
+        self.min_cycle_interval = settings.BOT_MIN_CYCLE_INTERVAL
+        self._price_event = asyncio.Event()
+        self._first_tick_at: Optional[float] = None  # 本轮第一个未处理行情的到达时间
+        self._last_cycle_at: Optional[float] = None
+        self._init_scheduling_stats()
     
     async def start(self):
         """启动机器人"""
@@ -78,76 +107,198 @@ class BotEngine:
             logger.warning(f"[BotEngine] Bot {self.bot_id} 已在运行")
             return
 
-        # 创建独立的数据库会话
-        from app.db.session import AsyncSessionLocal
-        logger.info(f"[BotEngine] Bot {self.bot_id} 创建独立数据库会话")
-
-        async with AsyncSessionLocal() as session:
-            self.db = session
-
-            try:
-                # 重新加载 bot 对象到当前会话
-                from sqlalchemy import select
-                result = await self.db.execute(
-                    select(BotInstance).where(BotInstance.id == self.bot_id)
-                )
-                self.bot = result.scalar_one()
-                logger.info(f"[BotEngine] Bot {self.bot_id} 已重新加载到独立会话")
-
+        try:
+            async with self._db_scope():
                 self.is_running = True
                 self.bot.status = "running"
-                await self.db.commit()
                 logger.info(f"[BotEngine] Bot {self.bot_id} 状态已更新为 running")
 
-                # 🔥 启动延迟：避免多个机器人同时启动时产生请求风暴
-                startup_delay = 2 + (self.bot_id % 3)  # 2-4秒的随机延迟
-                logger.info(f"[BotEngine] Bot {self.bot_id} 启动延迟 {startup_delay} 秒,避免API频率限制")
-                await asyncio.sleep(startup_delay)
+            # 订阅共享行情
+            await self._subscribe_market_data()
+
+            # 启动恢复时杠杆和持仓已按账户统一处理,跳过逐个机器人的预热
+            recovered_positions, self.recovered_positions = self.recovered_positions, None
+            if recovered_positions is None:
+                # 启用账户级限频时请求按令牌桶排队,不需要固定延迟
+                rate_limited = getattr(self.exchange, 'rate_governor', None) is not None
+                if not rate_limited:
+                    # 🔥 启动延迟：避免多个机器人同时启动时产生请求风暴
+                    startup_delay = 2 + (self.bot_id % 3)  # 2-4秒的随机延迟
+                    logger.info(f"[BotEngine] Bot {self.bot_id} 启动延迟 {startup_delay} 秒,避免API频率限制")
+                    await asyncio.sleep(startup_delay)
 
                 # 设置杠杆
                 logger.info(f"[BotEngine] Bot {self.bot_id} 开始设置杠杆")
                 await self._set_leverage()
-                
-                # 设置杠杆后等待,避免请求过快
-                await asyncio.sleep(1)
-
-                # 同步交易所状态（防止后端重启后数据不一致）
-                logger.info(f"[BotEngine] Bot {self.bot_id} 开始同步交易所状态")
-                await self._sync_state_with_exchange()
-
-                # 主循环
-                # 调整为10秒间隔，降低API请求频率
-                logger.info(f"[BotEngine] Bot {self.bot_id} 进入主循环（10秒间隔）")
-                cycle_count = 0
-                while self.is_running:
-                    cycle_count += 1
-                    logger.debug(f"[BotEngine] Bot {self.bot_id} 第 {cycle_count} 次循环开始")
-                    await self._execute_cycle()
-                    logger.debug(f"[BotEngine] Bot {self.bot_id} 第 {cycle_count} 次循环完成，等待10秒")
-                    await asyncio.sleep(10)  # 每10秒检查一次，降低API请求频率
 
-            except Exception as e:
-                logger.error(f"[BotEngine] Bot {self.bot_id} 运行错误: {str(e)}", exc_info=True)
+                if not rate_limited:
+                    # 设置杠杆后等待,避免请求过快
+                    await asyncio.sleep(1)
+
+            # 同步交易所状态（防止后端重启后数据不一致）
+            logger.info(f"[BotEngine] Bot {self.bot_id} 开始同步交易所状态")
+            async with self._db_scope():
+                await self._sync_state_with_exchange(recovered_positions)
+
+            # 主循环
+            # 每次循环借用一个数据库会话,循环之间不占用连接池
+            logger.info(
+                f"[BotEngine] Bot {self.bot_id} 进入主循环"
+                f"（模式: {self.cycle_mode}, 间隔: {self.cycle_interval}秒）"
+            )
+            cycle_count = 0
+            while self.is_running:
+                cycle_count += 1
+                logger.debug(f"[BotEngine] Bot {self.bot_id} 第 {cycle_count} 次循环开始")
+                self.in_cycle = True
                 try:
+                    async with self._db_scope():
+                        await self._execute_cycle()
+                finally:
+                    self.in_cycle = False
+                logger.debug(f"[BotEngine] Bot {self.bot_id} 第 {cycle_count} 次循环完成")
+                await self._wait_for_next_cycle()
+
+        except LeadershipLostError as e:
+            # 其他实例已接管: 直接退出,由新的主实例继续运行该机器人
+            logger.error(f"[BotEngine] Bot {self.bot_id} 停止运行: {e.message}")
+            self.release()
+        except Exception as e:
+            logger.error(f"[BotEngine] Bot {self.bot_id} 运行错误: {str(e)}", exc_info=True)
+            try:
+                # 遇到异常时停止机器人，而不是暂停
+                self.is_running = False
+                async with self._db_scope():
                     await self._log_error(f"运行错误: {str(e)}")
-                    # 遇到异常时停止机器人，而不是暂停
-                    self.is_running = False
-                    if self.bot:
-                        self.bot.status = "stopped"
-                        await self.db.commit()
-                        logger.info(f"[BotEngine] Bot {self.bot_id} 因异常已停止")
-                except Exception as inner_e:
-                    logger.error(f"[BotEngine] Bot {self.bot_id} 更新停止状态失败: {str(inner_e)}")
-            finally:
-                # 确保无论如何退出，都更新状态为 stopped（如果还是 running）
+                    self.bot.status = "stopped"
+                logger.info(f"[BotEngine] Bot {self.bot_id} 因异常已停止")
+            except Exception as inner_e:
+                logger.error(f"[BotEngine] Bot {self.bot_id} 更新停止状态失败: {str(inner_e)}")
+        finally:
+            await self._unsubscribe_market_data()
+
+            # 确保无论如何退出，都更新状态为 stopped（如果还是 running）
+            # 被释放的引擎不修改状态: 机器人仍由新的主实例运行
+            # 服务关闭时不修改状态: 由关闭流程决定(平仓完成才标记为 stopped)
+            if not self.released and not self.shutting_down:
                 try:
-                    if self.db and self.bot and self.bot.status == "running":
-                        self.bot.status = "stopped"
-                        await self.db.commit()
-                        logger.info(f"[BotEngine] Bot {self.bot_id} 最终状态已设为 stopped")
+                    await self._set_status("stopped", only_if="running")
                 except Exception as e:
                     logger.error(f"[BotEngine] Bot {self.bot_id} 最终状态更新失败: {str(e)}")
-                logger.info(f"[BotEngine] Bot {self.bot_id} 会话即将关闭")
+            logger.info(f"[BotEngine] Bot {self.bot_id} 已退出主循环")
+
+    @asynccontextmanager
+    async def _db_scope(self):
+        """
+        单个工作单元的数据库会话
+
+        进入时从连接池借用会话并重新加载机器人配置,退出时提交并归还连接。
+        同一机器人的工作单元串行执行(主循环与外部平仓请求互斥)。
+        """
+        from app.db.session import AsyncSessionLocal
+
+        async with self._unit_lock:
+            async with AsyncSessionLocal() as session:
+                self.db = session
+                try:
+                    bot = await session.get(BotInstance, self.bot_id)
+                    if bot is None:
+                        raise RuntimeError(f"机器人 {self.bot_id} 不存在")
+                    self.bot = bot
+                    await self._release_connection()
+                    yield session
+                    await self._commit()
+                except Exception:
+                    self._post_commit.clear()
+                    await session.rollback()
+                    raise
+                finally:
+                    self.db = None
+
+    async def _commit(self):
+        """
+        提交当前工作单元
+
+        写操作交给串行写入任务执行(会话在此之前不 flush),提交成功后执行推送回调
+        """
+        if self.db is None:
+            return
+
+        has_changes = bool(self.db.new or self.db.dirty or self.db.deleted)
+        if has_changes:
+            await db_writer.commit(self.db)
+            self.db_commits += 1
+        elif self.db.in_transaction():
+            # 只读事务: 直接结束即可
+            await self.db.commit()
+
+        callbacks, self._post_commit = self._post_commit, []
+        for callback in callbacks:
+            await callback()
+
+    def _after_commit(self, callback):
+        """注册提交成功后执行的异步回调(用于推送已持久化的数据)"""
+        self._post_commit.append(callback)
+
+    async def _release_connection(self):
+        """
+        在耗时的交易所调用之前结束当前事务,把连接归还连接池
+
+        expire_on_commit=False, 已加载的对象在提交后仍可继续使用
+        """
+        await self._commit()
+
+    async def _checkpoint(self):
+        """
+        显式检查点: 提交当前工作单元中已有的修改
+
+        一轮循环只在结束时提交一次,仅在交易所副作用(下单/平仓)前后调用检查点,
+        保证已成交的订单不会因后续步骤失败而丢失
+        """
+        await self._commit()
+
+    async def _fence(self):
+        """
+        下单前校验防护令牌
+
+        Raises:
+            LeadershipLostError: 本实例已不是主实例,或机器人已被释放
+        """
+        if self.released:
+            raise LeadershipLostError("机器人已被释放", token=self.fencing_token)
+        if self.fencing_token is not None:
+            from app.services.leader_election import leader_elector
+            await leader_elector.verify_token(self.fencing_token)
+
+    def request_shutdown(self):
+        """服务关闭: 本轮循环结束后退出,不修改机器人状态(见 bot_shutdown)"""
+        self.shutting_down = True
+        self.is_running = False
+        # 事件驱动模式下唤醒等待中的循环
+        self._price_event.set()
+
+    def release(self):
+        """释放引擎: 停止循环,不平仓、不修改机器人状态(用于失去主实例身份时)"""
+        self.released = True
+        self.is_running = False
+
+    async def _set_status(self, status: str, only_if: Optional[str] = None):
+        """
+        使用独立的短会话更新机器人状态(不等待正在执行的循环)
+
+        Args:
+            status: 新状态
+            only_if: 仅当当前状态为该值时更新(可选)
+        """
+        stmt = update(BotInstance).where(BotInstance.id == self.bot_id)
+        if only_if is not None:
+            stmt = stmt.where(BotInstance.status == only_if)
+
+        result = await db_writer.submit(lambda session: session.execute(stmt.values(status=status)))
+
+        if result.rowcount and self.bot is not None:
+            self.bot.status = status
+            logger.info(f"[BotEngine] Bot {self.bot_id} 状态已设为 {status}")
 
     async def _run(self):
         """异步任务执行的运行方法"""
@@ -165,9 +316,7 @@ class BotEngine:
         """暂停机器人"""
         logger.info(f"[BotEngine] 暂停机器人: Bot {self.bot_id}")
         self.is_running = False
-        if self.db and self.bot:
-            self.bot.status = "paused"
-            await self.db.commit()
+        await self._set_status("paused")
         
         # 停止数据同步服务
         try:
@@ -181,9 +330,7 @@ class BotEngine:
         """停止机器人"""
         logger.info(f"[BotEngine] 停止机器人: Bot {self.bot_id}")
         self.is_running = False
-        if self.db and self.bot:
-            self.bot.status = "stopped"
-            await self.db.commit()
+        await self._set_status("stopped")
     
     async def _execute_cycle(self):
         """执行一个交易循环"""
@@ -227,16 +374,16 @@ class BotEngine:
 
             # 4.6 更新持仓价格和未实现盈亏（降低频率）
             # 每3个循环才更新一次持仓，减少API请求
-            self._position_update_counter += 1
-            if self._position_update_counter >= self._position_update_interval:
-                self._position_update_counter = 0
+            now = time.monotonic()
+            if now - self._last_position_update >= self._position_update_interval:
+                self._last_position_update = now
                 try:
                     await self.update_position_prices()
                 except Exception as e:
                     # 更新持仓价格失败时记录警告，但不影响主流程
                     logger.warning(f"[BotEngine] Bot {self.bot.id} 更新持仓价格失败: {str(e)}")
             else:
-                logger.debug(f"[BotEngine] Bot {self.bot.id} 跳过持仓更新（{self._position_update_counter}/{self._position_update_interval}）")
+                logger.debug(f"[BotEngine] Bot {self.bot.id} 跳过持仓更新（距上次 {now - self._last_position_update:.0f} 秒）")
 
             # 5. 获取当前持仓
             positions = await self._get_open_positions()
@@ -287,10 +434,20 @@ class BotEngine:
 
             logger.debug(f"[BotEngine] Bot {self.bot.id} _execute_cycle() 执行完成")
 
+        except LeadershipLostError:
+            # 已不是主实例: 放弃本轮修改并退出主循环
+            raise
         except Exception as e:
             # 记录错误但不停止机器人（除非是严重错误）
             logger.error(f"[BotEngine] Bot {self.bot.id} 执行循环错误: {str(e)}", exc_info=True)
-            await self._log_error(f"执行循环错误: {str(e)}")
+            # 回滚上一个检查点之后的未提交修改(及其推送),只保留错误日志
+            self._post_commit.clear()
+            try:
+                await self.db.rollback()
+                await self.db.refresh(self.bot)
+                await self._log_error(f"执行循环错误: {str(e)}")
+            except Exception as log_error:
+                logger.error(f"[BotEngine] Bot {self.bot_id} 记录循环错误失败: {str(log_error)}")
 
         finally:
             # 结束性能计时并记录指标
@@ -306,7 +463,7 @@ class BotEngine:
         except Exception as e:
             logger.warning(f"设置杠杆失败: {str(e)}")
 
-    async def _sync_state_with_exchange(self):
+    async def _sync_state_with_exchange(self, exchange_positions: Optional[List[Dict[str, Any]]] = None):
         """
         同步交易所状态与数据库状态
 
@@ -314,12 +471,16 @@ class BotEngine:
         1. 对比交易所实际持仓与数据库记录
         2. 修正不一致的持仓数据
         3. 修正 current_dca_count
+
+        Args:
+            exchange_positions: 已查询的账户全部持仓(启动恢复时按账户预取),默认实时查询
         """
         try:
             logger.info(f"[状态同步] 开始同步机器人 {self.bot.id} 的状态")
 
             # 1. 获取交易所实际持仓
-            exchange_positions = await self.exchange.get_all_positions()
+            if exchange_positions is None:
+                exchange_positions = await self.exchange.get_all_positions()
             logger.info(f"[状态同步] 交易所持仓数量: {len(exchange_positions)}")
 
             # 过滤出本机器人相关的交易对
@@ -427,7 +588,7 @@ class BotEngine:
 
 
             # 5. 提交所有修改
-            await self.db.commit()
+            await self._commit()
             logger.info(f"[状态同步] 状态同步完成")
 
             # 6. 记录同步结果
@@ -473,7 +634,6 @@ class BotEngine:
             if time_diff < 300:  # 5分钟 = 300秒
                 self.bot.market1_start_price = current_market1_price
                 self.bot.market2_start_price = current_market2_price
-                await self.db.commit()
                 logger.info(
                     f"使用当前价格作为起始价格: "
                     f"{self.bot.market1_symbol}={current_market1_price}, "
@@ -505,7 +665,6 @@ class BotEngine:
             if historical_price1 and historical_price2:
                 self.bot.market1_start_price = historical_price1
                 self.bot.market2_start_price = historical_price2
-                await self.db.commit()
                 logger.info(
                     f"✅ 成功获取历史起始价格: "
                     f"{self.bot.market1_symbol}={historical_price1}, "
@@ -516,7 +675,6 @@ class BotEngine:
                 # 获取失败，使用当前价格作为备用方案
                 self.bot.market1_start_price = current_market1_price
                 self.bot.market2_start_price = current_market2_price
-                await self.db.commit()
                 logger.warning(
                     f"⚠️ 无法获取历史价格，使用当前价格: "
                     f"{self.bot.market1_symbol}={current_market1_price}, "
@@ -528,7 +686,6 @@ class BotEngine:
             logger.error(f"初始化起始价格失败: {str(e)}", exc_info=True)
             self.bot.market1_start_price = current_market1_price
             self.bot.market2_start_price = current_market2_price
-            await self.db.commit()
             logger.warning(
                 f"⚠️ 初始化失败，使用当前价格: "
                 f"{self.bot.market1_symbol}={current_market1_price}, "
@@ -537,32 +694,84 @@ class BotEngine:
     
     async def _get_market_price(self, symbol: str) -> Decimal:
         """
-        获取市场价格（带缓存）
+        获取市场价格
 
-        使用缓存机制减少API请求频率
+        从进程级行情数据中心读取,同一交易对的多个机器人共享一次行情请求。
+        本机器人触发的刷新不会回调自身,避免事件驱动模式下自我唤醒
         """
-        import time
+        price = await market_data_service.get_price(self.exchange, symbol, self.bot_id)
+        logger.debug(f"获取价格: {symbol} = {price}")
+        return price
 
-        current_time = time.time()
+    async def _subscribe_market_data(self):
+        """订阅本机器人两个交易对的共享行情(事件驱动模式下注册行情回调)"""
+        on_update = self._on_market_update if self.cycle_mode == "event" else None
+        for symbol in (self.bot.market1_symbol, self.bot.market2_symbol):
+            await market_data_service.subscribe(
+                self.exchange, symbol, self.bot_id, on_update=on_update
+            )
 
-        # 检查缓存
-        if symbol in self._price_cache:
-            cache_time = self._price_cache_time.get(symbol, 0)
-            if current_time - cache_time < self._price_cache_ttl:
-                # 缓存有效，直接返回
-                logger.debug(f"使用缓存价格: {symbol} = {self._price_cache[symbol]}")
-                return self._price_cache[symbol]
+    def _on_market_update(self, key, ticker):
+        """任一交易对收到新行情: 唤醒主循环(同一轮内的多次行情合并为一次评估)"""
+        self.ticks_received += 1
+        if self._first_tick_at is None:
+            self._first_tick_at = time.monotonic()
+        self._price_event.set()
 
-        # 缓存失效或不存在，从交易所获取
-        ticker = await self.exchange.get_ticker(symbol)
-        price = ticker['last_price']
+    async def _wait_for_next_cycle(self):
+        """
+        等待下一次循环
 
-        # 更新缓存
-        self._price_cache[symbol] = price
-        self._price_cache_time[symbol] = current_time
+        - polling 模式: 固定等待 cycle_interval 秒
+        - event 模式: 等待新行情到达(最长 cycle_interval 秒兜底),
+          且两次循环间隔不少于 min_cycle_interval 秒,期间到达的行情合并为一次评估
+        """
+        if self.cycle_mode != "event":
+            await asyncio.sleep(self.cycle_interval)
+            return
 
-        logger.debug(f"获取新价格: {symbol} = {price}")
-        return price
+        elapsed = time.monotonic() - self._last_cycle_at if self._last_cycle_at else 0.0
+
+        if not self._price_event.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._price_event.wait(),
+                    timeout=max(self.cycle_interval - elapsed, 0)
+                )
+            except asyncio.TimeoutError:
+                self.timeout_cycles += 1
+
+        # 最小循环间隔: 行情突发时限制评估频率
+        if self._last_cycle_at is not None:
+            remaining = self.min_cycle_interval - (time.monotonic() - self._last_cycle_at)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+        self._consume_ticks()
+
+    def _consume_ticks(self):
+        """开始新一轮评估: 清空待处理行情并记录合并数量与行情到评估的延迟"""
+        now = time.monotonic()
+        pending = self.ticks_received - self._ticks_consumed
+        if pending > 0:
+            self.event_cycles += 1
+            self.ticks_coalesced += pending - 1
+            if self._first_tick_at is not None:
+                self.tick_latencies.append(now - self._first_tick_at)
+                if len(self.tick_latencies) > 100:
+                    self.tick_latencies.pop(0)
+
+        self._ticks_consumed = self.ticks_received
+        self._first_tick_at = None
+        self._price_event.clear()
+
+    async def _unsubscribe_market_data(self):
+        """取消订阅共享行情"""
+        try:
+            for symbol in (self.bot.market1_symbol, self.bot.market2_symbol):
+                await market_data_service.unsubscribe(self.exchange, symbol, self.bot_id)
+        except Exception as e:
+            logger.warning(f"[BotEngine] Bot {self.bot_id} 取消行情订阅失败: {str(e)}")
     
     async def _record_spread(
         self,
@@ -570,23 +779,16 @@ class BotEngine:
         market2_price: Decimal,
         spread: Decimal
     ):
-        """记录价差历史"""
-        spread_record = SpreadHistory(
-            bot_instance_id=self.bot.id,
-            market1_price=market1_price,
-            market2_price=market2_price,
-            spread_percentage=spread
-        )
-        self.db.add(spread_record)
-        await self.db.commit()
-        
+        """记录价差历史(放入写缓冲,由后台任务批量写入)"""
+        sample = spread_recorder.record(self.bot.id, market1_price, market2_price, spread)
+
         # 返回价差记录供推送使用
         return {
             "bot_instance_id": self.bot.id,
             "market1_price": float(market1_price),
             "market2_price": float(market2_price),
             "spread_percentage": float(spread),
-            "recorded_at": spread_record.recorded_at.isoformat()
+            "recorded_at": sample["recorded_at"].isoformat()
         }
     
     async def _should_open_position(self, current_spread: Decimal) -> bool:
@@ -672,64 +874,64 @@ class BotEngine:
                 f"{self.bot.market2_symbol} {market2_side} {market2_amount}"
             )
             
-            order1 = await self.exchange.create_market_order(
-                self.bot.market1_symbol,
-                market1_side,
-                market1_amount
-            )
-
-            order2 = await self.exchange.create_market_order(
-                self.bot.market2_symbol,
-                market2_side,
-                market2_amount
-            )
-
-            # 🔥 关键修复：市价单创建后等待成交，然后重新查询订单状态获取实际成交数量
+            # 检查点: 下单前提交本轮已有的修改,交易所调用期间不占用连接
+            await self._checkpoint()
+            await self._fence()
+            # 两腿同时下单并汇总成交,单腿失败或部分成交时补单/回滚
+            legs = [
+                PairLeg(self.bot.market1_symbol, market1_side, market1_amount),
+                PairLeg(self.bot.market2_symbol, market2_side, market2_amount),
+            ]
             logger.info(f"等待订单成交...")
-            await asyncio.sleep(2)  # 等待2秒让订单成交
-
-            # 重新查询订单状态，获取实际成交数量
-            try:
-                order1 = await self.exchange.get_order(order1['id'], self.bot.market1_symbol)
-                order2 = await self.exchange.get_order(order2['id'], self.bot.market2_symbol)
+            execution = await PairExecutor(self.exchange).execute(legs)
+            self._record_execution(execution)
+            for leg in legs:
                 logger.info(
-                    f"订单查询成功: {self.bot.market1_symbol} filled={order1['filled']}, "
-                    f"{self.bot.market2_symbol} filled={order2['filled']}"
+                    f"订单成交: {leg.symbol} filled={leg.filled}/{leg.target}, "
+                    f"补单/回滚={len(leg.corrections)}, error={leg.error}"
                 )
-            except Exception as e:
-                logger.warning(f"重新查询订单状态失败: {str(e)}, 使用原始订单数据")
 
-            # 检查订单是否成交
-            if order1['filled'] == Decimal('0') or order2['filled'] == Decimal('0'):
-                logger.error(
-                    f"订单未成交: {self.bot.market1_symbol} filled={order1['filled']}, "
-                    f"{self.bot.market2_symbol} filled={order2['filled']}"
-                )
-                await self._log_error(f"开仓失败: 订单未成交")
+            # 保存全部订单记录;有净成交的腿按成交均价创建或更新持仓
+            for leg in legs:
+                for order in leg.orders:
+                    await self._save_order(order, dca_level + 1)
+                net_order = leg.net_order()
+                if net_order is not None:
+                    await self._create_or_update_position(net_order, leg.side, dca_level + 1)
+
+            if execution.unknown:
+                self.pair_unbalanced += 1
+                await self._stop_for_unknown_orders(execution)
+                await self._checkpoint()
                 return
 
-            # 保存订单记录
-            await self._save_order(order1, dca_level + 1)
-            await self._save_order(order2, dca_level + 1)
+            if not execution.balanced:
+                self.pair_unbalanced += 1
+                logger.error(f"开仓未完成: {execution.get_stats()}")
+                await self._log_error(
+                    "开仓失败: 两腿成交不一致 " + ", ".join(f"{leg.symbol} 成交={leg.filled}" for leg in legs)
+                )
+                await self._checkpoint()
+                return
 
-            # 创建或更新持仓记录（使用订单中的实际成交价，不再传入预估价格）
-            await self._create_or_update_position(order1, market1_side, dca_level + 1)
-            await self._create_or_update_position(order2, market2_side, dca_level + 1)
-            
             # 更新机器人状态
             self.bot.current_dca_count += 1
             self.bot.last_trade_spread = current_spread
             if self.bot.first_trade_spread is None:
                 self.bot.first_trade_spread = current_spread
-            self.bot.total_trades += 2
-            
-            await self.db.commit()
-            
+            self.bot.total_trades += sum(1 for leg in legs for order in leg.orders if order['filled'] > 0)
+
             await self._log_trade(
                 f"开仓成功: 第{self.bot.current_dca_count}次加仓, "
-                f"价差: {current_spread:.4f}%"
+                f"价差: {current_spread:.4f}%, 两腿时间差: {execution.leg_skew_ms}ms",
+                details={"execution": execution.get_stats()}
             )
+
+            # 检查点: 订单已在交易所成交,立即持久化订单、持仓和机器人状态
+            await self._checkpoint()
         
+        except LeadershipLostError:
+            raise
         except Exception as e:
             logger.error(f"开仓失败: {str(e)}", exc_info=True)
             await self._log_error(f"开仓失败: {str(e)}")
@@ -752,27 +954,28 @@ class BotEngine:
             filled_at=datetime.utcnow() if order_data['status'] == 'closed' else None
         )
         self.db.add(order)
-        await self.db.commit()
-        
-        # 推送订单更新
-        await self._broadcast_order_update({
-            "id": order.id,
-            "bot_instance_id": self.bot.id,
-            "cycle_number": order.cycle_number,
-            "exchange_order_id": order_data['id'],
-            "symbol": order_data['symbol'],
-            "side": order_data['side'],
-            "order_type": order_data['type'],
-            "price": float(order_data.get('price')) if order_data.get('price') else None,
-            "amount": float(order_data['amount']),
-            "filled_amount": float(order_data['filled']),
-            "cost": float(order_data.get('cost')) if order_data.get('cost') else None,
-            "status": order_data['status'],
-            "dca_level": dca_level,
-            "created_at": order.created_at.isoformat(),
-            "updated_at": order.updated_at.isoformat(),
-            "filled_at": order.created_at.isoformat() if order_data['status'] == 'closed' else None
-        })
+
+        # 订单ID在提交时生成,提交成功后再推送订单更新
+        async def broadcast():
+            await self._broadcast_order_update({
+                "id": order.id,
+                "bot_instance_id": self.bot.id,
+                "cycle_number": order.cycle_number,
+                "exchange_order_id": order_data['id'],
+                "symbol": order_data['symbol'],
+                "side": order_data['side'],
+                "order_type": order_data['type'],
+                "price": float(order_data.get('price')) if order_data.get('price') else None,
+                "amount": float(order_data['amount']),
+                "filled_amount": float(order_data['filled']),
+                "cost": float(order_data.get('cost')) if order_data.get('cost') else None,
+                "status": order_data['status'],
+                "dca_level": dca_level,
+                "created_at": order.created_at.isoformat(),
+                "updated_at": order.updated_at.isoformat(),
+                "filled_at": order.created_at.isoformat() if order_data['status'] == 'closed' else None
+            })
+        self._after_commit(broadcast)
     
     async def _get_open_positions(self):
         """获取当前打开的持仓"""
@@ -783,7 +986,8 @@ class BotEngine:
                 Position.is_open == True
             )
         )
-        return result.scalars().all()
+        # 本轮已在内存中标记关闭但尚未提交的持仓也需要排除
+        return [position for position in result.scalars().all() if position.is_open]
     
     async def _should_take_profit(
         self,
@@ -846,8 +1050,13 @@ class BotEngine:
 
         return total
     
-    async def _close_all_positions(self):
-        """平仓所有持仓并计算总收益"""
+    async def _close_all_positions(self) -> bool:
+        """
+        平仓所有持仓并计算总收益
+
+        Returns:
+            所有持仓是否已平仓(没有持仓时为True);平仓失败或未完成时为False
+        """
         # 🔥 关键修复：先获取所有需要的数据,避免在事务中执行新查询
         positions = None
         try:
@@ -858,11 +1067,18 @@ class BotEngine:
             
             if not positions:
                 logger.info(f"没有需要平仓的持仓")
-                return
+                return True
+
+            # 检查点: 提交本轮已有的修改(如 update_position_prices 更新的持仓价格)并归还连接,
+            # 随后查询交易所持仓,不在查询期间占用连接
+            await self._checkpoint()
+            await self._fence()
 
             # 🔥 新增：累计本次平仓的已实现盈亏
             cycle_realized_pnl = Decimal('0')
 
+            # 1. 确定每个持仓的平仓方向和数量(交易所已无持仓或数量太小的直接标记关闭)
+            closing = []
             for position in positions:
                 # 平仓订单方向与持仓方向相反
                 # 注意：数据库中 side 可能是 'buy'/'sell' (订单方向) 或 'long'/'short' (持仓方向)
@@ -939,30 +1155,31 @@ class BotEngine:
                     )
                     actual_amount = position.amount
 
-                # 创建平仓订单
-                order = await self.exchange.create_market_order(
-                    position.symbol,
-                    close_side,
-                    actual_amount,
-                    reduce_only=True
-                )
+                closing.append((position, PairLeg(position.symbol, close_side, actual_amount, reduce_only=True)))
 
-                # 🔥 关键修复：市价单创建后等待成交，然后重新查询订单状态获取实际成交价格和成本
+            # 2. 所有持仓同时下平仓单,并行等待成交,未完成的腿重试
+            execution = None
+            if closing:
                 logger.info(f"等待平仓订单成交...")
-                await asyncio.sleep(2)  # 等待2秒让订单成交
-
-                # 重新查询订单状态，获取实际成交价格和成本
-                try:
-                    order = await self.exchange.get_order(order['id'], position.symbol)
-                    logger.info(
-                        f"平仓订单查询成功: {position.symbol} "
-                        f"filled={order['filled']}, price={order.get('price')}, cost={order.get('cost')}"
-                    )
-                except Exception as e:
-                    logger.warning(f"重新查询平仓订单状态失败: {str(e)}, 使用原始订单数据")
+                execution = await PairExecutor(self.exchange).execute([leg for _, leg in closing])
+                self._record_execution(execution)
+
+            # 3. 保存平仓订单;完全成交的持仓标记关闭,未完成的保留剩余数量
+            unfinished = []
+            for position, leg in closing:
+                for order in leg.orders:
+                    await self._save_order(order, 0)  # dca_level=0表示平仓
+                logger.info(
+                    f"平仓订单成交: {position.symbol} filled={leg.filled}/{leg.target}, "
+                    f"重试={len(leg.corrections)}, error={leg.error}"
+                )
 
-                # 保存平仓订单
-                await self._save_order(order, 0)  # dca_level=0表示平仓
+                if leg.fill_ratio < 1 - execution.tolerance:
+                    unfinished.append(position.symbol)
+                    if leg.filled > 0:
+                        position.amount = max(position.amount - leg.filled, Decimal('0'))
+                        position.updated_at = datetime.utcnow()
+                    continue
 
                 # 🔥 累计本次持仓的已实现盈亏
                 if position.unrealized_pnl is not None:
@@ -976,21 +1193,36 @@ class BotEngine:
                 position.is_open = False
                 position.closed_at = datetime.utcnow()
 
-                # 推送持仓更新
-                await self._broadcast_position_update({
-                    "id": position.id,
-                    "bot_instance_id": position.bot_instance_id,
-                    "symbol": position.symbol,
-                    "side": position.side,
-                    "amount": float(position.amount),
-                    "entry_price": float(position.entry_price),
-                    "current_price": float(position.current_price),
-                    "unrealized_pnl": float(position.unrealized_pnl) if position.unrealized_pnl else None,
-                    "is_open": position.is_open,
-                    "created_at": position.created_at.isoformat(),
-                    "updated_at": position.updated_at.isoformat(),
-                    "closed_at": position.closed_at.isoformat() if position.closed_at else None
-                })
+                # 提交成功后推送持仓更新
+                async def broadcast(position=position):
+                    await self._broadcast_position_update({
+                        "id": position.id,
+                        "bot_instance_id": position.bot_instance_id,
+                        "symbol": position.symbol,
+                        "side": position.side,
+                        "amount": float(position.amount),
+                        "entry_price": float(position.entry_price),
+                        "current_price": float(position.current_price),
+                        "unrealized_pnl": float(position.unrealized_pnl) if position.unrealized_pnl else None,
+                        "is_open": position.is_open,
+                        "created_at": position.created_at.isoformat(),
+                        "updated_at": position.updated_at.isoformat(),
+                        "closed_at": position.closed_at.isoformat() if position.closed_at else None
+                    })
+                self._after_commit(broadcast)
+
+            if unfinished:
+                # 未平完的持仓保持打开,下一轮继续平仓;本轮不结算
+                self.pair_unbalanced += 1
+                self.bot.total_profit += cycle_realized_pnl
+                await self._log_error(f"平仓未完成: {', '.join(unfinished)}")
+                if execution.unknown:
+                    await self._stop_for_unknown_orders(execution)
+                await self._checkpoint()
+                return False
+
+            # 检查点: 持仓已在交易所平仓,立即持久化平仓订单与持仓状态
+            await self._checkpoint()
 
             # 🔥 更新总收益
             self.bot.total_profit += cycle_realized_pnl
@@ -1005,12 +1237,13 @@ class BotEngine:
             self.bot.last_trade_spread = None
             self.bot.first_trade_spread = None
 
-            await self.db.commit()
-
             await self._log_trade(
                 f"平仓成功 - 本轮盈亏: {cycle_realized_pnl:.2f} USDT, "
                 f"总收益: {self.bot.total_profit:.2f} USDT"
+                + (f", 两腿时间差: {execution.leg_skew_ms}ms" if execution is not None else ""),
+                details={"execution": execution.get_stats()} if execution is not None else None
             )
+            await self._checkpoint()
 
             # 推送状态更新
             await self._broadcast_status_update({
@@ -1025,12 +1258,15 @@ class BotEngine:
             # 检查是否需要暂停
             if self.bot.pause_after_close:
                 await self.pause()
+            return True
 
+        except LeadershipLostError:
+            raise
         except Exception as e:
             logger.error(f"平仓失败: {str(e)}", exc_info=True)
             # 🔥 关键修复：记录错误但不调用 _log_error (避免在异常处理中再次操作数据库)
             try:
-                # 仅记录到数据库,不再 commit (会在外层 commit)
+                # 仅记录到数据库,由工作单元结束时统一提交
                 if self.db:
                     log = TradeLog(
                         bot_instance_id=self.bot.id,
@@ -1038,28 +1274,32 @@ class BotEngine:
                         message=f"平仓失败: {str(e)}"
                     )
                     self.db.add(log)
-                    # 不调用 commit(),避免嵌套事务问题
             except Exception as log_error:
                 logger.error(f"记录错误日志失败: {str(log_error)}")
+            return False
     
-    async def close_all_positions(self):
+    async def close_all_positions(self) -> bool:
         """
         公共平仓方法，供外部调用
         
         这个方法会触发平仓所有持仓的操作，
         与内部自动平仓使用相同的逻辑
+
+        Returns:
+            所有持仓是否已平仓
         """
-        await self._close_all_positions()
+        async with self._db_scope():
+            return await self._close_all_positions()
     
-    async def _log_trade(self, message: str):
+    async def _log_trade(self, message: str, details: Optional[dict] = None):
         """记录交易日志"""
         log = TradeLog(
             bot_instance_id=self.bot.id,
             log_type="trade",
-            message=message
+            message=message,
+            details=details
         )
         self.db.add(log)
-        await self.db.commit()
     
     def _get_websocket_manager(self):
         """获取WebSocket管理器实例"""
@@ -1116,7 +1356,6 @@ class BotEngine:
             message=message
         )
         self.db.add(log)
-        await self.db.commit()
     
     async def _create_or_update_position(
         self,
@@ -1185,24 +1424,24 @@ class BotEngine:
                         position.is_open = False
                         position.closed_at = datetime.utcnow()
                     position.updated_at = datetime.utcnow()
-                
-                await self.db.commit()
-                
-                # 推送持仓更新
-                await self._broadcast_position_update({
-                    "id": position.id,
-                    "bot_instance_id": position.bot_instance_id,
-                    "symbol": position.symbol,
-                    "side": position.side,
-                    "amount": float(position.amount),
-                    "entry_price": float(position.entry_price),
-                    "current_price": float(position.current_price),
-                    "unrealized_pnl": float(position.unrealized_pnl) if position.unrealized_pnl else None,
-                    "is_open": position.is_open,
-                    "created_at": position.created_at.isoformat(),
-                    "updated_at": position.updated_at.isoformat(),
-                    "closed_at": position.closed_at.isoformat() if position.closed_at else None
-                })
+
+                # 提交成功后推送持仓更新
+                async def broadcast():
+                    await self._broadcast_position_update({
+                        "id": position.id,
+                        "bot_instance_id": position.bot_instance_id,
+                        "symbol": position.symbol,
+                        "side": position.side,
+                        "amount": float(position.amount),
+                        "entry_price": float(position.entry_price),
+                        "current_price": float(position.current_price),
+                        "unrealized_pnl": float(position.unrealized_pnl) if position.unrealized_pnl else None,
+                        "is_open": position.is_open,
+                        "created_at": position.created_at.isoformat(),
+                        "updated_at": position.updated_at.isoformat(),
+                        "closed_at": position.closed_at.isoformat() if position.closed_at else None
+                    })
+                self._after_commit(broadcast)
             else:
                 # 创建新持仓
                 # 将订单方向转换为持仓方向
@@ -1220,29 +1459,30 @@ class BotEngine:
                     is_open=True
                 )
                 self.db.add(position)
-                await self.db.commit()
 
                 logger.info(
                     f"✅ 创建持仓: {order_data['symbol']}, "
                     f"订单方向={side}, 持仓方向={position_side}, "
                     f"数量={position.amount:.4f}, 入场价={actual_price:.2f} USDT"
                 )
-                
-                # 推送持仓更新
-                await self._broadcast_position_update({
-                    "id": position.id,
-                    "bot_instance_id": position.bot_instance_id,
-                    "symbol": position.symbol,
-                    "side": position.side,
-                    "amount": float(position.amount),
-                    "entry_price": float(position.entry_price),
-                    "current_price": float(position.current_price),
-                    "unrealized_pnl": float(position.unrealized_pnl) if position.unrealized_pnl else None,
-                    "is_open": position.is_open,
-                    "created_at": position.created_at.isoformat(),
-                    "updated_at": position.updated_at.isoformat(),
-                    "closed_at": position.closed_at.isoformat() if position.closed_at else None
-                })
+
+                # 持仓ID和创建时间在提交时生成,提交成功后再推送
+                async def broadcast():
+                    await self._broadcast_position_update({
+                        "id": position.id,
+                        "bot_instance_id": position.bot_instance_id,
+                        "symbol": position.symbol,
+                        "side": position.side,
+                        "amount": float(position.amount),
+                        "entry_price": float(position.entry_price),
+                        "current_price": float(position.current_price),
+                        "unrealized_pnl": float(position.unrealized_pnl) if position.unrealized_pnl else None,
+                        "is_open": position.is_open,
+                        "created_at": position.created_at.isoformat(),
+                        "updated_at": position.updated_at.isoformat(),
+                        "closed_at": position.closed_at.isoformat() if position.closed_at else None
+                    })
+                self._after_commit(broadcast)
         
         except Exception as e:
             logger.error(f"创建或更新持仓失败: {str(e)}", exc_info=True)
@@ -1252,6 +1492,7 @@ class BotEngine:
         """更新所有持仓的当前价格和未实现盈亏"""
         try:
             positions = await self._get_open_positions()
+            await self._release_connection()
 
             for position in positions:
                 # 从交易所获取实际持仓数据（包含真实的盈亏）
@@ -1294,23 +1535,25 @@ class BotEngine:
                         logger.error(f"更新价格失败: {str(inner_e)}")
                         continue
 
-                # 推送持仓更新
-                await self._broadcast_position_update({
-                    "id": position.id,
-                    "bot_instance_id": position.bot_instance_id,
-                    "symbol": position.symbol,
-                    "side": position.side,
-                    "amount": float(position.amount),
-                    "entry_price": float(position.entry_price),
-                    "current_price": float(position.current_price),
-                    "unrealized_pnl": float(position.unrealized_pnl) if position.unrealized_pnl else None,
-                    "is_open": position.is_open,
-                    "created_at": position.created_at.isoformat(),
-                    "updated_at": position.updated_at.isoformat(),
-                    "closed_at": position.closed_at.isoformat() if position.closed_at else None
-                })
-
-            await self.db.commit()
+                # 提交成功后推送持仓更新
+                async def broadcast(position=position):
+                    await self._broadcast_position_update({
+                        "id": position.id,
+                        "bot_instance_id": position.bot_instance_id,
+                        "symbol": position.symbol,
+                        "side": position.side,
+                        "amount": float(position.amount),
+                        "entry_price": float(position.entry_price),
+                        "current_price": float(position.current_price),
+                        "unrealized_pnl": float(position.unrealized_pnl) if position.unrealized_pnl else None,
+                        "is_open": position.is_open,
+                        "created_at": position.created_at.isoformat(),
+                        "updated_at": position.updated_at.isoformat(),
+                        "closed_at": position.closed_at.isoformat() if position.closed_at else None
+                    })
+                self._after_commit(broadcast)
+
+            # 修改随本轮循环统一提交,提交成功后推送(_get_open_positions 会过滤已标记关闭的持仓)
 
         except Exception as e:
             logger.error(f"更新持仓价格失败: {str(e)}", exc_info=True)
@@ -1323,14 +1566,88 @@ class BotEngine:
         self.cycle_times = []
         self.total_cycle_time = 0
 
+    def _init_scheduling_stats(self):
+        """初始化循环调度统计"""
+        self.ticks_received = 0
+        self._ticks_consumed = 0
+        self.ticks_coalesced = 0
+        self.event_cycles = 0
+        self.timeout_cycles = 0
+        self.tick_latencies = []  # 最近100次 行情到达 -> 开始评估 的延迟(秒)
+        # 两腿执行
+        self.leg_skews = []  # 最近100笔交易的两腿时间差(毫秒)
+        self.pair_executions = 0
+        self.pair_corrections = 0  # 补单/回滚订单数
+        self.pair_unbalanced = 0  # 处理后仍未平衡(开仓)或未完成(平仓)的次数
+
+    def get_state(self) -> dict:
+        """运行中机器人的实时状态(可跨进程传递)"""
+        return {
+            "bot_id": self.bot_id,
+            "status": self.bot.status,
+            "is_running": self.is_running,
+            "current_cycle": self.bot.current_cycle,
+            "current_dca_count": self.bot.current_dca_count,
+            "scheduling": self.get_scheduling_stats(),
+            "execution": self.get_execution_stats(),
+        }
+
+    def get_scheduling_stats(self) -> dict:
+        """获取循环调度统计"""
+        latencies = self.tick_latencies
+        return {
+            "mode": self.cycle_mode,
+            "cycles": self.cycle_count,
+            "db_commits": self.db_commits,
+            "ticks_received": self.ticks_received,
+            "ticks_coalesced": self.ticks_coalesced,
+            "event_cycles": self.event_cycles,
+            "timeout_cycles": self.timeout_cycles,
+            "avg_tick_latency": round(sum(latencies) / len(latencies), 4) if latencies else None,
+            "max_tick_latency": round(max(latencies), 4) if latencies else None,
+        }
+
+    def _record_execution(self, execution: PairExecution):
+        """记录一次两腿执行的统计"""
+        self.pair_executions += 1
+        self.pair_corrections += execution.corrections
+        if execution.leg_skew_ms is not None:
+            self.leg_skews.append(execution.leg_skew_ms)
+            if len(self.leg_skews) > 100:
+                self.leg_skews.pop(0)
+        logger.info(f"两腿执行: {execution.get_stats()}")
+
+    async def _stop_for_unknown_orders(self, execution: PairExecution):
+        """
+        有腿的订单状态无法确认时停止机器人,等待人工核对交易所持仓
+
+        未知的订单可能已成交但没有持仓记录,继续运行会按错误的持仓开平仓
+        """
+        legs = ", ".join(f"{leg.symbol} {leg.side} {leg.amount}" for leg in execution.legs if leg.unknown)
+        logger.error(f"[BotEngine] Bot {self.bot_id} 订单状态无法确认,停止机器人: {legs}")
+        self.is_running = False
+        self.bot.status = "stopped"
+        await self._log_error(f"订单状态无法确认,机器人已停止,请核对交易所持仓: {legs}")
+
+    def get_execution_stats(self) -> dict:
+        """获取两腿执行统计"""
+        skews = self.leg_skews
+        return {
+            "executions": self.pair_executions,
+            "corrections": self.pair_corrections,
+            "unbalanced": self.pair_unbalanced,
+            "last_leg_skew_ms": skews[-1] if skews else None,
+            "avg_leg_skew_ms": round(sum(skews) / len(skews), 1) if skews else None,
+            "max_leg_skew_ms": max(skews) if skews else None,
+        }
+
     def _start_cycle_timer(self):
         """开始循环计时"""
-        import time
         self.cycle_start_time = time.time()
+        self._last_cycle_at = time.monotonic()
 
     def _end_cycle_timer(self):
         """结束循环计时并记录"""
-        import time
         if self.cycle_start_time:
             cycle_time = time.time() - self.cycle_start_time
             self.cycle_times.append(cycle_time)
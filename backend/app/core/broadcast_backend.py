@@ -0,0 +1,224 @@
+"""
+WebSocket 广播后端
+
+ConnectionManager 通过广播后端把机器人事件分发给所有进程中的订阅者:
+- InProcessBroadcastBackend: 默认,只分发给本进程的连接
+- RedisBroadcastBackend: WS_BROADCAST_BACKEND=redis 时启用,经 Redis(REDIS_URL) pub/sub 分发给所有 API 进程
+
+Redis 后端先直接分发给本进程的连接,再由后台任务把消息发布到 Redis,
+发布方不等待网络;其他进程收到后分发给各自的连接,自己发布的消息会被忽略。
+"""
+import asyncio
+import json
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+from app.core.ws_sender import encode_message
+from app.utils.logger import setup_logger
+
+logger = setup_logger('broadcast_backend')
+
+# 本进程分发函数: (bot_id, message) -> None
+Deliver = Callable[[int, Dict[str, Any]], Awaitable[None]]
+
+
+class InProcessBroadcastBackend:
+    """进程内广播(单进程部署)"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+        self.published = 0
+
+    def bind(self, deliver: Deliver):
+        """绑定本进程的分发函数"""
+        self._deliver = deliver
+
+    async def start(self):
+        pass
+
+    async def publish(self, bot_id: int, message: Dict[str, Any]):
+        """分发一条机器人事件"""
+        self.published += 1
+        await self._deliver(bot_id, message)
+
+    async def stop(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "published": self.published}
+
+
+class RedisBroadcastBackend:
+    """经 Redis pub/sub 跨进程广播"""
+
+    name = "redis"
+
+    def __init__(
+        self,
+        url: str,
+        password: Optional[str] = None,
+        channel: Optional[str] = None,
+        max_pending: Optional[int] = None
+    ):
+        """
+        初始化 Redis 广播
+
+        Args:
+            url: Redis 地址
+            password: Redis 密码(可选)
+            channel: 发布/订阅频道,默认 WS_BROADCAST_CHANNEL
+            max_pending: 待发布消息上限,写满时丢弃最旧的消息,默认 WS_BROADCAST_MAX_PENDING
+        """
+        self.url = url
+        self.password = password or None
+        self.channel = channel or settings.WS_BROADCAST_CHANNEL
+        self.max_pending = max_pending or settings.WS_BROADCAST_MAX_PENDING
+        self.origin = uuid.uuid4().hex
+        self.reconnect_delay = 1.0
+        self.max_reconnect_delay = 30.0
+
+        self._deliver: Optional[Deliver] = None
+        self._redis = None
+        self._pending: Optional[asyncio.Queue] = None
+        self._publisher_task: Optional[asyncio.Task] = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+        # 统计
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def bind(self, deliver: Deliver):
+        """绑定本进程的分发函数"""
+        self._deliver = deliver
+
+    async def start(self):
+        """连接 Redis 并启动发布/订阅任务(幂等)"""
+        if self._listener_task is not None and not self._listener_task.done():
+            return
+
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(self.url, password=self.password)
+        self._pending = asyncio.Queue()
+        self._publisher_task = asyncio.create_task(self._publisher())
+        self._listener_task = asyncio.create_task(self._listener())
+        logger.info(f"[Broadcast] Redis 广播已启动: channel={self.channel}")
+
+    async def wait_subscribed(self, timeout: float = 5.0):
+        """等待订阅生效(用于启动检查和测试)"""
+        await asyncio.wait_for(self._subscribed.wait(), timeout=timeout)
+
+    async def publish(self, bot_id: int, message: Dict[str, Any]):
+        """分发给本进程连接,并放入待发布队列(不等待 Redis)"""
+        await self._deliver(bot_id, message)
+
+        if self._pending is None:
+            await self.start()
+        if self._pending.qsize() >= self.max_pending:
+            self._pending.get_nowait()
+            self.dropped += 1
+        self._pending.put_nowait(encode_message({"o": self.origin, "b": bot_id, "m": message}))
+
+    async def _publisher(self):
+        while True:
+            payload = await self._pending.get()
+            try:
+                await self._redis.publish(self.channel, payload)
+                self.published += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"[Broadcast] 发布到 Redis 失败: {str(e)}")
+
+    async def _listener(self):
+        delay = self.reconnect_delay
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                self._subscribed.set()
+                delay = self.reconnect_delay
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    await self._handle(item["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self._subscribed.clear()
+                logger.warning(f"[Broadcast] Redis 订阅中断, {delay:.0f}s 后重连: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def _handle(self, data):
+        try:
+            envelope = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if envelope.get("o") == self.origin:
+            # 本进程发布的消息已在 publish() 中分发
+            return
+        self.received += 1
+        try:
+            await self._deliver(int(envelope["b"]), envelope["m"])
+        except Exception as e:
+            logger.error(f"[Broadcast] 分发远程消息失败: {str(e)}")
+
+    async def stop(self):
+        """停止任务并关闭 Redis 连接"""
+        for task in (self._listener_task, self._publisher_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener_task = self._publisher_task = None
+        self._pending = None
+        self._subscribed.clear()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "channel": self.channel,
+            "subscribed": self._subscribed.is_set(),
+            "pending": self._pending.qsize() if self._pending is not None else 0,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+def create_broadcast_backend():
+    """根据配置创建广播后端: WS_BROADCAST_BACKEND=redis 时使用 Redis,否则进程内广播"""
+    backend = settings.WS_BROADCAST_BACKEND.lower()
+    if backend == "redis":
+        if not settings.REDIS_URL:
+            logger.warning("[Broadcast] WS_BROADCAST_BACKEND=redis 但未配置 REDIS_URL,使用进程内广播")
+            return InProcessBroadcastBackend()
+        try:
+            import redis.asyncio  # noqa: F401
+        except ImportError:
+            logger.warning("[Broadcast] WS_BROADCAST_BACKEND=redis 但未安装 redis,使用进程内广播")
+            return InProcessBroadcastBackend()
+        return RedisBroadcastBackend(settings.REDIS_URL, password=settings.REDIS_PASSWORD)
+    if backend != "memory":
+        logger.warning(f"[Broadcast] 未知的 WS_BROADCAST_BACKEND={settings.WS_BROADCAST_BACKEND},使用进程内广播")
+    return InProcessBroadcastBackend()
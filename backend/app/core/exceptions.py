@@ -129,6 +129,14 @@ class OrderExecutionError(BusinessLogicError):
         super().__init__(message, context)
 
 
+class OrderStatusUnknownError(OrderExecutionError):
+    """下单请求失败后多次查询仍无法确认订单是否已提交(不能补单或回滚,需人工核对交易所持仓)"""
+    
+    def __init__(self, message: str, symbol: Optional[str] = None, side: Optional[str] = None):
+        super().__init__(message, symbol=symbol, order_type="market", side=side)
+        self.error_code = "ORDER_STATUS_UNKNOWN"
+
+
 class BotEngineError(BusinessLogicError):
     """机器人引擎错误"""
     
@@ -146,6 +154,16 @@ class BotEngineError(BusinessLogicError):
         super().__init__(message, context)
 
 
+class LeadershipLostError(BotEngineError):
+    """当前实例不是主实例(或防护令牌已失效),不能运行交易引擎"""
+    
+    def __init__(self, message: str = "当前实例不是主实例", token: Optional[int] = None):
+        super().__init__(message, operation="leader_election")
+        self.error_code = "LEADERSHIP_LOST"
+        if token is not None:
+            self.details["token"] = token
+
+
 class WebSocketError(BaseCustomException):
     """WebSocket错误"""
     
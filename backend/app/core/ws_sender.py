@@ -0,0 +1,262 @@
+"""
+WebSocket 连接发送队列
+
+每个连接一个有界发送队列和一个写任务,广播方只负责入队,不等待网络发送:
+- 合并(conflate): 价差、持仓、状态这类"只关心最新值"的消息,队列中已有同类未发送消息时直接替换
+- 丢弃最旧(drop_oldest): 队列写满时丢弃最早入队的消息并计数
+- 驱逐: 单次发送超时,或队首消息积压超过最大延迟的连接会被关闭
+
+广播消息只编码一次(make_frame),所有连接发送同一个文本帧。
+安装 orjson 时使用 orjson 编码,否则回退到标准库 json。
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.config import settings
+from app.utils.logger import setup_logger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 为可选依赖
+    orjson = None
+
+logger = setup_logger('ws_sender')
+
+CONFLATE = "conflate"
+DROP_OLDEST = "drop_oldest"
+
+# 按消息类型的入队策略(未列出的类型使用 DROP_OLDEST)
+MESSAGE_POLICIES: Dict[str, str] = {
+    "spread_update": CONFLATE,
+    "position_update": CONFLATE,
+    "status_update": CONFLATE,
+    "order_update": DROP_OLDEST,
+}
+
+# 被驱逐连接的关闭码
+CLOSE_SLOW_CONSUMER = 4008
+
+
+def conflation_key(message: Dict[str, Any]) -> Optional[Hashable]:
+    """
+    合并键: 同一个键的未发送消息只保留最新一条
+
+    Returns:
+        合并键,不合并的消息返回 None
+    """
+    message_type = message.get("type")
+    if MESSAGE_POLICIES.get(message_type, DROP_OLDEST) != CONFLATE:
+        return None
+    data = message.get("data") or {}
+    if message_type == "position_update":
+        # 每个持仓独立合并
+        return (message_type, data.get("bot_instance_id"), data.get("id"))
+    return (message_type, data.get("bot_instance_id"))
+
+
+def _json_default(value: Any):
+    # Decimal、datetime 等按字符串输出
+    return str(value)
+
+
+def encode_message(message: Dict[str, Any]) -> str:
+    """把消息编码为 JSON 文本"""
+    if orjson is not None:
+        return orjson.dumps(message, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+class Frame:
+    """已编码的消息帧: 合并键 + JSON 文本,可以直接放入多个连接的队列"""
+
+    __slots__ = ("key", "text")
+
+    def __init__(self, key: Optional[Hashable], text: str):
+        self.key = key
+        self.text = text
+
+
+def make_frame(message: Dict[str, Any]) -> Frame:
+    """计算合并键并编码消息(每条广播只执行一次)"""
+    return Frame(conflation_key(message), encode_message(message))
+
+
+class ConnectionSender:
+    """单个 WebSocket 连接的发送队列与写任务"""
+
+    def __init__(
+        self,
+        websocket,
+        max_queue: Optional[int] = None,
+        send_timeout: Optional[float] = None,
+        max_lag: Optional[float] = None,
+        on_evict: Optional[Callable[["ConnectionSender", str], Awaitable[None]]] = None
+    ):
+        """
+        初始化发送队列
+
+        Args:
+            websocket: FastAPI WebSocket(需要 send_text/close)
+            max_queue: 队列上限,默认 WS_SEND_QUEUE_SIZE
+            send_timeout: 单次发送超时(秒),默认 WS_SEND_TIMEOUT
+            max_lag: 队首消息允许的最大积压时间(秒),默认 WS_MAX_LAG_SECONDS
+            on_evict: 连接被驱逐后的回调(用于从管理器中移除)
+        """
+        self.websocket = websocket
+        self.max_queue = max_queue or settings.WS_SEND_QUEUE_SIZE
+        self.send_timeout = send_timeout or settings.WS_SEND_TIMEOUT
+        self.max_lag = max_lag or settings.WS_MAX_LAG_SECONDS
+        self.on_evict = on_evict
+
+        # 键 -> (入队时间, JSON 文本); 不合并的消息使用唯一序号作为键
+        self._queue: "OrderedDict[Hashable, Tuple[float, str]]" = OrderedDict()
+        self._seq = count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.evicted_reason: Optional[str] = None
+
+        # 统计
+        self.sent = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.max_lag_ms = 0.0
+        self.total_send_ms = 0.0
+
+    def start(self):
+        """启动写任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    def enqueue(self, message: Dict[str, Any]) -> bool:
+        """
+        放入一条消息(不等待发送)
+
+        Returns:
+            是否入队(连接已关闭或被驱逐时返回 False)
+        """
+        return self.enqueue_frame(make_frame(message))
+
+    def enqueue_frame(self, frame: Frame) -> bool:
+        """
+        放入一个已编码的消息帧(广播时所有连接共用同一个帧)
+
+        Returns:
+            是否入队(连接已关闭或被驱逐时返回 False)
+        """
+        if self.closed:
+            return False
+
+        now = time.monotonic()
+        key = frame.key
+        if key is not None and key in self._queue:
+            # 合并: 保留原位置和入队时间,只替换为最新内容
+            enqueued_at, _ = self._queue[key]
+            self._queue[key] = (enqueued_at, frame.text)
+            self.conflated += 1
+            return True
+
+        if key is None:
+            key = ("seq", next(self._seq))
+
+        if len(self._queue) >= self.max_queue:
+            self._queue.popitem(last=False)
+            self.dropped += 1
+
+        self._queue[key] = (now, frame.text)
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._wakeup.set()
+
+        # 队首积压过久: 消费方跟不上,驱逐
+        if self.lag() > self.max_lag:
+            self._schedule_evict(f"积压超过 {self.max_lag}s")
+        return True
+
+    def lag(self) -> float:
+        """队首消息已等待的时间(秒)"""
+        if not self._queue:
+            return 0.0
+        enqueued_at, _ = next(iter(self._queue.values()))
+        return time.monotonic() - enqueued_at
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                _, (enqueued_at, text) = self._queue.popitem(last=False)
+                started = time.monotonic()
+                self.max_lag_ms = max(self.max_lag_ms, (started - enqueued_at) * 1000)
+                try:
+                    await asyncio.wait_for(self.websocket.send_text(text), timeout=self.send_timeout)
+                except asyncio.TimeoutError:
+                    await self._evict(f"发送超时 {self.send_timeout}s")
+                    return
+                except Exception as e:
+                    # 连接已断开
+                    logger.debug(f"[WS] 发送失败,停止写任务: {str(e)}")
+                    self.closed = True
+                    if self.on_evict:
+                        await self.on_evict(self, "发送失败")
+                    return
+                self.sent += 1
+                self.total_send_ms += (time.monotonic() - started) * 1000
+        except asyncio.CancelledError:
+            pass
+
+    def _schedule_evict(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        asyncio.create_task(self._evict(reason))
+
+    async def _evict(self, reason: str):
+        """关闭过慢的连接"""
+        self.closed = True
+        self.evicted_reason = reason
+        self._queue.clear()
+        logger.warning(f"[WS] 驱逐慢速连接: {reason}")
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        try:
+            await asyncio.wait_for(
+                self.websocket.close(code=CLOSE_SLOW_CONSUMER, reason="消费过慢"),
+                timeout=self.send_timeout
+            )
+        except Exception:
+            pass
+        if self.on_evict:
+            await self.on_evict(self, reason)
+
+    async def close(self):
+        """停止写任务并丢弃未发送的消息"""
+        self.closed = True
+        self._queue.clear()
+        if self._task is not None and self._task is not asyncio.current_task() and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """连接发送统计: 队列深度与延迟"""
+        return {
+            "queue_depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "lag_ms": round(self.lag() * 1000, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "sent": self.sent,
+            "conflated": self.conflated,
+            "dropped": self.dropped,
+            "avg_send_ms": round(self.total_send_ms / self.sent, 2) if self.sent else 0,
+            "evicted": self.evicted_reason,
+        }
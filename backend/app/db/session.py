@@ -1,8 +1,13 @@
 """
 数据库会话管理
 """
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from app.config import settings
+from app.db.sqlite import install_sqlite_pragmas, is_sqlite_url
 
 # 创建异步数据库引擎
 engine = create_async_engine(
@@ -13,6 +18,71 @@ engine = create_async_engine(
     pool_pre_ping=True,  # 连接池预检查
 )
 
+# SQLite: 在每个连接上设置 WAL 等 PRAGMA
+if is_sqlite_url(settings.DATABASE_URL_ASYNC):
+    install_sqlite_pragmas(engine)
+
+
+class _PoolUsage:
+    """连接池使用统计(借出次数、峰值占用、借用时长)"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.total_hold_time = 0.0
+        self.max_hold_time = 0.0
+
+
+pool_usage = _PoolUsage()
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_usage.checkouts += 1
+    pool_usage.checked_out += 1
+    pool_usage.peak_checked_out = max(pool_usage.peak_checked_out, pool_usage.checked_out)
+    connection_record.info["checkout_at"] = time.monotonic()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    checkout_at = connection_record.info.pop("checkout_at", None)
+    if checkout_at is None:
+        return
+    pool_usage.checked_out -= 1
+    hold_time = time.monotonic() - checkout_at
+    pool_usage.total_hold_time += hold_time
+    pool_usage.max_hold_time = max(pool_usage.max_hold_time, hold_time)
+
+
+def get_pool_status() -> Dict[str, Any]:
+    """
+    获取数据库连接池使用情况
+
+    Returns:
+        连接池容量、当前占用、峰值占用以及连接平均/最长借用时长
+    """
+    pool = engine.pool
+    status: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if hasattr(pool, "size"):
+        status.update({
+            "pool_size": pool.size(),
+            "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+
+    status.update({
+        "checked_out": pool_usage.checked_out,
+        "peak_checked_out": pool_usage.peak_checked_out,
+        "checkouts": pool_usage.checkouts,
+        "avg_hold_ms": round(pool_usage.total_hold_time / pool_usage.checkouts * 1000, 2) if pool_usage.checkouts else 0,
+        "max_hold_ms": round(pool_usage.max_hold_time * 1000, 2),
+    })
+    return status
+
+
 # 创建会话工厂
 AsyncSessionLocal = async_sessionmaker(
     engine,
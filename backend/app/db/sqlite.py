@@ -0,0 +1,56 @@
+"""
+SQLite 性能配置
+
+在每个新建的 SQLite 连接上设置 PRAGMA:
+- journal_mode=WAL: 读写互不阻塞
+- synchronous: WAL 模式下 NORMAL 即可保证崩溃一致性,减少 fsync
+- busy_timeout: 遇到写锁时等待而不是立即报 "database is locked"
+- cache_size / mmap_size: 加大页缓存并启用内存映射读取
+"""
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+
+
+def is_sqlite_url(url: str) -> bool:
+    """数据库地址是否为 SQLite"""
+    return str(url).startswith("sqlite")
+
+
+def get_sqlite_pragmas() -> Dict[str, str]:
+    """根据配置生成 PRAGMA 列表"""
+    pragmas = {
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": str(settings.SQLITE_BUSY_TIMEOUT_MS),
+        # 负数表示以 KiB 为单位
+        "cache_size": str(-settings.SQLITE_CACHE_SIZE_KB),
+        "mmap_size": str(settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024),
+        "temp_store": "MEMORY",
+    }
+    if settings.SQLITE_WAL:
+        # journal_mode 需要最先设置
+        pragmas = {"journal_mode": "WAL", **pragmas}
+    return pragmas
+
+
+def install_sqlite_pragmas(engine: AsyncEngine, pragmas: Optional[Dict[str, str]] = None):
+    """
+    为引擎注册连接事件,在每个新连接上执行 PRAGMA
+
+    Args:
+        engine: 异步数据库引擎
+        pragmas: PRAGMA 名称 -> 值(默认读取配置)
+    """
+    pragmas = pragmas if pragmas is not None else get_sqlite_pragmas()
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
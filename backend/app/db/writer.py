@@ -0,0 +1,211 @@
+"""
+串行写入任务
+
+SQLite 同一时刻只允许一个写事务,多个协程同时提交时会互相等待写锁。
+SerializedWriter 把所有写操作放入队列,由单个后台任务依次执行:
+- 写事务之间不再争抢锁,也不会出现 busy_timeout 超时
+- 配合 WAL,读操作不受写操作影响
+
+注意: 交给写入任务的会话在提交前不能自行 flush(否则写锁会在队列外被持有)。
+写入任务自己创建的会话使用独立的单连接引擎,不与主连接池争抢连接
+(否则排队中的会话占满连接池时写入任务会拿不到连接)。
+非 SQLite 数据库或关闭 SQLITE_SERIALIZED_WRITER 时直接在调用方执行。
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.config import settings
+from app.db.sqlite import install_sqlite_pragmas, is_sqlite_url
+from app.utils.logger import setup_logger
+
+logger = setup_logger('db_writer')
+
+
+class _WriteJob:
+    def __init__(self, fn: Callable[..., Awaitable[Any]], args: tuple):
+        self.fn = fn
+        self.args = args
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.perf_counter()
+        self.started = False
+
+
+class SerializedWriter:
+    """单任务串行写入器"""
+
+    def __init__(self, enabled: bool = True, database_url: Optional[str] = None):
+        """
+        初始化写入器
+
+        Args:
+            enabled: 是否启用串行写入(关闭时 run() 直接执行)
+            database_url: submit() 使用的数据库地址(默认 DATABASE_URL_ASYNC)
+        """
+        self.enabled = enabled
+        self.database_url = database_url or settings.DATABASE_URL_ASYNC
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._engine = None
+        self._session_factory = None
+
+        # 统计
+        self.jobs = 0
+        self.errors = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.total_exec_ms = 0.0
+        self.max_exec_ms = 0.0
+
+    def _in_writer(self) -> bool:
+        return self._task is not None and asyncio.current_task() is self._task
+
+    def start(self):
+        """启动写入任务(幂等)"""
+        if (
+            self._task is None
+            or self._task.done()
+            or self._task.get_loop() is not asyncio.get_running_loop()
+        ):
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._worker())
+            logger.info("[DBWriter] 串行写入任务已启动")
+
+    async def run(self, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        在写入任务中执行一个写操作并等待结果
+
+        Args:
+            fn: 异步函数,例如 session.commit
+            *args: 传给 fn 的参数
+
+        Returns:
+            fn 的返回值
+        """
+        if not self.enabled or self._in_writer():
+            return await fn(*args)
+
+        self.start()
+        job = _WriteJob(fn, args)
+        await self._queue.put(job)
+
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            # 调用方被取消: 未开始的任务直接丢弃,已开始的等待其结束,避免会话被并发使用
+            if job.started:
+                await asyncio.wait({job.future})
+            else:
+                job.future.cancel()
+            raise
+
+    async def commit(self, session: AsyncSession):
+        """在写入任务中提交会话(包括未刷新的修改)"""
+        if self.enabled and not self._in_writer():
+            # 入队前先取得连接: 写入任务内不再向连接池借连接,
+            # 避免排队中的会话占满连接池时写入任务被阻塞
+            await session.connection()
+        await self.run(session.commit)
+
+    async def submit(self, fn: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        """
+        在写入任务中用新会话执行 fn(session) 并提交
+
+        Args:
+            fn: 接收会话的异步函数,例如执行批量插入或 UPDATE 语句
+
+        Returns:
+            fn 的返回值
+        """
+        async def job():
+            async with self._get_session_factory()() as session:
+                result = await fn(session)
+                await session.commit()
+                return result
+
+        return await self.run(job)
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            if self.enabled:
+                # 写入任务专用的单连接引擎
+                self._engine = create_async_engine(
+                    self.database_url, pool_size=1, max_overflow=0, pool_pre_ping=True
+                )
+                if is_sqlite_url(self.database_url):
+                    install_sqlite_pragmas(self._engine)
+                self._session_factory = async_sessionmaker(
+                    self._engine, class_=AsyncSession, expire_on_commit=False
+                )
+            else:
+                from app.db.session import AsyncSessionLocal
+                self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    async def _worker(self):
+        while True:
+            job: Optional[_WriteJob] = await self._queue.get()
+            if job is None:
+                # 停止信号: 之前入队的写操作均已执行
+                break
+            if job.future.done():
+                continue
+
+            job.started = True
+            started = time.perf_counter()
+            wait_ms = (started - job.enqueued_at) * 1000
+            try:
+                result = await job.fn(*job.args)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                self.errors += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+
+            exec_ms = (time.perf_counter() - started) * 1000
+            self.jobs += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.total_exec_ms += exec_ms
+            self.max_exec_ms = max(self.max_exec_ms, exec_ms)
+
+    async def stop(self):
+        """执行完队列中已有的写操作后停止"""
+        if self._task is None:
+            return
+
+        if not self._task.done() and self._task.get_loop() is asyncio.get_running_loop():
+            await self._queue.put(None)
+            await self._task
+        self._task = None
+
+        if self._engine is not None:
+            await self._engine.dispose()
+        logger.info("[DBWriter] 串行写入任务已停止")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """写入统计: 排队等待与执行耗时"""
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": self.jobs,
+            "errors": self.errors,
+            "avg_wait_ms": round(self.total_wait_ms / self.jobs, 2) if self.jobs else 0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+            "avg_exec_ms": round(self.total_exec_ms / self.jobs, 2) if self.jobs else 0,
+            "max_exec_ms": round(self.max_exec_ms, 2),
+        }
+
+
+# 全局串行写入器(仅 SQLite 启用)
+db_writer = SerializedWriter(
+    enabled=settings.SQLITE_SERIALIZED_WRITER and is_sqlite_url(settings.DATABASE_URL_ASYNC)
+)
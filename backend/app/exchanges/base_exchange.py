@@ -1,11 +1,31 @@
 """
 交易所抽象基类
 """
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Any
 from decimal import Decimal
 import ccxt.async_support as ccxt
 
+from app.config import settings
+from app.exchanges.order_stream import OrderStream, get_order_stream
+from app.exchanges.rate_governor import RateGovernor, get_rate_governor
+from app.exchanges.ticker_stream import TickerStream, get_ticker_stream
+from app.utils.logger import setup_logger
+
+logger = setup_logger('base_exchange')
+
+# 订单最终状态(CCXT 统一状态)
+FINAL_ORDER_STATUSES = ('closed', 'canceled', 'expired', 'rejected')
+
+# 回退查询订单的首次间隔(秒),之后倍增
+ORDER_POLL_INITIAL_DELAY = 0.2
+
+
+def is_final_order(order: Dict[str, Any]) -> bool:
+    """订单是否已到达最终状态(成交/撤销等,之后不再变化)"""
+    return order.get('status') in FINAL_ORDER_STATUSES
+
 
 class BaseExchange(ABC):
     """
@@ -14,6 +34,11 @@ class BaseExchange(ABC):
     所有交易所适配器都需要继承此类并实现抽象方法
     """
     
+    # 交易所名称(与 ExchangeFactory.EXCHANGES 的键一致)
+    exchange_name: str = ''
+    # 是否支持一次请求批量下单(create_market_orders)
+    supports_batch_orders: bool = False
+    
     def __init__(self, api_key: str, api_secret: str, passphrase: Optional[str] = None):
         """
         初始化交易所
@@ -26,7 +51,15 @@ class BaseExchange(ABC):
         self.api_key = api_key
         self.api_secret = api_secret
         self.passphrase = passphrase
+        # 账户级限频(同一 API Key 的所有实例共用),为None时只有 CCXT 自带的限频
+        self.rate_governor: Optional[RateGovernor] = get_rate_governor(
+            self.exchange_name, api_key, getattr(self, 'is_testnet', False)
+        )
         self.exchange = self._init_exchange()
+        # 公共行情推送(WebSocket), 为None时行情只走REST
+        self.ticker_stream: Optional[TickerStream] = None
+        # 私有订单推送(WebSocket), 为None时下单后查询订单获取成交
+        self.order_stream: Optional[OrderStream] = None
     
     @abstractmethod
     def _init_exchange(self) -> ccxt.Exchange:
@@ -79,6 +112,28 @@ class BaseExchange(ABC):
         """
         pass
     
+    async def create_market_orders(self, orders: List[Dict[str, Any]]) -> List[Any]:
+        """
+        批量创建市价订单
+        
+        支持批量接口的交易所(supports_batch_orders)在一次请求中提交,默认逐个同时下单
+        
+        Args:
+            orders: [{"symbol", "side", "amount", "reduce_only"}]
+            
+        Returns:
+            与 orders 顺序一致的订单信息;单个订单失败时对应位置为异常
+        """
+        return await asyncio.gather(
+            *(
+                self.create_market_order(
+                    order['symbol'], order['side'], order['amount'], reduce_only=order.get('reduce_only', False)
+                )
+                for order in orders
+            ),
+            return_exceptions=True
+        )
+    
     @abstractmethod
     async def create_limit_order(
         self,
@@ -203,6 +258,142 @@ class BaseExchange(ABC):
         """
         pass
     
+    def enable_ticker_stream(self, url: Optional[str] = None) -> Optional[TickerStream]:
+        """
+        启用公共行情推送
+
+        同一交易所(及测试网标识)的所有实例共享一条 WebSocket 连接
+        
+        Args:
+            url: 自定义 WebSocket 地址(可选,用于测试)
+            
+        Returns:
+            行情推送实例,交易所不支持推送时返回None
+        """
+        if self.ticker_stream is None:
+            self.ticker_stream = get_ticker_stream(
+                self.exchange_name,
+                getattr(self, 'is_testnet', False),
+                url=url,
+                proxy=getattr(self, 'proxy', None)
+            )
+        return self.ticker_stream
+    
+    async def _get_streamed_ticker(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """
+        从行情推送缓存读取行情
+        
+        Returns:
+            行情数据,未启用推送、尚未收到数据或数据过期时返回None(调用方回退到REST)
+        """
+        if self.ticker_stream is None:
+            return None
+        
+        await self.ticker_stream.subscribe(symbol)
+        ticker = self.ticker_stream.get_ticker(symbol, settings.TICKER_STREAM_MAX_AGE)
+        return dict(ticker) if ticker is not None else None
+    
+    def enable_order_stream(self, url: Optional[str] = None) -> Optional[OrderStream]:
+        """
+        启用私有订单推送
+
+        同一账户(API Key)的所有实例共享一条 WebSocket 连接
+        
+        Args:
+            url: 自定义 WebSocket 地址(可选,用于测试)
+            
+        Returns:
+            订单推送实例,交易所不支持推送时返回None
+        """
+        if self.order_stream is None:
+            self.order_stream = get_order_stream(
+                self.exchange_name,
+                self.api_key,
+                getattr(self, 'is_testnet', False),
+                lambda: self._create_order_stream(url)
+            )
+        if self.order_stream is not None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # 没有运行中的事件循环时,首次等待成交时再连接
+                return self.order_stream
+            self.order_stream.start()
+        return self.order_stream
+    
+    def _create_order_stream(self, url: Optional[str] = None) -> Optional[OrderStream]:
+        """
+        创建本账户的私有订单推送连接
+        
+        Returns:
+            订单推送实例,交易所不支持时返回None
+        """
+        return None
+    
+    def _parse_stream_order(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """将推送的原始订单数据转换为 get_order 的格式"""
+        raise NotImplementedError
+    
+    async def wait_for_fill(self, order: Dict[str, Any], symbol: str) -> Dict[str, Any]:
+        """
+        等待订单到达最终状态(成交/撤销)
+        
+        优先等待私有订单推送(最长 ORDER_STREAM_FILL_TIMEOUT 秒);推送未启用、未就绪、
+        断线或超时时按倍增间隔查询订单,总时长 ORDER_FILL_POLL_TIMEOUT 秒
+        
+        Args:
+            order: 下单返回的订单信息
+            symbol: 交易对符号
+            
+        Returns:
+            订单信息(格式同 get_order);超时仍未完成时为最后一次查询结果,
+            查询全部失败时为下单返回的订单信息
+        """
+        if is_final_order(order):
+            return order
+        
+        if self.order_stream is not None:
+            self.order_stream.start()
+            raw = await self.order_stream.wait_for_final(order['id'], settings.ORDER_STREAM_FILL_TIMEOUT)
+            if raw is not None:
+                try:
+                    filled = self._parse_stream_order(raw)
+                    # 与下单返回的交易对符号保持一致
+                    filled['symbol'] = order.get('symbol') or filled['symbol']
+                    return filled
+                except Exception as e:
+                    logger.warning(f"解析推送订单失败 {order['id']}: {str(e)}, 回退到查询")
+        
+        return await self._poll_order(order, symbol)
+    
+    async def _poll_order(self, order: Dict[str, Any], symbol: str) -> Dict[str, Any]:
+        """按倍增间隔查询订单,直到最终状态或超时"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.ORDER_FILL_POLL_TIMEOUT
+        delay = ORDER_POLL_INITIAL_DELAY
+        latest = order
+        while True:
+            await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+            try:
+                latest = await self.get_order(order['id'], symbol)
+                if is_final_order(latest):
+                    return latest
+            except Exception as e:
+                logger.warning(f"查询订单状态失败 {order['id']}: {str(e)}")
+            if loop.time() >= deadline:
+                return latest
+            delay *= 2
+    
+    async def _throttle(self, endpoint: str):
+        """
+        请求前取得账户限频令牌
+        
+        Args:
+            endpoint: 接口类别(order/query_order/positions/balance/leverage/market)
+        """
+        if self.rate_governor is not None:
+            await self.rate_governor.acquire(endpoint)
+    
     async def close(self):
         """关闭交易所连接"""
         if self.exchange:
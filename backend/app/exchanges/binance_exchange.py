@@ -6,7 +6,9 @@ import asyncio
 from typing import Dict, List, Optional, Any
 from decimal import Decimal
 
-from app.exchanges.base_exchange import BaseExchange
+from app.exchanges.base_exchange import BaseExchange, is_final_order
+from app.exchanges.order_stream import BinanceOrderStream, OrderStream
+from app.exchanges.singleflight import coalesced_read, invalidates_reads
 from app.utils.logger import setup_logger
 
 logger = setup_logger('binance_exchange')
@@ -15,6 +17,8 @@ logger = setup_logger('binance_exchange')
 class BinanceExchange(BaseExchange):
     """Binance交易所适配器"""
     
+    exchange_name = 'binance'
+    
     def __init__(self, api_key: str, api_secret: str, passphrase: Optional[str] = None, is_testnet: bool = True):
         """
         初始化Binance交易所
@@ -33,7 +37,7 @@ class BinanceExchange(BaseExchange):
         config = {
             'apiKey': self.api_key,
             'secret': self.api_secret,
-            'enableRateLimit': True,
+            'enableRateLimit': self.rate_governor is None,  # 启用账户级限频时不再使用 CCXT 单实例限频
             'options': {
                 'defaultType': 'future',  # 使用USDT永续合约
                 'adjustForTimeDifference': True,  # 自动调整时间差
@@ -59,7 +63,13 @@ class BinanceExchange(BaseExchange):
         Returns:
             行情数据
         """
+        # 优先使用WebSocket推送的行情,推送不可用时回退到REST
+        streamed = await self._get_streamed_ticker(symbol)
+        if streamed is not None:
+            return streamed
+        
         try:
+            await self._throttle("market")
             ticker = await self.exchange.fetch_ticker(symbol)
             return {
                 'symbol': symbol,
@@ -73,6 +83,7 @@ class BinanceExchange(BaseExchange):
             logger.error(f"获取行情失败 {symbol}: {str(e)}")
             raise
     
+    @invalidates_reads
     async def create_market_order(
         self,
         symbol: str,
@@ -94,6 +105,7 @@ class BinanceExchange(BaseExchange):
             if reduce_only:
                 params['reduceOnly'] = True
             
+            await self._throttle("order")
             order = await self.exchange.create_order(
                 symbol=symbol,
                 type='market',
@@ -109,6 +121,7 @@ class BinanceExchange(BaseExchange):
             logger.error(f"创建市价订单失败 {symbol}: {str(e)}")
             raise
     
+    @invalidates_reads
     async def create_limit_order(
         self,
         symbol: str,
@@ -123,6 +136,7 @@ class BinanceExchange(BaseExchange):
             if reduce_only:
                 params['reduceOnly'] = True
             
+            await self._throttle("order")
             order = await self.exchange.create_order(
                 symbol=symbol,
                 type='limit',
@@ -138,9 +152,11 @@ class BinanceExchange(BaseExchange):
             logger.error(f"创建限价订单失败 {symbol}: {str(e)}")
             raise
     
+    @invalidates_reads
     async def cancel_order(self, order_id: str, symbol: str) -> Dict[str, Any]:
         """取消订单"""
         try:
+            await self._throttle("order")
             result = await self.exchange.cancel_order(order_id, symbol)
             logger.info(f"取消订单成功: {order_id}")
             return result
@@ -148,18 +164,23 @@ class BinanceExchange(BaseExchange):
             logger.error(f"取消订单失败 {order_id}: {str(e)}")
             raise
     
+    # 未完成订单的状态变化快,只合并进行中的查询
+    @coalesced_read(reusable=is_final_order)
     async def get_order(self, order_id: str, symbol: str) -> Dict[str, Any]:
         """查询订单状态"""
         try:
+            await self._throttle("query_order")
             order = await self.exchange.fetch_order(order_id, symbol)
             return self._format_order(order)
         except Exception as e:
             logger.error(f"查询订单失败 {order_id}: {str(e)}")
             raise
     
+    @coalesced_read
     async def get_position(self, symbol: str) -> Optional[Dict[str, Any]]:
         """获取指定交易对的持仓"""
         try:
+            await self._throttle("positions")
             positions = await self.exchange.fetch_positions([symbol])
             if not positions:
                 return None
@@ -174,9 +195,11 @@ class BinanceExchange(BaseExchange):
             logger.error(f"获取持仓失败 {symbol}: {str(e)}")
             raise
     
+    @coalesced_read
     async def get_all_positions(self) -> List[Dict[str, Any]]:
         """获取所有持仓"""
         try:
+            await self._throttle("positions")
             positions = await self.exchange.fetch_positions()
             return [
                 self._format_position(pos)
@@ -187,9 +210,11 @@ class BinanceExchange(BaseExchange):
             logger.error(f"获取所有持仓失败: {str(e)}")
             raise
     
+    @invalidates_reads
     async def set_leverage(self, symbol: str, leverage: int) -> Dict[str, Any]:
         """设置杠杆倍数"""
         try:
+            await self._throttle("leverage")
             result = await self.exchange.set_leverage(leverage, symbol)
             logger.info(f"设置杠杆成功: {symbol} {leverage}x")
             return result
@@ -197,9 +222,11 @@ class BinanceExchange(BaseExchange):
             logger.error(f"设置杠杆失败 {symbol}: {str(e)}")
             raise
     
+    @coalesced_read
     async def get_balance(self) -> Dict[str, Any]:
         """获取账户余额"""
         try:
+            await self._throttle("balance")
             balance = await self.exchange.fetch_balance()
             return {
                 'total': balance.get('total', {}),
@@ -227,6 +254,7 @@ class BinanceExchange(BaseExchange):
         """
         try:
             # 使用5分钟K线，获取目标时间附近的数据
+            await self._throttle("market")
             ohlcv = await self.exchange.fetch_ohlcv(
                 symbol=symbol,
                 timeframe='5m',
@@ -265,6 +293,21 @@ class BinanceExchange(BaseExchange):
             logger.error(f"获取历史价格失败 {symbol} @ {timestamp}: {str(e)}")
             return None
     
+    def _create_order_stream(self, url: Optional[str] = None) -> Optional[OrderStream]:
+        """Binance U本位合约用户数据流"""
+        if url is None:
+            url = BinanceOrderStream.DEMO_URL if self.is_testnet else BinanceOrderStream.LIVE_URL
+        return BinanceOrderStream(url, self._create_listen_key)
+    
+    async def _create_listen_key(self) -> str:
+        """创建(或延长)用户数据流 listenKey"""
+        response = await self.exchange.fapiPrivatePostListenKey()
+        return response['listenKey']
+    
+    def _parse_stream_order(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """推送已转换为 REST 订单字段,由 CCXT 解析"""
+        return self._format_order(self.exchange.parse_order(raw))
+    
     def _format_order(self, order: Dict) -> Dict[str, Any]:
         """格式化订单数据"""
         def safe_decimal(value, default=None):
@@ -90,7 +90,17 @@ class ExchangeFactory:
             
             logger.info(f"Binance 配置: testnet={is_testnet}")
         
-        return exchange_class(**kwargs)
+        exchange = exchange_class(**kwargs)
+        
+        # 启用公共行情推送(WebSocket)
+        if settings.TICKER_STREAM_ENABLED:
+            exchange.enable_ticker_stream()
+        
+        # 启用私有订单推送(WebSocket)
+        if settings.ORDER_STREAM_ENABLED:
+            exchange.enable_order_stream()
+        
+        return exchange
     
     @staticmethod
     def get_supported_exchanges() -> list[str]:
@@ -0,0 +1,202 @@
+"""
+交易所客户端共享注册表
+
+同一交易所账户的机器人引擎、数据同步、平仓和交易对查询共用一个交易所实例(一个 CCXT 客户端):
+- 按账户(及其密钥指纹,密钥修改后使用新客户端)引用计数
+- 首次创建时加载一次市场信息,之后的使用方直接复用缓存
+- 最后一个使用方释放时关闭客户端
+
+用法:
+    exchange = await exchange_registry.acquire(account)
+    ...
+    await exchange_registry.release(exchange)
+
+    # 或
+    async with exchange_registry.lease(account) as exchange:
+        ...
+"""
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from app.exchanges.base_exchange import BaseExchange
+from app.exchanges.exchange_factory import ExchangeFactory
+from app.models.exchange_account import ExchangeAccount
+from app.utils.encryption import decrypt_key
+from app.utils.logger import setup_logger
+
+logger = setup_logger('exchange_registry')
+
+RegistryKey = Tuple[int, str]
+
+
+def create_account_exchange(account: ExchangeAccount) -> BaseExchange:
+    """按交易所账户创建交易所实例(解密密钥)"""
+    return ExchangeFactory.create(
+        exchange_name=account.exchange_name,
+        api_key=decrypt_key(account.api_key),
+        api_secret=decrypt_key(account.api_secret),
+        passphrase=decrypt_key(account.passphrase) if account.passphrase else None,
+        is_testnet=account.is_testnet
+    )
+
+
+class _Entry:
+    """一个账户的共享客户端"""
+
+    def __init__(self, key: RegistryKey):
+        self.key = key
+        self.exchange: Optional[BaseExchange] = None
+        self.refs = 0
+        self.ready = asyncio.Event()
+        self.error: Optional[BaseException] = None
+
+
+class ExchangeRegistry:
+    """按交易所账户共享、引用计数的交易所客户端"""
+
+    def __init__(self, factory: Optional[Callable[[ExchangeAccount], BaseExchange]] = None):
+        """
+        Args:
+            factory: 根据账户创建交易所实例,默认 create_account_exchange
+        """
+        self._factory = factory or create_account_exchange
+        self._entries: Dict[RegistryKey, _Entry] = {}
+        self._by_client: Dict[int, _Entry] = {}
+
+        # 统计
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+
+    @staticmethod
+    def make_key(account: ExchangeAccount) -> RegistryKey:
+        """账户ID + 密钥指纹(密钥修改后不再复用旧客户端)"""
+        fingerprint = hashlib.sha256("\x00".join([
+            account.exchange_name or "",
+            account.api_key or "",
+            account.api_secret or "",
+            account.passphrase or "",
+            str(bool(account.is_testnet)),
+        ]).encode()).hexdigest()[:16]
+        return account.id, fingerprint
+
+    async def acquire(self, account: ExchangeAccount) -> BaseExchange:
+        """
+        获取账户的共享交易所实例(引用计数 +1),使用完毕后调用 release()
+
+        Args:
+            account: 交易所账户
+
+        Returns:
+            交易所实例(不要直接调用其 close())
+        """
+        key = self.make_key(account)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry(key)
+            self._entries[key] = entry
+            entry.refs += 1
+            await self._open(entry, account)
+        else:
+            entry.refs += 1
+            await entry.ready.wait()
+            if entry.error is not None:
+                entry.refs -= 1
+                raise entry.error
+            self.reused += 1
+        return entry.exchange
+
+    async def _open(self, entry: _Entry, account: ExchangeAccount):
+        try:
+            exchange = self._factory(account)
+        except BaseException as e:
+            # 创建失败: 同时等待的使用方收到同样的异常
+            entry.error = e
+            entry.refs = 0
+            self._entries.pop(entry.key, None)
+            entry.ready.set()
+            raise
+
+        entry.exchange = exchange
+        self._by_client[id(exchange)] = entry
+        self.created += 1
+        logger.info(f"[ExchangeRegistry] 创建账户 {account.id} 的共享交易所客户端({account.exchange_name})")
+        try:
+            # 同时获取的使用方等待市场信息加载完成,避免重复加载
+            await self._load_markets(exchange)
+        finally:
+            entry.ready.set()
+
+    async def _load_markets(self, exchange: BaseExchange):
+        """加载一次市场信息,失败时由 CCXT 在首次请求时自行加载"""
+        client = getattr(exchange, "exchange", None)
+        if client is None or not hasattr(client, "load_markets"):
+            return
+        try:
+            await client.load_markets()
+        except Exception as e:
+            logger.warning(f"[ExchangeRegistry] 加载市场信息失败,首次请求时重试: {str(e)}")
+
+    async def release(self, exchange: Optional[BaseExchange]):
+        """
+        释放交易所实例(引用计数 -1),最后一个使用方释放时关闭客户端
+
+        Args:
+            exchange: acquire() 返回的实例;非注册表创建的实例直接关闭
+        """
+        if exchange is None:
+            return
+        entry = self._by_client.get(id(exchange))
+        if entry is None or entry.exchange is not exchange:
+            await exchange.close()
+            return
+
+        entry.refs -= 1
+        if entry.refs > 0:
+            return
+
+        self._by_client.pop(id(exchange), None)
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        self.closed += 1
+        try:
+            await exchange.close()
+        except Exception as e:
+            logger.warning(f"[ExchangeRegistry] 关闭账户 {entry.key[0]} 的交易所客户端失败: {str(e)}")
+
+    @asynccontextmanager
+    async def lease(self, account: ExchangeAccount) -> AsyncIterator[BaseExchange]:
+        """在 async with 范围内使用账户的共享交易所实例"""
+        exchange = await self.acquire(account)
+        try:
+            yield exchange
+        finally:
+            await self.release(exchange)
+
+    async def close_all(self):
+        """关闭所有客户端(进程退出时)"""
+        entries = list(self._entries.values())
+        self._entries.clear()
+        self._by_client.clear()
+        for entry in entries:
+            if entry.exchange is not None:
+                try:
+                    await entry.exchange.close()
+                except Exception as e:
+                    logger.warning(f"[ExchangeRegistry] 关闭交易所客户端失败: {str(e)}")
+                self.closed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._entries),
+            "refs": {entry.key[0]: entry.refs for entry in self._entries.values()},
+            "created": self.created,
+            "reused": self.reused,
+            "closed": self.closed,
+        }
+
+
+# 全局交易所客户端注册表
+exchange_registry = ExchangeRegistry()
@@ -16,6 +16,8 @@ logger = setup_logger('mock_exchange')
 class MockExchange(BaseExchange):
     """模拟交易所实现"""
     
+    exchange_name = 'mock'
+    
     def __init__(self, api_key: str, api_secret: str, passphrase: Optional[str] = None):
         """
         初始化模拟交易所
@@ -2,17 +2,30 @@
 OKX 交易所 API 客户端
 文档: https://www.okx.com/docs-v5/zh/
 """
+import asyncio
 import hmac
 import base64
 import time
 import json
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
+from urllib.parse import urlencode
 import httpx
 from app.utils.logger import setup_logger
 
 logger = setup_logger('okx_client')
 
+# 批量下单/撤单每次最多的订单数
+BATCH_LIMIT = 20
+
+
+class OKXAPIError(Exception):
+    """OKX 明确拒绝了请求(返回错误码或 4xx),请求未被执行"""
+
+    def __init__(self, message: str, code: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+
 
 class OKXClient:
     """OKX 交易所 API 客户端"""
@@ -22,7 +35,8 @@ class OKXClient:
         api_key: str,
         api_secret: str,
         passphrase: str,
-        is_demo: bool = True  # 默认使用模拟盘
+        is_demo: bool = True,  # 默认使用模拟盘
+        proxy: Optional[str] = None
     ):
         """
         初始化 OKX 客户端
@@ -32,6 +46,7 @@ class OKXClient:
             api_secret: API Secret
             passphrase: API Passphrase
             is_demo: 是否使用模拟盘 (默认 True)
+            proxy: 代理服务器地址 (可选)
         """
         self.api_key = api_key
         self.api_secret = api_secret
@@ -44,7 +59,7 @@ class OKXClient:
         else:
             self.base_url = "https://www.okx.com"
 
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = httpx.AsyncClient(timeout=30.0, **({"proxies": proxy} if proxy else {}))
 
     def _generate_signature(
         self, timestamp: str, method: str, request_path: str, body: str = ""
@@ -103,7 +118,12 @@ class OKXClient:
         return headers
 
     async def _request(
-        self, method: str, endpoint: str, params: Optional[Dict] = None, data: Optional[Dict] = None
+        self,
+        method: str,
+        endpoint: str,
+        params: Optional[Dict] = None,
+        data: Optional[Union[Dict, List[Dict]]] = None,
+        batch: bool = False
     ) -> Dict[str, Any]:
         """
         发送 HTTP 请求
@@ -112,23 +132,28 @@ class OKXClient:
             method: HTTP 方法
             endpoint: API 端点
             params: 查询参数
-            data: 请求体数据
+            data: 请求体数据(批量接口为列表)
+            batch: 批量接口,全部或部分失败(code 1/2)时也返回响应,由调用方检查每项的 sCode
 
         Returns:
             响应数据
 
         Raises:
-            Exception: 请求失败时抛出异常
+            OKXAPIError: OKX 明确拒绝请求
+            Exception: 请求失败(网络错误、超时、5xx)时抛出异常
         """
-        url = self.base_url + endpoint
+        # GET 请求的 requestPath 包含查询字符串,签名与实际请求使用同一个路径
+        request_path = endpoint + ("?" + urlencode(params) if params else "")
+        url = self.base_url + request_path
         body = json.dumps(data) if data else ""
-        headers = self._get_headers(method, endpoint, body)
+        headers = self._get_headers(method, request_path, body)
 
         try:
             if method.upper() == "GET":
-                response = await self.client.get(url, headers=headers, params=params)
+                response = await self.client.get(url, headers=headers)
             elif method.upper() == "POST":
-                response = await self.client.post(url, headers=headers, json=data)
+                # 发送与签名完全相同的请求体
+                response = await self.client.post(url, headers=headers, content=body)
             else:
                 raise ValueError(f"不支持的 HTTP 方法: {method}")
 
@@ -136,13 +161,18 @@ class OKXClient:
             result = response.json()
 
             # 检查 OKX API 返回的状态码
-            if result.get("code") != "0":
+            if result.get("code") != "0" and not (batch and result.get("code") in ("1", "2")):
                 error_msg = result.get("msg", "未知错误")
                 logger.error(f"OKX API 错误: {error_msg}, 完整响应: {result}")
-                raise Exception(f"OKX API 错误: {error_msg}")
+                raise OKXAPIError(f"OKX API 错误: {error_msg}", code=result.get("code"))
 
             return result
 
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP 请求失败: {str(e)}")
+            if 400 <= e.response.status_code < 500:
+                raise OKXAPIError(f"HTTP 请求失败: {str(e)}", code=str(e.response.status_code))
+            raise Exception(f"HTTP 请求失败: {str(e)}")
         except httpx.HTTPError as e:
             logger.error(f"HTTP 请求失败: {str(e)}")
             raise Exception(f"HTTP 请求失败: {str(e)}")
@@ -328,6 +358,59 @@ class OKXClient:
         result = await self._request("GET", endpoint, params=params)
         return result.get("data", [])[0] if result.get("data") else {}
 
+    async def batch_place_orders(self, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量下单(一次签名请求,最多20个)
+
+        Args:
+            orders: 订单参数列表,字段同 place_order 的请求体(instId, tdMode, side, ordType, sz, ...)
+
+        Returns:
+            与请求顺序一致的结果列表,每项包含 ordId, clOrdId, sCode, sMsg(sCode 为 "0" 表示成功)
+        """
+        if not orders or len(orders) > BATCH_LIMIT:
+            raise ValueError(f"批量下单数量必须在 1 到 {BATCH_LIMIT} 之间")
+        endpoint = "/api/v5/trade/batch-orders"
+        result = await self._request("POST", endpoint, data=orders, batch=True)
+        return result.get("data", [])
+
+    async def batch_cancel_orders(self, orders: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        批量撤单(一次签名请求,最多20个)
+
+        Args:
+            orders: [{"instId": ..., "ordId": ...}] 或 [{"instId": ..., "clOrdId": ...}]
+
+        Returns:
+            与请求顺序一致的结果列表,每项包含 ordId, clOrdId, sCode, sMsg
+        """
+        if not orders or len(orders) > BATCH_LIMIT:
+            raise ValueError(f"批量撤单数量必须在 1 到 {BATCH_LIMIT} 之间")
+        endpoint = "/api/v5/trade/cancel-batch-orders"
+        result = await self._request("POST", endpoint, data=orders, batch=True)
+        return result.get("data", [])
+
+    async def get_orders_detail(self, orders: List[Dict[str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        获取多个订单详情
+
+        OKX 没有批量查询订单详情的接口,这里同时发起单个查询,总耗时约为一次请求
+
+        Args:
+            orders: [{"instId": ..., "ordId": ...}] 或 [{"instId": ..., "clOrdId": ...}]
+
+        Returns:
+            与请求顺序一致的订单详情,查询失败的位置为 None
+        """
+        results = await asyncio.gather(
+            *(
+                self.get_order_detail(order["instId"], order.get("ordId"), order.get("clOrdId"))
+                for order in orders
+            ),
+            return_exceptions=True
+        )
+        return [None if isinstance(result, Exception) else result for result in results]
+
     async def close_position(
         self,
         inst_id: str,
@@ -3,11 +3,19 @@ OKX交易所适配器实现
 """
 import ccxt.async_support as ccxt
 import asyncio
+import time
+import uuid
 from typing import Dict, List, Optional, Any, Callable
 from decimal import Decimal
 from functools import wraps
 
-from app.exchanges.base_exchange import BaseExchange
+from app.config import settings
+from app.core.exceptions import OrderStatusUnknownError
+from app.exchanges.base_exchange import BaseExchange, is_final_order
+from app.exchanges.okx_client import BATCH_LIMIT, OKXAPIError, OKXClient
+from app.exchanges.order_stream import OKXOrderStream, OrderStream
+from app.exchanges.singleflight import coalesced_read, invalidates_reads
+from app.exchanges.ws_stream import split_symbol
 from app.utils.logger import setup_logger
 
 logger = setup_logger('okx_exchange')
@@ -64,6 +72,9 @@ def retry_on_network_error(max_retries: int = 3, base_delay: float = 1.0):
 class OKXExchange(BaseExchange):
     """OKX交易所适配器"""
     
+    exchange_name = 'okx'
+    supports_batch_orders = True
+    
     def __init__(self, api_key: str, api_secret: str, passphrase: str, is_testnet: bool = True, proxy: str = None):
         """
         初始化OKX交易所
@@ -77,6 +88,8 @@ class OKXExchange(BaseExchange):
         """
         self.is_testnet = is_testnet
         self.proxy = proxy
+        # 批量下单使用的 v5 签名客户端(首次批量下单时创建)
+        self._client: Optional[OKXClient] = None
         super().__init__(api_key, api_secret, passphrase)
     
     def _init_exchange(self) -> ccxt.Exchange:
@@ -85,7 +98,7 @@ class OKXExchange(BaseExchange):
             'apiKey': self.api_key,
             'secret': self.api_secret,
             'password': self.passphrase,
-            'enableRateLimit': True,
+            'enableRateLimit': self.rate_governor is None,  # 启用账户级限频时不再使用 CCXT 单实例限频
             'options': {
                 'defaultType': 'swap',  # 永续合约
                 'createMarketBuyOrderRequiresPrice': False,
@@ -120,7 +133,13 @@ class OKXExchange(BaseExchange):
         Returns:
             行情数据
         """
+        # 优先使用WebSocket推送的行情,推送不可用时回退到REST
+        streamed = await self._get_streamed_ticker(symbol)
+        if streamed is not None:
+            return streamed
+        
         try:
+            await self._throttle("market")
             ticker = await self.exchange.fetch_ticker(symbol)
             return {
                 'symbol': symbol,
@@ -134,6 +153,7 @@ class OKXExchange(BaseExchange):
             logger.error(f"获取行情失败 {symbol}: {str(e)}")
             raise
     
+    @invalidates_reads
     @retry_on_network_error(max_retries=5, base_delay=2.0)
     async def create_market_order(
         self,
@@ -152,8 +172,9 @@ class OKXExchange(BaseExchange):
             reduce_only: 是否仅减仓
         """
         try:
-            # 🔥 添加请求前延迟，避免触发频率限制
-            await asyncio.sleep(0.5)
+            # 🔥 添加请求前延迟，避免触发频率限制(启用账户级限频时由令牌桶排队,不需要固定延迟)
+            if self.rate_governor is None:
+                await asyncio.sleep(0.5)
             
             params = {}
             if reduce_only:
@@ -164,6 +185,7 @@ class OKXExchange(BaseExchange):
                 # 开仓时的持仓方向与交易方向一致
                 params['posSide'] = 'long' if side == 'buy' else 'short'
 
+            await self._throttle("order")
             order = await self.exchange.create_order(
                 symbol=symbol,
                 type='market',
@@ -179,6 +201,7 @@ class OKXExchange(BaseExchange):
             logger.error(f"创建市价订单失败 {symbol}: {str(e)}")
             raise
     
+    @invalidates_reads
     @retry_on_network_error(max_retries=3, base_delay=1.0)
     async def create_limit_order(
         self,
@@ -199,6 +222,7 @@ class OKXExchange(BaseExchange):
                 # 开仓时的持仓方向与交易方向一致
                 params['posSide'] = 'long' if side == 'buy' else 'short'
 
+            await self._throttle("order")
             order = await self.exchange.create_order(
                 symbol=symbol,
                 type='limit',
@@ -214,9 +238,11 @@ class OKXExchange(BaseExchange):
             logger.error(f"创建限价订单失败 {symbol}: {str(e)}")
             raise
     
+    @invalidates_reads
     async def cancel_order(self, order_id: str, symbol: str) -> Dict[str, Any]:
         """取消订单"""
         try:
+            await self._throttle("order")
             result = await self.exchange.cancel_order(order_id, symbol)
             logger.info(f"取消订单成功: {order_id}")
             return result
@@ -224,19 +250,24 @@ class OKXExchange(BaseExchange):
             logger.error(f"取消订单失败 {order_id}: {str(e)}")
             raise
     
+    # 未完成订单的状态变化快,只合并进行中的查询
+    @coalesced_read(reusable=is_final_order)
     async def get_order(self, order_id: str, symbol: str) -> Dict[str, Any]:
         """查询订单状态"""
         try:
+            await self._throttle("query_order")
             order = await self.exchange.fetch_order(order_id, symbol)
             return self._format_order(order)
         except Exception as e:
             logger.error(f"查询订单失败 {order_id}: {str(e)}")
             raise
     
+    @coalesced_read
     @retry_on_network_error(max_retries=3, base_delay=1.0)
     async def get_position(self, symbol: str) -> Optional[Dict[str, Any]]:
         """获取指定交易对的持仓"""
         try:
+            await self._throttle("positions")
             positions = await self.exchange.fetch_positions([symbol])
             if not positions:
                 return None
@@ -250,10 +281,12 @@ class OKXExchange(BaseExchange):
             logger.error(f"获取持仓失败 {symbol}: {str(e)}")
             raise
     
+    @coalesced_read
     @retry_on_network_error(max_retries=3, base_delay=1.0)
     async def get_all_positions(self) -> List[Dict[str, Any]]:
         """获取所有持仓"""
         try:
+            await self._throttle("positions")
             positions = await self.exchange.fetch_positions()
             return [
                 self._format_position(pos)
@@ -264,10 +297,12 @@ class OKXExchange(BaseExchange):
             logger.error(f"获取所有持仓失败: {str(e)}")
             raise
     
+    @invalidates_reads
     @retry_on_network_error(max_retries=2, base_delay=0.5)
     async def set_leverage(self, symbol: str, leverage: int) -> Dict[str, Any]:
         """设置杠杆倍数"""
         try:
+            await self._throttle("leverage")
             result = await self.exchange.set_leverage(
                 leverage,
                 symbol,
@@ -279,10 +314,12 @@ class OKXExchange(BaseExchange):
             logger.error(f"设置杠杆失败 {symbol}: {str(e)}")
             raise
     
+    @coalesced_read
     @retry_on_network_error(max_retries=3, base_delay=1.0)
     async def get_balance(self) -> Dict[str, Any]:
         """获取账户余额"""
         try:
+            await self._throttle("balance")
             balance = await self.exchange.fetch_balance()
             return {
                 'total': balance.get('total', {}),
@@ -293,6 +330,185 @@ class OKXExchange(BaseExchange):
             logger.error(f"获取余额失败: {str(e)}")
             raise
     
+    @invalidates_reads
+    async def create_market_orders(self, orders: List[Dict[str, Any]]) -> List[Any]:
+        """
+        批量创建市价订单(/api/v5/trade/batch-orders,每次签名请求最多20个)
+        
+        Args:
+            orders: [{"symbol", "side", "amount", "reduce_only"}]
+            
+        Returns:
+            与 orders 顺序一致的订单信息(待成交,需 wait_for_fill);单个订单失败时对应位置为异常
+            (请求失败后无法确认是否已提交的订单为 OrderStatusUnknownError)
+
+        Raises:
+            OKXAPIError: OKX 明确拒绝整批请求(没有订单被提交),调用方可改为逐个下单
+        """
+        results: List[Any] = []
+        for start in range(0, len(orders), BATCH_LIMIT):
+            chunk = orders[start:start + BATCH_LIMIT]
+            try:
+                results.extend(await self._create_market_batch(chunk))
+            except OKXAPIError as e:
+                if not results:
+                    raise
+                # 之前的批次已提交,不能让调用方整体重新下单: 本批的订单记为失败
+                results.extend([e] * len(chunk))
+        return results
+    
+    async def _create_market_batch(self, orders: List[Dict[str, Any]]) -> List[Any]:
+        client = self._get_client()
+        # 客户订单ID: 整批请求失败时据此确认订单是否已提交
+        prefix = uuid.uuid4().hex[:16]
+        requests = []
+        for index, order in enumerate(orders):
+            side = order['side']
+            if order.get('reduce_only'):
+                # 平仓时的持仓方向与交易方向相反
+                pos_side = 'short' if side == 'buy' else 'long'
+            else:
+                # 开仓时的持仓方向与交易方向一致
+                pos_side = 'long' if side == 'buy' else 'short'
+            request = {
+                "instId": self._inst_id(order['symbol']),
+                "tdMode": "cross",
+                "side": side,
+                "ordType": "market",
+                "sz": self._order_size(order['symbol'], order['amount']),
+                "posSide": pos_side,
+                "clOrdId": f"{prefix}{index}",
+            }
+            if order.get('reduce_only'):
+                request["reduceOnly"] = True
+            requests.append(request)
+        
+        for _ in requests:
+            await self._throttle("order")
+        
+        try:
+            results = await client.batch_place_orders(requests)
+        except OKXAPIError as e:
+            # 整批被拒绝: 没有订单被提交
+            logger.error(f"批量下单被拒绝: {str(e)}")
+            raise
+        except Exception as e:
+            # 超时或网络错误: 订单可能已提交,不能重新下单
+            logger.error(f"批量下单请求失败: {str(e)}, 按客户订单ID确认订单状态")
+            return await self._confirm_batch(client, orders, requests, e)
+        
+        by_client_id = {result.get('clOrdId'): result for result in results}
+        formatted = []
+        for order, request in zip(orders, requests):
+            result = by_client_id.get(request["clOrdId"]) or {}
+            if result.get('sCode') != '0' or not result.get('ordId'):
+                formatted.append(Exception(f"OKX 下单失败 {order['symbol']}: {result.get('sMsg') or '无返回'}"))
+                continue
+            logger.info(f"批量创建市价订单成功: {order['symbol']} {order['side']} {request['sz']} posSide={request['posSide']}")
+            formatted.append({
+                'id': result['ordId'],
+                'symbol': self._unified_symbol(order['symbol']),
+                'type': 'market',
+                'side': order['side'],
+                'price': None,
+                'amount': Decimal(request['sz']),
+                'filled': Decimal('0'),
+                'remaining': Decimal(request['sz']),
+                'cost': None,
+                'status': 'open',
+                'timestamp': int(result.get('ts') or time.time() * 1000),
+            })
+        return formatted
+    
+    async def _confirm_batch(
+        self, client: OKXClient, orders: List[Dict[str, Any]], requests: List[Dict[str, Any]], error: Exception
+    ) -> List[Any]:
+        """
+        整批请求失败后按客户订单ID确认订单(订单可能还未出现在查询结果中,按退避间隔重试)
+
+        Returns:
+            与 orders 顺序一致的订单信息;多次查询仍无法确认的位置为 OrderStatusUnknownError
+        """
+        results: List[Any] = [None] * len(orders)
+        pending = list(range(len(orders)))
+        delay = settings.PAIR_CONFIRM_DELAY
+        for attempt in range(max(settings.PAIR_CONFIRM_RETRIES, 1)):
+            if attempt:
+                await asyncio.sleep(delay)
+                delay *= 2
+            details = await client.get_orders_detail(
+                [{"instId": requests[index]["instId"], "clOrdId": requests[index]["clOrdId"]} for index in pending]
+            )
+            for index, detail in zip(pending, details):
+                if detail:
+                    results[index] = self._format_batch_detail(orders[index], detail)
+            pending = [index for index in pending if results[index] is None]
+            if not pending:
+                return results
+
+        for index in pending:
+            order = orders[index]
+            logger.error(f"无法确认订单是否已提交: {order['symbol']} {order['side']} clOrdId={requests[index]['clOrdId']}")
+            results[index] = OrderStatusUnknownError(
+                f"无法确认订单是否已提交 {order['symbol']} (clOrdId={requests[index]['clOrdId']}): {str(error)}",
+                symbol=order['symbol'],
+                side=order['side'],
+            )
+        return results
+    
+    def _format_batch_detail(self, order: Dict[str, Any], detail: Dict[str, Any]) -> Dict[str, Any]:
+        formatted = self._format_order(self.exchange.parse_order(detail))
+        formatted['symbol'] = self._unified_symbol(order['symbol'])
+        return formatted
+    
+    def _get_client(self) -> OKXClient:
+        if self._client is None:
+            self._client = OKXClient(
+                self.api_key, self.api_secret, self.passphrase or "", is_demo=self.is_testnet, proxy=self.proxy
+            )
+        return self._client
+    
+    def _inst_id(self, symbol: str) -> str:
+        """CCXT统一符号 -> OKX instId"""
+        try:
+            return self.exchange.market(symbol)['id']
+        except Exception:
+            if ':' not in symbol and '/' not in symbol:
+                return symbol
+            base, quote, settle = split_symbol(symbol)
+            return f"{base}-{quote}-SWAP" if settle else f"{base}-{quote}"
+    
+    def _unified_symbol(self, symbol: str) -> str:
+        """与单个下单返回的订单符号保持一致(CCXT统一符号)"""
+        try:
+            return self.exchange.market(symbol)['symbol']
+        except Exception:
+            return symbol
+    
+    def _order_size(self, symbol: str, amount: Decimal) -> str:
+        """按交易对精度格式化下单数量(与单个下单一致)"""
+        try:
+            return self.exchange.amount_to_precision(symbol, float(amount))
+        except Exception:
+            return str(amount)
+    
+    async def close(self):
+        """关闭交易所连接和批量下单客户端"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        await super().close()
+    
+    def _create_order_stream(self, url: Optional[str] = None) -> Optional[OrderStream]:
+        """OKX 私有 orders 频道(登录后订阅永续合约订单)"""
+        if url is None:
+            url = OKXOrderStream.DEMO_URL if self.is_testnet else OKXOrderStream.LIVE_URL
+        return OKXOrderStream(url, self.api_key, self.api_secret, self.passphrase or "", proxy=self.proxy)
+    
+    def _parse_stream_order(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """orders 频道的订单字段与 REST 一致,直接由 CCXT 解析"""
+        return self._format_order(self.exchange.parse_order(raw))
+    
     def _format_order(self, order: Dict) -> Dict[str, Any]:
         """格式化订单数据"""
         def safe_decimal(value, default=None):
@@ -362,6 +578,7 @@ class OKXExchange(BaseExchange):
             # limit: 返回的K线数量
 
             # 使用5分钟K线，获取目标时间附近的数据
+            await self._throttle("market")
             ohlcv = await self.exchange.fetch_ohlcv(
                 symbol=symbol,
                 timeframe='5m',
@@ -0,0 +1,310 @@
+"""
+私有订单推送(WebSocket)
+
+通过交易所私有频道(OKX orders / Binance 用户数据流 ORDER_TRADE_UPDATE)接收订单状态,
+下单后等待推送的最终状态,不再固定等待后查询订单:
+- 同一账户(API Key)的所有交易所实例共享一条连接
+- 订单成交或撤销时唤醒等待方;推送早于等待注册时从最近订单缓存中读取
+- 连接未就绪、断线或超时时返回None,由调用方回退到查询(见 BaseExchange.wait_for_fill)
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.exchanges.ws_stream import BaseWebSocketStream
+from app.utils.logger import setup_logger
+
+logger = setup_logger('order_stream')
+
+
+class OrderStream(BaseWebSocketStream):
+    """私有订单推送基类"""
+
+    # 缓存的最近最终状态订单数(推送可能早于下单接口返回)
+    recent_limit = 500
+
+    def __init__(self, url: str, proxy: Optional[str] = None):
+        super().__init__(url, proxy=proxy)
+        # 登录和订阅完成后才能依赖推送
+        self.ready = asyncio.Event()
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._recent: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        # 统计
+        self.updates = 0
+        self.resolved = 0
+        self.timeouts = 0
+
+    async def wait_for_final(self, order_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        等待订单到达最终状态(成交/撤销)
+
+        Args:
+            order_id: 交易所订单ID
+            timeout: 最长等待时间(秒)
+
+        Returns:
+            推送的原始订单数据;连接未就绪、等待期间断线或超时时返回None
+        """
+        order_id = str(order_id)
+        cached = self._recent.get(order_id)
+        if cached is not None:
+            self.resolved += 1
+            return cached
+        if not self.ready.is_set():
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(order_id, []).append(future)
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        finally:
+            waiters = self._waiters.get(order_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[order_id]
+
+        if result is not None:
+            self.resolved += 1
+        return result
+
+    async def _handle_message(self, message: Any):
+        for order_id, final, raw in self._parse_orders(message):
+            self.updates += 1
+            if not final:
+                continue
+
+            self._recent[order_id] = raw
+            self._recent.move_to_end(order_id)
+            while len(self._recent) > self.recent_limit:
+                self._recent.popitem(last=False)
+
+            for future in self._waiters.pop(order_id, []):
+                if not future.done():
+                    future.set_result(raw)
+
+    async def _on_disconnected(self):
+        self.ready.clear()
+        # 断线期间可能错过推送,等待方立即回退到查询
+        for waiters in self._waiters.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+        self._waiters.clear()
+
+    def _parse_orders(self, message: Any) -> List[Tuple[str, bool, Dict[str, Any]]]:
+        """解析推送消息,返回 [(订单ID, 是否最终状态, 原始订单数据)]"""
+        raise NotImplementedError
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats.update({
+            "ready": self.ready.is_set(),
+            "waiting": sum(len(waiters) for waiters in self._waiters.values()),
+            "updates": self.updates,
+            "resolved": self.resolved,
+            "timeouts": self.timeouts,
+        })
+        return stats
+
+
+class OKXOrderStream(OrderStream):
+    """OKX 私有 orders 频道(永续合约)"""
+
+    LIVE_URL = "wss://ws.okx.com:8443/ws/v5/private"
+    DEMO_URL = "wss://wspap.okx.com:8443/ws/v5/private?brokerId=9999"
+
+    # OKX 要求 30 秒内无数据时发送字符串 ping
+    heartbeat_message = 'ping'
+
+    FINAL_STATES = {'filled', 'canceled', 'mmp_canceled'}
+
+    def __init__(self, url: str, api_key: str, api_secret: str, passphrase: str, proxy: Optional[str] = None):
+        super().__init__(url, proxy=proxy)
+        self._api_key = api_key
+        self._api_secret = api_secret
+        self._passphrase = passphrase
+
+    def _login_message(self) -> Dict[str, Any]:
+        timestamp = str(int(time.time()))
+        digest = hmac.new(
+            self._api_secret.encode(), f"{timestamp}GET/users/self/verify".encode(), hashlib.sha256
+        ).digest()
+        return {
+            "op": "login",
+            "args": [{
+                "apiKey": self._api_key,
+                "passphrase": self._passphrase,
+                "timestamp": timestamp,
+                "sign": base64.b64encode(digest).decode(),
+            }]
+        }
+
+    async def _on_connected(self):
+        await self.send_json(self._login_message())
+
+    async def _handle_message(self, message: Any):
+        if isinstance(message, dict) and 'event' in message:
+            event = message['event']
+            if event == 'login':
+                if message.get('code') == '0':
+                    await self.send_json({"op": "subscribe", "args": [{"channel": "orders", "instType": "SWAP"}]})
+                else:
+                    self.last_error = message.get('msg')
+                    logger.warning(f"[{self.name}] 登录失败: {message.get('msg')}")
+            elif event == 'subscribe' and message.get('arg', {}).get('channel') == 'orders':
+                self.ready.set()
+                logger.info(f"[{self.name}] 已订阅订单推送")
+            elif event == 'error':
+                self.last_error = message.get('msg')
+                logger.warning(f"[{self.name}] 推送错误: {message.get('msg')}")
+            return
+
+        await super()._handle_message(message)
+
+    def _parse_orders(self, message: Any) -> List[Tuple[str, bool, Dict[str, Any]]]:
+        if not isinstance(message, dict) or message.get('arg', {}).get('channel') != 'orders':
+            return []
+        return [
+            (item['ordId'], item.get('state') in self.FINAL_STATES, item)
+            for item in message.get('data') or []
+            if item.get('ordId')
+        ]
+
+
+class BinanceOrderStream(OrderStream):
+    """Binance U本位合约用户数据流(ORDER_TRADE_UPDATE)"""
+
+    LIVE_URL = "wss://fstream.binance.com/ws"
+    DEMO_URL = "wss://stream.binancefuture.com/ws"
+
+    # listenKey 有效期60分钟,定期延长
+    keepalive_interval = 1800.0
+
+    FINAL_STATES = {'FILLED', 'CANCELED', 'EXPIRED', 'EXPIRED_IN_MATCH', 'REJECTED'}
+
+    def __init__(self, url: str, listen_key: Callable[[], Awaitable[str]], proxy: Optional[str] = None):
+        """
+        Args:
+            url: 用户数据流地址(不含 listenKey)
+            listen_key: 创建(或延长)listenKey 的请求
+            proxy: 代理服务器地址(可选)
+        """
+        super().__init__(url, proxy=proxy)
+        self._listen_key = listen_key
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    async def _connect_url(self) -> str:
+        listen_key = await self._listen_key()
+        return f"{self.url.rstrip('/')}/{listen_key}"
+
+    async def _on_connected(self):
+        # 用户数据流连接建立即开始推送,不需要订阅
+        self.ready.set()
+        self._keepalive_task = asyncio.create_task(self._keepalive())
+
+    async def _on_disconnected(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        await super()._on_disconnected()
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await self._listen_key()
+            except Exception as e:
+                logger.warning(f"[{self.name}] 延长 listenKey 失败: {str(e)}")
+
+    async def _handle_message(self, message: Any):
+        if isinstance(message, dict) and message.get('e') == 'listenKeyExpired':
+            # 断开后重连时使用新的 listenKey
+            logger.warning(f"[{self.name}] listenKey 已过期,重新连接")
+            if self._ws is not None:
+                await self._ws.close()
+            return
+
+        await super()._handle_message(message)
+
+    def _parse_orders(self, message: Any) -> List[Tuple[str, bool, Dict[str, Any]]]:
+        if not isinstance(message, dict) or message.get('e') != 'ORDER_TRADE_UPDATE':
+            return []
+        order = message.get('o') or {}
+        if order.get('i') is None:
+            return []
+        # 转换为 REST 订单字段,由 CCXT 统一解析
+        raw = {
+            "orderId": order['i'],
+            "clientOrderId": order.get('c'),
+            "symbol": order.get('s'),
+            "status": order.get('X'),
+            "price": order.get('p'),
+            "avgPrice": order.get('ap'),
+            "origQty": order.get('q'),
+            "executedQty": order.get('z'),
+            "type": order.get('o'),
+            "side": order.get('S'),
+            "reduceOnly": order.get('R'),
+            "updateTime": order.get('T') or message.get('E'),
+        }
+        return [(str(order['i']), order.get('X') in self.FINAL_STATES, raw)]
+
+
+# 进程内共享的订单推送连接: (交易所名称, 是否测试网, API Key 指纹) -> OrderStream
+_streams: Dict[Tuple[str, bool, str], OrderStream] = {}
+
+
+def get_order_stream(
+    exchange_name: str,
+    api_key: Optional[str],
+    is_testnet: bool,
+    factory: Callable[[], Optional[OrderStream]]
+) -> Optional[OrderStream]:
+    """
+    获取(或创建)交易所账户的共享订单推送连接
+
+    Args:
+        exchange_name: 交易所名称
+        api_key: API Key(按账户区分;同一 Key 的所有实例共用)
+        is_testnet: 是否测试网
+        factory: 创建推送连接(交易所不支持时返回None)
+
+    Returns:
+        订单推送实例,不支持推送的交易所返回None
+    """
+    account = hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+    key = (exchange_name, bool(is_testnet), account)
+    stream = _streams.get(key)
+    if stream is not None:
+        return stream
+
+    stream = factory()
+    if stream is None:
+        return None
+    _streams[key] = stream
+    logger.info(f"创建订单推送连接: {exchange_name} testnet={is_testnet} account={account}")
+    return stream
+
+
+async def close_order_streams():
+    """关闭所有订单推送连接"""
+    for stream in list(_streams.values()):
+        await stream.close()
+    _streams.clear()
+
+
+def get_order_stream_stats() -> Dict[str, Any]:
+    """所有订单推送连接的统计"""
+    return {
+        f"{exchange_name}{'-testnet' if is_testnet else ''}:{account}": stream.get_stats()
+        for (exchange_name, is_testnet, account), stream in _streams.items()
+    }
@@ -0,0 +1,214 @@
+"""
+交易所请求限频(账户级令牌桶)
+
+同一交易所账户(API Key)上的所有请求共用一个限频器,按接口类别分别维护令牌桶,
+桶的速率和容量按交易所公布的限频设置(乘以 RATE_GOVERNOR_SAFETY 留出余量):
+- 请求前取得令牌,令牌不足时等待,不再依赖 CCXT 的单实例限频和固定的启动延迟
+- 交易路径(下单、撤单、查询行情等)优先: 后台请求(数据同步)只在桶内剩余令牌超过
+  保留比例 RATE_GOVERNOR_BACKGROUND_RESERVE 且没有交易请求等待时才能取得令牌
+
+后台请求在 background_requests() 范围内发起:
+
+    with background_requests():
+        await exchange.get_order(...)
+"""
+import asyncio
+import contextvars
+import hashlib
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.config import settings
+from app.utils.logger import setup_logger
+
+logger = setup_logger('rate_governor')
+
+# 请求优先级
+PRIORITY_TRADE = 0
+PRIORITY_BACKGROUND = 1
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("exchange_request_priority", default=PRIORITY_TRADE)
+
+# 各交易所的接口类别限频: 类别 -> (每秒令牌数, 桶容量)
+# OKX v5: 下单/撤单/查单 60次/2s, 持仓/余额 10次/2s, 设置杠杆 20次/2s, 行情 20次/2s
+# Binance U本位合约: 下单 300次/10s; 其他接口按权重 2400/分钟折算(持仓、余额权重 5)
+EXCHANGE_LIMITS: Dict[str, Dict[str, Tuple[float, float]]] = {
+    "okx": {
+        "order": (30.0, 60.0),
+        "query_order": (30.0, 60.0),
+        "positions": (5.0, 10.0),
+        "balance": (5.0, 10.0),
+        "leverage": (10.0, 20.0),
+        "market": (10.0, 20.0),
+    },
+    "binance": {
+        "order": (30.0, 50.0),
+        "query_order": (20.0, 40.0),
+        "positions": (4.0, 8.0),
+        "balance": (4.0, 8.0),
+        "leverage": (5.0, 10.0),
+        "market": (20.0, 40.0),
+    },
+}
+
+
+@contextmanager
+def background_requests() -> Iterator[None]:
+    """范围内发起的交易所请求为后台优先级(让位于交易路径)"""
+    token = _priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """令牌桶"""
+
+    def __init__(self, rate: float, capacity: float, reserve: float = 0.0):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量(允许的突发请求数)
+            reserve: 为交易路径保留的令牌比例,后台请求不能使用
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = capacity * reserve
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self.trade_waiting = 0
+
+        # 统计
+        self.granted = 0
+        self.throttled = 0
+        self.waited_ms = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, priority: int, now: Optional[float] = None) -> float:
+        """
+        尝试取得一个令牌
+
+        Returns:
+            0 表示已取得;否则为建议等待的秒数
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        floor = 0.0
+        if priority != PRIORITY_TRADE:
+            if self.trade_waiting:
+                return 1 / self.rate
+            floor = self.reserve
+        if self.tokens - floor >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 + floor - self.tokens) / self.rate
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._refill(time.monotonic())
+        return {
+            "remaining": round(self.tokens, 2),
+            "capacity": self.capacity,
+            "rate": self.rate,
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "waited_ms": round(self.waited_ms, 1),
+        }
+
+
+class RateGovernor:
+    """一个交易所账户的限频器"""
+
+    def __init__(
+        self,
+        name: str,
+        limits: Dict[str, Tuple[float, float]],
+        safety: Optional[float] = None,
+        background_reserve: Optional[float] = None
+    ):
+        """
+        Args:
+            name: 名称(日志和指标)
+            limits: 接口类别 -> (每秒令牌数, 桶容量)
+            safety: 速率系数,默认 RATE_GOVERNOR_SAFETY
+            background_reserve: 后台请求不能使用的令牌比例,默认 RATE_GOVERNOR_BACKGROUND_RESERVE
+        """
+        safety = settings.RATE_GOVERNOR_SAFETY if safety is None else safety
+        reserve = settings.RATE_GOVERNOR_BACKGROUND_RESERVE if background_reserve is None else background_reserve
+        self.name = name
+        self.buckets: Dict[str, TokenBucket] = {
+            endpoint: TokenBucket(rate * safety, max(1.0, capacity * safety), reserve)
+            for endpoint, (rate, capacity) in limits.items()
+        }
+
+    async def acquire(self, endpoint: str, priority: Optional[int] = None):
+        """
+        取得一次请求的令牌,不足时等待
+
+        Args:
+            endpoint: 接口类别(未配置的类别不限频)
+            priority: 优先级,默认取当前上下文(background_requests() 内为后台)
+        """
+        bucket = self.buckets.get(endpoint)
+        if bucket is None:
+            return
+        priority = _priority.get() if priority is None else priority
+
+        wait = bucket.try_take(priority)
+        if wait == 0:
+            bucket.granted += 1
+            return
+
+        started = time.monotonic()
+        bucket.throttled += 1
+        if priority == PRIORITY_TRADE:
+            bucket.trade_waiting += 1
+        try:
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = bucket.try_take(priority)
+        finally:
+            if priority == PRIORITY_TRADE:
+                bucket.trade_waiting -= 1
+        bucket.granted += 1
+        bucket.waited_ms += (time.monotonic() - started) * 1000
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {endpoint: bucket.get_stats() for endpoint, bucket in self.buckets.items()}
+
+
+_governors: Dict[Tuple[str, bool, str], RateGovernor] = {}
+
+
+def get_rate_governor(exchange_name: str, api_key: Optional[str], is_testnet: bool = False) -> Optional[RateGovernor]:
+    """
+    获取(或创建)交易所账户的共享限频器
+
+    Args:
+        exchange_name: 交易所名称
+        api_key: API Key(按账户区分;同一 Key 的所有实例共用)
+        is_testnet: 是否测试网
+
+    Returns:
+        限频器,未启用或交易所未配置限频时返回None
+    """
+    limits = EXCHANGE_LIMITS.get(exchange_name)
+    if not settings.RATE_GOVERNOR_ENABLED or limits is None:
+        return None
+    account = hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+    key = (exchange_name, bool(is_testnet), account)
+    governor = _governors.get(key)
+    if governor is None:
+        governor = RateGovernor(f"{exchange_name}{'-testnet' if is_testnet else ''}:{account}", limits)
+        _governors[key] = governor
+        logger.info(f"[RateGovernor] 创建账户限频器: {governor.name}")
+    return governor
+
+
+def get_rate_governor_stats() -> Dict[str, Any]:
+    """所有账户限频器的剩余额度"""
+    return {governor.name: governor.get_stats() for governor in _governors.values()}
@@ -0,0 +1,194 @@
+"""
+交易所读请求合并(singleflight)
+
+同一账户上同时发起的相同读请求(方法和参数相同)只向交易所请求一次,其他调用方共享结果;
+请求完成后 EXCHANGE_READ_REUSE_WINDOW 秒内的相同请求直接复用结果。
+下单、撤单、设置杠杆等写操作完成后立即失效,之后的读请求不会拿到写操作之前的结果。
+
+交易所适配器中的用法:
+
+    @coalesced_read
+    async def get_all_positions(self): ...
+
+    @invalidates_reads
+    async def create_market_order(self, ...): ...
+"""
+import asyncio
+import copy
+import hashlib
+import time
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+from app.utils.logger import setup_logger
+
+logger = setup_logger('singleflight')
+
+
+class SingleFlight:
+    """一个交易所账户的读请求合并"""
+
+    def __init__(self, name: str, reuse_window: Optional[float] = None):
+        """
+        Args:
+            name: 名称(指标)
+            reuse_window: 结果复用时间(秒),默认 EXCHANGE_READ_REUSE_WINDOW,0 表示只合并进行中的请求
+        """
+        self.name = name
+        self.reuse_window = settings.EXCHANGE_READ_REUSE_WINDOW if reuse_window is None else reuse_window
+        # 写操作后递增,之前的进行中请求和缓存结果不再被使用
+        self.generation = 0
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self._recent: Dict[Tuple, Tuple[float, Any]] = {}
+
+        # 统计
+        self.calls = 0
+        self.executed = 0
+        self.saved_inflight = 0
+        self.saved_window = 0
+
+    async def do(
+        self,
+        key: Tuple,
+        fn: Callable[[], Awaitable[Any]],
+        reusable: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """
+        执行读请求,相同的进行中请求或复用时间内的结果直接共享
+
+        Args:
+            key: 请求键(方法名和参数)
+            fn: 实际请求
+            reusable: 判断结果能否在复用时间内提供给之后的请求(默认都可以)
+
+        Returns:
+            请求结果(每个调用方得到独立副本)
+        """
+        self.calls += 1
+        key = (self.generation,) + key
+
+        cached = self._recent.get(key)
+        if cached is not None:
+            if time.monotonic() - cached[0] <= self.reuse_window:
+                self.saved_window += 1
+                return copy.deepcopy(cached[1])
+            del self._recent[key]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.saved_inflight += 1
+        else:
+            # 独立任务执行: 发起方被取消时其他等待方不受影响
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            self.executed += 1
+            future.add_done_callback(lambda done, key=key: self._on_done(key, done, reusable))
+
+        result = await asyncio.shield(future)
+        return copy.deepcopy(result)
+
+    def _on_done(self, key: Tuple, future: asyncio.Future, reusable: Optional[Callable[[Any], bool]] = None):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if (
+            self.reuse_window > 0
+            and key[0] == self.generation
+            and not future.cancelled()
+            and future.exception() is None
+            and (reusable is None or reusable(future.result()))
+        ):
+            self._recent[key] = (time.monotonic(), future.result())
+            if len(self._recent) > 256:
+                self._prune()
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, (at, _) in list(self._recent.items()):
+            if now - at > self.reuse_window:
+                del self._recent[key]
+
+    def invalidate(self):
+        """写操作后调用: 丢弃缓存结果,之后的请求不再合并到之前发起的请求"""
+        self.generation += 1
+        self._recent.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        saved = self.saved_inflight + self.saved_window
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "saved": saved,
+            "saved_inflight": self.saved_inflight,
+            "saved_window": self.saved_window,
+            "inflight": len(self._inflight),
+        }
+
+
+_flights: Dict[Tuple[str, bool, str], SingleFlight] = {}
+
+
+def get_singleflight(exchange_name: str, api_key: Optional[str], is_testnet: bool = False) -> Optional[SingleFlight]:
+    """
+    获取(或创建)交易所账户的读请求合并(同一 API Key 的所有实例共用)
+
+    Returns:
+        未启用(EXCHANGE_READ_COALESCING=False)时返回None
+    """
+    if not settings.EXCHANGE_READ_COALESCING:
+        return None
+    account = hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+    key = (exchange_name, bool(is_testnet), account)
+    flight = _flights.get(key)
+    if flight is None:
+        flight = SingleFlight(f"{exchange_name}{'-testnet' if is_testnet else ''}:{account}")
+        _flights[key] = flight
+    return flight
+
+
+def get_singleflight_stats() -> Dict[str, Any]:
+    """所有账户的读请求合并统计"""
+    return {flight.name: flight.get_stats() for flight in _flights.values()}
+
+
+def _account_flight(exchange) -> Optional[SingleFlight]:
+    flight = getattr(exchange, '_read_flight', False)
+    if flight is False:
+        flight = get_singleflight(exchange.exchange_name, exchange.api_key, getattr(exchange, 'is_testnet', False))
+        exchange._read_flight = flight
+    return flight
+
+
+def coalesced_read(func: Optional[Callable] = None, *, reusable: Optional[Callable[[Any], bool]] = None):
+    """
+    交易所读方法装饰器: 合并相同的并发请求
+
+    可以直接使用 @coalesced_read,或用 @coalesced_read(reusable=...) 限制哪些结果可以复用
+    (例如未完成订单的状态变化快,只合并进行中的请求)
+    """
+    def decorator(func: Callable):
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            flight = _account_flight(self)
+            if flight is None:
+                return await func(self, *args, **kwargs)
+            key = (func.__name__, repr(args), repr(sorted(kwargs.items())))
+            return await flight.do(key, lambda: func(self, *args, **kwargs), reusable)
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def invalidates_reads(func: Callable):
+    """交易所写方法装饰器: 完成后(无论成功与否)使该账户的读结果失效"""
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            flight = _account_flight(self)
+            if flight is not None:
+                flight.invalidate()
+    return wrapper
@@ -0,0 +1,282 @@
+"""
+公共行情 WebSocket 推送
+
+通过交易所公共频道(OKX tickers / Binance bookTicker)维护每个交易对的最新价格,
+REST 行情请求优先读取这里的内存缓存,推送中断或数据过期时回退到 REST。
+"""
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from app.exchanges.ws_stream import BaseWebSocketStream, split_symbol
+from app.utils.logger import setup_logger
+
+logger = setup_logger('ticker_stream')
+
+TickerListener = Callable[[str, Dict[str, Any]], None]
+
+
+class TickerStream(BaseWebSocketStream):
+    """公共行情推送基类"""
+
+    def __init__(self, url: str, proxy: Optional[str] = None):
+        super().__init__(url, proxy=proxy)
+        self._symbols: Set[str] = set()
+        # 频道交易对ID -> CCXT统一符号
+        self._channel_symbols: Dict[str, str] = {}
+        # 统一符号 -> (行情数据, 本地接收时间)
+        self._tickers: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._listeners: List[TickerListener] = []
+
+        self.hits = 0
+        self.stale = 0
+
+    def add_listener(self, listener: TickerListener):
+        """注册行情推送回调 listener(symbol, ticker)"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: TickerListener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    async def subscribe(self, symbol: str):
+        """订阅交易对(幂等),连接未建立时会在连接后统一订阅"""
+        self.start()
+        if symbol in self._symbols:
+            return
+
+        self._symbols.add(symbol)
+        self._channel_symbols[self.to_channel_symbol(symbol)] = symbol
+        await self.send_json(self._subscribe_message([symbol]))
+
+    async def unsubscribe(self, symbol: str):
+        """取消订阅交易对(幂等),并丢弃该交易对的缓存"""
+        if symbol not in self._symbols:
+            return
+
+        self._symbols.discard(symbol)
+        self._channel_symbols.pop(self.to_channel_symbol(symbol), None)
+        self._tickers.pop(symbol, None)
+        await self.send_json(self._unsubscribe_message([symbol]))
+
+    def get_ticker(self, symbol: str, max_age: float) -> Optional[Dict[str, Any]]:
+        """
+        读取推送缓存中的行情
+
+        Args:
+            symbol: 交易对符号
+            max_age: 最大允许的数据年龄(秒)
+
+        Returns:
+            行情数据,不存在或已过期时返回None
+        """
+        cached = self._tickers.get(symbol)
+        if cached is None:
+            return None
+
+        ticker, received_at = cached
+        if time.time() - received_at > max_age:
+            self.stale += 1
+            return None
+
+        self.hits += 1
+        return ticker
+
+    async def _on_connected(self):
+        if self._symbols:
+            await self.send_json(self._subscribe_message(sorted(self._symbols)))
+
+    async def _on_disconnected(self):
+        # 断线期间的缓存不再可信,交由 REST 回退
+        self._tickers.clear()
+
+    async def _handle_message(self, message: Any):
+        for channel_symbol, ticker in self._parse_tickers(message):
+            symbol = self._channel_symbols.get(channel_symbol)
+            if symbol is None:
+                continue
+
+            ticker['symbol'] = symbol
+            self._tickers[symbol] = (ticker, time.time())
+
+            for listener in list(self._listeners):
+                try:
+                    listener(symbol, ticker)
+                except Exception as e:
+                    logger.warning(f"[{self.name}] 行情回调失败: {str(e)}")
+
+    def to_channel_symbol(self, symbol: str) -> str:
+        """CCXT统一符号 -> 频道交易对ID"""
+        raise NotImplementedError
+
+    def _subscribe_message(self, symbols: List[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _unsubscribe_message(self, symbols: List[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _parse_tickers(self, message: Any) -> List[Tuple[str, Dict[str, Any]]]:
+        """解析推送消息,返回 [(频道交易对ID, 行情数据)]"""
+        raise NotImplementedError
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats.update({
+            "symbols": len(self._symbols),
+            "cached": len(self._tickers),
+            "hits": self.hits,
+            "stale": self.stale,
+        })
+        return stats
+
+
+class OKXTickerStream(TickerStream):
+    """OKX 公共 tickers 频道"""
+
+    LIVE_URL = "wss://ws.okx.com:8443/ws/v5/public"
+    DEMO_URL = "wss://wspap.okx.com:8443/ws/v5/public?brokerId=9999"
+
+    # OKX 要求 30 秒内无数据时发送字符串 ping
+    heartbeat_message = 'ping'
+
+    def to_channel_symbol(self, symbol: str) -> str:
+        if ':' not in symbol and '/' not in symbol:
+            # 已经是 OKX instId, 例如 BTC-USDT-SWAP
+            return symbol
+        base, quote, settle = split_symbol(symbol)
+        if settle:
+            return f"{base}-{quote}-SWAP"
+        return f"{base}-{quote}"
+
+    def _subscribe_message(self, symbols: List[str], op: str = "subscribe") -> Dict[str, Any]:
+        return {
+            "op": op,
+            "args": [
+                {"channel": "tickers", "instId": self.to_channel_symbol(symbol)}
+                for symbol in symbols
+            ]
+        }
+
+    def _unsubscribe_message(self, symbols: List[str]) -> Dict[str, Any]:
+        return self._subscribe_message(symbols, op="unsubscribe")
+
+    def _parse_tickers(self, message: Any) -> List[Tuple[str, Dict[str, Any]]]:
+        if not isinstance(message, dict) or message.get('arg', {}).get('channel') != 'tickers':
+            return []
+
+        tickers = []
+        for item in message.get('data') or []:
+            if not item.get('last'):
+                continue
+            tickers.append((item['instId'], {
+                'last_price': Decimal(item['last']),
+                'bid': Decimal(item['bidPx']) if item.get('bidPx') else None,
+                'ask': Decimal(item['askPx']) if item.get('askPx') else None,
+                'volume': Decimal(item['vol24h']) if item.get('vol24h') else None,
+                'timestamp': int(item['ts']) if item.get('ts') else None,
+            }))
+        return tickers
+
+
+class BinanceTickerStream(TickerStream):
+    """Binance U本位合约 bookTicker 频道"""
+
+    LIVE_URL = "wss://fstream.binance.com/ws"
+    DEMO_URL = "wss://stream.binancefuture.com/ws"
+
+    def __init__(self, url: str, proxy: Optional[str] = None):
+        super().__init__(url, proxy=proxy)
+        self._request_id = 0
+
+    def to_channel_symbol(self, symbol: str) -> str:
+        if '/' not in symbol:
+            return symbol.upper()
+        base, quote, _ = split_symbol(symbol)
+        return f"{base}{quote}"
+
+    def _subscribe_message(self, symbols: List[str], method: str = "SUBSCRIBE") -> Dict[str, Any]:
+        self._request_id += 1
+        return {
+            "method": method,
+            "params": [f"{self.to_channel_symbol(symbol).lower()}@bookTicker" for symbol in symbols],
+            "id": self._request_id
+        }
+
+    def _unsubscribe_message(self, symbols: List[str]) -> Dict[str, Any]:
+        return self._subscribe_message(symbols, method="UNSUBSCRIBE")
+
+    def _parse_tickers(self, message: Any) -> List[Tuple[str, Dict[str, Any]]]:
+        if not isinstance(message, dict) or message.get('e') != 'bookTicker':
+            return []
+
+        bid = Decimal(message['b'])
+        ask = Decimal(message['a'])
+        # bookTicker 不含最新成交价,使用买一卖一中间价
+        return [(message['s'], {
+            'last_price': (bid + ask) / 2,
+            'bid': bid,
+            'ask': ask,
+            'volume': None,
+            'timestamp': message.get('T') or message.get('E'),
+        })]
+
+
+TICKER_STREAMS = {
+    'okx': OKXTickerStream,
+    'binance': BinanceTickerStream,
+}
+
+# 进程内共享的行情推送连接: (交易所名称, 是否测试网) -> TickerStream
+_streams: Dict[Tuple[str, bool], TickerStream] = {}
+
+
+def get_ticker_stream(
+    exchange_name: str,
+    is_testnet: bool,
+    url: Optional[str] = None,
+    proxy: Optional[str] = None
+) -> Optional[TickerStream]:
+    """
+    获取(或创建)交易所的共享行情推送连接
+
+    Args:
+        exchange_name: 交易所名称
+        is_testnet: 是否测试网
+        url: 自定义 WebSocket 地址(可选,默认使用交易所官方地址)
+        proxy: 代理服务器地址(可选)
+
+    Returns:
+        行情推送实例,不支持推送的交易所返回None
+    """
+    key = (exchange_name, bool(is_testnet))
+    stream = _streams.get(key)
+    if stream is not None:
+        return stream
+
+    stream_class = TICKER_STREAMS.get(exchange_name)
+    if stream_class is None:
+        return None
+
+    if url is None:
+        url = stream_class.DEMO_URL if is_testnet else stream_class.LIVE_URL
+
+    stream = stream_class(url, proxy=proxy)
+    _streams[key] = stream
+    logger.info(f"创建行情推送连接: {exchange_name} testnet={is_testnet} -> {url}")
+    return stream
+
+
+async def close_ticker_streams():
+    """关闭所有行情推送连接"""
+    for stream in list(_streams.values()):
+        await stream.close()
+    _streams.clear()
+
+
+def get_ticker_stream_stats() -> Dict[str, Any]:
+    """所有行情推送连接的统计"""
+    return {
+        f"{exchange_name}{'-testnet' if is_testnet else ''}": stream.get_stats()
+        for (exchange_name, is_testnet), stream in _streams.items()
+    }
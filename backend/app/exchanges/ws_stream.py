@@ -0,0 +1,199 @@
+"""
+交易所 WebSocket 连接基类
+
+负责连接建立、断线重连(指数退避)、应用层心跳和消息分发,
+具体的订阅报文与消息解析由子类实现。
+"""
+import asyncio
+import json
+from typing import Any, List, Optional
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger('ws_stream')
+
+
+class BaseWebSocketStream:
+    """
+    交易所 WebSocket 长连接基类
+
+    子类需要实现:
+    - _on_connected(): 连接建立后发送登录/订阅报文
+    - _handle_message(message): 处理解析后的消息
+    """
+
+    # 空闲多久发送一次心跳(秒)
+    heartbeat_interval: float = 25.0
+    # 应用层心跳报文(为None时仅依赖协议层ping)
+    heartbeat_message: Optional[str] = None
+
+    def __init__(
+        self,
+        url: str,
+        proxy: Optional[str] = None,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0
+    ):
+        """
+        初始化 WebSocket 连接
+
+        Args:
+            url: WebSocket 地址
+            proxy: 代理服务器地址(可选)
+            reconnect_delay: 首次重连等待时间(秒)
+            max_reconnect_delay: 最大重连等待时间(秒)
+        """
+        self.url = url
+        self.proxy = proxy or None
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._ws = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.connected = asyncio.Event()
+
+        # 统计
+        self.messages = 0
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.__class__.__name__
+
+    def start(self):
+        """启动后台连接任务(幂等)"""
+        if self._closed:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """关闭连接并停止重连"""
+        self._closed = True
+        if self._ws is not None:
+            try:
+                await self._ws.close()
+            except Exception:
+                pass
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self.connected.clear()
+
+    async def send_json(self, payload: Any):
+        """在已建立的连接上发送 JSON 报文,未连接时忽略(重连后会重新订阅)"""
+        if self._ws is None or not self.connected.is_set():
+            return
+        try:
+            await self._ws.send(json.dumps(payload))
+        except ConnectionClosed:
+            pass
+
+    async def _run(self):
+        """连接循环: 断线后按指数退避重连"""
+        delay = self.reconnect_delay
+        while not self._closed:
+            try:
+                url = await self._connect_url()
+                # websockets>=15 支持 HTTP 代理;未配置代理时显式关闭,不读取系统代理环境变量
+                async with connect(url, proxy=self.proxy) as ws:
+                    self._ws = ws
+                    self.connected.set()
+                    delay = self.reconnect_delay
+                    logger.info(f"[{self.name}] 已连接: {self.url}")
+
+                    await self._on_connected()
+                    await self._read_loop(ws)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"[{self.name}] 连接异常: {str(e)}")
+            finally:
+                self._ws = None
+                self.connected.clear()
+                await self._on_disconnected()
+
+            if self._closed:
+                break
+
+            self.reconnects += 1
+            logger.info(f"[{self.name}] {delay:.1f}秒后重连...")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _read_loop(self, ws):
+        """读取消息,空闲时发送心跳"""
+        while True:
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                if self.heartbeat_message is not None:
+                    await ws.send(self.heartbeat_message)
+                continue
+
+            self.messages += 1
+            if raw == 'pong':
+                continue
+
+            try:
+                message = json.loads(raw)
+            except (TypeError, ValueError):
+                logger.debug(f"[{self.name}] 忽略非JSON消息: {raw!r}")
+                continue
+
+            try:
+                await self._handle_message(message)
+            except Exception as e:
+                logger.warning(f"[{self.name}] 处理消息失败: {str(e)}")
+
+    async def _connect_url(self) -> str:
+        """每次连接(含重连)前调用,返回实际连接地址(例如附带临时凭证)"""
+        return self.url
+
+    async def _on_connected(self):
+        """连接建立后的钩子(发送登录/订阅报文)"""
+        pass
+
+    async def _on_disconnected(self):
+        """连接断开后的钩子"""
+        pass
+
+    async def _handle_message(self, message: Any):
+        """处理一条已解析的消息"""
+        raise NotImplementedError
+
+    def get_stats(self) -> dict:
+        """连接统计"""
+        return {
+            "url": self.url,
+            "connected": self.connected.is_set(),
+            "messages": self.messages,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+
+def split_symbol(symbol: str) -> List[str]:
+    """
+    拆分CCXT统一交易对符号
+
+    Args:
+        symbol: 例如 BTC/USDT:USDT 或 BTC/USDT
+
+    Returns:
+        [base, quote, settle],现货的 settle 为空字符串
+    """
+    pair, _, settle = symbol.partition(':')
+    base, _, quote = pair.partition('/')
+    return [base, quote, settle]
@@ -22,34 +22,64 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all, checkfirst=True)
     
-    # 恢复运行中的机器人
+    from app.services.bot_runner import is_remote_runner, runner_client
+    from app.api.v1.websocket import manager as ws_manager
+    
+    if is_remote_runner():
+        # 机器人运行在独立进程(python -m app.runner),经 IPC 控制并接收推送事件
+        print(f"[INFO] 连接机器人运行进程 {runner_client.host}:{runner_client.port}...")
+        await runner_client.start(on_event=ws_manager.deliver_local)
+    else:
+        # 恢复运行中的机器人(启用主实例选举时成为主实例后再恢复)
+        try:
+            from app.services.bot_manager import bot_manager
+            from app.services.leader_election import host_bot_engines
+            
+            print("[INFO] 恢复运行中的机器人...")
+            recovered_count = await host_bot_engines(bot_manager)
+            if recovered_count is None:
+                print("[INFO] 已启用主实例选举,成为主实例后恢复机器人")
+            else:
+                print(f"[INFO] 成功恢复 {recovered_count} 个机器人")
+        except Exception as e:
+            print(f"[ERROR] 恢复机器人失败: {str(e)}")
+            import traceback
+            traceback.print_exc()
+    
+    # 启动WebSocket广播后端(WS_BROADCAST_BACKEND=redis 时跨进程广播)
     try:
-        from app.services.bot_manager import bot_manager
-        from app.db.session import AsyncSessionLocal
-        
-        print("[INFO] 恢复运行中的机器人...")
-        async with AsyncSessionLocal() as db:
-            recovered_count = await bot_manager.recover_running_bots(db)
-            print(f"[INFO] 成功恢复 {recovered_count} 个机器人")
+        await ws_manager.start()
     except Exception as e:
-        print(f"[ERROR] 恢复机器人失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        print(f"[ERROR] 启动WebSocket广播后端失败: {str(e)}")
+    
+    # 启动数据保留与归档任务(remote 模式下由运行进程执行)
+    if not is_remote_runner():
+        from app.services.retention_service import retention_service
+        retention_service.start()
     
     yield
     
     # 关闭时执行
     print("[INFO] 应用关闭中...")
     
-    # 停止所有运行中的机器人
-    try:
-        from app.services.bot_manager import bot_manager
-        print("[INFO] 停止所有运行中的机器人...")
-        await bot_manager.cleanup()
-        print("[INFO] 所有机器人已停止")
-    except Exception as e:
-        print(f"[ERROR] 停止机器人失败: {str(e)}")
+    if is_remote_runner():
+        # 机器人继续在运行进程中运行
+        await runner_client.close()
+    else:
+        # 停止所有运行中的机器人
+        try:
+            from app.services.bot_manager import bot_manager
+            print("[INFO] 停止所有运行中的机器人...")
+            await bot_manager.cleanup()
+            print("[INFO] 所有机器人已停止")
+        except Exception as e:
+            print(f"[ERROR] 停止机器人失败: {str(e)}")
+        
+        # 释放主实例租约,其他实例可以立即接管
+        from app.services.leader_election import leader_elector
+        await leader_elector.stop()
     
+    await ws_manager.stop()
     await engine.dispose()
 
 
@@ -94,8 +124,70 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查"""
-    return {"status": "healthy"}
+    """健康检查(附带机器人启动恢复进度)"""
+    from app.services.bot_recovery import recovery_progress
+    from app.services.bot_runner import BotRunnerError, is_remote_runner, runner_client
+
+    if is_remote_runner():
+        # 机器人在运行进程中恢复
+        try:
+            recovery = await runner_client.call("recovery", timeout=2.0)
+        except BotRunnerError as e:
+            recovery = {"state": "unavailable", "error": str(e)}
+    else:
+        recovery = recovery_progress.get_stats()
+    return {"status": "healthy", "recovery": recovery}
+
+
+@app.get("/metrics")
+async def metrics():
+    """运行时指标"""
+    from app.services.market_data_service import market_data_service
+    from app.exchanges.ticker_stream import get_ticker_stream_stats
+    from app.exchanges.order_stream import get_order_stream_stats
+    from app.services.bot_manager import bot_manager
+    from app.db.session import get_pool_status
+    from app.db.writer import db_writer
+    from app.services.spread_recorder import spread_recorder
+    from app.services.retention_service import retention_service
+    from app.api.v1.websocket import manager as ws_manager
+    from app.services.bot_runner import BotRunnerError, is_remote_runner, runner_client
+    from app.services.leader_election import leader_elector
+    from app.exchanges.exchange_registry import exchange_registry
+    from app.exchanges.rate_governor import get_rate_governor_stats
+    from app.exchanges.singleflight import get_singleflight_stats
+
+    if is_remote_runner():
+        # 机器人相关指标来自运行进程
+        try:
+            runner = await runner_client.call("metrics", timeout=5.0)
+        except BotRunnerError as e:
+            runner = {"error": str(e)}
+        return {
+            "db_pool": get_pool_status(),
+            "websocket": ws_manager.get_stats(),
+            "runner_client": runner_client.get_stats(),
+            "runner": runner,
+        }
+
+    return {
+        "db_pool": get_pool_status(),
+        "db_writer": db_writer.get_stats(),
+        "market_data": market_data_service.get_stats(),
+        "ticker_streams": get_ticker_stream_stats(),
+        "order_streams": get_order_stream_stats(),
+        "spread_recorder": spread_recorder.get_stats(),
+        "retention": retention_service.get_stats(),
+        "websocket": ws_manager.get_stats(),
+        "leader": leader_elector.get_stats(),
+        "exchange_clients": exchange_registry.get_stats(),
+        "rate_limits": get_rate_governor_stats(),
+        "read_coalescing": get_singleflight_stats(),
+        "bots": {
+            bot_id: {**engine.get_scheduling_stats(), "execution": engine.get_execution_stats()}
+            for bot_id, engine in bot_manager.running_bots.items()
+        },
+    }
 
 
 if __name__ == "__main__":
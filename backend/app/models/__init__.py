@@ -8,6 +8,8 @@ from app.models.order import Order
 from app.models.position import Position
 from app.models.trade_log import TradeLog
 from app.models.spread_history import SpreadHistory
+from app.models.spread_rollup import SpreadRollup
+from app.models.service_lease import ServiceLease
 
 __all__ = [
     "User",
@@ -17,4 +19,6 @@ __all__ = [
     "Position",
     "TradeLog",
     "SpreadHistory",
+    "SpreadRollup",
+    "ServiceLease",
 ]
\ No newline at end of file
@@ -16,6 +16,7 @@ if TYPE_CHECKING:
     from app.models.position import Position
     from app.models.trade_log import TradeLog
     from app.models.spread_history import SpreadHistory
+    from app.models.spread_rollup import SpreadRollup
 
 
 class BotInstance(Base):
@@ -138,5 +139,11 @@ class BotInstance(Base):
         cascade="all, delete-orphan"
     )
     
+    spread_rollups: Mapped[List["SpreadRollup"]] = relationship(
+        "SpreadRollup",
+        back_populates="bot_instance",
+        cascade="all, delete-orphan"
+    )
+    
     def __repr__(self) -> str:
         return f"<BotInstance(id={self.id}, name='{self.bot_name}', status='{self.status}')>"
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+服务租约数据模型
+"""
+from sqlalchemy import String, DateTime, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+
+from app.db.base import Base
+
+
+class ServiceLease(Base):
+    """服务租约模型 - 多实例部署时用于选举唯一运行交易引擎的主实例"""
+    __tablename__ = "service_leases"
+    
+    # 租约名称(如 bot-engines)
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    
+    # 当前持有者(主机名:进程号:随机后缀)
+    holder: Mapped[str] = mapped_column(String(128), nullable=False)
+    
+    # 防护令牌: 每次租约易主时递增,旧主实例持有的令牌随即失效
+    token: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    
+    # 时间戳
+    acquired_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    renewed_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    
+    def __repr__(self) -> str:
+        return f"<ServiceLease(name={self.name}, holder={self.holder}, token={self.token})>"
@@ -0,0 +1,60 @@
+"""
+价差历史聚合数据模型
+"""
+from sqlalchemy import String, DateTime, ForeignKey, Integer, DECIMAL, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from datetime import datetime
+from decimal import Decimal
+from typing import TYPE_CHECKING
+
+from app.db.base import Base
+
+if TYPE_CHECKING:
+    from app.models.bot_instance import BotInstance
+
+
+class SpreadRollup(Base):
+    """价差聚合模型 - 按机器人、粒度(1m/5m/1h/1d)和时间桶保存 OHLC 统计"""
+    __tablename__ = "spread_rollups"
+    
+    # 主键
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    
+    # 外键
+    bot_instance_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("bot_instances.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    
+    # 聚合粒度与时间桶起点
+    resolution: Mapped[str] = mapped_column(String(4), nullable=False)  # 1m, 5m, 1h, 1d
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    
+    # 价差统计
+    open: Mapped[Decimal] = mapped_column(DECIMAL(10, 4), nullable=False)
+    high: Mapped[Decimal] = mapped_column(DECIMAL(10, 4), nullable=False)
+    low: Mapped[Decimal] = mapped_column(DECIMAL(10, 4), nullable=False)
+    close: Mapped[Decimal] = mapped_column(DECIMAL(10, 4), nullable=False)
+    spread_sum: Mapped[Decimal] = mapped_column(DECIMAL(24, 4), nullable=False)  # 用于计算均值
+    sample_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    
+    # 桶内最后一次价格
+    market1_price: Mapped[Decimal] = mapped_column(DECIMAL(18, 8), nullable=False)
+    market2_price: Mapped[Decimal] = mapped_column(DECIMAL(18, 8), nullable=False)
+    
+    # 关系
+    bot_instance: Mapped["BotInstance"] = relationship("BotInstance", back_populates="spread_rollups")
+    
+    # 唯一约束(同时用作查询索引)
+    __table_args__ = (
+        UniqueConstraint('bot_instance_id', 'resolution', 'bucket_start'),
+    )
+    
+    @property
+    def mean(self) -> Decimal:
+        """桶内平均价差"""
+        return Decimal(self.spread_sum) / self.sample_count if self.sample_count else Decimal(0)
+    
+    def __repr__(self) -> str:
+        return f"<SpreadRollup(bot_id={self.bot_instance_id}, {self.resolution} {self.bucket_start}, close={self.close}%)>"
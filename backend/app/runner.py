@@ -0,0 +1,150 @@
+"""
+机器人运行进程入口
+
+在独立进程中运行 BotManager/BotEngine,交易循环不与 API 请求共用事件循环,
+也可以单独对该进程做性能分析。
+API 进程设置 BOT_RUNNER_MODE=remote 后经本机 IPC 控制机器人(见 app.services.bot_runner)。
+
+BOT_RUNNER_SHARDS > 1 时该进程作为监督进程,机器人按 ID 分配到多个工作进程(见 app.services.bot_shards)。
+
+用法:
+    python -m app.runner                 # 单进程或监督进程(按 BOT_RUNNER_SHARDS)
+    python -m app.runner --shards 4      # 覆盖分片数
+    python -m app.runner --worker --port 8766   # 工作进程(由监督进程启动)
+"""
+import argparse
+import asyncio
+import signal
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.core.broadcast_backend import RedisBroadcastBackend
+from app.db.base import Base
+from app.db.session import engine, get_pool_status
+from app.services.bot_runner import BotRunnerServer, RunnerEventBackend
+from app.services.bot_shards import ShardedBotManager
+from app.services.leader_election import host_bot_engines, leader_elector
+from app.utils.logger import setup_logger
+
+logger = setup_logger('runner')
+
+
+async def collect_metrics(server: BotRunnerServer, shards=None) -> Dict[str, Any]:
+    """运行进程指标(API 的 /metrics 经 IPC 读取);分片模式下汇总各工作进程"""
+    from app.services.market_data_service import market_data_service
+    from app.exchanges.ticker_stream import get_ticker_stream_stats
+    from app.exchanges.order_stream import get_order_stream_stats
+    from app.exchanges.exchange_registry import exchange_registry
+    from app.exchanges.rate_governor import get_rate_governor_stats
+    from app.exchanges.singleflight import get_singleflight_stats
+    from app.services.bot_manager import bot_manager
+    from app.db.writer import db_writer
+    from app.services.spread_recorder import spread_recorder
+    from app.services.retention_service import retention_service
+    from app.api.v1.websocket import manager as ws_manager
+
+    metrics = {
+        "ipc": server.get_stats(),
+        "db_pool": get_pool_status(),
+        "db_writer": db_writer.get_stats(),
+        "market_data": market_data_service.get_stats(),
+        "ticker_streams": get_ticker_stream_stats(),
+        "order_streams": get_order_stream_stats(),
+        "spread_recorder": spread_recorder.get_stats(),
+        "retention": retention_service.get_stats(),
+        "broadcast": ws_manager.backend.get_stats(),
+        "leader": leader_elector.get_stats(),
+        "exchange_clients": exchange_registry.get_stats(),
+        "rate_limits": get_rate_governor_stats(),
+        "read_coalescing": get_singleflight_stats(),
+        "bots": {
+            bot_id: {**bot_engine.get_scheduling_stats(), "execution": bot_engine.get_execution_stats()}
+            for bot_id, bot_engine in bot_manager.running_bots.items()
+        },
+    }
+    if shards is not None:
+        metrics.update(await shards.get_metrics())
+    return metrics
+
+
+async def run(port: Optional[int] = None, shards: Optional[int] = None, worker: bool = False):
+    """
+    启动运行进程,收到 SIGINT/SIGTERM 后停止所有机器人并退出
+
+    Args:
+        port: IPC 端口,默认 BOT_RUNNER_PORT
+        shards: 工作进程数,默认 BOT_RUNNER_SHARDS(小于 2 时在本进程运行机器人)
+        worker: 是否为分片工作进程(不恢复机器人、不执行数据保留,由监督进程负责)
+    """
+    from app.services.bot_manager import bot_manager
+    from app.services.retention_service import retention_service
+    from app.api.v1.websocket import manager as ws_manager
+
+    shards = settings.BOT_RUNNER_SHARDS if shards is None else shards
+    role = "工作进程" if worker else ("监督进程" if shards > 1 else "运行进程")
+    logger.info(f"[Runner] 机器人{role}启动中...")
+
+    if not worker:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+
+    sharded = None
+    if shards > 1 and not worker:
+        base_port = (port or settings.BOT_RUNNER_PORT) + 1
+        sharded = ShardedBotManager(shards, base_port=base_port)
+
+    server = BotRunnerServer(sharded or bot_manager, port=port)
+    server.set_metrics_provider(lambda: collect_metrics(server, sharded))
+
+    # 机器人推送: 使用 Redis 广播后端时直接经 Redis 发给所有 API 进程,否则经 IPC 转发
+    if not isinstance(ws_manager.backend, RedisBroadcastBackend):
+        ws_manager.use_backend(RunnerEventBackend(server))
+    await ws_manager.start()
+    await server.start()
+
+    if sharded is not None:
+        # 工作进程的推送事件经监督进程转发
+        await sharded.start(on_event=ws_manager.broadcast_to_bot)
+
+    if not worker:
+        # 恢复运行中的机器人(启用主实例选举时成为主实例后再恢复)
+        await host_bot_engines(sharded or bot_manager)
+        retention_service.start()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows 不支持,由 KeyboardInterrupt 结束
+            pass
+
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info(f"[Runner] 机器人{role}关闭中...")
+        await server.stop()
+        if sharded is not None:
+            await sharded.cleanup()
+        await bot_manager.cleanup()
+        await leader_elector.stop()
+        await ws_manager.stop()
+        await engine.dispose()
+        logger.info(f"[Runner] 机器人{role}已退出")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="机器人运行进程")
+    parser.add_argument("--port", type=int, default=None, help="IPC 端口(默认 BOT_RUNNER_PORT)")
+    parser.add_argument("--shards", type=int, default=None, help="工作进程数(默认 BOT_RUNNER_SHARDS)")
+    parser.add_argument("--worker", action="store_true", help="作为分片工作进程运行")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(port=args.port, shards=args.shards, worker=args.worker))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
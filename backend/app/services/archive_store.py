@@ -0,0 +1,241 @@
+"""
+本地归档存储
+
+过期数据在删除前按 表/机器人(/分区) 写入压缩的列式归档文件:
+    {ARCHIVE_DIR}/{table}/bot_{bot_id}[/{分区}]/{起始时间戳}-{结束时间戳}-{首个id}-{行数}.json.gz
+
+分区用于同一张表中查询时互不相关的数据(例如 spread_rollups 按粒度分区),
+查询某个分区时不读取其他分区的文件。
+
+文件内容为 gzip 压缩的 JSON,按列保存:
+    {"table": ..., "columns": [...], "data": {"列名": [值, ...]}}
+
+文件名中包含时间范围,查询时只打开与时间窗口重叠的文件。
+同一批数据可能因删除前中断而被重复归档,读取时按 id 去重。
+读取会解压并解析文件,在事件循环中调用时应放到线程中执行(asyncio.to_thread)。
+"""
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import DECIMAL, DateTime, Table
+
+from app.config import settings
+from app.utils.logger import setup_logger
+
+logger = setup_logger('archive_store')
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decoder(column) -> Callable[[Any], Any]:
+    if isinstance(column.type, DECIMAL):
+        return lambda v: Decimal(v) if v is not None else None
+    if isinstance(column.type, DateTime):
+        return lambda v: datetime.fromisoformat(v) if v is not None else None
+    return lambda v: v
+
+
+def _timestamp(ts: datetime) -> int:
+    return int((ts - datetime(1970, 1, 1)).total_seconds())
+
+
+class ArchiveStore:
+    """压缩列式归档文件的写入与查询"""
+
+    def __init__(self, root: Optional[str] = None):
+        """
+        初始化归档存储
+
+        Args:
+            root: 归档根目录,默认读取 ARCHIVE_DIR
+        """
+        self.root = Path(root or settings.ARCHIVE_DIR)
+
+    def _bot_dir(self, table: Table, bot_id: int, partition: Optional[str] = None) -> Path:
+        directory = self.root / table.name / f"bot_{bot_id}"
+        return directory / partition if partition else directory
+
+    def _files(self, table: Table, bot_id: int, partition: Optional[str] = None) -> List[Path]:
+        """
+        机器人(分区)的归档文件
+
+        查询分区时同时返回机器人目录下未分区的文件(分区之前写入的归档,由调用方的 where 过滤)
+        """
+        directories = [self._bot_dir(table, bot_id, partition)]
+        if partition:
+            directories.append(self._bot_dir(table, bot_id))
+        return [
+            path
+            for directory in directories if directory.exists()
+            for path in directory.glob("*.json.gz")
+        ]
+
+    def write(
+        self,
+        table: Table,
+        time_column: str,
+        bot_id: int,
+        rows: List[Dict[str, Any]],
+        partition: Optional[str] = None
+    ) -> Path:
+        """
+        把同一机器人的一批行写入归档文件(先写临时文件再重命名,保证文件完整)
+
+        Args:
+            partition: 分区名(可选)
+
+        Returns:
+            归档文件路径
+        """
+        columns = [column.name for column in table.columns]
+        times = [row[time_column] for row in rows]
+        ids = [row["id"] for row in rows]
+
+        directory = self._bot_dir(table, bot_id, partition)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / (
+            f"{_timestamp(min(times))}-{_timestamp(max(times))}-{min(ids)}-{len(rows)}.json.gz"
+        )
+
+        payload = {
+            "table": table.name,
+            "columns": columns,
+            "data": {name: [_encode(row.get(name)) for row in rows] for name in columns},
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+                f.flush()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return path
+
+    def query(
+        self,
+        table: Table,
+        time_column: str,
+        bot_id: int,
+        start: datetime,
+        end: datetime,
+        where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        partition: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        读取时间窗口内的归档行
+
+        Args:
+            where: 额外的行过滤条件
+            partition: 只读取该分区(及分区之前写入的未分区文件)
+
+        Returns:
+            按时间升序的行
+        """
+        start_ts, end_ts = _timestamp(start), _timestamp(end)
+        rows: Dict[Any, Dict[str, Any]] = {}
+
+        for path in self._files(table, bot_id, partition):
+            try:
+                first_ts, last_ts = (int(part) for part in path.name.split("-")[:2])
+            except ValueError:
+                continue
+            if last_ts < start_ts or first_ts > end_ts:
+                continue
+
+            for row in self._read(path, table):
+                if not (start <= row[time_column] <= end):
+                    continue
+                if where is not None and not where(row):
+                    continue
+                rows[row["id"]] = row
+
+        return sorted(rows.values(), key=lambda row: (row[time_column], row["id"]))
+
+    def list_files(
+        self,
+        table: Table,
+        bot_id: int,
+        start: datetime,
+        end: datetime
+    ) -> List[Path]:
+        """
+        与窗口重叠的归档文件(按文件名判断),按时间顺序排列
+
+        与 read_file 配合逐个文件读取,每次只加载一个文件
+        """
+        start_ts, end_ts = _timestamp(start), _timestamp(end)
+        files = []
+        for path in self._files(table, bot_id):
+            try:
+                first_ts, last_ts, first_id = (int(part) for part in path.name.split("-")[:3])
+            except ValueError:
+                continue
+            if last_ts >= start_ts and first_ts <= end_ts:
+                files.append(((first_ts, first_id), path))
+        return [path for _, path in sorted(files)]
+
+    def read_file(
+        self,
+        path: Path,
+        table: Table,
+        time_column: str,
+        start: datetime,
+        end: datetime
+    ) -> List[Dict[str, Any]]:
+        """读取单个归档文件中窗口内的行(按时间升序)"""
+        rows = [
+            row for row in self._read(path, table)
+            if start <= row[time_column] <= end
+        ]
+        rows.sort(key=lambda row: (row[time_column], row["id"]))
+        return rows
+
+    def _read(self, path: Path, table: Table) -> List[Dict[str, Any]]:
+        decoders = {column.name: _decoder(column) for column in table.columns}
+        with gzip.open(path, "rb") as f:
+            payload = json.loads(f.read())
+        data = payload["data"]
+        names = [name for name in payload["columns"] if name in decoders]
+        return [
+            {name: decoders[name](value) for name, value in zip(names, values)}
+            for values in zip(*(data[name] for name in names))
+        ]
+
+    def count(
+        self,
+        table: Table,
+        bot_id: int,
+        start: datetime,
+        end: datetime,
+        partition: Optional[str] = None
+    ) -> int:
+        """按文件名估算窗口内的归档行数(只统计与窗口重叠的文件)"""
+        start_ts, end_ts = _timestamp(start), _timestamp(end)
+        total = 0
+        for path in self._files(table, bot_id, partition):
+            try:
+                first_ts, last_ts, _, count = (int(part) for part in path.name[:-len(".json.gz")].split("-"))
+            except ValueError:
+                continue
+            if last_ts >= start_ts and first_ts <= end_ts:
+                total += count
+        return total
+
+
+# 全局归档存储实例
+archive_store = ArchiveStore()
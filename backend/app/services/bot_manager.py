@@ -2,16 +2,27 @@
 机器人管理服务 - 负责启动机器人并管理其生命周期
 """
 import asyncio
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 
+from app.config import settings
 from app.models.bot_instance import BotInstance
 from app.models.exchange_account import ExchangeAccount
-from app.exchanges.exchange_factory import ExchangeFactory
+from app.models.position import Position
+from app.exchanges.exchange_registry import exchange_registry
+from app.exchanges.order_stream import close_order_streams
+from app.exchanges.ticker_stream import close_ticker_streams
 from app.core.bot_engine import BotEngine
+from app.core.exceptions import LeadershipLostError
 from app.services.data_sync_service import data_sync_service
-from app.utils.encryption import decrypt_key
+from app.services.market_data_service import market_data_service
+from app.services.spread_recorder import spread_recorder
+from app.services.retention_service import retention_service
+from app.services.leader_election import leader_elector
+from app.services.bot_shutdown import ShutdownCoordinator
+from app.services.bot_recovery import group_by_account, prepare_account, recovery_progress
+from app.db.writer import db_writer
 from app.utils.logger import setup_logger
 
 logger = setup_logger('bot_manager')
@@ -26,19 +37,31 @@ class BotManager:
         # 存储机器人任务
         self.bot_tasks: Dict[int, asyncio.Task] = {}
     
-    async def start_bot(self, bot_id: int, db: AsyncSession) -> bool:
+    async def start_bot(
+        self,
+        bot_id: int,
+        db: AsyncSession,
+        fencing_token: Optional[int] = None,
+        recovered_positions: Optional[List[Dict[str, Any]]] = None
+    ) -> bool:
         """
         启动机器人
         
         Args:
             bot_id: 机器人ID
             db: 数据库会话
+            fencing_token: 主实例防护令牌(分片工作进程由监督进程传入),
+                默认使用本实例的令牌;启用主实例选举且本实例不是主实例时不启动
+            recovered_positions: 启动恢复时按账户预取的全部持仓(见 bot_recovery)
             
         Returns:
             是否启动成功
         """
         try:
             logger.info(f"[BotManager] 尝试启动机器人 {bot_id}")
+            
+            if fencing_token is None:
+                fencing_token = leader_elector.current_token()
             logger.info(f"[BotManager] 当前运行中的机器人: {list(self.running_bots.keys())}")
             
             # 检查机器人是否已在运行
@@ -68,19 +91,17 @@ class BotManager:
                 logger.error(f"交易所账户不存在: {bot.exchange_account_id}")
                 return False
             
-            # 创建交易所实例
-            logger.info(f"[BotManager] 创建交易所实例: {exchange_account.exchange_name}")
-            exchange = ExchangeFactory.create(
-                exchange_name=exchange_account.exchange_name,
-                api_key=decrypt_key(exchange_account.api_key),
-                api_secret=decrypt_key(exchange_account.api_secret),
-                passphrase=decrypt_key(exchange_account.passphrase) if exchange_account.passphrase else None,
-                is_testnet=exchange_account.is_testnet
-            )
+            # 获取账户共享的交易所实例(停止时释放)
+            logger.info(f"[BotManager] 获取交易所实例: {exchange_account.exchange_name}")
+            exchange = await exchange_registry.acquire(exchange_account)
             
             # 创建机器人引擎（不传递 db 会话，BotEngine 会创建独立会话）
             logger.info(f"[BotManager] 创建 BotEngine 实例")
-            bot_engine = BotEngine(bot, exchange, bot_id)
+            bot_engine = BotEngine(
+                bot, exchange, bot_id,
+                fencing_token=fencing_token,
+                recovered_positions=recovered_positions
+            )
             
             # 保存机器人实例
             self.running_bots[bot_id] = bot_engine
@@ -107,6 +128,9 @@ class BotManager:
             logger.info(f"[BotManager] 机器人 {bot_id} 启动成功")
             return True
             
+        except LeadershipLostError as e:
+            logger.warning(f"[BotManager] 不启动机器人 {bot_id}: {e.message}")
+            return False
         except Exception as e:
             logger.error(f"启动机器人 {bot_id} 失败: {str(e)}", exc_info=True)
             return False
@@ -136,8 +160,10 @@ class BotManager:
             # 🔥 关键修复：停止前先平仓所有持仓
             logger.info(f"[BotManager] 停止前先平仓所有持仓")
             try:
-                await bot_engine.close_all_positions()
-                logger.info(f"[BotManager] 机器人 {bot_id} 平仓完成")
+                if await bot_engine.close_all_positions():
+                    logger.info(f"[BotManager] 机器人 {bot_id} 平仓完成")
+                else:
+                    logger.error(f"[BotManager] 机器人 {bot_id} 平仓失败或未完成,继续停止流程")
             except Exception as e:
                 logger.error(f"[BotManager] 平仓失败: {str(e)}", exc_info=True)
                 # 即使平仓失败也继续停止流程
@@ -165,9 +191,9 @@ class BotManager:
                             pass
                 del self.bot_tasks[bot_id]
             
-            # 关闭交易所连接
+            # 释放交易所实例(账户最后一个使用方释放时关闭连接)
             try:
-                await bot_engine.exchange.close()
+                await exchange_registry.release(bot_engine.exchange)
             except Exception as e:
                 logger.warning(f"[BotManager] 关闭交易所连接失败: {str(e)}")
             
@@ -247,11 +273,15 @@ class BotManager:
                 # 机器人正在运行，使用引擎平仓
                 logger.info(f"机器人 {bot_id} 正在运行，使用引擎平仓")
                 bot_engine = self.running_bots[bot_id]
-                await bot_engine.close_all_positions()
-                logger.info(f"机器人 {bot_id} 平仓成功")
-                return True
-
-            # 机器人未运行，直接通过交易所API平仓
+                closed = await bot_engine.close_all_positions()
+                if closed:
+                    logger.info(f"机器人 {bot_id} 平仓成功")
+                else:
+                    logger.error(f"机器人 {bot_id} 平仓失败或未完成")
+                return closed
+
+            # 机器人未运行，直接通过交易所API平仓(只允许主实例下单)
+            leader_elector.check()
             logger.warning(f"机器人 {bot_id} 未在运行，尝试直接通过交易所API平仓")
 
             # 获取机器人信息
@@ -274,71 +304,63 @@ class BotManager:
                 logger.error(f"交易所账户不存在: {bot.exchange_account_id}")
                 return False
 
-            # 创建交易所实例
-            from app.utils.encryption import decrypt_key
-            exchange = ExchangeFactory.create(
-                exchange_name=exchange_account.exchange_name,
-                api_key=decrypt_key(exchange_account.api_key),
-                api_secret=decrypt_key(exchange_account.api_secret),
-                passphrase=decrypt_key(exchange_account.passphrase) if exchange_account.passphrase else None,
-                is_testnet=exchange_account.is_testnet
-            )
-
-            # 获取交易所持仓
-            positions = await exchange.get_all_positions()
-            bot_symbols = {bot.market1_symbol, bot.market2_symbol}
-            relevant_positions = [pos for pos in positions if pos['symbol'] in bot_symbols]
-
-            logger.info(f"发现 {len(relevant_positions)} 个需要平仓的持仓")
+            # 使用账户共享的交易所实例
+            async with exchange_registry.lease(exchange_account) as exchange:
+                # 获取交易所持仓
+                positions = await exchange.get_all_positions()
+                bot_symbols = {bot.market1_symbol, bot.market2_symbol}
+                relevant_positions = [pos for pos in positions if pos['symbol'] in bot_symbols]
 
-            # 平仓每个持仓
-            for pos in relevant_positions:
-                try:
-                    # 确定平仓方向
-                    if pos['side'] == 'long':
-                        close_side = 'sell'
-                    else:
-                        close_side = 'buy'
+                logger.info(f"发现 {len(relevant_positions)} 个需要平仓的持仓")
 
-                    logger.info(
-                        f"平仓 {pos['symbol']}: 方向={pos['side']}, "
-                        f"数量={pos['amount']}, 平仓方向={close_side}"
-                    )
-
-                    # 创建平仓订单
-                    order = await exchange.create_market_order(
-                        pos['symbol'],
-                        close_side,
-                        pos['amount'],
-                        reduce_only=True
+                # 平仓每个持仓
+                for pos in relevant_positions:
+                    try:
+                        # 确定平仓方向
+                        if pos['side'] == 'long':
+                            close_side = 'sell'
+                        else:
+                            close_side = 'buy'
+
+                        logger.info(
+                            f"平仓 {pos['symbol']}: 方向={pos['side']}, "
+                            f"数量={pos['amount']}, 平仓方向={close_side}"
+                        )
+
+                        # 创建平仓订单
+                        order = await exchange.create_market_order(
+                            pos['symbol'],
+                            close_side,
+                            pos['amount'],
+                            reduce_only=True
+                        )
+
+                        logger.info(f"平仓订单已创建: {order['id']}")
+
+                    except Exception as e:
+                        logger.error(f"平仓 {pos['symbol']} 失败: {str(e)}", exc_info=True)
+                        # 继续尝试平仓其他持仓
+
+                # 更新数据库中的持仓状态
+                from datetime import datetime
+                db_positions = await db.execute(
+                    select(Position).where(
+                        Position.bot_instance_id == bot_id,
+                        Position.is_open == True
                     )
-
-                    logger.info(f"平仓订单已创建: {order['id']}")
-
-                except Exception as e:
-                    logger.error(f"平仓 {pos['symbol']} 失败: {str(e)}", exc_info=True)
-                    # 继续尝试平仓其他持仓
-
-            # 更新数据库中的持仓状态
-            from datetime import datetime
-            db_positions = await db.execute(
-                select(Position).where(
-                    Position.bot_instance_id == bot_id,
-                    Position.is_open == True
                 )
-            )
-            for db_pos in db_positions.scalars().all():
-                db_pos.is_open = False
-                db_pos.closed_at = datetime.utcnow()
+                for db_pos in db_positions.scalars().all():
+                    db_pos.is_open = False
+                    db_pos.closed_at = datetime.utcnow()
 
-            await db.commit()
-
-            # 关闭交易所连接
-            await exchange.close()
+                await db.commit()
 
             logger.info(f"机器人 {bot_id} 直接平仓成功")
             return True
 
+        except LeadershipLostError as e:
+            logger.warning(f"机器人 {bot_id} 平仓被拒绝: {e.message}")
+            return False
         except Exception as e:
             logger.error(f"机器人 {bot_id} 平仓失败: {str(e)}", exc_info=True)
             return False
@@ -364,11 +386,21 @@ class BotManager:
         """
         return self.running_bots.copy()
     
+    async def get_bot_states(self) -> Dict[int, dict]:
+        """
+        获取所有运行中机器人的实时状态
+        
+        Returns:
+            {bot_id: 状态字典}
+        """
+        return {bot_id: engine.get_state() for bot_id, engine in self.running_bots.items()}
+    
     async def recover_running_bots(self, db: AsyncSession) -> int:
         """
         恢复所有状态为 running 的机器人
         
-        在应用启动时调用，自动恢复之前运行中的机器人
+        在应用启动时调用，自动恢复之前运行中的机器人。
+        按交易所账户分组并行恢复(见 bot_recovery),进度通过 /health 查看。
         
         Args:
             db: 数据库会话
@@ -384,46 +416,103 @@ class BotManager:
                 select(BotInstance).where(BotInstance.status == "running")
             )
             running_bots = result.scalars().all()
+            groups = group_by_account(running_bots)
+            recovery_progress.begin(len(running_bots), len(groups))
             
             if not running_bots:
                 logger.info("[BotManager] 没有需要恢复的机器人")
+                recovery_progress.finish()
                 return 0
             
-            logger.info(f"[BotManager] 发现 {len(running_bots)} 个需要恢复的机器人")
+            logger.info(
+                f"[BotManager] 发现 {len(running_bots)} 个需要恢复的机器人,"
+                f"分布在 {len(groups)} 个交易所账户"
+            )
+            
+            result = await db.execute(
+                select(ExchangeAccount).where(ExchangeAccount.id.in_(list(groups)))
+            )
+            accounts = {account.id: account for account in result.scalars().all()}
+            
+            semaphore = asyncio.Semaphore(max(1, settings.BOT_RECOVERY_CONCURRENCY))
+            
+            async def recover_account(account_id: int, bots: List[BotInstance]) -> List[int]:
+                async with semaphore:
+                    try:
+                        return await self._recover_account(accounts.get(account_id), bots)
+                    finally:
+                        recovery_progress.account_done()
+            
+            failed_groups = await asyncio.gather(
+                *(recover_account(account_id, bots) for account_id, bots in groups.items())
+            )
+            failed = [bot_id for group in failed_groups for bot_id in group]
             
-            recovered_count = 0
-            for bot in running_bots:
+            # 恢复失败的机器人统一标记为 stopped
+            if failed:
                 try:
-                    logger.info(f"[BotManager] 恢复机器人: {bot.id} - {bot.bot_name}")
-                    
-                    # 使用 start_bot 方法启动机器人
-                    success = await self.start_bot(bot.id, db)
-                    
-                    if success:
-                        recovered_count += 1
-                        logger.info(f"[BotManager] 机器人 {bot.id} 恢复成功")
-                    else:
-                        logger.warning(f"[BotManager] 机器人 {bot.id} 恢复失败")
-                        # 更新数据库状态为 stopped
-                        bot.status = "stopped"
-                        await db.commit()
-                        
+                    await db.execute(
+                        update(BotInstance)
+                        .where(BotInstance.id.in_(failed), BotInstance.status == "running")
+                        .values(status="stopped")
+                    )
+                    await db.commit()
                 except Exception as e:
-                    logger.error(f"[BotManager] 恢复机器人 {bot.id} 时出错: {str(e)}", exc_info=True)
-                    # 更新数据库状态为 stopped
-                    try:
-                        bot.status = "stopped"
-                        await db.commit()
-                    except:
-                        pass
+                    logger.error(f"[BotManager] 更新恢复失败机器人状态失败: {str(e)}")
             
-            logger.info(f"[BotManager] 机器人恢复完成: {recovered_count}/{len(running_bots)} 成功")
+            recovered_count = len(running_bots) - len(failed)
+            recovery_progress.finish()
+            logger.info(
+                f"[BotManager] 机器人恢复完成: {recovered_count}/{len(running_bots)} 成功,"
+                f"耗时 {recovery_progress.get_stats()['elapsed']} 秒"
+            )
             return recovered_count
             
         except Exception as e:
+            recovery_progress.finish()
             logger.error(f"[BotManager] 恢复运行中的机器人失败: {str(e)}", exc_info=True)
             return 0
     
+    async def _recover_account(
+        self,
+        account: Optional[ExchangeAccount],
+        bots: List[BotInstance]
+    ) -> List[int]:
+        """
+        恢复同一交易所账户下的机器人: 账户级预热一次,再逐个启动引擎
+
+        Returns:
+            恢复失败的机器人ID
+        """
+        # 预热使用的共享交易所实例即之后各引擎使用的实例
+        exchange = None
+        positions = None
+        if account is not None:
+            try:
+                exchange = await exchange_registry.acquire(account)
+                positions = await prepare_account(exchange, bots)
+            except Exception as e:
+                logger.warning(f"[BotManager] 账户 {account.id} 预热失败,机器人启动时各自同步: {str(e)}")
+        
+        from app.db.session import AsyncSessionLocal
+        failed = []
+        try:
+            async with AsyncSessionLocal() as db:
+                for bot in bots:
+                    try:
+                        success = await self.start_bot(bot.id, db, recovered_positions=positions)
+                    except Exception as e:
+                        logger.error(f"[BotManager] 恢复机器人 {bot.id} 时出错: {str(e)}", exc_info=True)
+                        success = False
+                    recovery_progress.bot_done(success)
+                    if not success:
+                        logger.warning(f"[BotManager] 机器人 {bot.id} 恢复失败")
+                        failed.append(bot.id)
+        finally:
+            # 引擎各自持有引用,这里释放恢复流程的引用
+            await exchange_registry.release(exchange)
+        return failed
+    
     def _task_done_callback(self, bot_id: int):
         """异步任务完成回调函数"""
         def callback(task: asyncio.Task):
@@ -473,21 +562,63 @@ class BotManager:
 
         return callback
 
-    async def cleanup(self):
-        """清理所有运行中的机器人"""
-        logger.info("开始清理所有运行中的机器人")
+    async def release_all(self):
+        """
+        释放所有运行中的机器人(失去主实例身份时调用)
 
-        for bot_id in list(self.running_bots.keys()):
+        只停止本实例的交易循环,不平仓、不修改数据库状态,机器人由新的主实例接管
+        """
+        bot_ids = list(self.running_bots.keys())
+        logger.warning(f"[BotManager] 释放 {len(bot_ids)} 个机器人")
+        for bot_id in bot_ids:
+            bot_engine = self.running_bots.pop(bot_id)
+            bot_engine.release()
+            task = self.bot_tasks.pop(bot_id, None)
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
             try:
-                # 创建一个虚拟的数据库会话
-                from app.db.session import AsyncSessionLocal
-                async with AsyncSessionLocal() as db:
-                    await self.stop_bot(bot_id, db)
+                await exchange_registry.release(bot_engine.exchange)
+            except Exception as e:
+                logger.warning(f"[BotManager] 关闭交易所连接失败: {str(e)}")
+            try:
+                await data_sync_service.stop_sync_for_bot(bot_id)
             except Exception as e:
-                logger.error(f"清理机器人 {bot_id} 失败: {str(e)}")
+                logger.warning(f"[BotManager] 停止数据同步服务失败: {str(e)}")
+    
+    async def cleanup(self):
+        """
+        清理所有运行中的机器人
 
-        # 停止所有数据同步
+        所有引擎并行停止,总耗时不超过 BOT_SHUTDOWN_TIMEOUT(见 bot_shutdown)
+        """
+        logger.info("开始清理所有运行中的机器人")
+
+        try:
+            await ShutdownCoordinator().shutdown(self.running_bots, self.bot_tasks)
+        except Exception as e:
+            logger.error(f"停止机器人失败: {str(e)}", exc_info=True)
+        self.running_bots.clear()
+        self.bot_tasks.clear()
+
+        # 停止所有数据同步,关闭剩余的交易所连接
         await data_sync_service.stop_all_sync()
+        await exchange_registry.close_all()
+
+        # 停止共享行情轮询、行情推送和订单推送
+        await market_data_service.stop()
+        await close_ticker_streams()
+        await close_order_streams()
+
+        # 停止数据保留任务
+        await retention_service.stop()
+
+        # 写入缓冲中剩余的价差样本,然后停止串行写入任务
+        await spread_recorder.stop()
+        await db_writer.stop()
 
         logger.info("所有机器人清理完成")
 
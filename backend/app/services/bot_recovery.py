@@ -0,0 +1,124 @@
+"""
+机器人启动恢复
+
+重启后按交易所账户分组并行恢复状态为 running 的机器人:
+- 同时处理的账户数不超过 BOT_RECOVERY_CONCURRENCY
+- 每个账户使用一个共享交易所连接(见 exchange_registry),杠杆按 (交易对, 倍数) 去重设置,持仓只查询一次,
+  账户内请求间隔 BOT_RECOVERY_REQUEST_INTERVAL 秒(交易所限频按账户计算)
+- 机器人用预取的持仓同步状态,不再逐个等待启动延迟
+
+恢复进度通过 /health 查看。
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.models.bot_instance import BotInstance
+from app.utils.logger import setup_logger
+
+logger = setup_logger('bot_recovery')
+
+
+class RecoveryProgress:
+    """恢复进度(/health 展示)"""
+
+    def __init__(self):
+        self.state = "idle"  # idle / running / done
+        self.total = 0
+        self.recovered = 0
+        self.failed = 0
+        self.accounts_total = 0
+        self.accounts_done = 0
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def begin(self, total: int, accounts: int):
+        self.state = "running"
+        self.total = total
+        self.recovered = 0
+        self.failed = 0
+        self.accounts_total = accounts
+        self.accounts_done = 0
+        self._started_at = time.monotonic()
+        self._finished_at = None
+
+    def bot_done(self, success: bool):
+        if success:
+            self.recovered += 1
+        else:
+            self.failed += 1
+
+    def account_done(self):
+        self.accounts_done += 1
+
+    def finish(self):
+        self.state = "done"
+        self._finished_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        elapsed = None
+        if self._started_at is not None:
+            elapsed = round((self._finished_at or time.monotonic()) - self._started_at, 2)
+        return {
+            "state": self.state,
+            "total": self.total,
+            "recovered": self.recovered,
+            "failed": self.failed,
+            "pending": self.total - self.recovered - self.failed,
+            "accounts_total": self.accounts_total,
+            "accounts_done": self.accounts_done,
+            "elapsed": elapsed,
+        }
+
+
+def group_by_account(bots: List[BotInstance]) -> Dict[int, List[BotInstance]]:
+    """按交易所账户分组"""
+    groups: Dict[int, List[BotInstance]] = {}
+    for bot in bots:
+        groups.setdefault(bot.exchange_account_id, []).append(bot)
+    return groups
+
+
+async def prepare_account(
+    exchange,
+    bots: List[BotInstance],
+    request_interval: Optional[float] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    账户级预热: 设置杠杆并查询一次全部持仓
+
+    Args:
+        exchange: 账户的交易所连接
+        bots: 该账户下要恢复的机器人
+        request_interval: 请求间隔(秒),默认 BOT_RECOVERY_REQUEST_INTERVAL(启用账户级限频时不等待)
+
+    Returns:
+        账户全部持仓;查询失败时返回 None(机器人启动时各自同步)
+    """
+    interval = settings.BOT_RECOVERY_REQUEST_INTERVAL if request_interval is None else request_interval
+    if getattr(exchange, 'rate_governor', None) is not None:
+        # 账户级限频器负责请求节奏
+        interval = 0
+
+    leverages = {}
+    for bot in bots:
+        for symbol in (bot.market1_symbol, bot.market2_symbol):
+            leverages[(symbol, bot.leverage)] = None
+
+    for symbol, leverage in leverages:
+        try:
+            await exchange.set_leverage(symbol, leverage)
+        except Exception as e:
+            logger.warning(f"[Recovery] 设置杠杆失败: {symbol} {leverage}x: {str(e)}")
+        await asyncio.sleep(interval)
+
+    try:
+        return await exchange.get_all_positions()
+    except Exception as e:
+        logger.warning(f"[Recovery] 查询账户持仓失败,机器人启动时各自同步: {str(e)}")
+        return None
+
+
+# 全局恢复进度
+recovery_progress = RecoveryProgress()
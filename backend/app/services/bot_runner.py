@@ -0,0 +1,473 @@
+"""
+机器人运行进程与 IPC
+
+BOT_RUNNER_MODE=remote 时机器人运行在独立进程(python -m app.runner)中,
+交易循环使用自己的事件循环,不与 API 请求争抢:
+- BotRunnerServer: 运行进程内的本机 IPC 服务,执行启动/停止/暂停/平仓并提供实时状态
+- BotRunnerClient: API 进程中的客户端,收到的机器人推送事件交给本进程的 WebSocket 连接
+- RemoteBotManager: 与 BotManager 接口一致,BotService 在 remote 模式下使用
+
+协议: 每行一个 JSON 对象(TCP,只监听本机地址)。
+连接后先发送 {"op": "hello", "token": ...},token 由 SECRET_KEY 派生。
+请求 {"id": n, "op": ..., "bot_id": ...},响应 {"id": n, "ok": true/false, "result"/"error": ...};
+运行进程主动推送 {"event": "broadcast", "bot_id": ..., "message": ...}。
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app.config import settings
+from app.core.ws_sender import encode_message
+from app.utils.logger import setup_logger
+
+logger = setup_logger('bot_runner')
+
+# 单行消息上限(字节)
+LINE_LIMIT = 16 * 1024 * 1024
+# 客户端写缓冲超过该值时丢弃推送事件(客户端处理不过来)
+EVENT_BUFFER_LIMIT = 4 * 1024 * 1024
+
+# 需要数据库会话的控制操作(对应 BotManager 的同名方法)
+CONTROL_OPS = {"start_bot", "stop_bot", "pause_bot", "close_bot_positions"}
+
+
+def runner_token() -> str:
+    """IPC 认证令牌(由 SECRET_KEY 派生,API 进程和运行进程共享)"""
+    return hmac.new(settings.SECRET_KEY.encode(), b"bot-runner", hashlib.sha256).hexdigest()
+
+
+def _encode_line(payload: Dict[str, Any]) -> bytes:
+    return encode_message(payload).encode("utf-8") + b"\n"
+
+
+class BotRunnerServer:
+    """运行进程内的 IPC 服务"""
+
+    def __init__(self, manager=None, host: Optional[str] = None, port: Optional[int] = None, session_factory=None):
+        """
+        初始化 IPC 服务
+
+        Args:
+            manager: 机器人管理器,默认全局 bot_manager
+            host: 监听地址,默认 BOT_RUNNER_HOST
+            port: 监听端口,默认 BOT_RUNNER_PORT(0 表示随机端口)
+            session_factory: 控制操作使用的数据库会话工厂,默认 AsyncSessionLocal
+        """
+        if manager is None:
+            from app.services.bot_manager import bot_manager
+            manager = bot_manager
+        self.manager = manager
+        self.host = host or settings.BOT_RUNNER_HOST
+        self.port = settings.BOT_RUNNER_PORT if port is None else port
+        self._session_factory = session_factory
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._metrics_provider: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None
+
+        # 统计
+        self.requests = 0
+        self.errors = 0
+        self.events_sent = 0
+        self.events_dropped = 0
+
+    def set_metrics_provider(self, provider: Callable[[], Awaitable[Dict[str, Any]]]):
+        """设置 metrics 请求返回的运行进程指标(异步函数)"""
+        self._metrics_provider = provider
+
+    async def start(self):
+        """开始监听"""
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, limit=LINE_LIMIT)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"[BotRunner] IPC 服务已启动: {self.host}:{self.port}")
+
+    async def stop(self):
+        """停止监听并断开所有客户端"""
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._clients):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        logger.info("[BotRunner] IPC 服务已停止")
+
+    def publish_event(self, bot_id: int, message: Dict[str, Any]):
+        """把机器人推送事件发给所有已认证的客户端(不等待网络)"""
+        if not self._clients:
+            return
+        line = _encode_line({"event": "broadcast", "bot_id": bot_id, "message": message})
+        for writer in list(self._clients):
+            if writer.is_closing():
+                self._clients.discard(writer)
+                continue
+            if writer.transport.get_write_buffer_size() > EVENT_BUFFER_LIMIT:
+                self.events_dropped += 1
+                continue
+            writer.write(line)
+            self.events_sent += 1
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks: Set[asyncio.Task] = set()
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            if hello.get("op") != "hello" or not hmac.compare_digest(str(hello.get("token", "")), runner_token()):
+                writer.write(_encode_line({"id": hello.get("id", 0), "ok": False, "error": "认证失败"}))
+                await writer.drain()
+                return
+            writer.write(_encode_line({"id": hello.get("id", 0), "ok": True}))
+            await writer.drain()
+            self._clients.add(writer)
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                # 每个请求独立执行: 停止机器人需要等待平仓,不能阻塞状态查询
+                task = asyncio.create_task(self._respond(request, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"[BotRunner] IPC 连接异常: {str(e)}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _respond(self, request: Dict[str, Any], writer: asyncio.StreamWriter):
+        self.requests += 1
+        try:
+            result = await self.handle(request.get("op"), request)
+            response = {"id": request.get("id"), "ok": True, "result": result}
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"[BotRunner] 处理请求 {request.get('op')} 失败: {str(e)}", exc_info=True)
+            response = {"id": request.get("id"), "ok": False, "error": str(e)}
+        if writer.is_closing():
+            return
+        writer.write(_encode_line(response))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def handle(self, op: str, params: Dict[str, Any]) -> Any:
+        """执行一个请求"""
+        if op in CONTROL_OPS:
+            bot_id = int(params["bot_id"])
+            extra = {}
+            if op == "start_bot" and params.get("fencing_token") is not None:
+                # 分片监督进程传入的主实例防护令牌
+                extra["fencing_token"] = int(params["fencing_token"])
+            async with self._get_session_factory()() as db:
+                return await getattr(self.manager, op)(bot_id, db, **extra)
+        if op == "running_bots":
+            return sorted((await self.manager.get_bot_states()).keys())
+        if op == "bot_state":
+            return (await self.manager.get_bot_states()).get(int(params["bot_id"]))
+        if op == "all_bot_states":
+            return await self.manager.get_bot_states()
+        if op == "metrics":
+            return await self._metrics_provider() if self._metrics_provider else {}
+        if op == "recovery":
+            from app.services.bot_recovery import recovery_progress
+            return recovery_progress.get_stats()
+        if op == "ping":
+            return "pong"
+        raise ValueError(f"未知操作: {op}")
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from app.db.session import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "address": f"{self.host}:{self.port}",
+            "clients": len(self._clients),
+            "requests": self.requests,
+            "errors": self.errors,
+            "events_sent": self.events_sent,
+            "events_dropped": self.events_dropped,
+        }
+
+
+class RunnerEventBackend:
+    """运行进程的广播后端: 把机器人推送事件经 IPC 转发给 API 进程"""
+
+    name = "runner_ipc"
+
+    def __init__(self, server: BotRunnerServer):
+        self.server = server
+        self.published = 0
+
+    def bind(self, deliver):
+        # 运行进程没有 WebSocket 连接,不需要本地分发
+        pass
+
+    async def start(self):
+        pass
+
+    async def publish(self, bot_id: int, message: Dict[str, Any]):
+        self.published += 1
+        self.server.publish_event(bot_id, message)
+
+    async def stop(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "published": self.published}
+
+
+class BotRunnerError(Exception):
+    """运行进程不可用或请求失败"""
+
+
+class BotRunnerClient:
+    """API 进程中的 IPC 客户端(单连接,请求按 id 复用)"""
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, timeout: Optional[float] = None):
+        """
+        初始化客户端
+
+        Args:
+            host: 运行进程地址,默认 BOT_RUNNER_HOST
+            port: 运行进程端口,默认 BOT_RUNNER_PORT
+            timeout: 请求超时(秒),默认 BOT_RUNNER_TIMEOUT
+        """
+        self.host = host or settings.BOT_RUNNER_HOST
+        self.port = port or settings.BOT_RUNNER_PORT
+        self.timeout = timeout or settings.BOT_RUNNER_TIMEOUT
+        self.reconnect_delay = 1.0
+        self.max_reconnect_delay = 30.0
+
+        self.on_event: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = count(1)
+        self._closed = False
+
+        # 统计
+        self.requests = 0
+        self.errors = 0
+        self.events = 0
+        self.reconnects = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def start(self, on_event: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None):
+        """
+        连接运行进程;连接失败时在后台重试
+
+        Args:
+            on_event: 收到机器人推送事件时的回调(bot_id, message)
+        """
+        self.on_event = on_event
+        self._closed = False
+        try:
+            await self._ensure_connected()
+        except BotRunnerError as e:
+            logger.warning(f"[BotRunner] {str(e)},后台重试")
+            self._schedule_reconnect()
+
+    async def _ensure_connected(self):
+        if self.connected:
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT), timeout=5.0
+                )
+                writer.write(_encode_line({"id": 0, "op": "hello", "token": runner_token()}))
+                await writer.drain()
+                reply = json.loads(await asyncio.wait_for(reader.readline(), timeout=5.0) or b"{}")
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                raise BotRunnerError(f"无法连接机器人运行进程 {self.host}:{self.port}: {str(e)}")
+            if not reply.get("ok"):
+                writer.close()
+                raise BotRunnerError(f"机器人运行进程拒绝连接: {reply.get('error')}")
+
+            self._reader, self._writer = reader, writer
+            self._reader_task = asyncio.create_task(self._read_loop(reader))
+            logger.info(f"[BotRunner] 已连接机器人运行进程 {self.host}:{self.port}")
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "event" in message:
+                    self.events += 1
+                    if self.on_event is not None:
+                        try:
+                            await self.on_event(int(message["bot_id"]), message["message"])
+                        except Exception as e:
+                            logger.error(f"[BotRunner] 处理推送事件失败: {str(e)}")
+                    continue
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[BotRunner] IPC 读取中断: {str(e)}")
+        finally:
+            self._disconnected()
+
+    def _disconnected(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(BotRunnerError("与机器人运行进程的连接已断开"))
+        self._pending.clear()
+        if not self._closed:
+            logger.warning("[BotRunner] 与机器人运行进程的连接已断开")
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        if self._closed or (self._reconnect_task is not None and not self._reconnect_task.done()):
+            return
+        self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        # 保持连接以接收推送事件
+        delay = self.reconnect_delay
+        while not self._closed and not self.connected:
+            await asyncio.sleep(delay)
+            try:
+                await self._ensure_connected()
+                self.reconnects += 1
+            except BotRunnerError:
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def call(self, op: str, timeout: Optional[float] = None, **params) -> Any:
+        """
+        发送请求并等待结果
+
+        Raises:
+            BotRunnerError: 运行进程不可用、超时或返回错误
+        """
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self.requests += 1
+        try:
+            self._writer.write(_encode_line({"id": request_id, "op": op, **params}))
+            await self._writer.drain()
+            response = await asyncio.wait_for(future, timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.errors += 1
+            raise BotRunnerError(f"机器人运行进程请求超时: {op}")
+        except (ConnectionError, BotRunnerError) as e:
+            self.errors += 1
+            raise BotRunnerError(str(e))
+        finally:
+            self._pending.pop(request_id, None)
+
+        if not response.get("ok"):
+            self.errors += 1
+            raise BotRunnerError(response.get("error") or f"请求失败: {op}")
+        return response.get("result")
+
+    async def close(self):
+        """断开连接并停止重连"""
+        self._closed = True
+        for task in (self._reconnect_task, self._reader_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._reconnect_task = self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "address": f"{self.host}:{self.port}",
+            "connected": self.connected,
+            "requests": self.requests,
+            "errors": self.errors,
+            "events": self.events,
+            "reconnects": self.reconnects,
+        }
+
+
+class RemoteBotManager:
+    """经 IPC 控制运行进程中的机器人,接口与 BotManager 一致"""
+
+    def __init__(self, client: BotRunnerClient):
+        self.client = client
+
+    async def _control(self, op: str, bot_id: int) -> bool:
+        try:
+            return bool(await self.client.call(op, bot_id=bot_id))
+        except BotRunnerError as e:
+            logger.error(f"[BotRunner] {op} 机器人 {bot_id} 失败: {str(e)}")
+            return False
+
+    async def start_bot(self, bot_id: int, db=None) -> bool:
+        return await self._control("start_bot", bot_id)
+
+    async def stop_bot(self, bot_id: int, db=None) -> bool:
+        return await self._control("stop_bot", bot_id)
+
+    async def pause_bot(self, bot_id: int, db=None) -> bool:
+        return await self._control("pause_bot", bot_id)
+
+    async def close_bot_positions(self, bot_id: int, db=None) -> bool:
+        return await self._control("close_bot_positions", bot_id)
+
+    async def get_running_bot(self, bot_id: int) -> Optional[Dict[str, Any]]:
+        """运行中机器人的实时状态(运行进程中的引擎无法跨进程返回)"""
+        try:
+            return await self.client.call("bot_state", bot_id=bot_id)
+        except BotRunnerError as e:
+            logger.error(f"[BotRunner] 获取机器人 {bot_id} 状态失败: {str(e)}")
+            return None
+
+    async def get_all_running_bots(self) -> Dict[int, Dict[str, Any]]:
+        """所有运行中机器人的实时状态"""
+        try:
+            states = await self.client.call("all_bot_states")
+        except BotRunnerError as e:
+            logger.error(f"[BotRunner] 获取机器人状态失败: {str(e)}")
+            return {}
+        return {int(bot_id): state for bot_id, state in states.items()}
+
+    async def get_bot_states(self) -> Dict[int, Dict[str, Any]]:
+        return await self.get_all_running_bots()
+
+    async def cleanup(self):
+        """断开与运行进程的连接(机器人继续在运行进程中运行)"""
+        await self.client.close()
+
+
+# API 进程中的运行进程客户端(BOT_RUNNER_MODE=remote 时使用)
+runner_client = BotRunnerClient()
+remote_bot_manager = RemoteBotManager(runner_client)
+
+
+def is_remote_runner() -> bool:
+    """机器人是否运行在独立进程中"""
+    return settings.BOT_RUNNER_MODE == "remote"
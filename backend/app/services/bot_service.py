@@ -9,16 +9,23 @@ from sqlalchemy import select
 from app.models.bot_instance import BotInstance
 from app.models.exchange_account import ExchangeAccount
 from app.services.bot_manager import bot_manager
+from app.services.bot_runner import is_remote_runner, remote_bot_manager
 from app.utils.logger import setup_logger
 
 logger = setup_logger('bot_service')
 
 
+def _manager():
+    """当前使用的机器人管理器: remote 模式经 IPC 控制独立运行进程"""
+    return remote_bot_manager if is_remote_runner() else bot_manager
+
+
 class BotService:
     """
     机器人管理服务
     
-    负责管理机器人的生命周期,包括启动、暂停、停止等操作
+    负责管理机器人的生命周期,包括启动、暂停、停止等操作。
+    BOT_RUNNER_MODE=remote 时操作转发给独立的机器人运行进程。
     """
     
     @classmethod
@@ -49,9 +56,9 @@ class BotService:
                 return False
 
             # 使用机器人管理器启动机器人
-            logger.info(f"[BotService] 调用 bot_manager.start_bot()")
-            success = await bot_manager.start_bot(bot_id, db)
-            logger.info(f"[BotService] bot_manager.start_bot() 返回: {success}")
+            logger.info(f"[BotService] 调用 {type(_manager()).__name__}.start_bot()")
+            success = await _manager().start_bot(bot_id, db)
+            logger.info(f"[BotService] start_bot() 返回: {success}")
 
             if success:
                 logger.info(f"[BotService] 机器人 {bot_id} 启动成功")
@@ -79,7 +86,7 @@ class BotService:
             # 创建一个新的数据库会话
             from app.db.session import AsyncSessionLocal
             async with AsyncSessionLocal() as db:
-                success = await bot_manager.pause_bot(bot_id, db)
+                success = await _manager().pause_bot(bot_id, db)
             
             if success:
                 logger.info(f"机器人 {bot_id} 已暂停")
@@ -107,7 +114,7 @@ class BotService:
             # 创建一个新的数据库会话
             from app.db.session import AsyncSessionLocal
             async with AsyncSessionLocal() as db:
-                success = await bot_manager.stop_bot(bot_id, db)
+                success = await _manager().stop_bot(bot_id, db)
             
             if success:
                 logger.info(f"机器人 {bot_id} 已停止")
@@ -135,7 +142,7 @@ class BotService:
             # 创建一个新的数据库会话
             from app.db.session import AsyncSessionLocal
             async with AsyncSessionLocal() as db:
-                success = await bot_manager.close_bot_positions(bot_id, db)
+                success = await _manager().close_bot_positions(bot_id, db)
             
             if success:
                 logger.info(f"机器人 {bot_id} 平仓指令已发送")
@@ -159,7 +166,7 @@ class BotService:
         Returns:
             机器人引擎实例,如果不存在返回None
         """
-        return await bot_manager.get_running_bot(bot_id)
+        return await _manager().get_running_bot(bot_id)
     
     @classmethod
     async def get_all_running_bots(cls):
@@ -169,7 +176,7 @@ class BotService:
         Returns:
             机器人ID到引擎实例的映射
         """
-        return await bot_manager.get_all_running_bots()
+        return await _manager().get_all_running_bots()
 
     @classmethod
     async def get_bot(cls, bot_id: int, db: AsyncSession) -> Optional[BotInstance]:
@@ -195,5 +202,5 @@ class BotService:
     @classmethod
     async def stop_all_bots(cls):
         """停止所有运行中的机器人"""
-        await bot_manager.cleanup()
+        await _manager().cleanup()
         logger.info("所有机器人已停止")
\ No newline at end of file
@@ -0,0 +1,481 @@
+"""
+机器人多进程分片
+
+单个事件循环上的 Decimal 计算、日志、ORM 刷新和 JSON 编码会随机器人数量线性增长。
+BOT_RUNNER_SHARDS > 1 时运行进程作为监督进程,启动 N 个工作进程(python -m app.runner --worker),
+按机器人 ID 一致性哈希分配机器人:
+- 每个工作进程有自己的事件循环和 IPC 端口(BOT_RUNNER_PORT + 1 + 序号)
+- 健康检查循环定期查询各工作进程;进程退出或连续无响应时终止并重启该进程,
+  其上的机器人按哈希环重新分配(重启成功时回到原分片,否则迁移到相邻分片)
+- 已运行的机器人不会因为分片恢复而迁移(迁移需要停止机器人)
+- 状态与指标按分片汇总
+
+ShardedBotManager 与 BotManager 接口一致,由监督进程的 IPC 服务直接使用。
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.core.exceptions import LeadershipLostError
+from app.models.bot_instance import BotInstance
+from app.services.bot_recovery import recovery_progress
+from app.services.bot_runner import BotRunnerClient, BotRunnerError
+from app.services.leader_election import leader_elector
+from app.utils.logger import setup_logger
+
+logger = setup_logger('bot_shards')
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """一致性哈希环(虚拟节点)"""
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100):
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self.nodes: Set[str] = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            self._owners[point] = node
+            bisect.insort(self._keys, point)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._keys.pop(bisect.bisect_left(self._keys, point))
+
+    def node_for(self, key: Any) -> Optional[str]:
+        """键所属的节点(环为空时返回 None)"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._owners[self._keys[index]]
+
+
+class ShardWorker:
+    """一个工作进程"""
+
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.name = f"shard-{index}"
+        self.port = port
+        self.process = None
+        self.client: Optional[BotRunnerClient] = None
+        self.alive = False
+        self.failures = 0
+        self.restarts = 0
+        self.last_check_ms: Optional[float] = None
+        self.started_at: Optional[float] = None
+
+    @property
+    def exited(self) -> bool:
+        return self.process is None or self.process.returncode is not None
+
+    def get_stats(self, bots: int) -> Dict[str, Any]:
+        return {
+            "alive": self.alive,
+            "pid": getattr(self.process, "pid", None),
+            "port": self.port,
+            "bots": bots,
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "last_check_ms": self.last_check_ms,
+            "uptime": round(time.monotonic() - self.started_at, 1) if self.started_at and self.alive else 0,
+        }
+
+
+class ShardedBotManager:
+    """按一致性哈希把机器人分配到多个工作进程"""
+
+    def __init__(
+        self,
+        shards: Optional[int] = None,
+        base_port: Optional[int] = None,
+        health_interval: Optional[float] = None,
+        max_failures: Optional[int] = None,
+        session_factory=None
+    ):
+        """
+        初始化分片管理器
+
+        Args:
+            shards: 工作进程数,默认 BOT_RUNNER_SHARDS
+            base_port: 第一个工作进程的端口,默认 BOT_RUNNER_PORT + 1
+            health_interval: 健康检查间隔(秒),默认 BOT_SHARD_HEALTH_INTERVAL
+            max_failures: 连续无响应多少次判定为故障,默认 BOT_SHARD_MAX_FAILURES
+            session_factory: 数据库会话工厂,默认 AsyncSessionLocal
+        """
+        shards = shards or settings.BOT_RUNNER_SHARDS
+        base_port = base_port or settings.BOT_RUNNER_PORT + 1
+        self.health_interval = health_interval or settings.BOT_SHARD_HEALTH_INTERVAL
+        self.max_failures = max_failures or settings.BOT_SHARD_MAX_FAILURES
+        self._session_factory = session_factory
+
+        self.workers: Dict[str, ShardWorker] = {
+            f"shard-{i}": ShardWorker(i, base_port + i) for i in range(shards)
+        }
+        self.ring = HashRing()
+        # 机器人 -> 所在分片
+        self.assignments: Dict[int, str] = {}
+        self.on_event = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._failover_lock = asyncio.Lock()
+
+        # 统计
+        self.failovers = 0
+        self.reassigned = 0
+
+    # ---------- 工作进程 ----------
+
+    async def start(self, on_event=None):
+        """
+        启动所有工作进程和健康检查
+
+        Args:
+            on_event: 工作进程推送事件的回调(bot_id, message)
+        """
+        self.on_event = on_event
+        await asyncio.gather(*(self._start_worker(worker) for worker in self.workers.values()))
+        self._health_task = asyncio.create_task(self._health_loop())
+        logger.info(f"[Shards] {len([w for w in self.workers.values() if w.alive])}/{len(self.workers)} 个工作进程已就绪")
+
+    async def _spawn(self, worker: ShardWorker):
+        """启动工作进程(子进程),返回进程对象"""
+        # 工作进程不参与选举,使用监督进程在 start_bot 时传入的防护令牌
+        env = dict(os.environ, BOT_RUNNER_SHARDS="0", LEADER_ELECTION_ENABLED="false")
+        return await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "app.runner", "--worker", "--port", str(worker.port),
+            cwd=str(BACKEND_DIR), env=env
+        )
+
+    async def _start_worker(self, worker: ShardWorker, ready_timeout: float = 30.0) -> bool:
+        """启动工作进程并等待其 IPC 可用,成功后加入哈希环"""
+        try:
+            worker.process = await self._spawn(worker)
+        except Exception as e:
+            logger.error(f"[Shards] 启动 {worker.name} 失败: {str(e)}")
+            return False
+
+        worker.client = BotRunnerClient(port=worker.port)
+        deadline = time.monotonic() + ready_timeout
+        while time.monotonic() < deadline and not worker.exited:
+            try:
+                await worker.client.start(on_event=self.on_event)
+                await worker.client.call("ping", timeout=2.0)
+                break
+            except BotRunnerError:
+                await asyncio.sleep(0.5)
+        else:
+            logger.error(f"[Shards] {worker.name} 未能在 {ready_timeout}s 内就绪")
+            await self._terminate(worker)
+            return False
+
+        worker.alive = True
+        worker.failures = 0
+        worker.started_at = time.monotonic()
+        self.ring.add(worker.name)
+        logger.info(f"[Shards] {worker.name} 已就绪: pid={worker.process.pid}, port={worker.port}")
+        return True
+
+    async def _terminate(self, worker: ShardWorker, timeout: Optional[float] = None):
+        """
+        终止工作进程
+
+        Args:
+            timeout: 正常退出的等待时间(秒);为 None 时直接 kill
+                (故障转移时不能让旧进程在退出流程中平仓,机器人要在新分片上继续运行)
+        """
+        worker.alive = False
+        self.ring.remove(worker.name)
+        if worker.client is not None:
+            await worker.client.close()
+            worker.client = None
+        process = worker.process
+        if process is None or process.returncode is not None:
+            return
+        try:
+            if timeout is not None:
+                process.terminate()
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=timeout)
+                    return
+                except asyncio.TimeoutError:
+                    logger.warning(f"[Shards] {worker.name} 未在 {timeout}s 内退出,强制终止")
+            process.kill()
+            await process.wait()
+        except ProcessLookupError:
+            pass
+
+    # ---------- 健康检查与故障转移 ----------
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_workers()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Shards] 健康检查失败: {str(e)}", exc_info=True)
+
+    async def check_workers(self):
+        """检查所有工作进程,同步机器人分配,处理故障"""
+        results = await asyncio.gather(*(self._check(worker) for worker in self.workers.values()))
+        failed = [worker for worker, healthy in zip(self.workers.values(), results) if not healthy]
+        for worker in failed:
+            await self._failover(worker)
+
+    async def _check(self, worker: ShardWorker) -> bool:
+        """返回 False 表示需要故障转移"""
+        if not worker.alive:
+            return False
+        if worker.exited:
+            logger.error(f"[Shards] {worker.name} 已退出: returncode={worker.process.returncode}")
+            return False
+
+        started = time.perf_counter()
+        try:
+            running = await worker.client.call("running_bots", timeout=self.health_interval)
+        except BotRunnerError as e:
+            worker.failures += 1
+            logger.warning(f"[Shards] {worker.name} 无响应({worker.failures}/{self.max_failures}): {str(e)}")
+            return worker.failures < self.max_failures
+
+        worker.failures = 0
+        worker.last_check_ms = round((time.perf_counter() - started) * 1000, 2)
+        # 同步分配: 工作进程内因异常停止的机器人不再属于该分片
+        running = set(running)
+        for bot_id, name in list(self.assignments.items()):
+            if name == worker.name and bot_id not in running:
+                del self.assignments[bot_id]
+        for bot_id in running:
+            self.assignments.setdefault(bot_id, worker.name)
+        return True
+
+    async def _failover(self, worker: ShardWorker):
+        """终止并重启故障分片,把其上的机器人按哈希环重新分配"""
+        async with self._failover_lock:
+            orphans = [bot_id for bot_id, name in self.assignments.items() if name == worker.name]
+            was_alive = worker.alive
+            # 先确保旧进程已终止,避免同一机器人在两个进程中交易
+            await self._terminate(worker)
+            for bot_id in orphans:
+                del self.assignments[bot_id]
+
+            if was_alive:
+                self.failovers += 1
+                logger.error(f"[Shards] {worker.name} 故障,重启进程并重新分配 {len(orphans)} 个机器人")
+            worker.restarts += 1
+            await self._start_worker(worker)
+
+            if orphans:
+                await self._reassign(orphans)
+
+    async def _reassign(self, bot_ids: List[int]):
+        """在当前哈希环上重新启动仍处于 running 状态的机器人"""
+        running = await self._running_in_db(bot_ids)
+        for bot_id in bot_ids:
+            if bot_id not in running:
+                continue
+            if await self.start_bot(bot_id):
+                self.reassigned += 1
+                logger.info(f"[Shards] 机器人 {bot_id} 已迁移到 {self.assignments.get(bot_id)}")
+            else:
+                logger.error(f"[Shards] 机器人 {bot_id} 重新分配失败")
+
+    async def _running_in_db(self, bot_ids: List[int]) -> Set[int]:
+        async with self._get_session_factory()() as db:
+            result = await db.execute(
+                select(BotInstance.id).where(BotInstance.id.in_(bot_ids), BotInstance.status == "running")
+            )
+            return set(result.scalars().all())
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from app.db.session import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    # ---------- BotManager 接口 ----------
+
+    def shard_for(self, bot_id: int) -> Optional[ShardWorker]:
+        """机器人所在(或应分配到)的分片"""
+        name = self.assignments.get(bot_id) or self.ring.node_for(bot_id)
+        return self.workers.get(name) if name else None
+
+    async def _control(self, op: str, bot_id: int, worker: Optional[ShardWorker], **params) -> bool:
+        if worker is None or not worker.alive:
+            logger.error(f"[Shards] 机器人 {bot_id} 没有可用的分片")
+            return False
+        try:
+            return bool(await worker.client.call(op, bot_id=bot_id, **params))
+        except BotRunnerError as e:
+            logger.error(f"[Shards] {worker.name} {op} 机器人 {bot_id} 失败: {str(e)}")
+            return False
+
+    async def start_bot(self, bot_id: int, db=None, fencing_token: Optional[int] = None) -> bool:
+        try:
+            if fencing_token is None:
+                fencing_token = leader_elector.current_token()
+        except LeadershipLostError as e:
+            logger.warning(f"[Shards] 不启动机器人 {bot_id}: {e.message}")
+            return False
+        worker = self.shard_for(bot_id)
+        success = await self._control("start_bot", bot_id, worker, fencing_token=fencing_token)
+        if success:
+            self.assignments[bot_id] = worker.name
+        return success
+
+    async def stop_bot(self, bot_id: int, db=None) -> bool:
+        if bot_id not in self.assignments:
+            logger.warning(f"[Shards] 机器人 {bot_id} 未在运行")
+            return False
+        success = await self._control("stop_bot", bot_id, self.shard_for(bot_id))
+        if success:
+            self.assignments.pop(bot_id, None)
+        return success
+
+    async def pause_bot(self, bot_id: int, db=None) -> bool:
+        if bot_id not in self.assignments:
+            logger.warning(f"[Shards] 机器人 {bot_id} 未在运行")
+            return False
+        return await self._control("pause_bot", bot_id, self.shard_for(bot_id))
+
+    async def close_bot_positions(self, bot_id: int, db=None) -> bool:
+        # 未运行的机器人由哈希环上的分片直接通过交易所平仓(只允许主实例下单)
+        if bot_id not in self.assignments and not leader_elector.is_leader:
+            logger.warning(f"[Shards] 机器人 {bot_id} 平仓被拒绝: 当前实例不是主实例")
+            return False
+        return await self._control("close_bot_positions", bot_id, self.shard_for(bot_id))
+
+    async def get_bot_states(self) -> Dict[int, Dict[str, Any]]:
+        """汇总所有分片中运行中机器人的实时状态"""
+        async def fetch(worker: ShardWorker):
+            if not worker.alive:
+                return {}
+            try:
+                states = await worker.client.call("all_bot_states", timeout=self.health_interval)
+            except BotRunnerError:
+                return {}
+            return {int(bot_id): dict(state, shard=worker.name) for bot_id, state in states.items()}
+
+        merged: Dict[int, Dict[str, Any]] = {}
+        for states in await asyncio.gather(*(fetch(worker) for worker in self.workers.values())):
+            merged.update(states)
+        return merged
+
+    async def get_all_running_bots(self) -> Dict[int, Dict[str, Any]]:
+        return await self.get_bot_states()
+
+    async def recover_running_bots(self, db) -> int:
+        """把数据库中状态为 running 的机器人并行分配到各分片(进度见 /health)"""
+        result = await db.execute(select(BotInstance).where(BotInstance.status == "running"))
+        bots = result.scalars().all()
+        # 账户级预热由工作进程各自进行,这里只统计机器人数
+        recovery_progress.begin(len(bots), 0)
+        semaphore = asyncio.Semaphore(max(1, settings.BOT_RECOVERY_CONCURRENCY))
+
+        async def recover(bot_id: int) -> bool:
+            async with semaphore:
+                success = await self.start_bot(bot_id)
+            recovery_progress.bot_done(success)
+            return success
+
+        results = await asyncio.gather(*(recover(bot.id) for bot in bots))
+        failed = [bot.id for bot, success in zip(bots, results) if not success]
+        if failed:
+            await db.execute(
+                update(BotInstance)
+                .where(BotInstance.id.in_(failed), BotInstance.status == "running")
+                .values(status="stopped")
+            )
+            await db.commit()
+        recovery_progress.finish()
+        recovered = len(bots) - len(failed)
+        logger.info(f"[Shards] 机器人恢复完成: {recovered}/{len(bots)} 成功")
+        return recovered
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """汇总各分片的运行指标"""
+        async def fetch(worker: ShardWorker):
+            if not worker.alive:
+                return worker.name, {"error": "分片不可用"}
+            try:
+                return worker.name, await worker.client.call("metrics", timeout=self.health_interval)
+            except BotRunnerError as e:
+                return worker.name, {"error": str(e)}
+
+        shards = dict(await asyncio.gather(*(fetch(worker) for worker in self.workers.values())))
+        bots: Dict[Any, Any] = {}
+        for metrics in shards.values():
+            bots.update(metrics.get("bots", {}))
+        return {"supervisor": self.get_stats(), "bots": bots, "shards": shards}
+
+    def get_stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for name in self.assignments.values():
+            counts[name] = counts.get(name, 0) + 1
+        return {
+            "shards": len(self.workers),
+            "alive": len([worker for worker in self.workers.values() if worker.alive]),
+            "bots": len(self.assignments),
+            "failovers": self.failovers,
+            "reassigned": self.reassigned,
+            "workers": {
+                name: worker.get_stats(counts.get(name, 0)) for name, worker in self.workers.items()
+            },
+        }
+
+    async def release_all(self):
+        """
+        释放所有机器人(失去主实例身份时调用)
+
+        直接终止各工作进程(不平仓、不修改机器人状态)后重新启动空的工作进程
+        """
+        logger.warning(f"[Shards] 释放 {len(self.assignments)} 个机器人,重启所有工作进程")
+        async with self._failover_lock:
+            self.assignments.clear()
+            await asyncio.gather(*(self._terminate(worker) for worker in self.workers.values()))
+            await asyncio.gather(*(self._start_worker(worker) for worker in self.workers.values()))
+
+    async def cleanup(self):
+        """停止健康检查,让各工作进程停止其上的机器人后退出"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        # 工作进程收到 SIGTERM 后在 BOT_SHUTDOWN_TIMEOUT 内停止机器人,留出退出余量
+        timeout = settings.BOT_SHUTDOWN_TIMEOUT + 10
+        await asyncio.gather(*(
+            self._terminate(worker, timeout=timeout) for worker in self.workers.values()
+        ))
+        self.assignments.clear()
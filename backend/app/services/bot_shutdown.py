@@ -0,0 +1,174 @@
+"""
+机器人并行关闭
+
+服务关闭时同时通知所有引擎停止,在统一的截止时间(BOT_SHUTDOWN_TIMEOUT)内并行收尾:
+1. 所有引擎同时设置停止标志;空闲等待中的引擎直接结束,正在执行循环的引擎完成本轮后退出
+2. BOT_SHUTDOWN_CLOSE_POSITIONS 为 True 时并行平仓,全部持仓已平仓的机器人标记为 stopped
+   (平仓失败、部分成交或超时的保持 running)
+3. 截止时间到达仍未结束的引擎被取消(本轮未提交的修改回滚,下单前的检查点已提交)
+4. 并行释放交易所连接(账户最后一个使用方释放时关闭)
+
+未平仓(或未启用平仓)的机器人保持 running 状态,并写入一条关闭检查点日志,
+下次启动时由恢复流程与交易所持仓同步后继续运行。
+"""
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Dict, Optional, Set
+
+from sqlalchemy import insert, update
+
+from app.config import settings
+from app.db.writer import db_writer
+from app.exchanges.exchange_registry import exchange_registry
+from app.models.bot_instance import BotInstance
+from app.models.trade_log import TradeLog
+from app.utils.logger import setup_logger
+
+logger = setup_logger('bot_shutdown')
+
+# 关闭交易所连接的超时(秒)
+EXCHANGE_CLOSE_TIMEOUT = 5.0
+
+
+class ShutdownCoordinator:
+    """在截止时间内并行停止所有机器人"""
+
+    def __init__(self, timeout: Optional[float] = None, close_positions: Optional[bool] = None):
+        """
+        Args:
+            timeout: 全局截止时间(秒),默认 BOT_SHUTDOWN_TIMEOUT
+            close_positions: 关闭前是否平仓,默认 BOT_SHUTDOWN_CLOSE_POSITIONS
+        """
+        self.timeout = settings.BOT_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        self.close_positions = (
+            settings.BOT_SHUTDOWN_CLOSE_POSITIONS if close_positions is None else close_positions
+        )
+
+    async def shutdown(self, engines: Dict[int, Any], tasks: Dict[int, asyncio.Task]) -> Dict[str, Any]:
+        """
+        停止所有引擎
+
+        Args:
+            engines: 运行中的引擎(bot_id -> BotEngine)
+            tasks: 引擎任务(bot_id -> Task)
+
+        Returns:
+            关闭统计
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.timeout
+
+        # 1. 同时通知所有引擎;空闲等待中的引擎不需要等下一轮
+        for engine in engines.values():
+            engine.request_shutdown()
+        for bot_id, engine in engines.items():
+            task = tasks.get(bot_id)
+            if task is not None and not task.done() and not engine.in_cycle:
+                task.cancel()
+
+        # 2. 并行平仓(等待各自正在执行的循环结束后进行)
+        closed: Set[int] = set()
+        if self.close_positions and engines:
+            results = await self._run_until(
+                deadline, {bot_id: engine.close_all_positions() for bot_id, engine in engines.items()}
+            )
+            closed = {bot_id for bot_id, ok in results.items() if ok}
+
+        # 3. 等待引擎退出,截止时间到达后取消
+        interrupted: Set[int] = set()
+        pending = [task for task in tasks.values() if not task.done()]
+        if pending:
+            _, still_running = await asyncio.wait(pending, timeout=max(deadline - loop.time(), 0))
+            interrupted = {bot_id for bot_id, task in tasks.items() if task in still_running}
+            for task in still_running:
+                task.cancel()
+            await asyncio.gather(*still_running, return_exceptions=True)
+
+        # 4. 并行释放交易所连接
+        await asyncio.gather(
+            *(self._close_exchange(bot_id, engine) for bot_id, engine in engines.items()),
+            return_exceptions=True
+        )
+
+        # 5. 状态与检查点
+        resumable = [bot_id for bot_id in engines if bot_id not in closed]
+        await self._persist(closed, resumable, interrupted)
+
+        stats = {
+            "bots": len(engines),
+            "closed": len(closed),
+            "resumable": len(resumable),
+            "interrupted": len(interrupted),
+            "elapsed": round(loop.time() - started, 2),
+        }
+        logger.info(f"[Shutdown] 机器人已全部停止: {stats}")
+        return stats
+
+    async def _run_until(self, deadline: float, coros: Dict[int, Awaitable]) -> Dict[int, bool]:
+        """并行平仓,截止时间到达后取消未完成的;返回每个机器人的持仓是否已全部平仓"""
+        tasks = {bot_id: asyncio.ensure_future(coro) for bot_id, coro in coros.items()}
+        remaining = max(deadline - asyncio.get_running_loop().time(), 0)
+        _, pending = await asyncio.wait(tasks.values(), timeout=remaining)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        results = {}
+        for bot_id, task in tasks.items():
+            if task.cancelled():
+                logger.warning(f"[Shutdown] 机器人 {bot_id} 平仓未在截止时间内完成")
+                ok = False
+            elif task.exception() is not None:
+                logger.error(f"[Shutdown] 机器人 {bot_id} 平仓失败: {task.exception()}")
+                ok = False
+            else:
+                # close_all_positions 内部处理异常,平仓失败或未完成时返回 False
+                ok = task.result() is True
+                if not ok:
+                    logger.error(f"[Shutdown] 机器人 {bot_id} 平仓失败或未完成")
+            results[bot_id] = ok
+        return results
+
+    async def _close_exchange(self, bot_id: int, engine):
+        try:
+            await asyncio.wait_for(exchange_registry.release(engine.exchange), timeout=EXCHANGE_CLOSE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"[Shutdown] 关闭机器人 {bot_id} 的交易所连接失败: {str(e)}")
+
+    async def _persist(self, closed: Set[int], resumable: list, interrupted: Set[int]):
+        """已平仓的机器人标记为 stopped;其余保持 running 并写入关闭检查点"""
+        if not closed and not resumable:
+            return
+        now = datetime.utcnow()
+        rows = [
+            {
+                "bot_instance_id": bot_id,
+                "log_type": "info",
+                "message": "服务关闭,机器人将在下次启动时与交易所同步后继续运行",
+                "details": {
+                    "shutdown_checkpoint": {
+                        "at": now.isoformat(),
+                        "interrupted": bot_id in interrupted,
+                        "close_pending": self.close_positions,
+                    }
+                },
+                "created_at": now,
+            }
+            for bot_id in resumable
+        ]
+
+        async def write(session):
+            if closed:
+                await session.execute(
+                    update(BotInstance)
+                    .where(BotInstance.id.in_(list(closed)), BotInstance.status == "running")
+                    .values(status="stopped")
+                )
+            if rows:
+                await session.execute(insert(TradeLog), rows)
+
+        try:
+            await db_writer.submit(write)
+        except Exception as e:
+            logger.error(f"[Shutdown] 写入关闭检查点失败: {str(e)}", exc_info=True)
@@ -11,8 +11,11 @@ from app.models.bot_instance import BotInstance
 from app.models.exchange_account import ExchangeAccount
 from app.models.order import Order
 from app.models.position import Position
-from app.exchanges.exchange_factory import ExchangeFactory
-from app.utils.encryption import decrypt_key
+from app.db.session import AsyncSessionLocal
+from app.db.writer import db_writer
+from app.exchanges.base_exchange import BaseExchange
+from app.exchanges.exchange_registry import exchange_registry
+from app.exchanges.rate_governor import background_requests
 from app.utils.logger import setup_logger
 
 logger = setup_logger('data_sync_service')
@@ -23,6 +26,7 @@ class DataSyncService:
     
     def __init__(self):
         self.sync_tasks: Dict[int, asyncio.Task] = {}
+        self.sync_exchanges: Dict[int, BaseExchange] = {}
         self.is_running = False
     
     async def start_sync_for_bot(self, bot_id: int, db: AsyncSession):
@@ -60,18 +64,13 @@ class DataSyncService:
                 logger.error(f"交易所账户不存在: {bot.exchange_account_id}")
                 return
             
-            # 创建交易所实例
-            exchange = ExchangeFactory.create(
-                exchange_name=exchange_account.exchange_name,
-                api_key=decrypt_key(exchange_account.api_key),
-                api_secret=decrypt_key(exchange_account.api_secret),
-                passphrase=decrypt_key(exchange_account.passphrase) if exchange_account.passphrase else None,
-                is_testnet=exchange_account.is_testnet
-            )
+            # 使用账户共享的交易所实例(与机器人引擎共用,停止同步时释放)
+            exchange = await exchange_registry.acquire(exchange_account)
+            self.sync_exchanges[bot_id] = exchange
             
             # 创建同步任务
             task = asyncio.create_task(
-                self._sync_loop(bot_id, exchange, db)
+                self._sync_loop(bot_id, exchange)
             )
             self.sync_tasks[bot_id] = task
             
@@ -97,6 +96,13 @@ class DataSyncService:
                     pass
             del self.sync_tasks[bot_id]
             logger.info(f"停止机器人 {bot_id} 数据同步")
+        
+        exchange = self.sync_exchanges.pop(bot_id, None)
+        if exchange is not None:
+            try:
+                await exchange_registry.release(exchange)
+            except Exception as e:
+                logger.warning(f"释放机器人 {bot_id} 的交易所连接失败: {str(e)}")
     
     async def stop_all_sync(self):
         """停止所有数据同步任务"""
@@ -104,13 +110,19 @@ class DataSyncService:
             await self.stop_sync_for_bot(bot_id)
         logger.info("所有数据同步任务已停止")
     
-    async def _sync_loop(self, bot_id: int, exchange, db: AsyncSession):
-        """数据同步循环"""
+    async def _sync_loop(self, bot_id: int, exchange):
+        """
+        数据同步循环(每次同步借用独立会话,同步间隔内不占用连接池)
+
+        同步请求为后台优先级,账户限频额度优先留给机器人交易
+        """
         while True:
             try:
                 # 同步订单和持仓
-                await self._sync_orders(bot_id, exchange, db)
-                await self._sync_positions(bot_id, exchange, db)
+                with background_requests():
+                    async with AsyncSessionLocal() as db:
+                        await self._sync_orders(bot_id, exchange, db)
+                        await self._sync_positions(bot_id, exchange, db)
                 
                 # 每30秒同步一次
                 await asyncio.sleep(30)
@@ -164,7 +176,7 @@ class DataSyncService:
                         f"获取订单 {order.exchange_order_id} 状态失败: {str(e)}"
                     )
             
-            await db.commit()
+            await db_writer.commit(db)
             
         except Exception as e:
             logger.error(f"同步订单数据失败: {str(e)}", exc_info=True)
@@ -255,7 +267,7 @@ class DataSyncService:
 
                     logger.info(f"发现新持仓: {symbol}, 分配周期号: {next_cycle}")
             
-            await db.commit()
+            await db_writer.commit(db)
             
         except Exception as e:
             logger.error(f"同步持仓数据失败: {str(e)}", exc_info=True)
@@ -0,0 +1,316 @@
+"""
+主实例选举(数据库租约)
+
+多个后端实例同时运行时,只有持有 service_leases 中 bot-engines 租约的实例运行交易引擎,
+其他实例只提供读接口:
+- 租约有过期时间,主实例按 LEADER_RENEW_INTERVAL 续约;过期后任何实例都可以接管
+- 每次租约易主时防护令牌(token)递增。机器人启动时拿到当前令牌,
+  下单前校验数据库中的令牌未变化,旧主实例即使还在运行也无法继续下单
+- 续约失败且本地有效期已过时主动让出,释放本地交易引擎(不平仓、不修改机器人状态)
+
+本地有效期 = 续约开始时间 + TTL - 续约间隔,实例之间的时钟偏差需小于续约间隔。
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import case, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.core.exceptions import LeadershipLostError
+from app.models.service_lease import ServiceLease
+from app.utils.logger import setup_logger
+
+logger = setup_logger('leader_election')
+
+# 交易引擎租约名称
+BOT_ENGINE_LEASE = "bot-engines"
+
+
+class LeaderElector:
+    """基于数据库租约的主实例选举"""
+
+    def __init__(
+        self,
+        name: str = BOT_ENGINE_LEASE,
+        enabled: Optional[bool] = None,
+        ttl: Optional[float] = None,
+        renew_interval: Optional[float] = None,
+        session_factory=None
+    ):
+        """
+        初始化选举
+
+        Args:
+            name: 租约名称
+            enabled: 是否启用,默认 LEADER_ELECTION_ENABLED(关闭时本实例始终视为主实例)
+            ttl: 租约有效期(秒),默认 LEADER_LEASE_TTL
+            renew_interval: 续约/竞选间隔(秒),默认 LEADER_RENEW_INTERVAL
+            session_factory: 数据库会话工厂,默认 AsyncSessionLocal
+        """
+        self.name = name
+        self.enabled = settings.LEADER_ELECTION_ENABLED if enabled is None else enabled
+        self.ttl = ttl or settings.LEADER_LEASE_TTL
+        self.renew_interval = renew_interval or settings.LEADER_RENEW_INTERVAL
+        self._session_factory = session_factory
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.token: Optional[int] = None
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._on_elected: Optional[Callable[[int], Awaitable[None]]] = None
+        self._on_lost: Optional[Callable[[], Awaitable[None]]] = None
+
+        # 统计
+        self.elections = 0
+        self.step_downs = 0
+        self.renew_failures = 0
+        self.last_renew_ms: Optional[float] = None
+
+    @property
+    def is_leader(self) -> bool:
+        """本实例当前是否持有有效租约(未启用选举时始终为 True)"""
+        if not self.enabled:
+            return True
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    def current_token(self) -> Optional[int]:
+        """
+        当前防护令牌(启动机器人时记录到引擎中)
+
+        Returns:
+            令牌,未启用选举时返回 None
+
+        Raises:
+            LeadershipLostError: 本实例不是主实例
+        """
+        if not self.enabled:
+            return None
+        if not self.is_leader:
+            raise LeadershipLostError()
+        return self.token
+
+    def check(self):
+        """本地检查: 不是主实例时抛出 LeadershipLostError"""
+        if not self.is_leader:
+            raise LeadershipLostError()
+
+    # ---------- 生命周期 ----------
+
+    async def start(
+        self,
+        on_elected: Callable[[int], Awaitable[None]],
+        on_lost: Callable[[], Awaitable[None]]
+    ):
+        """
+        开始竞选
+
+        Args:
+            on_elected: 成为主实例后的回调(参数为防护令牌),例如恢复运行中的机器人
+            on_lost: 失去主实例身份后的回调,例如释放本地交易引擎
+        """
+        self._on_elected = on_elected
+        self._on_lost = on_lost
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"[Leader] 开始竞选: lease={self.name}, holder={self.holder_id}, ttl={self.ttl}s")
+
+    async def _loop(self):
+        while True:
+            try:
+                if self.token is None:
+                    if await self.try_acquire():
+                        await self._on_elected(self.token)
+                elif not await self.renew():
+                    await self._step_down("租约已被其他实例接管")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.renew_failures += 1
+                logger.error(f"[Leader] 租约操作失败: {str(e)}")
+                if self.token is not None and time.monotonic() >= self._valid_until:
+                    await self._step_down("续约失败且租约已到期")
+            await asyncio.sleep(self.renew_interval)
+
+    async def _step_down(self, reason: str):
+        token, self.token = self.token, None
+        self._valid_until = 0.0
+        self.step_downs += 1
+        logger.error(f"[Leader] 失去主实例身份(token={token}): {reason}")
+        if self._on_lost is not None:
+            try:
+                await self._on_lost()
+            except Exception as e:
+                logger.error(f"[Leader] 释放交易引擎失败: {str(e)}", exc_info=True)
+
+    async def stop(self):
+        """停止竞选;如果是主实例则释放租约,其他实例可以立即接管"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.token is not None:
+            try:
+                async with self._get_session_factory()() as db:
+                    await db.execute(
+                        update(ServiceLease)
+                        .where(
+                            ServiceLease.name == self.name,
+                            ServiceLease.holder == self.holder_id,
+                            ServiceLease.token == self.token
+                        )
+                        .values(expires_at=datetime.utcnow())
+                    )
+                    await db.commit()
+                logger.info(f"[Leader] 已释放租约(token={self.token})")
+            except Exception as e:
+                logger.warning(f"[Leader] 释放租约失败,等待其自然过期: {str(e)}")
+            self.token = None
+            self._valid_until = 0.0
+
+    # ---------- 租约操作 ----------
+    # 租约读写使用独立的短会话,不经过串行写入队列,避免续约被批量写入延迟
+
+    async def try_acquire(self) -> bool:
+        """
+        尝试获取租约(租约不存在、已过期或本来就属于本实例)
+
+        Returns:
+            是否成为主实例
+        """
+        started = time.monotonic()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        is_mine = ServiceLease.holder == self.holder_id
+
+        async with self._get_session_factory()() as db:
+            result = await db.execute(
+                update(ServiceLease)
+                .where(ServiceLease.name == self.name, or_(is_mine, ServiceLease.expires_at < now))
+                .values(
+                    holder=self.holder_id,
+                    token=case((is_mine, ServiceLease.token), else_=ServiceLease.token + 1),
+                    acquired_at=case((is_mine, ServiceLease.acquired_at), else_=now),
+                    renewed_at=now,
+                    expires_at=expires_at
+                )
+            )
+            if result.rowcount == 0:
+                db.add(ServiceLease(
+                    name=self.name, holder=self.holder_id, token=1,
+                    acquired_at=now, renewed_at=now, expires_at=expires_at
+                ))
+                try:
+                    await db.flush()
+                except IntegrityError:
+                    # 租约存在且由其他实例持有
+                    await db.rollback()
+                    return False
+            token = (await db.execute(
+                select(ServiceLease.token).where(ServiceLease.name == self.name, is_mine)
+            )).scalar_one()
+            await db.commit()
+
+        self.token = token
+        self._valid_until = started + self.ttl - self.renew_interval
+        self.elections += 1
+        logger.info(f"[Leader] 成为主实例: lease={self.name}, token={token}")
+        return True
+
+    async def renew(self) -> bool:
+        """
+        续约
+
+        Returns:
+            是否仍持有租约(False 表示已被其他实例接管)
+        """
+        started = time.monotonic()
+        now = datetime.utcnow()
+        async with self._get_session_factory()() as db:
+            result = await db.execute(
+                update(ServiceLease)
+                .where(
+                    ServiceLease.name == self.name,
+                    ServiceLease.holder == self.holder_id,
+                    ServiceLease.token == self.token
+                )
+                .values(renewed_at=now, expires_at=now + timedelta(seconds=self.ttl))
+            )
+            await db.commit()
+
+        self.last_renew_ms = round((time.monotonic() - started) * 1000, 2)
+        if result.rowcount != 1:
+            return False
+        self._valid_until = started + self.ttl - self.renew_interval
+        return True
+
+    async def verify_token(self, token: int):
+        """
+        防护令牌校验: 下单前确认令牌仍是数据库中的当前令牌且租约未过期
+
+        Raises:
+            LeadershipLostError: 令牌已失效
+        """
+        async with self._get_session_factory()() as db:
+            lease = await db.get(ServiceLease, self.name)
+        if lease is None or lease.token != token or lease.expires_at < datetime.utcnow():
+            raise LeadershipLostError("防护令牌已失效,租约已被其他实例接管", token=token)
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from app.db.session import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "lease": self.name,
+            "holder": self.holder_id,
+            "is_leader": self.is_leader,
+            "token": self.token,
+            "valid_for": round(max(0.0, self._valid_until - time.monotonic()), 1) if self.token else 0,
+            "elections": self.elections,
+            "step_downs": self.step_downs,
+            "renew_failures": self.renew_failures,
+            "last_renew_ms": self.last_renew_ms,
+        }
+
+
+# 全局主实例选举(交易引擎租约)
+leader_elector = LeaderElector()
+
+
+async def host_bot_engines(manager) -> Optional[int]:
+    """
+    在本实例运行交易引擎: 恢复状态为 running 的机器人
+
+    启用主实例选举时改为开始竞选,成为主实例后再恢复,失去主实例身份时释放本地引擎。
+
+    Args:
+        manager: 机器人管理器(BotManager 或 ShardedBotManager)
+
+    Returns:
+        恢复的机器人数量;启用选举时返回 None(恢复在成为主实例后进行)
+    """
+    from app.db.session import AsyncSessionLocal
+
+    async def recover(token: Optional[int] = None) -> int:
+        async with AsyncSessionLocal() as db:
+            recovered = await manager.recover_running_bots(db)
+        logger.info(f"[Leader] 已恢复 {recovered} 个机器人(token={token})")
+        return recovered
+
+    if not leader_elector.enabled:
+        return await recover()
+    await leader_elector.start(on_elected=recover, on_lost=manager.release_all)
+    return None
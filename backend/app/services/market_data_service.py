@@ -0,0 +1,341 @@
+"""
+行情数据中心 - 进程内共享的行情缓存与分发服务
+
+同一进程内所有机器人共享行情数据:
+- 以 (交易所, 是否测试网, 交易对) 为键,每个键每个周期只请求一次行情
+- 后台轮询任务定期刷新行情,并分发给所有订阅的 BotEngine
+- 交易所启用 WebSocket 行情推送时,推送的每个行情立即写入缓存并通知订阅者
+- 记录每个行情的刷新时间以及命中/未命中统计
+"""
+import asyncio
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.exchanges.base_exchange import BaseExchange
+from app.utils.logger import setup_logger
+
+logger = setup_logger('market_data_service')
+
+# 行情键: (交易所名称, 是否测试网, 交易对)
+MarketDataKey = Tuple[str, bool, str]
+
+
+class _TickerFeed:
+    """单个行情键的缓存与订阅状态"""
+
+    def __init__(self, key: MarketDataKey):
+        self.key = key
+        self.ticker: Optional[Dict[str, Any]] = None
+        self.updated_at: Optional[float] = None  # 本地刷新时间(秒)
+        # 订阅者: subscriber_id -> 交易所实例(用于轮询请求)
+        self.subscribers: Dict[int, BaseExchange] = {}
+        # 行情更新回调: subscriber_id -> callback(key, ticker)
+        self.listeners: Dict[int, Callable[[MarketDataKey, Dict[str, Any]], None]] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        # 已桥接的行情推送及其回调
+        self.stream = None
+        self.stream_listener: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.errors = 0
+
+    def age(self) -> Optional[float]:
+        """距上次刷新的秒数"""
+        if self.updated_at is None:
+            return None
+        return time.time() - self.updated_at
+
+    def is_fresh(self, max_age: float) -> bool:
+        """缓存是否仍然新鲜"""
+        age = self.age()
+        return self.ticker is not None and age is not None and age < max_age
+
+
+class MarketDataService:
+    """
+    进程级行情数据服务
+
+    BotEngine 通过 subscribe() 注册关心的交易对,
+    通过 get_price() 读取共享缓存,避免每个机器人各自轮询行情。
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        """
+        初始化行情数据服务
+
+        Args:
+            interval: 行情刷新间隔(秒),默认读取 MARKET_DATA_INTERVAL 配置
+        """
+        self.interval = interval if interval is not None else settings.MARKET_DATA_INTERVAL
+        self._feeds: Dict[MarketDataKey, _TickerFeed] = {}
+
+    @staticmethod
+    def make_key(exchange: BaseExchange, symbol: str) -> MarketDataKey:
+        """根据交易所实例和交易对生成行情键"""
+        return (
+            exchange.exchange_name,
+            bool(getattr(exchange, 'is_testnet', False)),
+            symbol
+        )
+
+    def _get_or_create_feed(self, key: MarketDataKey) -> _TickerFeed:
+        feed = self._feeds.get(key)
+        if feed is None:
+            feed = _TickerFeed(key)
+            self._feeds[key] = feed
+        return feed
+
+    async def subscribe(
+        self,
+        exchange: BaseExchange,
+        symbol: str,
+        subscriber_id: int,
+        on_update: Optional[Callable[[MarketDataKey, Dict[str, Any]], None]] = None
+    ):
+        """
+        订阅交易对行情
+
+        Args:
+            exchange: 订阅者使用的交易所实例
+            symbol: 交易对符号
+            subscriber_id: 订阅者ID(通常为机器人ID)
+            on_update: 行情刷新时的回调(可选)
+        """
+        key = self.make_key(exchange, symbol)
+        feed = self._get_or_create_feed(key)
+        feed.subscribers[subscriber_id] = exchange
+        if on_update is not None:
+            feed.listeners[subscriber_id] = on_update
+
+        if feed.task is None or feed.task.done():
+            feed.task = asyncio.create_task(self._poll_loop(feed))
+            logger.info(f"[MarketData] 启动行情轮询: {key}")
+
+        await self._bridge_stream(feed, exchange)
+
+        logger.debug(f"[MarketData] 订阅者 {subscriber_id} 订阅 {key}, 当前订阅数: {len(feed.subscribers)}")
+
+    async def unsubscribe(self, exchange: BaseExchange, symbol: str, subscriber_id: int):
+        """
+        取消订阅交易对行情,最后一个订阅者退出时停止轮询
+
+        Args:
+            exchange: 订阅者使用的交易所实例
+            symbol: 交易对符号
+            subscriber_id: 订阅者ID
+        """
+        key = self.make_key(exchange, symbol)
+        feed = self._feeds.get(key)
+        if feed is None:
+            return
+
+        feed.subscribers.pop(subscriber_id, None)
+        feed.listeners.pop(subscriber_id, None)
+
+        if not feed.subscribers:
+            await self._stop_feed(feed)
+            self._feeds.pop(key, None)
+            logger.info(f"[MarketData] 无订阅者,停止行情轮询: {key}")
+
+    async def _bridge_stream(self, feed: _TickerFeed, exchange: BaseExchange):
+        """交易所启用了行情推送时,把推送的行情直接发布到该行情键"""
+        stream = getattr(exchange, 'ticker_stream', None)
+        if stream is None or feed.stream is not None:
+            return
+
+        symbol = feed.key[2]
+
+        def on_stream_ticker(stream_symbol: str, ticker: Dict[str, Any]):
+            if stream_symbol == symbol:
+                self.publish(feed.key, dict(ticker))
+
+        feed.stream = stream
+        feed.stream_listener = on_stream_ticker
+        stream.add_listener(on_stream_ticker)
+        await stream.subscribe(symbol)
+        logger.info(f"[MarketData] 行情推送已接入: {feed.key}")
+
+    async def get_ticker(
+        self,
+        exchange: BaseExchange,
+        symbol: str,
+        subscriber_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        获取行情数据(已订阅的交易对优先使用共享缓存)
+
+        Args:
+            exchange: 调用方的交易所实例(缓存失效时用于请求)
+            symbol: 交易对符号
+            subscriber_id: 调用方订阅者ID(可选),由调用方触发的刷新不会再回调调用方自己
+
+        Returns:
+            行情数据字典
+        """
+        key = self.make_key(exchange, symbol)
+        feed = self._feeds.get(key)
+        if feed is None:
+            # 无订阅者的交易对不建立行情缓存(没有释放时机),直接请求
+            return await exchange.get_ticker(symbol)
+
+        if feed.is_fresh(self.interval):
+            feed.hits += 1
+            return feed.ticker
+
+        async with feed.lock:
+            # 等待锁期间可能已被其他协程刷新
+            if feed.is_fresh(self.interval):
+                feed.hits += 1
+                return feed.ticker
+
+            feed.misses += 1
+            await self._fetch(feed, exchange, source_id=subscriber_id)
+            return feed.ticker
+
+    async def get_price(
+        self,
+        exchange: BaseExchange,
+        symbol: str,
+        subscriber_id: Optional[int] = None
+    ) -> Decimal:
+        """获取最新价格"""
+        ticker = await self.get_ticker(exchange, symbol, subscriber_id)
+        return ticker['last_price']
+
+    async def _fetch(
+        self,
+        feed: _TickerFeed,
+        exchange: BaseExchange,
+        source_id: Optional[int] = None
+    ):
+        """从交易所请求行情并更新缓存"""
+        try:
+            ticker = await exchange.get_ticker(feed.key[2])
+        except Exception:
+            feed.errors += 1
+            raise
+
+        feed.fetches += 1
+        self.publish(feed.key, ticker, source_id=source_id)
+
+    def publish(
+        self,
+        key: MarketDataKey,
+        ticker: Dict[str, Any],
+        source_id: Optional[int] = None
+    ):
+        """
+        写入行情并分发给订阅者
+
+        Args:
+            key: 行情键
+            ticker: 行情数据
+            source_id: 触发本次刷新的订阅者ID(可选),不回调该订阅者
+        """
+        feed = self._feeds.get(key)
+        if feed is None:
+            return
+
+        feed.ticker = ticker
+        feed.updated_at = time.time()
+
+        for subscriber_id, listener in list(feed.listeners.items()):
+            if subscriber_id == source_id:
+                continue
+            try:
+                listener(key, ticker)
+            except Exception as e:
+                logger.warning(f"[MarketData] 订阅者 {subscriber_id} 处理行情回调失败: {str(e)}")
+
+    async def _poll_loop(self, feed: _TickerFeed):
+        """后台轮询: 每个周期刷新一次行情"""
+        try:
+            while feed.subscribers:
+                if not feed.is_fresh(self.interval):
+                    async with feed.lock:
+                        if not feed.is_fresh(self.interval):
+                            await self._refresh_from_any(feed)
+
+                # 在缓存即将过期前再次刷新
+                age = feed.age() or 0
+                await asyncio.sleep(max(self.interval - age, 0.1))
+        except asyncio.CancelledError:
+            pass
+
+    async def _refresh_from_any(self, feed: _TickerFeed):
+        """依次尝试订阅者的交易所实例,直到刷新成功"""
+        for exchange in list(feed.subscribers.values()):
+            try:
+                await self._fetch(feed, exchange)
+                return
+            except Exception as e:
+                logger.warning(f"[MarketData] 刷新行情失败 {feed.key}: {str(e)}")
+
+    async def _stop_feed(self, feed: _TickerFeed):
+        if feed.stream is not None:
+            feed.stream.remove_listener(feed.stream_listener)
+            # 推送连接在进程内共享: 没有订阅者的交易对同时取消推送订阅
+            await feed.stream.unsubscribe(feed.key[2])
+            feed.stream = None
+            feed.stream_listener = None
+
+        if feed.task and not feed.task.done():
+            feed.task.cancel()
+            try:
+                await feed.task
+            except asyncio.CancelledError:
+                pass
+        feed.task = None
+
+    async def stop(self):
+        """停止所有行情轮询任务"""
+        for feed in list(self._feeds.values()):
+            await self._stop_feed(feed)
+        self._feeds.clear()
+        logger.info("[MarketData] 所有行情轮询已停止")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取行情服务统计
+
+        Returns:
+            包含整体命中/未命中计数以及每个行情新鲜度的字典
+        """
+        feeds: List[Dict[str, Any]] = []
+        for feed in self._feeds.values():
+            exchange_name, is_testnet, symbol = feed.key
+            age = feed.age()
+            feeds.append({
+                "exchange": exchange_name,
+                "is_testnet": is_testnet,
+                "symbol": symbol,
+                "subscribers": len(feed.subscribers),
+                "streaming": feed.stream is not None,
+                "last_price": float(feed.ticker['last_price']) if feed.ticker else None,
+                "updated_at": datetime.utcfromtimestamp(feed.updated_at).isoformat() if feed.updated_at else None,
+                "age_seconds": round(age, 3) if age is not None else None,
+                "hits": feed.hits,
+                "misses": feed.misses,
+                "fetches": feed.fetches,
+                "errors": feed.errors,
+            })
+
+        return {
+            "interval": self.interval,
+            "hits": sum(f["hits"] for f in feeds),
+            "misses": sum(f["misses"] for f in feeds),
+            "fetches": sum(f["fetches"] for f in feeds),
+            "errors": sum(f["errors"] for f in feeds),
+            "feeds": feeds,
+        }
+
+
+# 全局行情数据服务实例
+market_data_service = MarketDataService()
@@ -0,0 +1,315 @@
+"""
+配对交易两腿执行
+
+开仓和平仓时两条腿同时下单(PAIR_EXECUTION_MODE=concurrent,sequential 为依次下单;
+交易所支持批量下单且 PAIR_BATCH_ORDERS 启用时,所有腿在一次签名请求中提交),并行等待成交后汇总:
+- 开仓时两腿成交比例不一致(一腿失败或部分成交)按 PAIR_FAILURE_ACTION 处理:
+  hedge 先为成交不足的腿补单(最多 PAIR_HEDGE_RETRIES 次),仍不平衡时再 unwind;
+  unwind 用只减仓市价单平掉成交多出的部分,使两腿成交比例一致
+- 平仓时未完成的腿重试(最多 PAIR_HEDGE_RETRIES 次),平仓不回滚
+- 批量下单请求失败后无法确认是否已提交的腿记为状态未知,此时不补单也不回滚(由调用方停止交易并人工核对)
+- 记录每笔交易的两腿时间差: 下单确认、成交确认和交易所成交时间
+"""
+import asyncio
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.core.exceptions import OrderStatusUnknownError
+from app.utils.logger import setup_logger
+
+logger = setup_logger('pair_executor')
+
+
+class PairLeg:
+    """一条腿: 下单请求、主订单和补单/回滚订单"""
+
+    def __init__(self, symbol: str, side: str, amount: Decimal, reduce_only: bool = False):
+        self.symbol = symbol
+        self.side = side
+        self.amount = amount
+        self.reduce_only = reduce_only
+
+        self.order: Optional[Dict[str, Any]] = None  # 主订单(已等待成交)
+        self.error: Optional[str] = None
+        self.unknown = False  # 无法确认主订单是否已提交
+        self.corrections: List[Tuple[str, Dict[str, Any]]] = []  # (hedge/unwind, 订单)
+        self.submitted_at: Optional[float] = None  # 下单接口返回时间
+        self.confirmed_at: Optional[float] = None  # 确认成交时间
+
+    @property
+    def opposite_side(self) -> str:
+        return 'sell' if self.side == 'buy' else 'buy'
+
+    @property
+    def orders(self) -> List[Dict[str, Any]]:
+        """本腿在交易所创建的全部订单"""
+        orders = [self.order] if self.order is not None else []
+        return orders + [order for _, order in self.corrections]
+
+    @property
+    def filled(self) -> Decimal:
+        """净成交数量(主订单 + 补单 - 回滚)"""
+        total = self.order['filled'] if self.order is not None else Decimal('0')
+        for action, order in self.corrections:
+            total += order['filled'] if action == 'hedge' else -order['filled']
+        return total
+
+    @property
+    def target(self) -> Decimal:
+        """目标数量: 交易所接受的数量(已按精度调整),主订单失败时为请求数量"""
+        if self.order is not None and self.order.get('amount'):
+            return self.order['amount']
+        return self.amount
+
+    @property
+    def fill_ratio(self) -> Decimal:
+        return self.filled / self.target if self.target > 0 else Decimal('0')
+
+    def net_order(self) -> Optional[Dict[str, Any]]:
+        """
+        合并后的净成交(用于更新持仓)
+
+        Returns:
+            订单格式的净成交,成交价为主订单和补单的成交均价;没有净成交时返回None
+        """
+        net = self.filled
+        entries = [order for order in self.orders if order['side'] == self.side and order['filled'] > 0]
+        if net <= 0 or not entries:
+            return None
+
+        filled_in = sum((order['filled'] for order in entries), Decimal('0'))
+        cost_in = Decimal('0')
+        for order in entries:
+            if order.get('cost'):
+                cost_in += Decimal(str(order['cost']))
+            elif order.get('price'):
+                cost_in += Decimal(str(order['price'])) * order['filled']
+        average = cost_in / filled_in
+
+        merged = dict(entries[0])
+        merged.update({'filled': net, 'cost': average * net, 'price': average})
+        return merged
+
+
+class PairExecution:
+    """一次两腿执行的结果"""
+
+    def __init__(self, legs: List[PairLeg], mode: str, tolerance: Decimal):
+        self.legs = legs
+        self.mode = mode
+        self.tolerance = tolerance
+        self.batch = False  # 是否通过一次批量请求提交
+        self.elapsed_ms: Optional[float] = None
+
+        # 两腿时间差按主订单计算(补单和回滚不计入)
+        self.submit_skew_ms = self._skew([leg.submitted_at for leg in legs], 1000)
+        self.confirm_skew_ms = self._skew([leg.confirmed_at for leg in legs], 1000)
+        self.exchange_skew_ms = self._skew(
+            [leg.order.get('timestamp') if leg.order is not None else None for leg in legs], 1
+        )
+
+    @staticmethod
+    def _skew(values: List[Optional[float]], scale: float) -> Optional[float]:
+        known = [value for value in values if value is not None]
+        if len(known) < 2 or len(known) != len(values):
+            return None
+        return round((max(known) - min(known)) * scale, 1)
+
+    @property
+    def leg_skew_ms(self) -> Optional[float]:
+        """两腿时间差: 优先使用交易所成交时间,否则为本地下单确认时间差"""
+        return self.exchange_skew_ms if self.exchange_skew_ms is not None else self.submit_skew_ms
+
+    @property
+    def corrections(self) -> int:
+        return sum(len(leg.corrections) for leg in self.legs)
+
+    @property
+    def unknown(self) -> bool:
+        """有腿的订单状态无法确认(可能已在交易所成交)"""
+        return any(leg.unknown for leg in self.legs)
+
+    @property
+    def complete(self) -> bool:
+        """所有腿按目标数量成交"""
+        return all(leg.fill_ratio >= 1 - self.tolerance for leg in self.legs)
+
+    @property
+    def balanced(self) -> bool:
+        """两腿都有成交且成交比例一致"""
+        ratios = [leg.fill_ratio for leg in self.legs]
+        return min(ratios) > 0 and max(ratios) - min(ratios) <= self.tolerance
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "batch": self.batch,
+            "leg_skew_ms": self.leg_skew_ms,
+            "submit_skew_ms": self.submit_skew_ms,
+            "confirm_skew_ms": self.confirm_skew_ms,
+            "exchange_skew_ms": self.exchange_skew_ms,
+            "elapsed_ms": self.elapsed_ms,
+            "unknown": self.unknown,
+            "legs": [
+                {
+                    "symbol": leg.symbol,
+                    "side": leg.side,
+                    "amount": float(leg.amount),
+                    "filled": float(leg.filled),
+                    "error": leg.error,
+                    "unknown": leg.unknown,
+                    "corrections": [
+                        {"action": action, "filled": float(order['filled'])}
+                        for action, order in leg.corrections
+                    ],
+                }
+                for leg in self.legs
+            ],
+        }
+
+
+class PairExecutor:
+    """两腿下单、成交汇总和单腿失败处理"""
+
+    def __init__(
+        self,
+        exchange,
+        mode: Optional[str] = None,
+        failure_action: Optional[str] = None,
+        hedge_retries: Optional[int] = None,
+        tolerance: Optional[float] = None,
+        batch: Optional[bool] = None
+    ):
+        """
+        Args:
+            exchange: 交易所实例
+            mode: concurrent(同时下单)/ sequential(依次下单),默认 PAIR_EXECUTION_MODE
+            failure_action: 开仓不平衡时 unwind / hedge,默认 PAIR_FAILURE_ACTION
+            hedge_retries: 补单(平仓重试)次数,默认 PAIR_HEDGE_RETRIES
+            tolerance: 视为平衡的成交比例差,默认 PAIR_BALANCE_TOLERANCE
+            batch: 交易所支持时使用批量下单,默认 PAIR_BATCH_ORDERS
+        """
+        self.exchange = exchange
+        self.mode = mode or settings.PAIR_EXECUTION_MODE
+        self.failure_action = failure_action or settings.PAIR_FAILURE_ACTION
+        self.hedge_retries = settings.PAIR_HEDGE_RETRIES if hedge_retries is None else hedge_retries
+        self.tolerance = Decimal(str(settings.PAIR_BALANCE_TOLERANCE if tolerance is None else tolerance))
+        self.batch = settings.PAIR_BATCH_ORDERS if batch is None else batch
+        self._batched = False
+
+    async def execute(self, legs: List[PairLeg]) -> PairExecution:
+        """
+        执行两腿下单
+
+        Args:
+            legs: 各腿(全部为开仓或全部为只减仓的平仓)
+
+        Returns:
+            执行结果,各腿的订单和净成交见 legs
+        """
+        started = time.monotonic()
+        self._batched = False
+        if self.mode == 'sequential':
+            for leg in legs:
+                await self._submit(leg)
+        elif self.batch and len(legs) > 1 and getattr(self.exchange, 'supports_batch_orders', False):
+            await self._submit_batch(legs)
+        else:
+            await asyncio.gather(*(self._submit(leg) for leg in legs))
+        await asyncio.gather(*(self._confirm(leg) for leg in legs if leg.order is not None))
+
+        execution = PairExecution(legs, self.mode, self.tolerance)
+        execution.batch = self._batched
+        if execution.unknown:
+            # 未知的腿可能已成交: 按失败处理会对另一腿做错误的补单/回滚
+            logger.error(f"[PairExecutor] 订单状态无法确认,不补单/回滚: {execution.get_stats()}")
+        elif any(leg.reduce_only for leg in legs):
+            await self._complete_close(legs)
+        else:
+            await self._balance_open(legs)
+
+        execution.elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+        return execution
+
+    async def _submit(self, leg: PairLeg):
+        try:
+            leg.order = await self.exchange.create_market_order(
+                leg.symbol, leg.side, leg.amount, reduce_only=leg.reduce_only
+            )
+            leg.submitted_at = time.monotonic()
+        except Exception as e:
+            leg.error = str(e)
+            logger.error(f"[PairExecutor] 下单失败 {leg.symbol} {leg.side} {leg.amount}: {str(e)}")
+
+    async def _submit_batch(self, legs: List[PairLeg]):
+        """
+        所有腿在一次批量请求中提交
+
+        create_market_orders 只在整批请求被明确拒绝(没有订单提交)时抛出异常,此时改为逐个下单;
+        请求超时等情况由交易所按客户订单ID重试确认,不会重复下单,仍无法确认的腿标记为状态未知
+        """
+        try:
+            results = await self.exchange.create_market_orders([
+                {"symbol": leg.symbol, "side": leg.side, "amount": leg.amount, "reduce_only": leg.reduce_only}
+                for leg in legs
+            ])
+        except Exception as e:
+            logger.warning(f"[PairExecutor] 批量下单不可用,改为逐个同时下单: {str(e)}")
+            await asyncio.gather(*(self._submit(leg) for leg in legs))
+            return
+
+        self._batched = True
+        submitted_at = time.monotonic()
+        for leg, result in zip(legs, results):
+            if isinstance(result, Exception):
+                leg.error = str(result)
+                leg.unknown = isinstance(result, OrderStatusUnknownError)
+                logger.error(f"[PairExecutor] 下单失败 {leg.symbol} {leg.side} {leg.amount}: {str(result)}")
+            else:
+                leg.order = result
+                leg.submitted_at = submitted_at
+
+    async def _confirm(self, leg: PairLeg):
+        leg.order = await self.exchange.wait_for_fill(leg.order, leg.symbol)
+        leg.confirmed_at = time.monotonic()
+
+    async def _correct(self, leg: PairLeg, action: str, amount: Decimal):
+        """补单(hedge,与本腿同向)或回滚(unwind,反向只减仓)"""
+        side = leg.side if action == 'hedge' else leg.opposite_side
+        reduce_only = leg.reduce_only or action == 'unwind'
+        logger.warning(f"[PairExecutor] {action} {leg.symbol} {side} {amount}")
+        try:
+            order = await self.exchange.create_market_order(leg.symbol, side, amount, reduce_only=reduce_only)
+            order = await self.exchange.wait_for_fill(order, leg.symbol)
+        except Exception as e:
+            logger.error(f"[PairExecutor] {action} 失败 {leg.symbol}: {str(e)}")
+            return
+        leg.corrections.append((action, order))
+
+    async def _balance_open(self, legs: List[PairLeg]):
+        if self.failure_action == 'hedge':
+            for _ in range(self.hedge_retries):
+                target = max(leg.fill_ratio for leg in legs)
+                behind = [leg for leg in legs if target - leg.fill_ratio > self.tolerance]
+                if target <= 0 or not behind:
+                    break
+                await asyncio.gather(*(
+                    self._correct(leg, 'hedge', (target - leg.fill_ratio) * leg.target) for leg in behind
+                ))
+
+        target = min(leg.fill_ratio for leg in legs)
+        ahead = [leg for leg in legs if leg.fill_ratio - target > self.tolerance]
+        await asyncio.gather(*(
+            self._correct(leg, 'unwind', (leg.fill_ratio - target) * leg.target) for leg in ahead
+        ))
+
+    async def _complete_close(self, legs: List[PairLeg]):
+        for _ in range(self.hedge_retries):
+            pending = [leg for leg in legs if 1 - leg.fill_ratio > self.tolerance]
+            if not pending:
+                break
+            await asyncio.gather(*(
+                self._correct(leg, 'hedge', (1 - leg.fill_ratio) * leg.target) for leg in pending
+            ))
@@ -0,0 +1,269 @@
+"""
+数据保留与归档服务
+
+按表配置保留策略,定期清理过期数据:
+- spread_history: 原始样本保留 SPREAD_HISTORY_RETENTION_DAYS 天
+- spread_rollups: 各粒度分别保留(粒度越粗保留越久, 0 表示永久保留)
+- trade_logs: 保留 TRADE_LOG_RETENTION_DAYS 天(归档后只能从归档文件读取,没有接口读回)
+
+默认关闭(RETENTION_ENABLED=False),由运维确认保留天数后开启。
+
+过期数据按机器人分块处理: 先写入归档文件(archive_store),再按 id 删除该块。
+每块删除都是一个独立的短事务(经串行写入任务执行),块之间让出写锁,
+不会长时间阻塞机器人写入。
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, select
+
+from app.config import settings
+from app.db.writer import db_writer
+from app.models.spread_history import SpreadHistory
+from app.models.spread_rollup import SpreadRollup
+from app.models.trade_log import TradeLog
+from app.services.archive_store import ArchiveStore, archive_store
+from app.services.leader_election import leader_elector
+from app.utils.logger import setup_logger
+
+logger = setup_logger('retention_service')
+
+
+class RetentionPolicy:
+    """单个表(或表的一部分)的保留策略"""
+
+    def __init__(
+        self,
+        name: str,
+        model,
+        time_column: str,
+        keep_days: int,
+        archive: bool = True,
+        where=None,
+        partition: Optional[str] = None
+    ):
+        """
+        Args:
+            name: 策略名称(用于日志和统计)
+            model: ORM 模型
+            time_column: 判断过期的时间列
+            keep_days: 保留天数, 0 表示永久保留
+            archive: 删除前是否写入归档
+            where: 额外的筛选条件(例如 rollup 粒度)
+            partition: 归档分区(例如 rollup 粒度),查询时只读取该分区的归档文件
+        """
+        self.name = name
+        self.model = model
+        self.time_column = time_column
+        self.keep_days = keep_days
+        self.archive = archive
+        self.where = where
+        self.partition = partition
+
+    def conditions(self, cutoff: datetime) -> list:
+        conditions = [getattr(self.model, self.time_column) < cutoff]
+        if self.where is not None:
+            conditions.append(self.where)
+        return conditions
+
+
+def default_policies() -> List[RetentionPolicy]:
+    """根据配置生成默认策略"""
+    policies = [
+        RetentionPolicy("spread_history", SpreadHistory, "recorded_at", settings.SPREAD_HISTORY_RETENTION_DAYS),
+        RetentionPolicy("trade_logs", TradeLog, "created_at", settings.TRADE_LOG_RETENTION_DAYS),
+    ]
+    for resolution, keep_days in settings.SPREAD_ROLLUP_RETENTION_DAYS.items():
+        policies.append(RetentionPolicy(
+            f"spread_rollups_{resolution}",
+            SpreadRollup,
+            "bucket_start",
+            keep_days,
+            where=SpreadRollup.resolution == resolution,
+            partition=resolution
+        ))
+    return policies
+
+
+class RetentionService:
+    """定期执行保留策略的后台服务"""
+
+    def __init__(
+        self,
+        policies: Optional[List[RetentionPolicy]] = None,
+        store: Optional[ArchiveStore] = None,
+        session_factory=None,
+        chunk_size: Optional[int] = None,
+        chunk_pause: Optional[float] = None
+    ):
+        """
+        初始化保留服务
+
+        Args:
+            policies: 保留策略,默认 default_policies()
+            store: 归档存储,默认全局 archive_store
+            session_factory: 数据库会话工厂(可选,默认读用 AsyncSessionLocal、删除经串行写入任务)
+            chunk_size: 每块处理的行数,默认 RETENTION_CHUNK_SIZE
+            chunk_pause: 块之间的间隔(秒),默认 RETENTION_CHUNK_PAUSE
+        """
+        self._policies = policies
+        self.store = store or archive_store
+        self._session_factory = session_factory
+        self.chunk_size = chunk_size or settings.RETENTION_CHUNK_SIZE
+        self.chunk_pause = settings.RETENTION_CHUNK_PAUSE if chunk_pause is None else chunk_pause
+        self._task: Optional[asyncio.Task] = None
+        self._run_lock = asyncio.Lock()
+
+        # 统计
+        self.runs = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_run_ms = 0.0
+        self.archived: Dict[str, int] = {}
+        self.deleted: Dict[str, int] = {}
+        self.archive_files = 0
+        self.max_chunk_delete_ms = 0.0
+        self.errors = 0
+
+    @property
+    def policies(self) -> List[RetentionPolicy]:
+        if self._policies is None:
+            self._policies = default_policies()
+        return self._policies
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from app.db.session import AsyncSessionLocal
+            return AsyncSessionLocal
+        return self._session_factory
+
+    def start(self):
+        """启动定期清理任务(幂等)"""
+        if not settings.RETENTION_ENABLED:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"[Retention] 定期清理已启动, 间隔 {settings.RETENTION_INTERVAL_HOURS} 小时")
+
+    async def stop(self):
+        """停止定期清理(正在处理的块会被取消,未删除的数据下次重新归档)"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                # 多实例部署时只由主实例清理
+                if leader_elector.is_leader:
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[Retention] 清理失败: {str(e)}")
+            await asyncio.sleep(settings.RETENTION_INTERVAL_HOURS * 3600)
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        执行一次所有策略
+
+        Returns:
+            策略名称 -> 删除行数
+        """
+        async with self._run_lock:
+            started = time.perf_counter()
+            now = now or datetime.utcnow()
+            result = {}
+            for policy in self.policies:
+                if policy.keep_days <= 0:
+                    continue
+                cutoff = now - timedelta(days=policy.keep_days)
+                result[policy.name] = await self._apply(policy, cutoff)
+
+            self.runs += 1
+            self.last_run_at = now
+            self.last_run_ms = (time.perf_counter() - started) * 1000
+            removed = {name: count for name, count in result.items() if count}
+            if removed:
+                logger.info(f"[Retention] 本次清理: {removed}, 耗时 {self.last_run_ms:.0f}ms")
+            return result
+
+    async def _apply(self, policy: RetentionPolicy, cutoff: datetime) -> int:
+        """按机器人分块归档并删除过期数据"""
+        model = policy.model
+        time_col = getattr(model, policy.time_column)
+
+        async with self._get_session_factory()() as db:
+            bot_ids = list(await db.scalars(
+                select(model.bot_instance_id).where(*policy.conditions(cutoff)).distinct()
+            ))
+
+        total = 0
+        for bot_id in bot_ids:
+            while True:
+                async with self._get_session_factory()() as db:
+                    result = await db.execute(
+                        select(model.__table__)
+                        .where(model.bot_instance_id == bot_id, *policy.conditions(cutoff))
+                        .order_by(time_col, model.id)
+                        .limit(self.chunk_size)
+                    )
+                    rows = [dict(row._mapping) for row in result]
+                if not rows:
+                    break
+
+                if policy.archive:
+                    # 归档文件写入完成后才删除(文件 IO 放到线程中执行)
+                    await asyncio.to_thread(
+                        self.store.write, model.__table__, policy.time_column, bot_id, rows, policy.partition
+                    )
+                    self.archive_files += 1
+                    self.archived[policy.name] = self.archived.get(policy.name, 0) + len(rows)
+
+                await self._delete_chunk(model, [row["id"] for row in rows])
+                self.deleted[policy.name] = self.deleted.get(policy.name, 0) + len(rows)
+                total += len(rows)
+
+                if len(rows) < self.chunk_size:
+                    break
+                # 块之间让出写锁
+                await asyncio.sleep(self.chunk_pause)
+        return total
+
+    async def _delete_chunk(self, model, ids: List[int]):
+        started = time.perf_counter()
+        stmt = delete(model).where(model.id.in_(ids))
+        if self._session_factory is None:
+            await db_writer.submit(lambda session: session.execute(stmt))
+        else:
+            async with self._session_factory() as session:
+                await session.execute(stmt)
+                await session.commit()
+        self.max_chunk_delete_ms = max(self.max_chunk_delete_ms, (time.perf_counter() - started) * 1000)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """保留服务统计"""
+        return {
+            "enabled": settings.RETENTION_ENABLED,
+            "runs": self.runs,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_ms": round(self.last_run_ms, 2),
+            "archived": dict(self.archived),
+            "deleted": dict(self.deleted),
+            "archive_files": self.archive_files,
+            "max_chunk_delete_ms": round(self.max_chunk_delete_ms, 2),
+            "errors": self.errors,
+            "policies": {
+                policy.name: policy.keep_days for policy in self.policies
+            },
+        }
+
+
+# 全局保留服务实例
+retention_service = RetentionService()
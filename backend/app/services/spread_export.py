@@ -0,0 +1,152 @@
+"""
+价差历史流式导出
+
+按 (bot_instance_id, recorded_at, id) 做 keyset 分页,每页使用一个短会话读取后立即归还连接,
+逐页生成 NDJSON 或 CSV 文本块:
+- 内存占用只与页大小有关,与导出时间范围无关
+- 第一页较小,大范围导出也能很快返回首字节
+- 客户端读取缓慢时不占用数据库连接
+已归档的数据先于数据库中的数据按文件顺序输出。
+"""
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+
+from app.config import settings
+from app.models.spread_history import SpreadHistory
+from app.services.archive_store import ArchiveStore, archive_store
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = [
+    "id",
+    "bot_instance_id",
+    "recorded_at",
+    "market1_price",
+    "market2_price",
+    "spread_percentage",
+]
+
+# 首页行数: 尽快返回首字节
+FIRST_PAGE_SIZE = 200
+
+
+def _json_default(value: Any):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化 {type(value)}")
+
+
+def _format_rows(rows: List[Dict[str, Any]], fmt: str) -> str:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps({name: row[name] for name in EXPORT_COLUMNS}, default=_json_default) + "\n"
+            for row in rows
+        )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            row[name].isoformat() if isinstance(row[name], datetime) else row[name]
+            for name in EXPORT_COLUMNS
+        ])
+    return buffer.getvalue()
+
+
+def _csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_COLUMNS)
+    return buffer.getvalue()
+
+
+async def iter_spread_export(
+    bot_id: int,
+    start: datetime,
+    end: datetime,
+    fmt: str = "ndjson",
+    session_factory=None,
+    store: ArchiveStore = archive_store,
+    page_size: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    逐页生成导出内容
+
+    Args:
+        bot_id: 机器人ID
+        start: 起始时间(含)
+        end: 结束时间(含)
+        fmt: ndjson 或 csv
+        session_factory: 数据库会话工厂,默认 AsyncSessionLocal
+        store: 归档存储
+        page_size: 每页行数,默认 SPREAD_EXPORT_PAGE_SIZE
+
+    Yields:
+        文本块(每页一个)
+    """
+    if session_factory is None:
+        from app.db.session import AsyncSessionLocal
+        session_factory = AsyncSessionLocal
+    page_size = page_size or settings.SPREAD_EXPORT_PAGE_SIZE
+
+    if fmt == "csv":
+        yield _csv_header()
+
+    # 上一次输出的 (recorded_at, id),同时用于跳过重复归档的行
+    last_key: Optional[Tuple[datetime, int]] = None
+
+    # 归档数据: 每个文件一块(解压和解析在线程中执行,不阻塞事件循环)
+    table = SpreadHistory.__table__
+    paths = await asyncio.to_thread(store.list_files, table, bot_id, start, end)
+    for path in paths:
+        rows = await asyncio.to_thread(store.read_file, path, table, "recorded_at", start, end)
+        if last_key is not None:
+            rows = [row for row in rows if (row["recorded_at"], row["id"]) > last_key]
+        if rows:
+            last_key = (rows[-1]["recorded_at"], rows[-1]["id"])
+            yield _format_rows(rows, fmt)
+
+    # 数据库数据: keyset 分页
+    limit = min(FIRST_PAGE_SIZE, page_size)
+    while True:
+        stmt = select(
+            SpreadHistory.id,
+            SpreadHistory.bot_instance_id,
+            SpreadHistory.recorded_at,
+            SpreadHistory.market1_price,
+            SpreadHistory.market2_price,
+            SpreadHistory.spread_percentage,
+        ).where(
+            SpreadHistory.bot_instance_id == bot_id,
+            SpreadHistory.recorded_at >= start,
+            SpreadHistory.recorded_at <= end,
+        )
+        if last_key is not None:
+            stmt = stmt.where(or_(
+                SpreadHistory.recorded_at > last_key[0],
+                and_(SpreadHistory.recorded_at == last_key[0], SpreadHistory.id > last_key[1])
+            ))
+        stmt = stmt.order_by(SpreadHistory.recorded_at, SpreadHistory.id).limit(limit)
+
+        async with session_factory() as session:
+            rows = [row._asdict() for row in await session.execute(stmt)]
+
+        if not rows:
+            break
+        last_key = (rows[-1]["recorded_at"], rows[-1]["id"])
+        yield _format_rows(rows, fmt)
+
+        if len(rows) < limit:
+            break
+        limit = page_size
@@ -0,0 +1,232 @@
+"""
+价差历史写缓冲服务
+
+BotEngine 每个循环只把价差样本放入内存队列,由后台任务批量写入 spread_history:
+- 队列有上限,写满时丢弃最旧的样本并计数
+- 达到批量大小或超过刷新间隔时触发一次批量插入(executemany)
+- 关闭时把队列中剩余的样本全部写入数据库
+- 每批样本同时增量更新 1m/5m/1h/1d 聚合(见 spread_rollup)
+"""
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.db.writer import db_writer
+from app.models.spread_history import SpreadHistory
+from app.services.spread_rollup import aggregate_samples, upsert_rollups
+from app.utils.logger import setup_logger
+
+logger = setup_logger('spread_recorder')
+
+
+class SpreadRecorder:
+    """价差历史写缓冲(write-behind)"""
+
+    def __init__(
+        self,
+        max_queue: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        session_factory=None
+    ):
+        """
+        初始化写缓冲
+
+        Args:
+            max_queue: 队列最大样本数,默认读取 SPREAD_RECORDER_MAX_QUEUE
+            batch_size: 触发刷新的样本数,默认读取 SPREAD_RECORDER_BATCH_SIZE
+            flush_interval: 最长刷新间隔(秒),默认读取 SPREAD_RECORDER_FLUSH_INTERVAL
+            session_factory: 数据库会话工厂(可选,默认经串行写入任务写入主数据库)
+        """
+        self.max_queue = max_queue or settings.SPREAD_RECORDER_MAX_QUEUE
+        self.batch_size = batch_size or settings.SPREAD_RECORDER_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.SPREAD_RECORDER_FLUSH_INTERVAL
+        self._session_factory = session_factory
+
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._flush_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop_flushing = False  # 后台任务正在写入(已出队的批次尚未写完)
+        self._stopping = False
+
+        # 统计
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def record(
+        self,
+        bot_id: int,
+        market1_price: Decimal,
+        market2_price: Decimal,
+        spread: Decimal,
+        recorded_at: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        放入一条价差样本(不等待数据库)
+
+        Returns:
+            入队的样本(含 recorded_at),可直接用于推送
+        """
+        sample = {
+            "bot_instance_id": bot_id,
+            "market1_price": market1_price,
+            "market2_price": market2_price,
+            "spread_percentage": spread,
+            "recorded_at": recorded_at or datetime.utcnow(),
+        }
+
+        if len(self._queue) >= self.max_queue:
+            self._queue.popleft()
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"[SpreadRecorder] 队列已满({self.max_queue}),丢弃最旧样本,累计丢弃 {self.dropped}")
+
+        self._queue.append(sample)
+        self.enqueued += 1
+
+        self.start()
+        if len(self._queue) >= self.batch_size:
+            self._flush_event.set()
+
+        return sample
+
+    def start(self):
+        """启动后台刷新任务(幂等)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info(
+                f"[SpreadRecorder] 后台刷新已启动: batch={self.batch_size}, "
+                f"interval={self.flush_interval}s, max_queue={self.max_queue}"
+            )
+
+    async def _flush_loop(self):
+        """按批量大小或时间间隔刷新"""
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_event.clear()
+
+                self._loop_flushing = True
+                try:
+                    await self.flush()
+                except Exception as e:
+                    logger.error(f"[SpreadRecorder] 批量写入失败: {str(e)}")
+                finally:
+                    self._loop_flushing = False
+                if self._stopping:
+                    break
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self) -> int:
+        """
+        把队列中的样本分批写入数据库
+
+        Returns:
+            写入的样本数
+        """
+        async with self._flush_lock:
+            total = 0
+            while self._queue:
+                count = min(len(self._queue), self.batch_size)
+                batch = [self._queue.popleft() for _ in range(count)]
+
+                started = time.perf_counter()
+                try:
+                    await self._write_batch(batch)
+                except Exception:
+                    self.errors += 1
+                    # 写入失败: 放回队首,等待下次刷新(仍受队列上限约束)
+                    room = self.max_queue - len(self._queue)
+                    if room < len(batch):
+                        self.dropped += len(batch) - room
+                        batch = batch[len(batch) - room:] if room > 0 else []
+                    self._queue.extendleft(reversed(batch))
+                    raise
+
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.flushes += 1
+                self.written += count
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+                total += count
+
+            return total
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]):
+        """批量插入(executemany),默认经串行写入任务执行"""
+        if self._session_factory is None:
+            await db_writer.submit(lambda session: self._insert_batch(session, batch))
+            return
+
+        async with self._session_factory() as session:
+            await self._insert_batch(session, batch)
+            await session.commit()
+
+    @staticmethod
+    async def _insert_batch(session, batch: List[Dict[str, Any]]):
+        """写入原始样本,并在同一事务中增量更新各粒度聚合"""
+        await session.execute(insert(SpreadHistory), batch)
+        await upsert_rollups(session, aggregate_samples(batch))
+
+    async def stop(self):
+        """停止后台任务并写入剩余样本"""
+        if self._task and not self._task.done():
+            if self._loop_flushing:
+                # 正在写入的批次已出队,取消会丢失该批次: 等待本次写入完成后退出
+                self._stopping = True
+                try:
+                    await self._task
+                finally:
+                    self._stopping = False
+            else:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+
+        try:
+            written = await self.flush()
+            logger.info(f"[SpreadRecorder] 关闭前写入剩余样本 {written} 条")
+        except Exception as e:
+            logger.error(f"[SpreadRecorder] 关闭前写入失败,丢失 {len(self._queue)} 条样本: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """写缓冲统计: 队列深度与刷新耗时"""
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+# 全局价差写缓冲实例
+spread_recorder = SpreadRecorder()
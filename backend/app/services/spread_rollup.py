@@ -0,0 +1,336 @@
+"""
+价差历史多粒度聚合
+
+SpreadRecorder 每次批量写入原始样本时,在同一事务中把样本聚合进
+1m/5m/1h/1d 四种粒度的时间桶(OHLC、最小/最大、均值),通过 upsert 增量更新。
+查询时根据时间范围和最大点数自动选择粒度:
+- 原始样本不超过 max_points 时直接返回原始数据
+- 否则选择点数不超过 max_points 的最细粒度
+已被保留策略清理的数据从归档文件(archive_store,按粒度分区)在线程中读取并合并。
+"""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.spread_history import SpreadHistory
+from app.models.spread_rollup import SpreadRollup
+from app.services.archive_store import ArchiveStore, archive_store
+
+# 聚合粒度(秒),从细到粗
+RESOLUTIONS: "OrderedDict[str, int]" = OrderedDict([
+    ("1m", 60),
+    ("5m", 300),
+    ("1h", 3600),
+    ("1d", 86400),
+])
+
+RAW_RESOLUTION = "raw"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(ts: datetime, seconds: int) -> datetime:
+    """计算时间所属桶的起点(UTC, 与 recorded_at 一样不带时区)"""
+    if ts.tzinfo is not None:
+        ts = ts.replace(tzinfo=None) - ts.utcoffset()
+    elapsed = int((ts - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+def aggregate_samples(samples: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    把一批原始样本聚合为各粒度的桶
+
+    Args:
+        samples: SpreadRecorder 样本(bot_instance_id/market1_price/market2_price/spread_percentage/recorded_at)
+
+    Returns:
+        spread_rollups 行(每个 机器人+粒度+时间桶 一行)
+    """
+    buckets: Dict[tuple, Dict[str, Any]] = {}
+    for sample in sorted(samples, key=lambda s: s["recorded_at"]):
+        spread = Decimal(sample["spread_percentage"])
+        for resolution, seconds in RESOLUTIONS.items():
+            key = (sample["bot_instance_id"], resolution, bucket_start(sample["recorded_at"], seconds))
+            row = buckets.get(key)
+            if row is None:
+                buckets[key] = {
+                    "bot_instance_id": key[0],
+                    "resolution": resolution,
+                    "bucket_start": key[2],
+                    "open": spread,
+                    "high": spread,
+                    "low": spread,
+                    "close": spread,
+                    "spread_sum": spread,
+                    "sample_count": 1,
+                    "market1_price": sample["market1_price"],
+                    "market2_price": sample["market2_price"],
+                }
+                continue
+            row["high"] = max(row["high"], spread)
+            row["low"] = min(row["low"], spread)
+            row["close"] = spread
+            row["spread_sum"] += spread
+            row["sample_count"] += 1
+            row["market1_price"] = sample["market1_price"]
+            row["market2_price"] = sample["market2_price"]
+    return list(buckets.values())
+
+
+async def upsert_rollups(session: AsyncSession, rows: List[Dict[str, Any]]):
+    """
+    增量合并聚合行: 已存在的桶保留 open,更新 high/low/close/累计值
+
+    假设同一个桶的新样本晚于已写入的样本(SpreadRecorder 按记录顺序写入)
+    """
+    if not rows:
+        return
+
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(SpreadRollup)
+        greatest, least = func.greatest, func.least
+    else:
+        stmt = sqlite.insert(SpreadRollup)
+        # SQLite 的多参数 max/min 是标量函数
+        greatest, least = func.max, func.min
+
+    table = SpreadRollup.__table__
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["bot_instance_id", "resolution", "bucket_start"],
+        set_={
+            "high": greatest(table.c.high, excluded.high),
+            "low": least(table.c.low, excluded.low),
+            "close": excluded.close,
+            "spread_sum": table.c.spread_sum + excluded.spread_sum,
+            "sample_count": table.c.sample_count + excluded.sample_count,
+            "market1_price": excluded.market1_price,
+            "market2_price": excluded.market2_price,
+        }
+    )
+    await session.execute(stmt, rows)
+
+
+async def choose_resolution(
+    db: AsyncSession,
+    bot_id: int,
+    start: datetime,
+    end: datetime,
+    max_points: int,
+    store: ArchiveStore = archive_store
+) -> str:
+    """
+    根据时间范围和最大点数选择粒度
+
+    Returns:
+        "raw" 或 RESOLUTIONS 中的粒度
+    """
+    # 只数到 max_points + 1 条,代价与窗口大小无关
+    limited = (
+        select(SpreadHistory.id)
+        .where(
+            SpreadHistory.bot_instance_id == bot_id,
+            SpreadHistory.recorded_at >= start,
+            SpreadHistory.recorded_at <= end
+        )
+        .limit(max_points + 1)
+        .subquery()
+    )
+    raw_count = await db.scalar(select(func.count()).select_from(limited))
+    if raw_count <= max_points:
+        raw_count += await asyncio.to_thread(store.count, SpreadHistory.__table__, bot_id, start, end)
+    if raw_count <= max_points:
+        return RAW_RESOLUTION
+
+    span = max((end - start).total_seconds(), 1)
+    for resolution, seconds in RESOLUTIONS.items():
+        if span / seconds <= max_points:
+            return resolution
+    return next(reversed(RESOLUTIONS))
+
+
+async def get_spread_series(
+    db: AsyncSession,
+    bot_id: int,
+    start: datetime,
+    end: datetime,
+    max_points: int,
+    resolution: Optional[str] = None,
+    store: ArchiveStore = archive_store
+) -> List[Dict[str, Any]]:
+    """
+    查询价差时间序列(数据库与归档合并)
+
+    Args:
+        resolution: 指定粒度(raw/1m/5m/1h/1d),为空时自动选择
+        store: 归档存储
+
+    Returns:
+        时间升序的数据点; 聚合点的 recorded_at 为桶起点, spread_percentage 为收盘价差
+    """
+    if resolution is None:
+        resolution = await choose_resolution(db, bot_id, start, end, max_points, store)
+
+    if resolution == RAW_RESOLUTION:
+        result = await db.execute(
+            select(
+                SpreadHistory.id,
+                SpreadHistory.bot_instance_id,
+                SpreadHistory.market1_price,
+                SpreadHistory.market2_price,
+                SpreadHistory.spread_percentage,
+                SpreadHistory.recorded_at,
+            ).where(
+                SpreadHistory.bot_instance_id == bot_id,
+                SpreadHistory.recorded_at >= start,
+                SpreadHistory.recorded_at <= end
+            ).order_by(SpreadHistory.recorded_at.asc())
+        )
+        rows = _merge_archived(
+            [row._asdict() for row in result],
+            await asyncio.to_thread(store.query, SpreadHistory.__table__, "recorded_at", bot_id, start, end),
+            "recorded_at"
+        )
+        return [
+            {
+                "id": row["id"],
+                "bot_instance_id": row["bot_instance_id"],
+                "market1_price": row["market1_price"],
+                "market2_price": row["market2_price"],
+                "spread_percentage": row["spread_percentage"],
+                "recorded_at": row["recorded_at"],
+                "resolution": RAW_RESOLUTION,
+            }
+            for row in rows
+        ]
+
+    bucket_from = bucket_start(start, RESOLUTIONS[resolution])
+    result = await db.execute(
+        select(SpreadRollup.__table__).where(
+            SpreadRollup.bot_instance_id == bot_id,
+            SpreadRollup.resolution == resolution,
+            SpreadRollup.bucket_start >= bucket_from,
+            SpreadRollup.bucket_start <= end
+        ).order_by(SpreadRollup.bucket_start.asc())
+    )
+    rows = _merge_archived(
+        [dict(row._mapping) for row in result],
+        await asyncio.to_thread(
+            store.query, SpreadRollup.__table__, "bucket_start", bot_id, bucket_from, end,
+            where=lambda row: row["resolution"] == resolution, partition=resolution
+        ),
+        "bucket_start"
+    )
+    return [
+        {
+            "id": row["id"],
+            "bot_instance_id": row["bot_instance_id"],
+            "market1_price": row["market1_price"],
+            "market2_price": row["market2_price"],
+            "spread_percentage": row["close"],
+            "recorded_at": row["bucket_start"],
+            "resolution": resolution,
+            "open": row["open"],
+            "high": row["high"],
+            "low": row["low"],
+            "close": row["close"],
+            "mean": Decimal(row["spread_sum"]) / row["sample_count"] if row["sample_count"] else Decimal(0),
+            "sample_count": row["sample_count"],
+        }
+        for row in rows
+    ]
+
+
+def _merge_archived(rows: List[Dict[str, Any]], archived: List[Dict[str, Any]], time_column: str) -> List[Dict[str, Any]]:
+    """合并数据库行与归档行(归档在前,按 id 去重)"""
+    if not archived:
+        return rows
+    seen = {row["id"] for row in rows}
+    merged = [row for row in archived if row["id"] not in seen] + rows
+    merged.sort(key=lambda row: (row[time_column], row["id"]))
+    return merged
+
+
+async def rebuild_rollups(db: AsyncSession, bot_id: Optional[int] = None, chunk_size: int = 5000) -> int:
+    """
+    从原始样本重建聚合(用于已有历史数据的回填)
+
+    只重建原始样本仍覆盖的时间范围: 保留策略清理(归档)原始样本后,更早的聚合无法再从原始样本恢复,
+    不删除也不修改。每种粒度中包含最早原始样本的桶可能已包含被清理的样本,已存在时保持不变。
+
+    Returns:
+        处理的原始样本数
+    """
+    stmt = select(SpreadHistory.bot_instance_id, func.min(SpreadHistory.recorded_at)).group_by(
+        SpreadHistory.bot_instance_id
+    )
+    if bot_id is not None:
+        stmt = stmt.where(SpreadHistory.bot_instance_id == bot_id)
+    first_samples = dict((await db.execute(stmt)).all())
+
+    processed = 0
+    for bot, first_at in first_samples.items():
+        processed += await _rebuild_bot_rollups(db, bot, first_at, chunk_size)
+
+    await db.commit()
+    return processed
+
+
+async def _rebuild_bot_rollups(db: AsyncSession, bot_id: int, first_at: datetime, chunk_size: int) -> int:
+    """重建单个机器人从最早原始样本所在桶开始的聚合"""
+    boundaries = {resolution: bucket_start(first_at, seconds) for resolution, seconds in RESOLUTIONS.items()}
+
+    table = SpreadRollup.__table__
+    kept = set()
+    for resolution, boundary in boundaries.items():
+        await db.execute(table.delete().where(
+            table.c.bot_instance_id == bot_id,
+            table.c.resolution == resolution,
+            table.c.bucket_start > boundary
+        ))
+        existing = await db.scalar(select(func.count()).select_from(table).where(
+            table.c.bot_instance_id == bot_id,
+            table.c.resolution == resolution,
+            table.c.bucket_start == boundary
+        ))
+        if existing:
+            kept.add((resolution, boundary))
+
+    processed = 0
+    last_key = None
+    while True:
+        stmt = select(
+            SpreadHistory.id,
+            SpreadHistory.bot_instance_id,
+            SpreadHistory.market1_price,
+            SpreadHistory.market2_price,
+            SpreadHistory.spread_percentage,
+            SpreadHistory.recorded_at,
+        ).where(SpreadHistory.bot_instance_id == bot_id).order_by(
+            SpreadHistory.recorded_at, SpreadHistory.id
+        ).limit(chunk_size)
+        if last_key is not None:
+            stmt = stmt.where(
+                (SpreadHistory.recorded_at > last_key[0])
+                | ((SpreadHistory.recorded_at == last_key[0]) & (SpreadHistory.id > last_key[1]))
+            )
+
+        rows = [row._asdict() for row in await db.execute(stmt)]
+        if not rows:
+            break
+        await upsert_rollups(db, [
+            row for row in aggregate_samples(rows)
+            if (row["resolution"], row["bucket_start"]) not in kept
+        ])
+        processed += len(rows)
+        last_key = (rows[-1]["recorded_at"], rows[-1]["id"])
+
+    return processed
@@ -0,0 +1,42 @@
+"""
+从 spread_history 原始样本重建价差聚合(1m/5m/1h/1d)
+
+新样本写入时会自动更新聚合,只有升级前已存在的历史数据需要回填。
+只重建原始样本仍覆盖的时间范围,保留策略已清理(归档)原始样本的时间段内的聚合保持不变。
+
+用法:
+    python scripts/backfill_spread_rollups.py            # 所有机器人
+    python scripts/backfill_spread_rollups.py --bot 4    # 指定机器人
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.base import Base  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+import app.models  # noqa: E402,F401  注册所有模型
+from app.services.spread_rollup import rebuild_rollups  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="重建价差聚合")
+    parser.add_argument("--bot", type=int, default=None, help="机器人ID(默认全部)")
+    args = parser.parse_args()
+
+    # 确保 spread_rollups 表存在
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+
+    async with AsyncSessionLocal() as db:
+        processed = await rebuild_rollups(db, bot_id=args.bot)
+
+    print(f"完成! 处理原始样本 {processed} 条")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
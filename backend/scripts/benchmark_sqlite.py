@@ -0,0 +1,149 @@
+"""
+SQLite 写入基准测试(调优前后对比)
+
+模拟多个机器人并发写入 spread_history / 更新 bot_instances,同时一个读协程持续查询:
+- before: 默认 journal 模式,无 PRAGMA,各协程各自提交
+- after:  WAL + PRAGMA(synchronous/busy_timeout/cache_size/mmap_size),写操作经 SerializedWriter 串行执行
+
+用法:
+    python scripts/benchmark_sqlite.py --writers 50 --writes 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+if "ENCRYPTION_KEY" not in os.environ:
+    from cryptography.fernet import Fernet
+    os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.db.sqlite import get_sqlite_pragmas, install_sqlite_pragmas  # noqa: E402
+from app.db.writer import SerializedWriter  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SQLite 写入基准测试")
+    parser.add_argument("--writers", type=int, default=50, help="并发写入协程数(模拟机器人)")
+    parser.add_argument("--writes", type=int, default=40, help="每个写入协程的提交次数")
+    parser.add_argument("--rows", type=int, default=5, help="每次提交插入的行数")
+    return parser.parse_args()
+
+
+SCHEMA = [
+    "CREATE TABLE bots (id INTEGER PRIMARY KEY, cycles INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE samples (id INTEGER PRIMARY KEY AUTOINCREMENT, bot_id INTEGER, value REAL, recorded_at REAL)",
+    "CREATE INDEX ix_samples_bot ON samples (bot_id, recorded_at)",
+]
+
+
+async def run_case(name: str, args, tuned: bool) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="chainmakes_bench_"), f"{name}.db")
+    url = f"sqlite+aiosqlite:///{db_path}"
+    # 调优前: 默认 5 秒锁等待(pysqlite 默认)且不设置 PRAGMA
+    engine = create_async_engine(url, pool_size=5, max_overflow=10)
+    if tuned:
+        install_sqlite_pragmas(engine, get_sqlite_pragmas())
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    writer = SerializedWriter(enabled=tuned, database_url=url)
+
+    async with engine.begin() as conn:
+        for statement in SCHEMA:
+            await conn.execute(text(statement))
+        await conn.execute(
+            text("INSERT INTO bots (id) VALUES (:id)"),
+            [{"id": i} for i in range(args.writers)]
+        )
+
+    stats = {"commits": 0, "lock_errors": 0, "read_latencies": []}
+    stop = asyncio.Event()
+
+    async def bot_writer(bot_id: int):
+        for _ in range(args.writes):
+            async with session_factory() as session:
+                # 与 BotEngine 一致: 先读再写
+                await session.execute(text("SELECT cycles FROM bots WHERE id = :id"), {"id": bot_id})
+                await session.execute(
+                    text("INSERT INTO samples (bot_id, value, recorded_at) VALUES (:b, :v, :t)"),
+                    [{"b": bot_id, "v": 1.0, "t": time.time()} for _ in range(args.rows)]
+                )
+                await session.execute(
+                    text("UPDATE bots SET cycles = cycles + 1 WHERE id = :id"), {"id": bot_id}
+                )
+                try:
+                    await writer.commit(session)
+                    stats["commits"] += 1
+                except OperationalError:
+                    stats["lock_errors"] += 1
+                    await session.rollback()
+            await asyncio.sleep(0)
+
+    async def reader():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                async with session_factory() as session:
+                    await session.execute(
+                        text("SELECT bot_id, COUNT(*) FROM samples GROUP BY bot_id")
+                    )
+                stats["read_latencies"].append(time.perf_counter() - started)
+            except OperationalError:
+                stats["lock_errors"] += 1
+            await asyncio.sleep(0.01)
+
+    reader_task = asyncio.create_task(reader())
+    started = time.perf_counter()
+    await asyncio.gather(*(bot_writer(i) for i in range(args.writers)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await reader_task
+    await writer.stop()
+    await engine.dispose()
+
+    latencies = sorted(stats["read_latencies"]) or [0.0]
+    return {
+        "name": name,
+        "elapsed": elapsed,
+        "commits": stats["commits"],
+        "commits_per_sec": stats["commits"] / elapsed if elapsed else 0,
+        "rows_per_sec": stats["commits"] * args.rows / elapsed if elapsed else 0,
+        "lock_errors": stats["lock_errors"],
+        "read_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "read_max_ms": latencies[-1] * 1000,
+    }
+
+
+def print_result(result: dict):
+    print(
+        f"{result['name']:<8} 耗时 {result['elapsed']:6.2f}s | "
+        f"提交 {result['commits']:5d} ({result['commits_per_sec']:7.1f}/s, 行 {result['rows_per_sec']:8.1f}/s) | "
+        f"锁错误 {result['lock_errors']:3d} | "
+        f"读 p50={result['read_p50_ms']:.1f}ms max={result['read_max_ms']:.1f}ms"
+    )
+
+
+async def main():
+    args = parse_args()
+    print(f"并发写入: {args.writers} 个协程 × {args.writes} 次提交 × {args.rows} 行\n")
+
+    before = await run_case("before", args, tuned=False)
+    print_result(before)
+    after = await run_case("after", args, tuned=True)
+    print_result(after)
+
+    if before["commits_per_sec"]:
+        print(f"\n提交吞吐提升: {after['commits_per_sec'] / before['commits_per_sec']:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""
+WebSocket 广播开销基准测试
+
+对比两种编码方式在每个机器人 1 / 100 / 1000 个订阅者时的开销:
+- per-connection: 每个连接各自序列化一次(旧的 send_json 方式)
+- encode-once:    ConnectionManager.broadcast_to_bot 只编码一次,所有连接共用同一个文本帧
+
+两种方式都经过相同的连接发送队列,分别统计:
+- 广播调用耗时(机器人循环中实际等待的时间)
+- 全部送达耗时(包括各连接写任务发送完毕)
+替身连接的 send_text 不做网络 IO,测得的是序列化和分发本身的 CPU 开销。
+
+用法:
+    python scripts/benchmark_ws_broadcast.py --messages 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+if "ENCRYPTION_KEY" not in os.environ:
+    from cryptography.fernet import Fernet
+    os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.api.v1.websocket import ConnectionManager  # noqa: E402
+from app.core import ws_sender  # noqa: E402
+
+
+class NullWebSocket:
+    """替身连接: 只统计发送的字节数"""
+
+    def __init__(self):
+        self.bytes_sent = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.bytes_sent += len(text)
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def make_message(i: int) -> dict:
+    return {
+        "type": "order_update",
+        "timestamp": "2024-01-01T00:00:00",
+        "data": {
+            "id": i,
+            "bot_instance_id": 1,
+            "symbol": "BTC-USDT-SWAP",
+            "side": "buy",
+            "order_type": "market",
+            "price": 65000.5 + i,
+            "amount": 0.0123,
+            "filled_amount": 0.0123,
+            "status": "closed",
+            "dca_level": 1,
+            "created_at": "2024-01-01T00:00:00",
+        },
+    }
+
+
+async def bench(subscribers: int, messages: int, encode_once: bool):
+    """
+    Returns:
+        (广播调用耗时, 全部送达耗时)
+    """
+    manager = ConnectionManager()
+    sockets = [NullWebSocket() for _ in range(subscribers)]
+    for user_id, ws in enumerate(sockets):
+        await manager.connect(ws, 1, user_id)
+    senders = list(manager.senders.values())
+    for sender in senders:
+        sender.max_queue = messages + 1
+
+    broadcast_time = 0.0
+    started = time.perf_counter()
+    for i in range(messages):
+        message = make_message(i)
+        call_started = time.perf_counter()
+        if encode_once:
+            await manager.broadcast_to_bot(1, message)
+        else:
+            for sender in senders:
+                sender.enqueue(message)
+        broadcast_time += time.perf_counter() - call_started
+    # 等待所有写任务把队列发完
+    while any(sender.get_stats()["queue_depth"] for sender in senders):
+        await asyncio.sleep(0)
+    delivered = time.perf_counter() - started
+
+    for ws in sockets:
+        await manager.disconnect(ws)
+    return broadcast_time, delivered
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="WebSocket 广播开销基准测试")
+    parser.add_argument("--messages", type=int, default=200, help="每个场景广播的消息数")
+    args = parser.parse_args()
+
+    encoder = "orjson" if ws_sender.orjson is not None else "json"
+    print(f"每个场景广播 {args.messages} 条消息, 编码器: {encoder}\n")
+    print(f"{'订阅者':>6} | {'方式':<14} | {'广播调用 us/条':>14} | {'全部送达 us/条':>14}")
+    for subscribers in (1, 100, 1000):
+        results = {}
+        for name, encode_once in (("per-connection", False), ("encode-once", True)):
+            broadcast_time, delivered = await bench(subscribers, args.messages, encode_once)
+            results[name] = broadcast_time
+            print(
+                f"{subscribers:>6} | {name:<14} | "
+                f"{broadcast_time / args.messages * 1e6:>14.1f} | {delivered / args.messages * 1e6:>14.1f}"
+            )
+        print(f"{'':>6} | 广播调用加速 {results['per-connection'] / results['encode-once']:.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,170 @@
+"""
+机器人并发负载测试
+
+在临时 SQLite 数据库(默认配置)上同时运行大量 BotEngine(模拟交易所),
+同时模拟 API 请求持续查询数据库,验证连接池不会被运行中的机器人耗尽。
+
+用法:
+    python scripts/load_test_bots.py --bots 200 --duration 30
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="机器人并发负载测试")
+    parser.add_argument("--bots", type=int, default=200, help="并发机器人数量")
+    parser.add_argument("--duration", type=float, default=30.0, help="运行时长(秒)")
+    parser.add_argument("--cycle-interval", type=float, default=2.0, help="机器人循环间隔(秒)")
+    parser.add_argument("--max-api-latency", type=float, default=2.0, help="API查询允许的最大延迟(秒)")
+    return parser.parse_args()
+
+
+def prepare_environment(args) -> str:
+    """在导入 app 之前配置临时数据库"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="chainmakes_load_"), "load.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["DATABASE_URL_ASYNC"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["ENVIRONMENT"] = "production"  # 关闭 SQL echo
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["BOT_CYCLE_INTERVAL"] = str(args.cycle_interval)
+    os.environ.setdefault("SECRET_KEY", "load-test-secret")
+    if "ENCRYPTION_KEY" not in os.environ:
+        from cryptography.fernet import Fernet
+        os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+    return db_path
+
+
+async def create_bots(count: int):
+    from app.db.base import Base
+    from app.db.session import AsyncSessionLocal, engine
+    from app.models.bot_instance import BotInstance
+    from app.models.exchange_account import ExchangeAccount
+    from app.models.user import User
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as db:
+        user = User(username="load", email="load@example.com", password_hash="x")
+        db.add(user)
+        await db.flush()
+
+        account = ExchangeAccount(
+            user_id=user.id, exchange_name="mock", api_key="k", api_secret="s"
+        )
+        db.add(account)
+        await db.flush()
+
+        pairs = [("BTC-USDT", "ETH-USDT"), ("BNB-USDT", "SOL-USDT"), ("ADA-USDT", "ETH-USDT")]
+        bots = []
+        for i in range(count):
+            market1, market2 = pairs[i % len(pairs)]
+            bots.append(BotInstance(
+                user_id=user.id,
+                exchange_account_id=account.id,
+                bot_name=f"load-{i}",
+                market1_symbol=market1,
+                market2_symbol=market2,
+                start_time=datetime.now(timezone.utc).replace(tzinfo=None),
+                investment_per_order=Decimal("10"),
+                max_position_value=Decimal("1000"),
+                dca_config=[{"times": 1, "spread": 1.0, "multiplier": 1.0}],
+            ))
+        db.add_all(bots)
+        await db.commit()
+        return [bot.id for bot in bots], bots
+
+
+async def api_probe(stop: asyncio.Event, latencies: list):
+    """模拟 API 请求: 每次借用会话执行一次查询"""
+    from sqlalchemy import func, select
+    from app.db.session import AsyncSessionLocal
+    from app.models.bot_instance import BotInstance
+
+    while not stop.is_set():
+        started = time.monotonic()
+        async with AsyncSessionLocal() as db:
+            await db.execute(select(func.count()).select_from(BotInstance))
+        latencies.append(time.monotonic() - started)
+        await asyncio.sleep(0.2)
+
+
+async def run(args):
+    from app.core.bot_engine import BotEngine
+    from app.db.session import get_pool_status
+    from app.db.writer import db_writer
+    from app.exchanges.mock_exchange import MockExchange
+    from app.services.market_data_service import market_data_service
+    from app.services.spread_recorder import spread_recorder
+
+    bot_ids, bots = await create_bots(args.bots)
+    engines = [
+        BotEngine(bot, MockExchange(api_key="k", api_secret="s"), bot_id)
+        for bot_id, bot in zip(bot_ids, bots)
+    ]
+
+    stop = asyncio.Event()
+    latencies: list = []
+    probe = asyncio.create_task(api_probe(stop, latencies))
+
+    print(f"启动 {len(engines)} 个机器人, 运行 {args.duration} 秒...")
+    started = time.monotonic()
+    tasks = [asyncio.create_task(engine._run()) for engine in engines]
+
+    await asyncio.sleep(args.duration)
+
+    for engine in engines:
+        engine.is_running = False
+    stop.set()
+    await asyncio.wait(tasks, timeout=30)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, probe, return_exceptions=True)
+    await market_data_service.stop()
+    await spread_recorder.stop()
+    await db_writer.stop()
+    elapsed = time.monotonic() - started
+
+    cycles = [engine.cycle_count for engine in engines]
+    active = sum(1 for c in cycles if c > 0)
+    latencies.sort()
+    pool = get_pool_status()
+
+    print("\n========== 负载测试结果 ==========")
+    print(f"机器人数量: {len(engines)}, 完成至少一次循环: {active}")
+    print(f"总循环次数: {sum(cycles)}, 单机器人循环: min={min(cycles)} max={max(cycles)}")
+    print(f"运行时长: {elapsed:.1f}s")
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99) - 1] if len(latencies) > 1 else latencies[0]
+        print(f"API查询: {len(latencies)} 次, p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms max={latencies[-1] * 1000:.1f}ms")
+    print(f"连接池: {pool}")
+    print(f"价差写缓冲: {spread_recorder.get_stats()}")
+    print(f"串行写入: {db_writer.get_stats()}")
+
+    ok = active == len(engines) and latencies and latencies[-1] <= args.max_api_latency
+    print("结果: " + ("通过 ✅" if ok else "未通过 ❌"))
+    return ok
+
+
+def main():
+    args = parse_args()
+    db_path = prepare_environment(args)
+    print(f"临时数据库: {db_path}")
+    ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
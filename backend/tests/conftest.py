@@ -3,15 +3,18 @@ pytest配置文件
 """
 import asyncio
 import pytest
+import pytest_asyncio
 from typing import AsyncGenerator, Generator
 from httpx import AsyncClient
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
+import app.models  # noqa: F401  注册所有模型
 from app.main import app
 from app.db.base import Base
 from app.db.session import get_db
-from app.core.config import settings
+from app.config import settings
 
 # 测试数据库URL
 TEST_DATABASE_URL = "sqlite+aiosqlite:///./test_trading_bot.db"
@@ -40,6 +43,20 @@ def event_loop() -> Generator:
     loop.close()
 
 
+@pytest_asyncio.fixture
+async def session_factory() -> AsyncGenerator[async_sessionmaker, None]:
+    """内存数据库(所有会话共用一个连接)的会话工厂,测试结束后释放"""
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
 @pytest.fixture(scope="function")
 async def db_session() -> AsyncGenerator[AsyncSession, None]:
     """创建测试数据库会话"""
@@ -0,0 +1,105 @@
+"""
+机器人数据库连接池测试(小连接池上多个机器人同时循环,连接按工作单元借还)
+"""
+import asyncio
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import app.db.session as db_session
+from app.core.bot_engine import BotEngine
+from app.db.base import Base
+from app.exchanges.mock_exchange import MockExchange
+from app.models import BotInstance, ExchangeAccount, Order, User
+
+POOL_SIZE = 2
+BOTS = 6
+
+
+@pytest_asyncio.fixture
+async def small_pool(tmp_path, monkeypatch):
+    """文件数据库 + 2 个连接、无溢出、1 秒获取超时的连接池"""
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=1,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(db_session, "AsyncSessionLocal", factory)
+    yield engine, factory
+    await engine.dispose()
+
+
+async def create_engines(factory):
+    async with factory() as session:
+        user = User(username="pool", email="pool@example.com", password_hash="x")
+        session.add(user)
+        await session.flush()
+        account = ExchangeAccount(user_id=user.id, exchange_name="mock", api_key="k", api_secret="s")
+        session.add(account)
+        await session.flush()
+        bots = [
+            BotInstance(
+                user_id=user.id,
+                exchange_account_id=account.id,
+                bot_name=f"pool-{i}",
+                market1_symbol="BTC-USDT",
+                market2_symbol="ETH-USDT",
+                market1_start_price=Decimal("100"),
+                market2_start_price=Decimal("100"),
+                start_time=datetime.utcnow(),
+                investment_per_order=Decimal("10"),
+                max_position_value=Decimal("1000"),
+                dca_config=[{"times": 3, "spread": 1.0, "multiplier": 1.0}],
+            )
+            for i in range(BOTS)
+        ]
+        session.add_all(bots)
+        await session.commit()
+
+    engines = []
+    for bot in bots:
+        engine = BotEngine(bot, MockExchange(api_key="k", api_secret="s"), bot.id)
+        prices = {"BTC-USDT": Decimal("110"), "ETH-USDT": Decimal("100")}
+
+        async def fixed_price(symbol, prices=prices):
+            return prices[symbol]
+
+        engine._get_market_price = fixed_price
+        engine._last_position_update = float("inf")
+        engines.append(engine)
+    return engines
+
+
+async def run_cycle(engine):
+    async with engine._db_scope():
+        await engine._execute_cycle()
+
+
+@pytest.mark.asyncio
+async def test_bot_cycles_share_small_pool_without_timeout(small_pool):
+    """6 个机器人在 2 个连接的连接池上同时循环: 不发生获取超时,每轮结束后连接全部归还"""
+    engine, factory = small_pool
+    engines = await create_engines(factory)
+
+    for _ in range(3):
+        # 获取连接超时(sqlalchemy TimeoutError)会在这里抛出
+        await asyncio.gather(*(run_cycle(bot_engine) for bot_engine in engines))
+        assert engine.pool.checkedout() == 0
+
+        # 机器人循环之间 API 请求可以立即借到连接
+        async with factory() as session:
+            await asyncio.wait_for(session.execute(select(func.count()).select_from(BotInstance)), 1)
+
+    assert engine.pool.checkedout() == 0
+    async with factory() as session:
+        # 每个机器人都完成了开仓(每次两腿)
+        assert await session.scalar(select(func.count()).select_from(Order)) >= BOTS * 2
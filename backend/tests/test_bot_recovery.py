@@ -0,0 +1,133 @@
+"""
+机器人启动恢复测试(按账户分组并行、账户级预热、恢复进度)
+"""
+import asyncio
+import time
+import pytest
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+
+import app.db.session as db_session
+from app.config import settings
+from app.exchanges.exchange_registry import exchange_registry
+from app.models import BotInstance, ExchangeAccount, User
+from app.services.bot_manager import BotManager
+from app.services.bot_recovery import recovery_progress
+
+
+@pytest.fixture
+def factory(session_factory, monkeypatch):
+    monkeypatch.setattr(db_session, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(settings, "BOT_RECOVERY_REQUEST_INTERVAL", 0)
+    return session_factory
+
+
+class FakeExchange:
+    """账户级交易所连接: 记录请求,查询持仓耗时 0.2 秒"""
+
+    def __init__(self, account_id):
+        self.account_id = account_id
+        self.leverages = []
+        self.position_queries = 0
+        self.closed = False
+
+    async def set_leverage(self, symbol, leverage):
+        self.leverages.append((symbol, leverage))
+
+    async def get_all_positions(self):
+        self.position_queries += 1
+        await asyncio.sleep(0.2)
+        return [{"symbol": "BTC-USDT", "account": self.account_id}]
+
+    async def close(self):
+        self.closed = True
+
+
+class RecordingManager(BotManager):
+    """不启动真实引擎,只记录恢复时传入的预取持仓"""
+
+    def __init__(self, fail=()):
+        super().__init__()
+        self.fail = set(fail)
+        self.started = {}
+
+    async def start_bot(self, bot_id, db, fencing_token=None, recovered_positions=None):
+        if bot_id in self.fail:
+            return False
+        self.started[bot_id] = recovered_positions
+        return True
+
+
+async def seed(factory, bots_per_account):
+    async with factory() as session:
+        user = User(username="u", email="u@example.com", password_hash="x")
+        session.add(user)
+        await session.flush()
+        ids = {}
+        for n in bots_per_account:
+            account = ExchangeAccount(user_id=user.id, exchange_name="mock", api_key="k", api_secret="s")
+            session.add(account)
+            await session.flush()
+            for i in range(n):
+                bot = BotInstance(
+                    user_id=user.id,
+                    exchange_account_id=account.id,
+                    bot_name=f"bot-{account.id}-{i}",
+                    market1_symbol="BTC-USDT",
+                    market2_symbol="ETH-USDT" if i % 2 == 0 else "SOL-USDT",
+                    market1_start_price=Decimal("100"),
+                    market2_start_price=Decimal("100"),
+                    start_time=datetime.utcnow(),
+                    investment_per_order=Decimal("10"),
+                    max_position_value=Decimal("1000"),
+                    leverage=10,
+                    dca_config=[{"times": 1, "spread": 1.0, "multiplier": 1.0}],
+                    status="running",
+                )
+                session.add(bot)
+                await session.flush()
+                ids.setdefault(account.id, []).append(bot.id)
+        await session.commit()
+    return ids
+
+
+@pytest.mark.asyncio
+async def test_recovery_batches_per_account_in_parallel(factory, monkeypatch):
+    """每个账户只查询一次持仓、杠杆去重,账户之间并行;失败的机器人标记为 stopped"""
+    ids = await seed(factory, [3, 2])
+    exchanges = {}
+
+    def create_account_exchange(account):
+        exchanges[account.id] = FakeExchange(account.id)
+        return exchanges[account.id]
+
+    monkeypatch.setattr(exchange_registry, "_factory", create_account_exchange)
+    failing = ids[max(ids)][0]
+    manager = RecordingManager(fail=[failing])
+
+    started_at = time.monotonic()
+    async with factory() as db:
+        assert await manager.recover_running_bots(db) == 4
+    # 两个账户的持仓查询并行进行
+    assert time.monotonic() - started_at < 0.35
+
+    for account_id, exchange in exchanges.items():
+        assert exchange.position_queries == 1
+        assert exchange.closed
+        assert sorted(exchange.leverages) == [
+            ("BTC-USDT", 10), ("ETH-USDT", 10), ("SOL-USDT", 10)
+        ]
+        for bot_id in ids[account_id]:
+            if bot_id != failing:
+                assert manager.started[bot_id] == [{"symbol": "BTC-USDT", "account": account_id}]
+
+    async with factory() as db:
+        status = (await db.execute(select(BotInstance.status).where(BotInstance.id == failing))).scalar_one()
+    assert status == "stopped"
+
+    progress = recovery_progress.get_stats()
+    assert progress["state"] == "done"
+    assert (progress["recovered"], progress["failed"], progress["pending"]) == (4, 1, 0)
+    assert progress["accounts_done"] == progress["accounts_total"] == 2
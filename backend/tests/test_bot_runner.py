@@ -0,0 +1,109 @@
+"""
+机器人运行进程 IPC 测试(控制请求、推送事件转发、认证、运行进程不可用)
+"""
+import asyncio
+import contextlib
+import json
+import pytest
+import pytest_asyncio
+
+from app.services.bot_runner import (
+    BotRunnerClient, BotRunnerError, BotRunnerServer, RemoteBotManager, RunnerEventBackend
+)
+
+
+class FakeManager:
+    """替身 BotManager: 记录收到的控制操作"""
+
+    def __init__(self):
+        self.running_bots = {}
+        self.calls = []
+        self.stop_gate = asyncio.Event()
+
+    async def start_bot(self, bot_id, db):
+        self.calls.append(("start_bot", bot_id))
+        return bot_id != 404
+
+    async def stop_bot(self, bot_id, db):
+        self.calls.append(("stop_bot", bot_id))
+        await self.stop_gate.wait()
+        return True
+
+    async def pause_bot(self, bot_id, db):
+        raise RuntimeError("交易所不可用")
+
+    async def close_bot_positions(self, bot_id, db):
+        return True
+
+    async def get_bot_states(self):
+        return {bot_id: {"bot_id": bot_id} for bot_id in self.running_bots}
+
+
+@pytest_asyncio.fixture
+async def runner():
+    manager = FakeManager()
+    server = BotRunnerServer(manager, host="127.0.0.1", port=0, session_factory=contextlib.nullcontext)
+    await server.start()
+    yield manager, server
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_control_requests_and_events(runner):
+    """控制请求返回管理器结果,慢请求不阻塞其他请求,推送事件转发给客户端"""
+    manager, server = runner
+    events = []
+
+    async def on_event(bot_id, message):
+        events.append((bot_id, message))
+
+    client = BotRunnerClient(host="127.0.0.1", port=server.port, timeout=5)
+    await client.start(on_event=on_event)
+    remote = RemoteBotManager(client)
+
+    assert await remote.start_bot(1) is True
+    assert await remote.start_bot(404) is False
+    # 管理器抛出的异常作为失败返回
+    assert await remote.pause_bot(1) is False
+
+    # 停止机器人等待平仓期间,其他请求照常响应
+    stopping = asyncio.create_task(remote.stop_bot(1))
+    assert await client.call("ping") == "pong"
+    assert not stopping.done()
+    manager.stop_gate.set()
+    assert await stopping is True
+
+    backend = RunnerEventBackend(server)
+    await backend.publish(1, {"type": "spread_update", "data": {"bot_instance_id": 1}})
+    for _ in range(100):
+        if events:
+            break
+        await asyncio.sleep(0.01)
+    assert events == [(1, {"type": "spread_update", "data": {"bot_instance_id": 1}})]
+    assert manager.calls == [("start_bot", 1), ("start_bot", 404), ("stop_bot", 1)]
+
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_rejects_wrong_token(runner):
+    """令牌错误的连接被拒绝"""
+    _, server = runner
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    writer.write(b'{"id": 0, "op": "hello", "token": "wrong"}\n')
+    await writer.drain()
+    reply = json.loads(await reader.readline())
+    assert reply["ok"] is False
+    assert await reader.readline() == b""
+    writer.close()
+
+
+@pytest.mark.asyncio
+async def test_runner_unavailable():
+    """运行进程未启动时控制请求返回失败,不抛出异常"""
+    client = BotRunnerClient(host="127.0.0.1", port=1, timeout=1)
+    remote = RemoteBotManager(client)
+    assert await remote.start_bot(1) is False
+    with pytest.raises(BotRunnerError):
+        await client.call("ping")
+    await client.close()
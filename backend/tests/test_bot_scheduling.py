@@ -0,0 +1,68 @@
+"""
+机器人循环调度测试(事件驱动模式)
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.bot_engine import BotEngine
+from app.exchanges.mock_exchange import MockExchange
+
+
+def make_engine(min_interval=0.1, interval=1.0):
+    exchange = MockExchange(api_key="test_api_key", api_secret="test_api_secret")
+    engine = BotEngine(bot=MagicMock(), exchange=exchange, bot_id=1)
+    engine.cycle_mode = "event"
+    engine.min_cycle_interval = min_interval
+    engine.cycle_interval = interval
+    return engine
+
+
+@pytest.mark.asyncio
+async def test_tick_wakes_cycle_before_interval():
+    """新行情到达即唤醒,无需等满轮询间隔"""
+    engine = make_engine(min_interval=0.0, interval=5.0)
+    engine._start_cycle_timer()
+
+    asyncio.get_running_loop().call_later(0.05, engine._on_market_update, None, {})
+    started = time.monotonic()
+    await engine._wait_for_next_cycle()
+
+    assert time.monotonic() - started < 1.0
+    stats = engine.get_scheduling_stats()
+    assert stats["event_cycles"] == 1
+    assert stats["timeout_cycles"] == 0
+    assert stats["avg_tick_latency"] is not None
+
+
+@pytest.mark.asyncio
+async def test_burst_is_coalesced_and_min_interval_enforced():
+    """行情突发合并为一次评估,且遵守最小循环间隔"""
+    engine = make_engine(min_interval=0.2, interval=5.0)
+    engine._start_cycle_timer()
+
+    for _ in range(10):
+        engine._on_market_update(None, {})
+
+    started = time.monotonic()
+    await engine._wait_for_next_cycle()
+
+    assert time.monotonic() - started >= 0.15
+    stats = engine.get_scheduling_stats()
+    assert stats["event_cycles"] == 1
+    assert stats["ticks_coalesced"] == 9
+    assert not engine._price_event.is_set()
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_interval_without_ticks():
+    """无新行情时按兜底间隔执行"""
+    engine = make_engine(min_interval=0.0, interval=0.1)
+    engine._start_cycle_timer()
+
+    await engine._wait_for_next_cycle()
+
+    stats = engine.get_scheduling_stats()
+    assert stats["timeout_cycles"] == 1
+    assert stats["event_cycles"] == 0
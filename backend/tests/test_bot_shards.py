@@ -0,0 +1,153 @@
+"""
+机器人多进程分片测试(一致性哈希、状态汇总、分片故障后重启与迁移)
+
+工作进程用进程内的 IPC 服务替代,进程对象用替身模拟退出。
+"""
+import asyncio
+import contextlib
+import pytest
+
+from app.services.bot_runner import BotRunnerServer
+from app.services.bot_shards import HashRing, ShardedBotManager
+
+
+class FakeManager:
+    def __init__(self):
+        self.running_bots = {}
+
+    async def start_bot(self, bot_id, db):
+        self.running_bots[bot_id] = True
+        return True
+
+    async def stop_bot(self, bot_id, db):
+        return self.running_bots.pop(bot_id, None) is not None
+
+    async def pause_bot(self, bot_id, db):
+        return bot_id in self.running_bots
+
+    async def close_bot_positions(self, bot_id, db):
+        return True
+
+    async def get_bot_states(self):
+        return {bot_id: {"bot_id": bot_id} for bot_id in self.running_bots}
+
+
+class FakeProcess:
+    """替身子进程: kill() 时关闭对应的 IPC 服务"""
+
+    _pids = iter(range(1000, 2000))
+
+    def __init__(self, server):
+        self.server = server
+        self.pid = next(self._pids)
+        self.returncode = None
+
+    def crash(self):
+        self.returncode = -9
+        asyncio.ensure_future(self.server.stop())
+
+    def kill(self):
+        if self.returncode is None:
+            self.crash()
+
+    terminate = kill
+
+    async def wait(self):
+        return self.returncode
+
+
+class InProcessShards(ShardedBotManager):
+    """工作进程在本进程内运行的分片管理器"""
+
+    def __init__(self, shards):
+        super().__init__(shards, base_port=1, health_interval=1, max_failures=1)
+        self.managers = {}
+        self.fail_spawn = set()
+
+    async def _spawn(self, worker):
+        if worker.name in self.fail_spawn:
+            raise OSError("无法启动")
+        manager = FakeManager()
+        server = BotRunnerServer(manager, host="127.0.0.1", port=0, session_factory=contextlib.nullcontext)
+        await server.start()
+        worker.port = server.port
+        self.managers[worker.name] = manager
+        return FakeProcess(server)
+
+    async def _running_in_db(self, bot_ids):
+        return set(bot_ids)
+
+
+def test_hash_ring_moves_only_removed_node_keys():
+    """移除一个节点只会迁移该节点上的键,加回后键回到原节点"""
+    ring = HashRing(["shard-0", "shard-1", "shard-2"])
+    before = {key: ring.node_for(key) for key in range(1000)}
+    assert set(before.values()) == {"shard-0", "shard-1", "shard-2"}
+
+    ring.remove("shard-1")
+    after = {key: ring.node_for(key) for key in range(1000)}
+    for key, node in before.items():
+        if node != "shard-1":
+            assert after[key] == node
+        else:
+            assert after[key] in {"shard-0", "shard-2"}
+
+    ring.add("shard-1")
+    assert {key: ring.node_for(key) for key in range(1000)} == before
+
+
+@pytest.mark.asyncio
+async def test_routes_by_hash_and_aggregates_states():
+    """机器人按哈希环分配到分片,状态按分片汇总"""
+    shards = InProcessShards(3)
+    await shards.start()
+    try:
+        for bot_id in range(1, 31):
+            assert await shards.start_bot(bot_id) is True
+            assert bot_id in shards.managers[shards.ring.node_for(bot_id)].running_bots
+
+        states = await shards.get_bot_states()
+        assert sorted(states) == list(range(1, 31))
+        assert states[7]["shard"] == shards.assignments[7]
+        assert sum(w["bots"] for w in shards.get_stats()["workers"].values()) == 30
+
+        assert await shards.stop_bot(7) is True
+        assert 7 not in shards.assignments
+        assert await shards.stop_bot(7) is False
+    finally:
+        await shards.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_failed_shard_restarts_and_bots_are_reassigned():
+    """分片进程退出后被重启,其上的机器人重新启动;重启失败时迁移到其他分片"""
+    shards = InProcessShards(3)
+    await shards.start()
+    try:
+        for bot_id in range(1, 31):
+            await shards.start_bot(bot_id)
+        orphans = sorted(b for b, name in shards.assignments.items() if name == "shard-1")
+        assert orphans
+
+        # 进程退出: 重启成功,机器人回到原分片
+        shards.workers["shard-1"].process.crash()
+        await shards.check_workers()
+        assert shards.workers["shard-1"].alive
+        assert sorted(shards.managers["shard-1"].running_bots) == orphans
+        assert all(shards.assignments[b] == "shard-1" for b in orphans)
+
+        # 再次退出且无法重启: 机器人迁移到其他分片
+        shards.fail_spawn.add("shard-1")
+        shards.workers["shard-1"].process.crash()
+        await shards.check_workers()
+        assert not shards.workers["shard-1"].alive
+        assert "shard-1" not in shards.ring.nodes
+        for bot_id in orphans:
+            assert shards.assignments[bot_id] in {"shard-0", "shard-2"}
+            assert bot_id in shards.managers[shards.assignments[bot_id]].running_bots
+        stats = shards.get_stats()
+        assert stats["alive"] == 2
+        assert stats["bots"] == 30
+        assert stats["failovers"] == 2
+    finally:
+        await shards.cleanup()
@@ -0,0 +1,142 @@
+"""
+机器人并行关闭测试(统一截止时间、并行平仓、关闭检查点)
+"""
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.db.writer import db_writer
+from app.models import BotInstance, ExchangeAccount, TradeLog, User
+from app.services.bot_shutdown import ShutdownCoordinator
+
+
+@pytest_asyncio.fixture
+async def factory(session_factory, monkeypatch):
+    monkeypatch.setattr(db_writer, "_session_factory", session_factory)
+    yield session_factory
+    await db_writer.stop()
+
+
+async def seed(factory, count):
+    async with factory() as session:
+        user = User(username="u", email="u@example.com", password_hash="x")
+        session.add(user)
+        await session.flush()
+        account = ExchangeAccount(user_id=user.id, exchange_name="mock", api_key="k", api_secret="s")
+        session.add(account)
+        await session.flush()
+        bots = [
+            BotInstance(
+                user_id=user.id,
+                exchange_account_id=account.id,
+                bot_name=f"bot-{i}",
+                market1_symbol="BTC-USDT",
+                market2_symbol="ETH-USDT",
+                market1_start_price=Decimal("100"),
+                market2_start_price=Decimal("100"),
+                start_time=datetime.utcnow(),
+                investment_per_order=Decimal("10"),
+                max_position_value=Decimal("1000"),
+                dca_config=[{"times": 1, "spread": 1.0, "multiplier": 1.0}],
+                status="running",
+            )
+            for i in range(count)
+        ]
+        session.add_all(bots)
+        await session.commit()
+    return [bot.id for bot in bots]
+
+
+class FakeExchange:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeEngine:
+    """替身引擎: cycle 秒后结束当前循环,平仓耗时 close 秒,平仓结果为 closed"""
+
+    def __init__(self, cycle=0.0, close=0.0, closed=True):
+        self.exchange = FakeExchange()
+        self.cycle = cycle
+        self.close = close
+        self.closed = closed
+        self.in_cycle = cycle > 0
+        self.is_running = True
+        self.shutting_down = False
+
+    def request_shutdown(self):
+        self.shutting_down = True
+        self.is_running = False
+
+    async def run(self):
+        if self.cycle:
+            await asyncio.sleep(self.cycle)
+            self.in_cycle = False
+        while self.is_running:
+            await asyncio.sleep(60)
+
+    async def close_all_positions(self):
+        await asyncio.sleep(self.close)
+        return self.closed
+
+
+def start(engines):
+    return {bot_id: asyncio.create_task(engine.run()) for bot_id, engine in engines.items()}
+
+
+async def load(factory):
+    async with factory() as session:
+        statuses = dict((await session.execute(select(BotInstance.id, BotInstance.status))).all())
+        logs = (await session.execute(select(TradeLog))).scalars().all()
+    return statuses, {log.bot_instance_id: log.details["shutdown_checkpoint"] for log in logs}
+
+
+@pytest.mark.asyncio
+async def test_all_bots_stop_within_one_deadline(factory):
+    """空闲引擎立即结束,循环中的引擎并行收尾,超时的被取消;机器人保持 running 并写入检查点"""
+    ids = await seed(factory, 22)
+    engines = {bot_id: FakeEngine() for bot_id in ids[:20]}
+    engines[ids[20]] = FakeEngine(cycle=0.1)
+    engines[ids[21]] = FakeEngine(cycle=10)
+    tasks = start(engines)
+
+    started = time.monotonic()
+    stats = await ShutdownCoordinator(timeout=0.5, close_positions=False).shutdown(engines, tasks)
+    assert time.monotonic() - started < 1.0
+    assert (stats["bots"], stats["closed"], stats["resumable"], stats["interrupted"]) == (22, 0, 22, 1)
+    assert all(task.done() for task in tasks.values())
+    assert all(engine.exchange.closed for engine in engines.values())
+
+    statuses, checkpoints = await load(factory)
+    assert set(statuses.values()) == {"running"}
+    assert sorted(checkpoints) == sorted(ids)
+    assert checkpoints[ids[21]]["interrupted"] is True
+    assert checkpoints[ids[20]]["interrupted"] is False
+
+
+@pytest.mark.asyncio
+async def test_parallel_close_marks_only_finished_bots_stopped(factory):
+    """并行平仓: 完成的标记为 stopped;超时、失败或部分平仓的保持 running 并记录待平仓"""
+    ids = await seed(factory, 5)
+    engines = {bot_id: FakeEngine(close=0.1) for bot_id in ids[:3]}
+    engines[ids[3]] = FakeEngine(close=10)
+    engines[ids[4]] = FakeEngine(close=0.1, closed=False)
+    tasks = start(engines)
+
+    started = time.monotonic()
+    stats = await ShutdownCoordinator(timeout=0.3, close_positions=True).shutdown(engines, tasks)
+    assert time.monotonic() - started < 0.8
+    assert (stats["closed"], stats["resumable"]) == (3, 2)
+
+    statuses, checkpoints = await load(factory)
+    assert [statuses[bot_id] for bot_id in ids] == ["stopped", "stopped", "stopped", "running", "running"]
+    assert sorted(checkpoints) == [ids[3], ids[4]]
+    assert checkpoints[ids[3]]["close_pending"] is True
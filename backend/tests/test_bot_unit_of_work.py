@@ -0,0 +1,154 @@
+"""
+机器人工作单元测试(每轮循环一次提交)
+"""
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import app.db.session as db_session
+from app.core.bot_engine import BotEngine
+from app.db.base import Base
+from app.exchanges.mock_exchange import MockExchange
+from app.models import BotInstance, ExchangeAccount, Order, Position, User
+
+
+@pytest_asyncio.fixture
+async def db(monkeypatch):
+    """内存数据库,并统计包含写操作的提交次数"""
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(db_session, "AsyncSessionLocal", factory)
+
+    commits = []
+    pending_write = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            pending_write.append(1)
+
+    def on_commit(conn):
+        if pending_write:
+            commits.append(1)
+            pending_write.clear()
+
+    event.listen(engine.sync_engine, "after_cursor_execute", on_execute)
+    event.listen(engine.sync_engine, "commit", on_commit)
+
+    yield factory, commits
+    await engine.dispose()
+
+
+async def create_engine_for_bot(factory, last_trade_spread=None):
+    async with factory() as session:
+        user = User(username="u", email="u@example.com", password_hash="x")
+        session.add(user)
+        await session.flush()
+        account = ExchangeAccount(user_id=user.id, exchange_name="mock", api_key="k", api_secret="s")
+        session.add(account)
+        await session.flush()
+        bot = BotInstance(
+            user_id=user.id,
+            exchange_account_id=account.id,
+            bot_name="uow",
+            market1_symbol="BTC-USDT",
+            market2_symbol="ETH-USDT",
+            market1_start_price=Decimal("100"),
+            market2_start_price=Decimal("100"),
+            start_time=datetime.utcnow(),
+            investment_per_order=Decimal("10"),
+            max_position_value=Decimal("1000"),
+            dca_config=[{"times": 1, "spread": 1.0, "multiplier": 1.0}],
+            last_trade_spread=last_trade_spread,
+        )
+        session.add(bot)
+        await session.commit()
+
+    engine = BotEngine(bot, MockExchange(api_key="k", api_secret="s"), bot.id)
+    prices = {"BTC-USDT": Decimal("110"), "ETH-USDT": Decimal("100")}
+
+    async def fixed_price(symbol):
+        return prices[symbol]
+
+    engine._get_market_price = fixed_price
+    engine._last_position_update = float("inf")  # 本测试不刷新持仓价格
+    return engine
+
+
+@pytest.mark.asyncio
+async def test_idle_cycle_commits_once(db):
+    """无交易的循环最多一次写提交"""
+    factory, commits = db
+    engine = await create_engine_for_bot(factory, last_trade_spread=Decimal("10"))
+
+    commits.clear()
+    async with engine._db_scope():
+        await engine._execute_cycle()
+
+    assert len(commits) <= 1
+
+
+@pytest.mark.asyncio
+async def test_open_cycle_uses_checkpoints_only(db):
+    """开仓循环: 订单、持仓和机器人状态在成交后的检查点一次写入"""
+    factory, commits = db
+    engine = await create_engine_for_bot(factory)
+
+    commits.clear()
+    async with engine._db_scope():
+        await engine._execute_cycle()
+
+    assert len(commits) <= 2
+
+    async with factory() as session:
+        assert await session.scalar(select(func.count()).select_from(Order)) == 2
+        assert await session.scalar(select(func.count()).select_from(Position)) == 2
+        bot = await session.get(BotInstance, engine.bot_id)
+        assert bot.current_dca_count == 1
+        assert bot.total_trades == 2
+
+
+@pytest.mark.asyncio
+async def test_position_price_updates_broadcast_after_commit(db):
+    """持仓价格更新(含交易所已无持仓时标记关闭)在提交成功后推送,回滚时不推送"""
+    factory, commits = db
+    engine = await create_engine_for_bot(factory)
+    async with engine._db_scope():
+        await engine._execute_cycle()
+
+    broadcasts = []
+
+    async def record_broadcast(position_data):
+        broadcasts.append(position_data)
+
+    async def no_position(symbol):
+        return None
+
+    engine._broadcast_position_update = record_broadcast
+    engine.exchange.get_position = no_position
+
+    with pytest.raises(RuntimeError):
+        async with engine._db_scope():
+            await engine.update_position_prices()
+            raise RuntimeError("提交前失败")
+    assert broadcasts == []
+
+    async with engine._db_scope():
+        await engine.update_position_prices()
+        assert broadcasts == []
+
+    assert sorted(data["symbol"] for data in broadcasts) == ["BTC-USDT", "ETH-USDT"]
+    assert all(data["is_open"] is False for data in broadcasts)
+    async with factory() as session:
+        assert await session.scalar(select(func.count()).select_from(Position).where(Position.is_open)) == 0
@@ -0,0 +1,169 @@
+"""
+WebSocket跨进程广播测试(进程内广播、经 Redis pub/sub 的跨进程广播)
+
+使用一个只实现 PING/SUBSCRIBE/PUBLISH 的本地 RESP 服务替代 Redis。
+"""
+import asyncio
+import json
+import pytest
+import pytest_asyncio
+
+from app.api.v1.websocket import ConnectionManager
+from app.config import settings
+from app.core.broadcast_backend import (
+    InProcessBroadcastBackend,
+    RedisBroadcastBackend,
+    create_broadcast_backend,
+)
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def _bulk(value: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(*items: bytes) -> bytes:
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+class StubBroker:
+    """最小 RESP 服务: 足够 redis-py 的 publish/pubsub 使用"""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    async def _read_command(reader):
+        header = await reader.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                command = args[0].upper()
+                if command == b"SUBSCRIBE":
+                    for index, channel in enumerate(args[1:], start=1):
+                        self.subscribers.setdefault(channel, set()).add(writer)
+                        writer.write(_array(_bulk(b"subscribe"), _bulk(channel), b":%d\r\n" % index))
+                elif command == b"PUBLISH":
+                    targets = self.subscribers.get(args[1], set())
+                    for target in targets:
+                        target.write(_array(_bulk(b"message"), _bulk(args[1]), _bulk(args[2])))
+                    writer.write(b":%d\r\n" % len(targets))
+                elif command == b"PING":
+                    writer.write(b"+PONG\r\n")
+                else:
+                    # CLIENT SETINFO 等握手命令
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for targets in self.subscribers.values():
+                targets.discard(writer)
+            writer.close()
+
+
+@pytest_asyncio.fixture
+async def broker():
+    server = StubBroker()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+async def wait_until(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("等待超时")
+        await asyncio.sleep(0.01)
+
+
+def spread(bot_id, value):
+    return {"type": "spread_update", "data": {"bot_instance_id": bot_id, "spread_percentage": value}}
+
+
+@pytest.mark.asyncio
+async def test_in_process_backend_is_default(monkeypatch):
+    """默认只分发给本进程的连接;仅配置 REDIS_URL(旧配置文件)不启用 Redis"""
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://localhost:6379/0")
+    manager = ConnectionManager()
+    assert isinstance(manager.backend, InProcessBroadcastBackend)
+
+    ws = FakeWebSocket()
+    await manager.connect(ws, bot_id=1, user_id=1)
+    await manager.broadcast_to_bot(1, spread(1, "0.1"))
+    await wait_until(lambda: len(ws.sent) == 1)
+    assert ws.sent[0]["data"]["spread_percentage"] == "0.1"
+    assert manager.get_stats()["broadcast"]["published"] == 1
+    await manager.disconnect(ws)
+
+    monkeypatch.setattr(settings, "WS_BROADCAST_BACKEND", "redis")
+    assert isinstance(create_broadcast_backend(), RedisBroadcastBackend)
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_fans_out_across_managers(broker):
+    """一个进程发布的消息到达其他进程的订阅者,发布方自己的订阅者只收到一次"""
+    url = f"redis://127.0.0.1:{broker.port}/0"
+    manager_a = ConnectionManager(backend=RedisBroadcastBackend(url, channel="test:ws"))
+    manager_b = ConnectionManager(backend=RedisBroadcastBackend(url, channel="test:ws"))
+    await manager_a.start()
+    await manager_b.start()
+    await manager_a.backend.wait_subscribed()
+    await manager_b.backend.wait_subscribed()
+
+    ws_a, ws_b, ws_other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await manager_a.connect(ws_a, bot_id=1, user_id=1)
+    await manager_b.connect(ws_b, bot_id=1, user_id=1)
+    await manager_b.connect(ws_other, bot_id=2, user_id=1)
+
+    await manager_a.broadcast_to_bot(1, spread(1, "0.25"))
+    await wait_until(lambda: len(ws_b.sent) == 1)
+    assert ws_b.sent[0]["data"]["spread_percentage"] == "0.25"
+
+    # 自己发布的消息回到本进程时被忽略
+    await wait_until(lambda: manager_a.backend.published == 1)
+    await asyncio.sleep(0.1)
+    assert len(ws_a.sent) == 1
+    assert ws_other.sent == []
+    assert manager_b.backend.get_stats()["received"] == 1
+    assert manager_a.backend.get_stats()["received"] == 0
+
+    for manager, ws in ((manager_a, ws_a), (manager_b, ws_b), (manager_b, ws_other)):
+        await manager.disconnect(ws)
+    await manager_a.stop()
+    await manager_b.stop()
@@ -0,0 +1,70 @@
+"""
+SQLite 串行写入任务与 PRAGMA 测试
+"""
+import asyncio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.sqlite import install_sqlite_pragmas
+from app.db.writer import SerializedWriter
+
+
+@pytest.mark.asyncio
+async def test_writer_runs_jobs_one_at_a_time():
+    """并发提交的写操作在写入任务中依次执行"""
+    writer = SerializedWriter(enabled=True)
+    running = 0
+    peak = 0
+    order = []
+
+    async def job(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        order.append(i)
+        running -= 1
+        return i
+
+    results = await asyncio.gather(*(writer.run(job, i) for i in range(5)))
+    await writer.stop()
+
+    assert results == [0, 1, 2, 3, 4]
+    assert order == [0, 1, 2, 3, 4]
+    assert peak == 1
+    assert writer.get_stats()["jobs"] == 5
+
+
+@pytest.mark.asyncio
+async def test_writer_propagates_errors():
+    """写操作异常返回给调用方,写入任务继续运行"""
+    writer = SerializedWriter(enabled=True)
+
+    async def fail():
+        raise ValueError("boom")
+
+    async def ok():
+        return "ok"
+
+    with pytest.raises(ValueError):
+        await writer.run(fail)
+    assert await writer.run(ok) == "ok"
+    await writer.stop()
+
+    assert writer.get_stats()["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pragmas_applied(tmp_path):
+    """新连接启用 WAL 与 busy_timeout"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pragma.db'}")
+    install_sqlite_pragmas(engine, {"journal_mode": "WAL", "busy_timeout": "1234"})
+
+    async with engine.connect() as conn:
+        journal_mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+        busy_timeout = (await conn.execute(text("PRAGMA busy_timeout"))).scalar()
+    await engine.dispose()
+
+    assert journal_mode.lower() == "wal"
+    assert busy_timeout == 1234
@@ -0,0 +1,91 @@
+"""
+交易所客户端共享注册表测试(同账户共享、引用计数、市场信息只加载一次)
+"""
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from app.exchanges.exchange_registry import ExchangeRegistry
+
+
+class FakeClient:
+    """替身 CCXT 客户端"""
+
+    def __init__(self):
+        self.market_loads = 0
+
+    async def load_markets(self):
+        self.market_loads += 1
+        await asyncio.sleep(0.05)
+        return {}
+
+
+class FakeExchange:
+    def __init__(self, account):
+        self.account = account
+        self.exchange = FakeClient()
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def account(account_id, api_key="k"):
+    return SimpleNamespace(
+        id=account_id, exchange_name="okx", api_key=api_key,
+        api_secret="s", passphrase=None, is_testnet=True
+    )
+
+
+@pytest.mark.asyncio
+async def test_shared_client_per_account_closed_by_last_user():
+    """同一账户共享客户端且只加载一次市场信息,最后一个使用方释放时关闭"""
+    created = []
+
+    def factory(acc):
+        created.append(FakeExchange(acc))
+        return created[-1]
+
+    registry = ExchangeRegistry(factory=factory)
+    first, second, third = await asyncio.gather(
+        registry.acquire(account(1)), registry.acquire(account(1)), registry.acquire(account(1))
+    )
+    other = await registry.acquire(account(2))
+
+    assert first is second is third
+    assert other is not first
+    assert len(created) == 2
+    assert first.exchange.market_loads == 1
+    assert registry.get_stats()["refs"] == {1: 3, 2: 1}
+
+    await registry.release(first)
+    await registry.release(second)
+    assert not first.closed
+    await registry.release(third)
+    assert first.closed
+    assert registry.get_stats()["clients"] == 1
+
+    # 账户重新被使用时创建新客户端
+    again = await registry.acquire(account(1))
+    assert again is not first and len(created) == 3
+    await registry.release(again)
+    await registry.release(other)
+    assert registry.get_stats()["clients"] == 0
+
+
+@pytest.mark.asyncio
+async def test_changed_credentials_use_new_client():
+    """账户密钥修改后使用新客户端,旧客户端在其使用方释放后关闭"""
+    registry = ExchangeRegistry(factory=FakeExchange)
+    old = await registry.acquire(account(1, api_key="old"))
+    new = await registry.acquire(account(1, api_key="new"))
+    assert new is not old
+
+    async with registry.lease(account(1, api_key="new")) as leased:
+        assert leased is new
+    assert not new.closed
+
+    await registry.release(old)
+    assert old.closed and not new.closed
+    await registry.release(new)
+    assert new.closed
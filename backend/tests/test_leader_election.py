@@ -0,0 +1,94 @@
+"""
+主实例选举测试(租约获取、过期接管、旧主实例让出、防护令牌)
+"""
+import asyncio
+import pytest
+import pytest_asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.exceptions import LeadershipLostError
+from app.db.base import Base
+from app.models.service_lease import ServiceLease
+from app.services.bot_manager import BotManager
+from app.services.leader_election import LeaderElector
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    # 每个会话独立连接,模拟多个实例共用同一个数据库
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'lease.db'}", poolclass=NullPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[ServiceLease.__table__])
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+def make_elector(session_factory, ttl=15.0, renew_interval=5.0):
+    return LeaderElector(enabled=True, ttl=ttl, renew_interval=renew_interval, session_factory=session_factory)
+
+
+@pytest.mark.asyncio
+async def test_only_one_instance_acquires(session_factory):
+    """租约有效期内只有一个实例能成为主实例,主实例续约保持令牌不变"""
+    a, b = make_elector(session_factory), make_elector(session_factory)
+    assert await a.try_acquire() is True
+    assert await b.try_acquire() is False
+    assert a.is_leader and not b.is_leader
+    assert a.current_token() == 1
+    with pytest.raises(LeadershipLostError):
+        b.current_token()
+
+    assert await a.renew() is True
+    assert await a.try_acquire() is True
+    assert a.token == 1
+    await a.verify_token(1)
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_taken_over_and_old_leader_fenced(session_factory):
+    """租约过期后被其他实例接管,令牌递增;旧主实例续约失败并让出,旧令牌无法通过校验"""
+    a = make_elector(session_factory, ttl=0.2, renew_interval=0.05)
+    b = make_elector(session_factory, ttl=0.2, renew_interval=0.05)
+    assert await a.try_acquire() is True
+    await asyncio.sleep(0.3)
+    assert not a.is_leader
+
+    assert await b.try_acquire() is True
+    assert b.token == 2
+    with pytest.raises(LeadershipLostError):
+        await a.verify_token(1)
+    await b.verify_token(2)
+
+    released = []
+
+    async def on_lost():
+        released.append(True)
+
+    async def on_elected(token):
+        pass
+
+    # 旧主实例仍认为自己持有令牌: 续约发现已被接管,让出并释放引擎
+    a.token, a._valid_until = 1, float("inf")
+    a._on_elected, a._on_lost = on_elected, on_lost
+    assert await a.renew() is False
+    await a._step_down("租约已被其他实例接管")
+    assert released == [True]
+    assert a.token is None and not a.is_leader
+
+    # 主实例停止后释放租约,其他实例无需等待过期即可接管
+    await b.stop()
+    assert await a.try_acquire() is True
+    assert a.token == 3
+
+
+@pytest.mark.asyncio
+async def test_follower_refuses_to_start_bots(monkeypatch):
+    """非主实例不启动机器人"""
+    follower = LeaderElector(enabled=True)
+    monkeypatch.setattr("app.services.bot_manager.leader_elector", follower)
+
+    manager = BotManager()
+    assert await manager.start_bot(1, db=None) is False
+    assert manager.running_bots == {}
@@ -0,0 +1,149 @@
+"""
+行情数据中心测试
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+
+from app.exchanges.mock_exchange import MockExchange
+from app.services.market_data_service import MarketDataService
+
+
+class CountingExchange(MockExchange):
+    """记录行情请求次数的模拟交易所"""
+
+    def __init__(self):
+        super().__init__(api_key="test_api_key", api_secret="test_api_secret")
+        self.ticker_calls = 0
+
+    async def get_ticker(self, symbol: str):
+        self.ticker_calls += 1
+        await asyncio.sleep(0.01)
+        return {
+            'symbol': symbol,
+            'last_price': Decimal('100') + self.ticker_calls,
+            'bid': None,
+            'ask': None,
+            'volume': None,
+            'timestamp': 0
+        }
+
+
+@pytest.mark.asyncio
+async def test_bots_on_same_symbol_share_one_request():
+    """同一交易对的多个订阅者共享一次行情请求"""
+    service = MarketDataService(interval=5.0)
+    exchanges = [CountingExchange() for _ in range(5)]
+
+    for bot_id, exchange in enumerate(exchanges):
+        await service.subscribe(exchange, "BTC/USDT:USDT", bot_id)
+
+    prices = await asyncio.gather(*[
+        service.get_price(exchange, "BTC/USDT:USDT") for exchange in exchanges
+    ])
+
+    assert len(set(prices)) == 1
+    assert sum(exchange.ticker_calls for exchange in exchanges) == 1
+
+    stats = service.get_stats()
+    assert stats["fetches"] == 1
+    assert stats["hits"] + stats["misses"] == 5
+    assert stats["feeds"][0]["subscribers"] == 5
+    assert stats["feeds"][0]["updated_at"] is not None
+
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_poll_loop_refreshes_and_fans_out():
+    """后台轮询按周期刷新并通知订阅者"""
+    service = MarketDataService(interval=0.05)
+    exchange = CountingExchange()
+    received = []
+
+    await service.subscribe(
+        exchange, "ETH/USDT:USDT", 1,
+        on_update=lambda key, ticker: received.append(ticker['last_price'])
+    )
+    await asyncio.sleep(0.2)
+
+    assert exchange.ticker_calls >= 2
+    assert len(received) == exchange.ticker_calls
+    assert service.get_stats()["feeds"][0]["age_seconds"] < 0.2
+
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_keys_are_separated_by_testnet_flag():
+    """测试网与真实盘的行情互不共享"""
+    service = MarketDataService(interval=5.0)
+    live = CountingExchange()
+    demo = CountingExchange()
+    demo.is_testnet = True
+
+    await service.subscribe(live, "BTC/USDT:USDT", 1)
+    await service.subscribe(demo, "BTC/USDT:USDT", 2)
+    await asyncio.sleep(0.05)
+
+    assert live.ticker_calls == 1
+    assert demo.ticker_calls == 1
+    assert len(service.get_stats()["feeds"]) == 2
+
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_unsubscribed_symbol_does_not_create_feed():
+    """未订阅的交易对直接请求行情,不建立缓存"""
+    service = MarketDataService(interval=5.0)
+    exchange = CountingExchange()
+
+    await service.get_price(exchange, "BTC/USDT:USDT")
+    await service.get_price(exchange, "BTC/USDT:USDT")
+
+    assert exchange.ticker_calls == 2
+    assert service.get_stats()["feeds"] == []
+
+
+@pytest.mark.asyncio
+async def test_last_unsubscribe_stops_polling():
+    """最后一个订阅者退出后停止轮询"""
+    service = MarketDataService(interval=0.05)
+    exchange = CountingExchange()
+
+    await service.subscribe(exchange, "BTC/USDT:USDT", 1)
+    await service.subscribe(exchange, "BTC/USDT:USDT", 2)
+    await service.unsubscribe(exchange, "BTC/USDT:USDT", 1)
+    assert service.get_stats()["feeds"][0]["subscribers"] == 1
+
+    await service.unsubscribe(exchange, "BTC/USDT:USDT", 2)
+    assert service.get_stats()["feeds"] == []
+
+    calls = exchange.ticker_calls
+    await asyncio.sleep(0.15)
+    assert exchange.ticker_calls == calls
+
+
+@pytest.mark.asyncio
+async def test_caller_refresh_does_not_notify_caller():
+    """调用方触发的刷新只通知其他订阅者"""
+    service = MarketDataService(interval=5.0)
+    exchange = CountingExchange()
+    received = {1: 0, 2: 0}
+
+    for bot_id in received:
+        await service.subscribe(
+            exchange, "BTC/USDT:USDT", bot_id,
+            on_update=lambda key, ticker, bot_id=bot_id: received.__setitem__(bot_id, received[bot_id] + 1)
+        )
+    await asyncio.sleep(0.05)
+    received.update({1: 0, 2: 0})
+
+    feed = service._feeds[service.make_key(exchange, "BTC/USDT:USDT")]
+    feed.updated_at = 0  # 使缓存过期
+    await service.get_price(exchange, "BTC/USDT:USDT", subscriber_id=1)
+
+    assert received == {1: 0, 2: 1}
+
+    await service.stop()
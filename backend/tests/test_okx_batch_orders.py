@@ -0,0 +1,246 @@
+"""
+OKX 批量下单测试(签名请求、部分失败、整批请求失败后按客户订单ID重试确认、整批被拒绝时逐个下单、两腿一次提交)
+"""
+import base64
+import hmac
+import json
+import pytest
+from decimal import Decimal
+from unittest.mock import AsyncMock
+
+import httpx
+
+from app.config import settings
+from app.core.exceptions import OrderStatusUnknownError
+from app.exchanges.okx_client import OKXClient
+from app.exchanges.okx_exchange import OKXExchange
+from app.services.pair_executor import PairExecutor, PairLeg
+
+
+class StandInOKX:
+    """替身 OKX v5 接口: 校验签名,记录请求"""
+
+    def __init__(
+        self, secret: str = "secret", fail_batch: bool = False, reject_batch: bool = False, reject=(),
+        hidden_lookups: int = 0, drop=()
+    ):
+        self.secret = secret
+        self.fail_batch = fail_batch
+        self.reject_batch = reject_batch
+        self.reject = set(reject)
+        self.hidden_lookups = hidden_lookups  # 已提交的订单在前几次查询中不可见
+        self.drop = set(drop)  # 这些交易对的订单始终查询不到
+        self.lookups = 0
+        self.requests = []
+        self.placed = {}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        body = request.content.decode()
+        # requestPath 包含查询字符串
+        message = request.headers["OK-ACCESS-TIMESTAMP"] + request.method + request.url.raw_path.decode() + body
+        expected = base64.b64encode(hmac.new(self.secret.encode(), message.encode(), "sha256").digest()).decode()
+        assert request.headers["OK-ACCESS-SIGN"] == expected
+        self.requests.append((request.method, request.url.path, body))
+
+        if request.url.path == "/api/v5/trade/batch-orders":
+            if self.reject_batch:
+                return httpx.Response(200, json={"code": "50014", "msg": "Parameter error", "data": []})
+            orders = json.loads(body)
+            data = []
+            for index, order in enumerate(orders):
+                if order["instId"] in self.reject:
+                    data.append({"clOrdId": order["clOrdId"], "ordId": "", "sCode": "51008", "sMsg": "余额不足"})
+                else:
+                    ord_id = f"9{index}"
+                    self.placed[order["clOrdId"]] = dict(order, ordId=ord_id)
+                    data.append({"clOrdId": order["clOrdId"], "ordId": ord_id, "sCode": "0", "sMsg": "", "ts": "1700000000000"})
+            if self.fail_batch:
+                return httpx.Response(502, json={"msg": "bad gateway"})
+            code = "0" if not self.reject else ("1" if len(self.reject) == len(orders) else "2")
+            return httpx.Response(200, json={"code": code, "msg": "", "data": data})
+
+        if request.url.path == "/api/v5/trade/cancel-batch-orders":
+            orders = json.loads(body)
+            return httpx.Response(200, json={"code": "0", "msg": "", "data": [
+                {"ordId": order["ordId"], "clOrdId": "", "sCode": "0", "sMsg": ""} for order in orders
+            ]})
+
+        if request.url.path == "/api/v5/trade/order" and request.method == "GET":
+            self.lookups += 1
+            placed = self.placed.get(request.url.params.get("clOrdId"))
+            if placed is not None and (self.lookups <= self.hidden_lookups or placed["instId"] in self.drop):
+                placed = None
+            if placed is None:
+                return httpx.Response(200, json={"code": "51603", "msg": "Order does not exist", "data": []})
+            return httpx.Response(200, json={"code": "0", "msg": "", "data": [{
+                "instId": placed["instId"], "instType": "SWAP", "ordId": placed["ordId"],
+                "clOrdId": placed["clOrdId"], "side": placed["side"], "ordType": "market",
+                "sz": placed["sz"], "px": "", "accFillSz": placed["sz"], "avgPx": "100",
+                "state": "filled", "cTime": "1700000000000", "uTime": "1700000000000"
+            }]})
+
+        return httpx.Response(404, json={"code": "404", "msg": "not found"})
+
+
+def make_exchange(stand_in: StandInOKX, key: str) -> OKXExchange:
+    exchange = OKXExchange(key, "secret", "pass", is_testnet=True)
+    client = exchange._get_client()
+    client.client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(stand_in.handler))
+    return exchange
+
+
+@pytest.mark.asyncio
+async def test_client_batch_endpoints_sign_body():
+    """批量下单/撤单在一次签名请求中提交,部分失败时返回每项结果"""
+    stand_in = StandInOKX(reject={"ETH-USDT-SWAP"})
+    client = OKXClient("key", "secret", "pass", is_demo=True)
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(stand_in.handler))
+    try:
+        results = await client.batch_place_orders([
+            {"instId": "BTC-USDT-SWAP", "tdMode": "cross", "side": "buy", "ordType": "market", "sz": "1", "clOrdId": "a0"},
+            {"instId": "ETH-USDT-SWAP", "tdMode": "cross", "side": "sell", "ordType": "market", "sz": "1", "clOrdId": "a1"},
+        ])
+        assert [result["sCode"] for result in results] == ["0", "51008"]
+        assert len(stand_in.requests) == 1
+
+        cancelled = await client.batch_cancel_orders([{"instId": "BTC-USDT-SWAP", "ordId": "90"}])
+        assert cancelled[0]["sCode"] == "0"
+
+        details = await client.get_orders_detail([
+            {"instId": "BTC-USDT-SWAP", "clOrdId": "a0"},
+            {"instId": "ETH-USDT-SWAP", "clOrdId": "a1"},
+        ])
+        assert details[0]["state"] == "filled" and details[1] is None
+
+        with pytest.raises(ValueError):
+            await client.batch_place_orders([{"instId": "X"}] * 21)
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_exchange_batch_maps_results_and_recovers_after_request_failure():
+    """适配器按客户订单ID对应结果;整批请求失败时查询确认已提交的订单"""
+    stand_in = StandInOKX(reject={"ETH-USDT-SWAP"})
+    exchange = make_exchange(stand_in, "batch-key")
+    try:
+        orders = await exchange.create_market_orders([
+            {"symbol": "BTC-USDT-SWAP", "side": "buy", "amount": Decimal("2")},
+            {"symbol": "ETH-USDT-SWAP", "side": "sell", "amount": Decimal("3"), "reduce_only": True},
+        ])
+        assert orders[0]["id"] == "90" and orders[0]["status"] == "open"
+        assert isinstance(orders[1], Exception)
+        sent = json.loads(stand_in.requests[0][2])
+        assert sent[0]["posSide"] == "long"
+        assert sent[1]["posSide"] == "long" and sent[1]["reduceOnly"] is True
+    finally:
+        await exchange.close()
+
+    stand_in = StandInOKX(fail_batch=True)
+    exchange = make_exchange(stand_in, "batch-recover-key")
+    try:
+        orders = await exchange.create_market_orders([
+            {"symbol": "BTC-USDT-SWAP", "side": "buy", "amount": Decimal("2")},
+        ])
+        assert orders[0]["id"] == "90"
+        assert orders[0]["status"] == "closed"
+        assert orders[0]["filled"] == Decimal("2")
+    finally:
+        await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_pair_executor_submits_both_legs_in_one_request():
+    """两腿通过一次批量请求提交"""
+    stand_in = StandInOKX()
+    exchange = make_exchange(stand_in, "batch-pair-key")
+    filled = []
+
+    async def wait_for_fill(order, symbol):
+        filled.append(order["id"])
+        return dict(order, filled=order["amount"], price=Decimal("100"), status="closed")
+
+    exchange.wait_for_fill = wait_for_fill
+    try:
+        legs = [PairLeg("BTC-USDT-SWAP", "buy", Decimal("2")), PairLeg("ETH-USDT-SWAP", "sell", Decimal("3"))]
+        execution = await PairExecutor(exchange, batch=True).execute(legs)
+
+        assert execution.batch and execution.balanced
+        assert [path for _, path, _ in stand_in.requests] == ["/api/v5/trade/batch-orders"]
+        assert sorted(filled) == ["90", "91"]
+        assert execution.get_stats()["submit_skew_ms"] == 0
+    finally:
+        await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_batch_falls_back_to_single_orders():
+    """整批被明确拒绝(没有订单提交)时改为逐个同时下单"""
+    stand_in = StandInOKX(reject_batch=True)
+    exchange = make_exchange(stand_in, "batch-reject-key")
+    exchange.exchange.create_order = AsyncMock(side_effect=lambda symbol, type, side, amount, params: {
+        "id": symbol, "symbol": symbol, "type": "market", "side": side,
+        "amount": amount, "filled": 0, "status": "open", "timestamp": 1
+    })
+
+    async def wait_for_fill(order, symbol):
+        return dict(order, filled=order["amount"], price=Decimal("100"), status="closed")
+
+    exchange.wait_for_fill = wait_for_fill
+    try:
+        legs = [PairLeg("BTC-USDT-SWAP", "buy", Decimal("2")), PairLeg("ETH-USDT-SWAP", "sell", Decimal("3"))]
+        execution = await PairExecutor(exchange, batch=True).execute(legs)
+
+        assert not execution.batch and execution.balanced
+        assert exchange.exchange.create_order.await_count == 2
+        assert [path for _, path, _ in stand_in.requests] == ["/api/v5/trade/batch-orders"]
+    finally:
+        await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_request_failure_retries_lookup_until_order_visible(monkeypatch):
+    """整批请求失败后订单暂时查询不到: 按退避间隔重试,之后查到的订单按已提交处理"""
+    monkeypatch.setattr(settings, "PAIR_CONFIRM_DELAY", 0)
+    stand_in = StandInOKX(fail_batch=True, hidden_lookups=1)
+    exchange = make_exchange(stand_in, "batch-lookup-retry-key")
+    try:
+        orders = await exchange.create_market_orders([
+            {"symbol": "BTC-USDT-SWAP", "side": "buy", "amount": Decimal("2")},
+        ])
+        assert stand_in.lookups == 2
+        assert orders[0]["id"] == "90" and orders[0]["filled"] == Decimal("2")
+    finally:
+        await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_unconfirmed_leg_is_unknown_and_not_unwound(monkeypatch):
+    """多次查询仍无法确认的腿记为状态未知: 不回滚另一腿,也不补单"""
+    monkeypatch.setattr(settings, "PAIR_CONFIRM_DELAY", 0)
+    monkeypatch.setattr(settings, "PAIR_CONFIRM_RETRIES", 3)
+    stand_in = StandInOKX(fail_batch=True, drop={"ETH-USDT-SWAP"})
+    exchange = make_exchange(stand_in, "batch-unknown-key")
+    exchange.exchange.create_order = AsyncMock()
+
+    async def wait_for_fill(order, symbol):
+        return dict(order, filled=order["amount"], price=Decimal("100"), status="closed")
+
+    exchange.wait_for_fill = wait_for_fill
+    try:
+        legs = [PairLeg("BTC-USDT-SWAP", "buy", Decimal("2")), PairLeg("ETH-USDT-SWAP", "sell", Decimal("3"))]
+        execution = await PairExecutor(exchange, batch=True, failure_action="unwind").execute(legs)
+
+        assert execution.unknown and legs[1].unknown and not legs[0].unknown
+        assert legs[0].filled == Decimal("2") and legs[0].corrections == []
+        assert exchange.exchange.create_order.await_count == 0
+        # 两次查询确认 BTC,ETH 查询 3 次后放弃
+        assert stand_in.lookups == 4
+        assert execution.get_stats()["unknown"] is True
+
+        results = await exchange.create_market_orders([
+            {"symbol": "ETH-USDT-SWAP", "side": "sell", "amount": Decimal("3")},
+        ])
+        assert isinstance(results[0], OrderStatusUnknownError)
+    finally:
+        await exchange.close()
@@ -0,0 +1,200 @@
+"""
+私有订单推送测试(使用本地替身WebSocket服务器)
+"""
+import asyncio
+import json
+import pytest
+from decimal import Decimal
+from unittest.mock import AsyncMock
+
+from websockets.asyncio.server import serve
+
+from app.config import settings
+from app.exchanges.binance_exchange import BinanceExchange
+from app.exchanges.okx_exchange import OKXExchange
+from app.exchanges.order_stream import OKXOrderStream, close_order_streams
+
+
+class StandInPrivateServer:
+    """本地替身私有频道服务器: 处理 OKX 登录/订阅,测试通过 push() 推送订单"""
+
+    def __init__(self, login_ok: bool = True):
+        self.login_ok = login_ok
+        self.requests = []
+        self.paths = []
+        self.connections = []
+        self._server = None
+
+    async def _handler(self, ws):
+        self.connections.append(ws)
+        self.paths.append(ws.request.path)
+        async for raw in ws:
+            if raw == 'ping':
+                await ws.send('pong')
+                continue
+            message = json.loads(raw)
+            self.requests.append(message)
+            if message.get('op') == 'login':
+                await ws.send(json.dumps({"event": "login", "code": "0" if self.login_ok else "60009", "msg": ""}))
+            elif message.get('op') == 'subscribe':
+                await ws.send(json.dumps({"event": "subscribe", "arg": message["args"][0]}))
+
+    async def push(self, payload):
+        await self.connections[-1].send(json.dumps(payload))
+
+    async def __aenter__(self):
+        self._server = await serve(self._handler, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await close_order_streams()
+        self._server.close()
+        await self._server.wait_closed()
+
+
+def okx_order(ord_id, state, filled="0", avg=""):
+    return {
+        "arg": {"channel": "orders", "instType": "SWAP"},
+        "data": [{
+            "instId": "BTC-USDT-SWAP", "instType": "SWAP", "ordId": ord_id, "side": "buy",
+            "ordType": "market", "sz": "2", "px": "", "accFillSz": filled, "avgPx": avg,
+            "state": state, "cTime": "1700000000000", "uTime": "1700000000100"
+        }]
+    }
+
+
+async def wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("等待超时")
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_okx_login_subscribe_and_fill():
+    """登录成功后订阅 orders 频道,成交推送唤醒等待方;中间状态不唤醒"""
+    async with StandInPrivateServer() as server:
+        stream = OKXOrderStream(server.url, "key", "secret", "pass")
+        stream.start()
+        await asyncio.wait_for(stream.ready.wait(), 2.0)
+
+        login = server.requests[0]
+        assert login["op"] == "login" and login["args"][0]["apiKey"] == "key"
+        assert server.requests[1]["args"] == [{"channel": "orders", "instType": "SWAP"}]
+
+        waiter = asyncio.create_task(stream.wait_for_final("1001", timeout=2.0))
+        await asyncio.sleep(0.01)
+        await server.push(okx_order("1001", "partially_filled", "1", "100"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+
+        await server.push(okx_order("1001", "filled", "2", "100.5"))
+        raw = await waiter
+        assert raw["accFillSz"] == "2"
+
+        # 推送早于等待注册: 从最近订单缓存读取
+        await server.push(okx_order("1002", "canceled"))
+        await wait_for(lambda: "1002" in stream._recent)
+        assert (await stream.wait_for_final("1002", timeout=0.1))["state"] == "canceled"
+        assert stream.get_stats()["resolved"] == 2
+
+
+@pytest.mark.asyncio
+async def test_not_ready_and_disconnect_fall_back():
+    """登录失败时不等待推送;等待期间断线立即返回None"""
+    async with StandInPrivateServer(login_ok=False) as server:
+        stream = OKXOrderStream(server.url, "key", "secret", "pass")
+        stream.start()
+        await wait_for(lambda: len(server.requests) == 1)
+        await asyncio.sleep(0.05)
+        assert await stream.wait_for_final("1", timeout=2.0) is None
+        await stream.close()
+
+    async with StandInPrivateServer() as server:
+        stream = OKXOrderStream(server.url, "key", "secret", "pass")
+        stream.reconnect_delay = 5.0
+        stream.start()
+        await asyncio.wait_for(stream.ready.wait(), 2.0)
+
+        waiter = asyncio.create_task(stream.wait_for_final("2001", timeout=5.0))
+        await asyncio.sleep(0.01)
+        await server.connections[0].close()
+        assert await asyncio.wait_for(waiter, 1.0) is None
+        await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_okx_wait_for_fill_uses_stream():
+    """交易所适配器通过推送获取成交,不查询订单"""
+    async with StandInPrivateServer() as server:
+        exchange = OKXExchange("stream-key", "secret", "pass", is_testnet=True)
+        exchange.exchange.fetch_order = AsyncMock()
+        try:
+            stream = exchange.enable_order_stream(url=server.url)
+            await asyncio.wait_for(stream.ready.wait(), 2.0)
+
+            placed = {"id": "3001", "symbol": "BTC/USDT:USDT", "status": None}
+            task = asyncio.create_task(exchange.wait_for_fill(placed, "BTC/USDT:USDT"))
+            await asyncio.sleep(0.01)
+            await server.push(okx_order("3001", "filled", "2", "100.5"))
+            order = await asyncio.wait_for(task, 2.0)
+
+            assert order["status"] == "closed"
+            assert order["filled"] == Decimal("2")
+            assert order["symbol"] == "BTC/USDT:USDT"
+            exchange.exchange.fetch_order.assert_not_called()
+        finally:
+            await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_binance_user_data_stream_listen_key():
+    """Binance 用户数据流地址附带 listenKey,ORDER_TRADE_UPDATE 转换为 REST 订单字段"""
+    async with StandInPrivateServer() as server:
+        exchange = BinanceExchange("binance-stream-key", "secret", is_testnet=True)
+        exchange.exchange.fapiPrivatePostListenKey = AsyncMock(return_value={"listenKey": "lk-1"})
+        try:
+            stream = exchange.enable_order_stream(url=server.url)
+            await asyncio.wait_for(stream.ready.wait(), 2.0)
+            assert server.paths == ["/lk-1"]
+
+            placed = {"id": "42", "symbol": "BTC/USDT:USDT", "status": "open"}
+            task = asyncio.create_task(exchange.wait_for_fill(placed, "BTC/USDT:USDT"))
+            await asyncio.sleep(0.01)
+            await server.push({
+                "e": "ORDER_TRADE_UPDATE", "E": 1700000000100,
+                "o": {"s": "BTCUSDT", "i": 42, "S": "BUY", "o": "MARKET", "q": "0.01",
+                      "p": "0", "ap": "100", "X": "FILLED", "z": "0.01", "T": 1700000000100}
+            })
+            order = await asyncio.wait_for(task, 2.0)
+            assert order["status"] == "closed"
+            assert order["filled"] == Decimal("0.01")
+        finally:
+            await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_for_fill_polls_with_backoff_without_stream(monkeypatch):
+    """未启用推送时按倍增间隔查询,未完成订单的查询结果不复用"""
+    monkeypatch.setattr(settings, "ORDER_FILL_POLL_TIMEOUT", 3.0)
+    exchange = OKXExchange("poll-key", "secret", "pass", is_testnet=True)
+    responses = [
+        {"id": "9", "symbol": "BTC/USDT:USDT", "type": "market", "side": "buy", "amount": 2,
+         "filled": filled, "status": status, "timestamp": 1}
+        for filled, status in [(0, "open"), (1, "open"), (2, "closed")]
+    ]
+    exchange.exchange.fetch_order = AsyncMock(side_effect=responses)
+    try:
+        started = asyncio.get_running_loop().time()
+        order = await exchange.wait_for_fill({"id": "9", "status": "open"}, "BTC/USDT:USDT")
+        elapsed = asyncio.get_running_loop().time() - started
+
+        assert order["status"] == "closed"
+        assert exchange.exchange.fetch_order.await_count == 3
+        # 0.2 + 0.4 + 0.8 秒
+        assert 1.3 <= elapsed < 2.0
+    finally:
+        await exchange.close()
@@ -0,0 +1,123 @@
+"""
+配对交易两腿执行测试(同时下单、单腿失败回滚、部分成交补单、平仓重试)
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+
+from app.services.pair_executor import PairExecutor, PairLeg
+
+
+class FakeExchange:
+    """按交易对配置成交比例或失败次数的交易所"""
+
+    def __init__(self, fill_ratios=None, failures=None, delay=0.02):
+        self.fill_ratios = fill_ratios or {}
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.placed = []
+        self.inflight = 0
+        self.max_inflight = 0
+        self._next_id = 0
+
+    async def create_market_order(self, symbol, side, amount, reduce_only=False):
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.inflight -= 1
+        self.placed.append((symbol, side, amount, reduce_only))
+        if self.failures.get(symbol, 0) > 0:
+            self.failures[symbol] -= 1
+            raise RuntimeError("insufficient margin")
+        self._next_id += 1
+        return {
+            "id": str(self._next_id), "symbol": symbol, "type": "market", "side": side,
+            "amount": amount, "filled": Decimal("0"), "price": None, "cost": None,
+            "status": "open", "timestamp": 1700000000000 + self._next_id,
+        }
+
+    async def wait_for_fill(self, order, symbol):
+        # 主订单按配置的比例成交,补单/回滚全部成交
+        first = len([p for p in self.placed if p[0] == symbol]) == 1
+        ratio = Decimal(str(self.fill_ratios.get(symbol, 1))) if first else Decimal("1")
+        filled = order["amount"] * ratio
+        price = Decimal("100")
+        return dict(order, filled=filled, price=price, cost=filled * price,
+                    status="closed" if ratio == 1 else "canceled")
+
+
+@pytest.mark.asyncio
+async def test_legs_submitted_concurrently_with_skew_stats():
+    """两腿同时下单,记录两腿时间差"""
+    exchange = FakeExchange()
+    legs = [PairLeg("A", "buy", Decimal("2")), PairLeg("B", "sell", Decimal("3"))]
+    execution = await PairExecutor(exchange, mode="concurrent").execute(legs)
+
+    assert exchange.max_inflight == 2
+    assert execution.balanced and execution.complete
+    assert execution.corrections == 0
+    stats = execution.get_stats()
+    assert stats["exchange_skew_ms"] == 1.0
+    assert stats["submit_skew_ms"] is not None and stats["submit_skew_ms"] < 15
+
+    sequential = FakeExchange()
+    await PairExecutor(sequential, mode="sequential").execute(
+        [PairLeg("A", "buy", Decimal("2")), PairLeg("B", "sell", Decimal("3"))]
+    )
+    assert sequential.max_inflight == 1
+
+
+@pytest.mark.asyncio
+async def test_one_sided_failure_unwinds_filled_leg():
+    """一腿下单失败时回滚另一腿的成交(反向只减仓)"""
+    exchange = FakeExchange(failures={"B": 1})
+    legs = [PairLeg("A", "buy", Decimal("2")), PairLeg("B", "sell", Decimal("3"))]
+    execution = await PairExecutor(exchange, failure_action="unwind").execute(legs)
+
+    assert not execution.balanced
+    assert legs[1].error == "insufficient margin"
+    assert exchange.placed[-1] == ("A", "sell", Decimal("2"), True)
+    assert legs[0].filled == 0
+    assert legs[0].net_order() is None
+
+
+@pytest.mark.asyncio
+async def test_partial_fill_hedged_then_balanced():
+    """部分成交的腿补单到与另一腿相同的成交比例,净成交按均价合并"""
+    exchange = FakeExchange(fill_ratios={"B": 0.5})
+    legs = [PairLeg("A", "buy", Decimal("2")), PairLeg("B", "sell", Decimal("4"))]
+    execution = await PairExecutor(exchange, failure_action="hedge", hedge_retries=1).execute(legs)
+
+    assert execution.balanced
+    assert exchange.placed[-1] == ("B", "sell", Decimal("2.0"), False)
+    net = legs[1].net_order()
+    assert net["filled"] == Decimal("4.0")
+    assert net["price"] == Decimal("100")
+
+    # unwind 模式: 多出的部分回滚
+    exchange = FakeExchange(fill_ratios={"B": 0.5})
+    legs = [PairLeg("A", "buy", Decimal("2")), PairLeg("B", "sell", Decimal("4"))]
+    execution = await PairExecutor(exchange, failure_action="unwind").execute(legs)
+    assert execution.balanced
+    assert exchange.placed[-1] == ("A", "sell", Decimal("1.0"), True)
+    assert legs[0].filled == Decimal("1.0")
+
+
+@pytest.mark.asyncio
+async def test_close_retries_failed_leg_without_unwind():
+    """平仓时失败的腿重试,不回滚已平的腿"""
+    exchange = FakeExchange(failures={"B": 1})
+    legs = [PairLeg("A", "sell", Decimal("2"), reduce_only=True), PairLeg("B", "buy", Decimal("3"), reduce_only=True)]
+    execution = await PairExecutor(exchange, hedge_retries=1).execute(legs)
+
+    assert execution.complete
+    assert exchange.placed[-1] == ("B", "buy", Decimal("3"), True)
+    assert all(side != "buy" for symbol, side, _, _ in exchange.placed if symbol == "A")
+
+    exchange = FakeExchange(failures={"B": 2})
+    legs = [PairLeg("A", "sell", Decimal("2"), reduce_only=True), PairLeg("B", "buy", Decimal("3"), reduce_only=True)]
+    execution = await PairExecutor(exchange, hedge_retries=1).execute(legs)
+    assert not execution.complete
+    assert legs[0].filled == Decimal("2")
@@ -0,0 +1,96 @@
+"""
+交易所账户级限频测试(令牌桶、交易请求优先、同账户共享)
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock
+
+from app.exchanges.okx_exchange import OKXExchange
+from app.exchanges.rate_governor import (
+    PRIORITY_BACKGROUND, PRIORITY_TRADE, RateGovernor, background_requests, get_rate_governor,
+    get_rate_governor_stats
+)
+
+
+@pytest.mark.asyncio
+async def test_burst_then_refill_rate():
+    """桶容量内的请求立即放行,超出后按速率放行"""
+    governor = RateGovernor("test", {"order": (20.0, 5.0)}, safety=1.0, background_reserve=0)
+    started = time.monotonic()
+    for _ in range(5):
+        await governor.acquire("order")
+    assert time.monotonic() - started < 0.02
+
+    for _ in range(4):
+        await governor.acquire("order")
+    elapsed = time.monotonic() - started
+    assert 0.15 <= elapsed < 0.4
+
+    stats = governor.get_stats()["order"]
+    assert stats["granted"] == 9
+    assert stats["throttled"] >= 1
+    # 未配置的接口类别不限频
+    await governor.acquire("unknown")
+
+
+@pytest.mark.asyncio
+async def test_trade_requests_take_priority_over_background():
+    """后台请求不能使用保留额度,且有交易请求等待时让位"""
+    governor = RateGovernor("test", {"query_order": (50.0, 4.0)}, safety=1.0, background_reserve=0.5)
+    bucket = governor.buckets["query_order"]
+
+    # 后台请求只能用到保留额度以上的部分
+    with background_requests():
+        await governor.acquire("query_order")
+        await governor.acquire("query_order")
+    assert bucket.try_take(PRIORITY_BACKGROUND) > 0
+    # 交易请求可以使用保留额度
+    await governor.acquire("query_order")
+
+    bucket.tokens = 0
+    order = []
+
+    async def request(kind, priority):
+        await governor.acquire("query_order", priority)
+        order.append(kind)
+
+    await asyncio.gather(
+        *[request("background", PRIORITY_BACKGROUND) for _ in range(3)],
+        *[request("trade", PRIORITY_TRADE) for _ in range(3)],
+    )
+    assert order[:3] == ["trade"] * 3
+
+
+@pytest.mark.asyncio
+async def test_governor_shared_by_api_key():
+    """同一 API Key 的交易所实例共用限频器,并关闭 CCXT 单实例限频"""
+    first = OKXExchange("governor-key", "s", "p", is_testnet=True)
+    second = OKXExchange("governor-key", "s", "p", is_testnet=True)
+    other = OKXExchange("other-key", "s", "p", is_testnet=True)
+    try:
+        assert first.rate_governor is second.rate_governor
+        assert first.rate_governor is not other.rate_governor
+        assert first.exchange.enableRateLimit is False
+        assert get_rate_governor("mock", "governor-key") is None
+        assert first.rate_governor.name in get_rate_governor_stats()
+    finally:
+        for exchange in (first, second, other):
+            await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_okx_order_skips_fixed_delay_with_governor():
+    """启用账户级限频时下单不再固定等待 0.5 秒"""
+    exchange = OKXExchange("governor-order-key", "s", "p", is_testnet=True)
+    exchange.exchange.create_order = AsyncMock(return_value={
+        "id": "1", "symbol": "BTC/USDT:USDT", "type": "market", "side": "buy",
+        "amount": 1, "filled": 0, "status": "open", "timestamp": 1
+    })
+    try:
+        assert exchange.rate_governor is not None
+        started = time.monotonic()
+        await exchange.create_market_order("BTC/USDT:USDT", "buy", 1)
+        assert time.monotonic() - started < 0.3
+    finally:
+        await exchange.close()
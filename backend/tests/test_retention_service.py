@@ -0,0 +1,157 @@
+"""
+数据保留与归档测试
+"""
+import pytest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, insert, select
+
+import app.models  # noqa: F401  注册所有模型
+from app.models.spread_history import SpreadHistory
+from app.models.spread_rollup import SpreadRollup
+from app.models.trade_log import TradeLog
+from app.services.archive_store import ArchiveStore
+from app.services.retention_service import RetentionPolicy, RetentionService
+from app.services.spread_recorder import SpreadRecorder
+from app.services.spread_rollup import get_spread_series
+
+
+NOW = datetime(2024, 3, 1)
+
+
+async def count(session_factory, model, *where) -> int:
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(model).where(*where))
+
+
+async def seed_spreads(session_factory, days_ago_list, bot_id=1):
+    recorder = SpreadRecorder(batch_size=10000, flush_interval=60, session_factory=session_factory)
+    for i, days_ago in enumerate(days_ago_list):
+        recorder.record(
+            bot_id, Decimal("100"), Decimal("200"), Decimal(i % 5),
+            NOW - timedelta(days=days_ago) + timedelta(seconds=i)
+        )
+    await recorder.flush()
+    await recorder.stop()
+
+
+@pytest.mark.asyncio
+async def test_expired_rows_archived_then_deleted_in_chunks(session_factory, tmp_path):
+    """过期原始数据分块写入归档并删除,保留期内数据不动"""
+    await seed_spreads(session_factory, [40] * 25 + [1] * 5)
+    store = ArchiveStore(tmp_path)
+    service = RetentionService(
+        policies=[RetentionPolicy("spread_history", SpreadHistory, "recorded_at", 30)],
+        store=store,
+        session_factory=session_factory,
+        chunk_size=10,
+        chunk_pause=0
+    )
+
+    result = await service.run_once(now=NOW)
+
+    assert result == {"spread_history": 25}
+    assert await count(session_factory, SpreadHistory) == 5
+    assert service.archive_files == 3  # 10 + 10 + 5
+    archived = store.query(
+        SpreadHistory.__table__, "recorded_at", 1, NOW - timedelta(days=41), NOW
+    )
+    assert len(archived) == 25
+    assert isinstance(archived[0]["spread_percentage"], Decimal)
+    assert isinstance(archived[0]["recorded_at"], datetime)
+
+
+@pytest.mark.asyncio
+async def test_history_query_reads_archives(session_factory, tmp_path):
+    """历史查询合并归档与数据库中的原始数据和聚合数据"""
+    await seed_spreads(session_factory, [40] * 3 + [1] * 2)
+    store = ArchiveStore(tmp_path)
+    service = RetentionService(
+        policies=[
+            RetentionPolicy("spread_history", SpreadHistory, "recorded_at", 30),
+            RetentionPolicy("spread_rollups_1m", SpreadRollup, "bucket_start", 30,
+                            where=SpreadRollup.resolution == "1m"),
+        ],
+        store=store,
+        session_factory=session_factory,
+        chunk_pause=0
+    )
+    await service.run_once(now=NOW)
+    assert await count(session_factory, SpreadRollup, SpreadRollup.resolution == "1m") == 1
+
+    start = NOW - timedelta(days=45)
+    async with session_factory() as session:
+        raw = await get_spread_series(session, 1, start, NOW, max_points=100, store=store)
+        minutes = await get_spread_series(session, 1, start, NOW, max_points=100, resolution="1m", store=store)
+
+    assert [row["resolution"] for row in raw] == ["raw"] * 5
+    assert raw == sorted(raw, key=lambda row: row["recorded_at"])
+    assert len(minutes) == 2
+    assert minutes[0]["sample_count"] == 3  # 归档中的 1m 桶
+
+
+@pytest.mark.asyncio
+async def test_rollup_archives_partitioned_by_resolution(session_factory, tmp_path):
+    """聚合归档按粒度分区,查询某一粒度只读取该分区的文件"""
+    await seed_spreads(session_factory, [40] * 3 + [1] * 2)
+    store = ArchiveStore(tmp_path)
+    service = RetentionService(
+        policies=[
+            RetentionPolicy("spread_rollups_1m", SpreadRollup, "bucket_start", 30,
+                            where=SpreadRollup.resolution == "1m", partition="1m"),
+            RetentionPolicy("spread_rollups_1h", SpreadRollup, "bucket_start", 30,
+                            where=SpreadRollup.resolution == "1h", partition="1h"),
+        ],
+        store=store,
+        session_factory=session_factory,
+        chunk_pause=0
+    )
+    await service.run_once(now=NOW)
+
+    bot_dir = tmp_path / "spread_rollups" / "bot_1"
+    assert len(list((bot_dir / "1m").glob("*.json.gz"))) == 1
+    assert len(list((bot_dir / "1h").glob("*.json.gz"))) == 1
+
+    read_paths = []
+    read = store._read
+    store._read = lambda path, table: read_paths.append(path.parent.name) or read(path, table)
+
+    start = NOW - timedelta(days=45)
+    async with session_factory() as session:
+        hours = await get_spread_series(session, 1, start, NOW, max_points=100, resolution="1h", store=store)
+
+    assert read_paths == ["1h"]
+    assert [row["sample_count"] for row in hours] == [3, 2]
+
+
+@pytest.mark.asyncio
+async def test_trade_logs_policy_and_disabled_policy(session_factory, tmp_path):
+    """交易日志按各自的保留期清理, keep_days=0 的策略不清理"""
+    async with session_factory() as session:
+        await session.execute(insert(TradeLog), [
+            {"bot_instance_id": 2, "log_type": "trade", "message": "old",
+             "details": {"a": 1}, "created_at": NOW - timedelta(days=100)},
+            {"bot_instance_id": 2, "log_type": "info", "message": "new",
+             "details": None, "created_at": NOW - timedelta(days=1)},
+        ])
+        await session.commit()
+    await seed_spreads(session_factory, [400])
+
+    store = ArchiveStore(tmp_path)
+    service = RetentionService(
+        policies=[
+            RetentionPolicy("trade_logs", TradeLog, "created_at", 90),
+            RetentionPolicy("spread_rollups_1d", SpreadRollup, "bucket_start", 0,
+                            where=SpreadRollup.resolution == "1d"),
+        ],
+        store=store,
+        session_factory=session_factory,
+        chunk_pause=0
+    )
+
+    assert await service.run_once(now=NOW) == {"trade_logs": 1}
+    assert await count(session_factory, TradeLog) == 1
+    assert await count(session_factory, SpreadRollup, SpreadRollup.resolution == "1d") == 1
+    archived = store.query(TradeLog.__table__, "created_at", 2, NOW - timedelta(days=365), NOW)
+    assert archived[0]["details"] == {"a": 1}
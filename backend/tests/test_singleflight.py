@@ -0,0 +1,124 @@
+"""
+交易所读请求合并测试(并发合并、结果复用、写操作失效、异常共享)
+"""
+import asyncio
+import pytest
+
+from app.exchanges.singleflight import SingleFlight, coalesced_read, get_singleflight_stats, invalidates_reads
+
+
+class FakeExchange:
+    """记录实际请求次数的交易所"""
+
+    exchange_name = "fake"
+    is_testnet = False
+
+    def __init__(self, api_key: str, delay: float = 0.02):
+        self.api_key = api_key
+        self.delay = delay
+        self.requests = 0
+        self.fail = False
+        self.positions = [{"symbol": "BTC-USDT-SWAP", "contracts": 1.0}]
+
+    @coalesced_read
+    async def get_all_positions(self):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("network down")
+        return self.positions
+
+    @coalesced_read
+    async def get_order(self, order_id: str, symbol: str):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return {"id": order_id, "symbol": symbol}
+
+    @invalidates_reads
+    async def create_market_order(self, symbol: str, contracts: float):
+        self.positions = [{"symbol": symbol, "contracts": contracts}]
+        return {"id": "new"}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_reads_execute_once():
+    """相同的并发查询只请求一次,调用方得到独立副本;参数不同的查询不合并"""
+    exchange = FakeExchange("sf-concurrent")
+    results = await asyncio.gather(*[exchange.get_all_positions() for _ in range(5)])
+    assert exchange.requests == 1
+    assert all(result == exchange.positions for result in results)
+    results[0][0]["contracts"] = 99
+    assert results[1][0]["contracts"] == 1.0
+
+    await asyncio.gather(exchange.get_order("1", "BTC"), exchange.get_order("2", "BTC"))
+    assert exchange.requests == 3
+
+    stats = get_singleflight_stats()
+    flight = next(value for name, value in stats.items() if name.startswith("fake:"))
+    assert flight["saved_inflight"] >= 4
+
+
+@pytest.mark.asyncio
+async def test_reuse_window_and_invalidation_after_write():
+    """复用时间内直接返回结果,写操作后重新查询"""
+    exchange = FakeExchange("sf-window")
+    await exchange.get_all_positions()
+    await exchange.get_all_positions()
+    assert exchange.requests == 1
+
+    await exchange.create_market_order("ETH-USDT-SWAP", 2.0)
+    positions = await exchange.get_all_positions()
+    assert exchange.requests == 2
+    assert positions[0]["symbol"] == "ETH-USDT-SWAP"
+
+
+@pytest.mark.asyncio
+async def test_inflight_read_started_before_write_is_not_reused():
+    """写操作之前发起的查询结果不提供给写操作之后的调用方"""
+    exchange = FakeExchange("sf-generation", delay=0.05)
+    before = asyncio.create_task(exchange.get_all_positions())
+    await asyncio.sleep(0.01)
+    await exchange.create_market_order("ETH-USDT-SWAP", 3.0)
+    after = await exchange.get_all_positions()
+    await before
+
+    assert exchange.requests == 2
+    assert after[0]["contracts"] == 3.0
+
+
+@pytest.mark.asyncio
+async def test_errors_shared_but_not_cached():
+    """失败结果同时返回给等待方,但不进入复用缓存"""
+    exchange = FakeExchange("sf-error")
+    exchange.fail = True
+    results = await asyncio.gather(
+        *[exchange.get_all_positions() for _ in range(3)], return_exceptions=True
+    )
+    assert exchange.requests == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    exchange.fail = False
+    assert await exchange.get_all_positions() == exchange.positions
+    assert exchange.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_request():
+    """发起方被取消时,其他等待方仍然拿到结果"""
+    flight = SingleFlight("test", reuse_window=0)
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.03)
+        return {"ok": True}
+
+    first = asyncio.create_task(flight.do(("positions",), fetch))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(flight.do(("positions",), fetch))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == {"ok": True}
+    assert calls == 1
@@ -0,0 +1,96 @@
+"""
+价差历史流式导出测试
+"""
+import csv
+import io
+import json
+import pytest
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert
+
+import app.models  # noqa: F401  注册所有模型
+from app.models.spread_history import SpreadHistory
+from app.services.archive_store import ArchiveStore
+from app.services.retention_service import RetentionPolicy, RetentionService
+from app.services.spread_export import iter_spread_export
+
+
+BASE = datetime(2024, 1, 1)
+
+
+async def seed(session_factory, n, bot_id=1, same_time_every=3):
+    """插入 n 条样本; 每 same_time_every 条共用同一时间,验证 keyset 的 id 次序"""
+    async with session_factory() as session:
+        await session.execute(insert(SpreadHistory), [
+            {
+                "bot_instance_id": bot_id,
+                "market1_price": Decimal("100"),
+                "market2_price": Decimal("200"),
+                "spread_percentage": Decimal(i % 10),
+                "recorded_at": BASE + timedelta(seconds=i // same_time_every),
+            }
+            for i in range(n)
+        ])
+        await session.commit()
+
+
+async def collect(iterator):
+    return [chunk async for chunk in iterator]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_pages_cover_all_rows_once(session_factory, tmp_path):
+    """keyset 分页不重复、不遗漏(包括相同时间戳的行),且只导出指定机器人"""
+    await seed(session_factory, 1000)
+    await seed(session_factory, 50, bot_id=2)
+
+    chunks = await collect(iter_spread_export(
+        1, BASE, BASE + timedelta(days=1), "ndjson",
+        session_factory=session_factory, store=ArchiveStore(tmp_path), page_size=300
+    ))
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+
+    assert len(chunks) == 4  # 首页 200 + 300 + 300 + 200
+    assert len(rows) == 1000
+    assert len({row["id"] for row in rows}) == 1000
+    assert all(row["bot_instance_id"] == 1 for row in rows)
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_csv_includes_archived_rows_first(session_factory, tmp_path):
+    """CSV 导出先输出归档数据,再输出数据库数据"""
+    await seed(session_factory, 30, same_time_every=1)
+    store = ArchiveStore(tmp_path)
+    service = RetentionService(
+        policies=[RetentionPolicy("spread_history", SpreadHistory, "recorded_at", 1)],
+        store=store,
+        session_factory=session_factory,
+        chunk_size=8,
+        chunk_pause=0
+    )
+    # 前 20 条过期并归档
+    await service.run_once(now=BASE + timedelta(days=1, seconds=20))
+
+    # 归档文件在线程中读取,不阻塞事件循环
+    reader_threads = []
+    read_file = store.read_file
+
+    def tracked_read_file(*args):
+        reader_threads.append(threading.current_thread())
+        return read_file(*args)
+
+    store.read_file = tracked_read_file
+    chunks = await collect(iter_spread_export(
+        1, BASE, BASE + timedelta(days=1), "csv",
+        session_factory=session_factory, store=store, page_size=100
+    ))
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+
+    assert reader_threads and threading.main_thread() not in reader_threads
+    assert len(rows) == 30
+    assert [int(row["id"]) for row in rows] == list(range(1, 31))
+    assert rows[0]["recorded_at"] == BASE.isoformat()
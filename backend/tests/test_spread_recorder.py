@@ -0,0 +1,104 @@
+"""
+价差历史写缓冲测试
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+import app.models  # noqa: F401  注册所有模型
+from app.models.spread_history import SpreadHistory
+from app.services.spread_recorder import SpreadRecorder
+
+
+async def count_rows(session_factory) -> int:
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(SpreadHistory))
+
+
+def record(recorder, n, bot_id=1):
+    for i in range(n):
+        recorder.record(bot_id, Decimal("100"), Decimal("200"), Decimal(i))
+
+
+@pytest.mark.asyncio
+async def test_flush_on_batch_size(session_factory):
+    """达到批量大小时立即写入"""
+    recorder = SpreadRecorder(batch_size=10, flush_interval=60, session_factory=session_factory)
+
+    record(recorder, 10)
+    await asyncio.sleep(0.1)
+
+    assert await count_rows(session_factory) == 10
+    stats = recorder.get_stats()
+    assert stats["queue_depth"] == 0
+    assert stats["flushes"] == 1
+    assert stats["written"] == 10
+
+    await recorder.stop()
+
+
+@pytest.mark.asyncio
+async def test_flush_on_interval(session_factory):
+    """未达到批量大小时按时间间隔写入"""
+    recorder = SpreadRecorder(batch_size=100, flush_interval=0.05, session_factory=session_factory)
+
+    record(recorder, 3)
+    assert recorder.get_stats()["queue_depth"] == 3
+    await asyncio.sleep(0.2)
+
+    assert await count_rows(session_factory) == 3
+    await recorder.stop()
+
+
+@pytest.mark.asyncio
+async def test_bounded_queue_drops_oldest(session_factory):
+    """队列写满时丢弃最旧样本"""
+    recorder = SpreadRecorder(max_queue=5, batch_size=100, flush_interval=60, session_factory=session_factory)
+
+    record(recorder, 8)
+    assert recorder.get_stats()["queue_depth"] == 5
+    assert recorder.get_stats()["dropped"] == 3
+
+    await recorder.stop()
+
+    async with session_factory() as session:
+        spreads = (await session.scalars(select(SpreadHistory.spread_percentage))).all()
+    assert sorted(int(s) for s in spreads) == [3, 4, 5, 6, 7]
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_remaining(session_factory):
+    """关闭时写入队列中剩余的全部样本"""
+    recorder = SpreadRecorder(batch_size=4, flush_interval=60, session_factory=session_factory)
+    recorder._flush_event.set = lambda: None  # 禁止按批量触发,只验证关闭刷新
+
+    record(recorder, 11)
+    await recorder.stop()
+
+    assert await count_rows(session_factory) == 11
+    assert recorder.get_stats()["flushes"] == 3
+
+
+@pytest.mark.asyncio
+async def test_stop_during_flush_keeps_in_flight_batch(session_factory):
+    """后台任务写入过程中关闭: 已出队的批次不丢失"""
+    recorder = SpreadRecorder(batch_size=5, flush_interval=60, session_factory=session_factory)
+    write_batch = recorder._write_batch
+    started = asyncio.Event()
+
+    async def slow_write(batch):
+        started.set()
+        await asyncio.sleep(0.1)
+        await write_batch(batch)
+
+    recorder._write_batch = slow_write
+
+    record(recorder, 5)
+    await asyncio.wait_for(started.wait(), 1)
+    record(recorder, 2)
+    await recorder.stop()
+
+    assert await count_rows(session_factory) == 7
+    assert recorder.get_stats()["queue_depth"] == 0
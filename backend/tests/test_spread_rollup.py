@@ -0,0 +1,142 @@
+"""
+价差多粒度聚合测试
+"""
+import pytest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import delete, select
+
+import app.models  # noqa: F401  注册所有模型
+from app.models.spread_history import SpreadHistory
+from app.models.spread_rollup import SpreadRollup
+from app.services.spread_recorder import SpreadRecorder
+from app.services.spread_rollup import bucket_start, get_spread_series, rebuild_rollups
+
+
+BASE = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def test_bucket_start():
+    """时间对齐到桶起点"""
+    ts = datetime(2024, 1, 1, 12, 7, 42)
+    assert bucket_start(ts, 60) == datetime(2024, 1, 1, 12, 7)
+    assert bucket_start(ts, 300) == datetime(2024, 1, 1, 12, 5)
+    assert bucket_start(ts, 86400) == datetime(2024, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_rollups_update_incrementally(session_factory):
+    """分两批写入同一个桶: 保留 open, 合并 high/low/close/均值"""
+    recorder = SpreadRecorder(batch_size=1000, flush_interval=60, session_factory=session_factory)
+
+    for i, spread in enumerate(["1.0", "3.0", "2.0"]):
+        recorder.record(1, Decimal("100"), Decimal("200"), Decimal(spread), BASE + timedelta(seconds=i))
+    await recorder.flush()
+    for i, spread in enumerate(["0.5", "1.5"]):
+        recorder.record(1, Decimal("101"), Decimal("201"), Decimal(spread), BASE + timedelta(seconds=10 + i))
+    await recorder.flush()
+    await recorder.stop()
+
+    async with session_factory() as session:
+        rollup = await session.scalar(
+            select(SpreadRollup).where(SpreadRollup.resolution == "1m")
+        )
+        count = len((await session.execute(select(SpreadRollup))).scalars().all())
+
+    assert count == 4  # 1m/5m/1h/1d 各一个桶
+    assert rollup.open == Decimal("1.0")
+    assert rollup.high == Decimal("3.0")
+    assert rollup.low == Decimal("0.5")
+    assert rollup.close == Decimal("1.5")
+    assert rollup.sample_count == 5
+    assert rollup.mean == Decimal("1.6")
+    assert rollup.market1_price == Decimal("101")
+
+
+@pytest.mark.asyncio
+async def test_series_picks_resolution_by_max_points(session_factory):
+    """样本数超过 max_points 时返回聚合数据"""
+    recorder = SpreadRecorder(batch_size=10000, flush_interval=60, session_factory=session_factory)
+    # 2 小时, 每 10 秒一个样本
+    for i in range(720):
+        recorder.record(1, Decimal("100"), Decimal("200"), Decimal(i % 7), BASE + timedelta(seconds=10 * i))
+    await recorder.flush()
+    await recorder.stop()
+
+    end = BASE + timedelta(hours=2)
+    async with session_factory() as session:
+        raw = await get_spread_series(session, 1, BASE, end, max_points=1000)
+        minutes = await get_spread_series(session, 1, BASE, end, max_points=200)
+        hours = await get_spread_series(session, 1, BASE, end, max_points=10)
+
+    assert len(raw) == 720 and raw[0]["resolution"] == "raw"
+    assert len(minutes) == 120 and minutes[0]["resolution"] == "1m"
+    assert minutes[0]["sample_count"] == 6
+    assert len(hours) == 2 and hours[0]["resolution"] == "1h"
+
+
+@pytest.mark.asyncio
+async def test_rebuild_matches_incremental(session_factory):
+    """回填结果与增量聚合一致"""
+    recorder = SpreadRecorder(batch_size=7, flush_interval=60, session_factory=session_factory)
+    for i in range(50):
+        recorder.record(1, Decimal("100"), Decimal("200"), Decimal(i % 5), BASE + timedelta(seconds=13 * i))
+    await recorder.flush()
+    await recorder.stop()
+
+    def snapshot(rows):
+        return sorted(
+            (r.resolution, r.bucket_start, r.open, r.high, r.low, r.close, r.sample_count) for r in rows
+        )
+
+    async with session_factory() as session:
+        incremental = snapshot((await session.execute(select(SpreadRollup))).scalars().all())
+    async with session_factory() as session:
+        processed = await rebuild_rollups(session, chunk_size=8)
+    async with session_factory() as session:
+        rebuilt = snapshot((await session.execute(select(SpreadRollup))).scalars().all())
+
+    assert processed == 50
+    assert rebuilt == incremental
+
+
+@pytest.mark.asyncio
+async def test_rebuild_keeps_rollups_of_pruned_raw_range(session_factory):
+    """原始样本被清理后重建: 清理范围内的聚合保持不变,之后的聚合与增量聚合一致"""
+    recorder = SpreadRecorder(batch_size=1000, flush_interval=60, session_factory=session_factory)
+    # 3 天, 每 2 小时一个样本
+    for i in range(36):
+        recorder.record(1, Decimal("100"), Decimal("200"), Decimal(i % 5), BASE + timedelta(hours=2 * i))
+    await recorder.flush()
+    await recorder.stop()
+
+    def snapshot(rows):
+        return sorted(
+            (r.resolution, r.bucket_start, r.open, r.high, r.low, r.close, r.sample_count) for r in rows
+        )
+
+    async with session_factory() as session:
+        incremental = snapshot((await session.execute(select(SpreadRollup))).scalars().all())
+        # 模拟保留策略清理第一天(及第二天凌晨)的原始样本
+        await session.execute(delete(SpreadHistory).where(SpreadHistory.recorded_at < BASE + timedelta(hours=16)))
+        await session.commit()
+
+    async with session_factory() as session:
+        processed = await rebuild_rollups(session)
+    async with session_factory() as session:
+        rebuilt = snapshot((await session.execute(select(SpreadRollup))).scalars().all())
+
+    assert processed == 28
+    assert rebuilt == incremental
+
+    # 升级前的数据(没有聚合): 从原始样本回填
+    async with session_factory() as session:
+        await session.execute(delete(SpreadRollup))
+        await session.commit()
+        await rebuild_rollups(session)
+    async with session_factory() as session:
+        daily = (await session.execute(
+            select(SpreadRollup).where(SpreadRollup.resolution == "1d").order_by(SpreadRollup.bucket_start)
+        )).scalars().all()
+    assert [row.sample_count for row in daily] == [10, 12, 6]
@@ -0,0 +1,249 @@
+"""
+WebSocket行情推送测试(使用本地替身WebSocket服务器)
+"""
+import asyncio
+import json
+import pytest
+from decimal import Decimal
+from unittest.mock import AsyncMock
+
+from websockets.asyncio.server import serve
+
+from app.exchanges.okx_exchange import OKXExchange
+from app.services.market_data_service import MarketDataService
+from app.exchanges.ticker_stream import (
+    BinanceTickerStream,
+    OKXTickerStream,
+    close_ticker_streams,
+)
+
+
+class StandInServer:
+    """本地替身行情服务器: 收到订阅后推送一条行情"""
+
+    def __init__(self, make_push):
+        self.make_push = make_push
+        self.subscriptions = []
+        self.connections = []
+        self._server = None
+
+    async def _handler(self, ws):
+        self.connections.append(ws)
+        async for raw in ws:
+            if raw == 'ping':
+                await ws.send('pong')
+                continue
+            message = json.loads(raw)
+            self.subscriptions.append(message)
+            for push in self.make_push(message):
+                await ws.send(json.dumps(push))
+
+    async def __aenter__(self):
+        self._server = await serve(self._handler, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+def okx_push(message):
+    if message.get("op") != "subscribe":
+        return []
+    return [{
+        "arg": {"channel": "tickers", "instId": arg["instId"]},
+        "data": [{
+            "instId": arg["instId"],
+            "last": "65000.5",
+            "bidPx": "65000.1",
+            "askPx": "65000.9",
+            "vol24h": "1234",
+            "ts": "1700000000000"
+        }]
+    } for arg in message["args"]]
+
+
+class StandInProxy:
+    """本地替身 HTTP 代理: 处理 CONNECT 并转发数据"""
+
+    def __init__(self):
+        self.targets = []
+        self._server = None
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handler(self, reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        target = request.split(b" ")[1].decode()
+        self.targets.append(target)
+        host, port = target.rsplit(":", 1)
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+        writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        await writer.drain()
+        await asyncio.gather(self._pipe(reader, upstream_writer), self._pipe(upstream_reader, writer))
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handler, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+
+
+async def wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("等待超时")
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_okx_stream_caches_last_price():
+    """OKX tickers 推送写入内存缓存"""
+    async with StandInServer(okx_push) as server:
+        stream = OKXTickerStream(server.url)
+        received = []
+        stream.add_listener(lambda symbol, ticker: received.append(symbol))
+
+        await stream.subscribe("BTC/USDT:USDT")
+        await wait_for(lambda: stream.get_ticker("BTC/USDT:USDT", 5.0) is not None)
+
+        ticker = stream.get_ticker("BTC/USDT:USDT", 5.0)
+        assert ticker["last_price"] == Decimal("65000.5")
+        assert ticker["bid"] == Decimal("65000.1")
+        assert received == ["BTC/USDT:USDT"]
+        assert server.subscriptions[0]["args"] == [{"channel": "tickers", "instId": "BTC-USDT-SWAP"}]
+
+        await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_stream_connects_through_proxy():
+    """配置代理时通过 HTTP 代理建立连接"""
+    async with StandInServer(okx_push) as server, StandInProxy() as proxy:
+        stream = OKXTickerStream(server.url, proxy=proxy.url)
+        await stream.subscribe("BTC/USDT:USDT")
+        await wait_for(lambda: stream.get_ticker("BTC/USDT:USDT", 5.0) is not None)
+
+        assert proxy.targets == [server.url[len("ws://"):]]
+        await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_stream_reconnects_and_resubscribes():
+    """连接断开后自动重连并重新订阅"""
+    async with StandInServer(okx_push) as server:
+        stream = OKXTickerStream(server.url)
+        stream.reconnect_delay = 0.05
+
+        await stream.subscribe("ETH/USDT:USDT")
+        await wait_for(lambda: len(server.subscriptions) == 1)
+
+        await server.connections[0].close()
+        await wait_for(lambda: len(server.subscriptions) == 2)
+
+        assert stream.reconnects >= 1
+        assert server.subscriptions[1]["args"][0]["instId"] == "ETH-USDT-SWAP"
+        await wait_for(lambda: stream.get_ticker("ETH/USDT:USDT", 5.0) is not None)
+
+        await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_last_feed_unsubscribe_unsubscribes_stream():
+    """行情键的最后一个订阅者退出后取消推送订阅,并丢弃该交易对的缓存"""
+    async with StandInServer(okx_push) as server:
+        exchange = OKXExchange("key", "secret", "pass", is_testnet=False)
+        exchange.exchange.fetch_ticker = AsyncMock(return_value={
+            "last": 1.5, "bid": 1.4, "ask": 1.6, "baseVolume": 10, "timestamp": 1
+        })
+        stream = exchange.enable_ticker_stream(url=server.url)
+        service = MarketDataService(interval=5.0)
+
+        await service.subscribe(exchange, "BTC/USDT:USDT", 1)
+        await service.subscribe(exchange, "ETH/USDT:USDT", 1)
+        await wait_for(lambda: stream.get_ticker("BTC/USDT:USDT", 5.0) is not None)
+
+        await service.unsubscribe(exchange, "BTC/USDT:USDT", 1)
+        await wait_for(lambda: server.subscriptions[-1]["op"] == "unsubscribe")
+
+        assert server.subscriptions[-1]["args"] == [{"channel": "tickers", "instId": "BTC-USDT-SWAP"}]
+        assert stream.get_ticker("BTC/USDT:USDT", 5.0) is None
+        assert stream.get_stats()["symbols"] == 1
+
+        # 重复取消订阅不再发送报文
+        await stream.unsubscribe("BTC/USDT:USDT")
+        assert sum(message["op"] == "unsubscribe" for message in server.subscriptions) == 1
+
+        await service.stop()
+        await exchange.close()
+        await close_ticker_streams()
+
+
+@pytest.mark.asyncio
+async def test_binance_book_ticker_uses_mid_price():
+    """Binance bookTicker 使用买一卖一中间价"""
+    def binance_push(message):
+        return [{"e": "bookTicker", "s": "BTCUSDT", "b": "100", "a": "102", "T": 1}]
+
+    async with StandInServer(binance_push) as server:
+        stream = BinanceTickerStream(server.url)
+        await stream.subscribe("BTC/USDT:USDT")
+        await wait_for(lambda: stream.get_ticker("BTC/USDT:USDT", 5.0) is not None)
+
+        assert server.subscriptions[0]["params"] == ["btcusdt@bookTicker"]
+        assert stream.get_ticker("BTC/USDT:USDT", 5.0)["last_price"] == Decimal("101")
+
+        await stream.close()
+
+
+@pytest.mark.asyncio
+async def test_exchange_falls_back_to_rest_on_gap():
+    """推送无数据或数据过期时回退到REST"""
+    async with StandInServer(lambda message: []) as server:
+        exchange = OKXExchange("key", "secret", "pass", is_testnet=False)
+        exchange.exchange.fetch_ticker = AsyncMock(return_value={
+            "last": 1.5, "bid": 1.4, "ask": 1.6, "baseVolume": 10, "timestamp": 1
+        })
+        exchange.enable_ticker_stream(url=server.url)
+
+        ticker = await exchange.get_ticker("BTC/USDT:USDT")
+
+        assert ticker["last_price"] == Decimal("1.5")
+        exchange.exchange.fetch_ticker.assert_awaited_once()
+
+        await exchange.close()
+        await close_ticker_streams()
+
+
+@pytest.mark.asyncio
+async def test_exchange_prefers_streamed_ticker():
+    """推送数据新鲜时不发送REST请求"""
+    async with StandInServer(okx_push) as server:
+        exchange = OKXExchange("key", "secret", "pass", is_testnet=False)
+        exchange.exchange.fetch_ticker = AsyncMock()
+        stream = exchange.enable_ticker_stream(url=server.url)
+
+        await stream.subscribe("BTC/USDT:USDT")
+        await wait_for(lambda: stream.get_ticker("BTC/USDT:USDT", 5.0) is not None)
+
+        ticker = await exchange.get_ticker("BTC/USDT:USDT")
+
+        assert ticker["last_price"] == Decimal("65000.5")
+        exchange.exchange.fetch_ticker.assert_not_awaited()
+
+        await exchange.close()
+        await close_ticker_streams()
@@ -0,0 +1,150 @@
+"""
+多路复用WebSocket测试(一个连接订阅多个机器人)
+"""
+import asyncio
+import json
+import pytest
+from datetime import datetime
+from decimal import Decimal
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import app.db.session as db_session
+from app.api.v1 import websocket as ws_module
+from app.api.v1.websocket import ConnectionManager
+from app.db.base import Base
+from app.models import BotInstance, ExchangeAccount, User
+from app.utils.security import create_access_token
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def update(message_type, bot_id):
+    return {"type": message_type, "data": {"bot_instance_id": bot_id, "id": 1}}
+
+
+@pytest.mark.asyncio
+async def test_subscription_index_routes_by_bot_and_event():
+    """广播只送达订阅了对应机器人和事件类型的连接"""
+    manager = ConnectionManager()
+    spread_only, everything, other_bot = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    for i, ws in enumerate((spread_only, everything, other_bot)):
+        await manager.accept(ws, i)
+
+    manager.subscribe(spread_only, [1, 2], {"spread_update"})
+    manager.subscribe(everything, [1])
+    manager.subscribe(everything, [1], {"order_update"})  # 已订阅全部事件,不重复登记
+    manager.subscribe(other_bot, [3])
+
+    await manager.broadcast_to_bot(1, update("spread_update", 1))
+    await manager.broadcast_to_bot(1, update("order_update", 1))
+    await manager.broadcast_to_bot(2, update("order_update", 2))
+    await asyncio.sleep(0.02)
+
+    assert [m["type"] for m in spread_only.sent] == ["spread_update"]
+    assert [m["type"] for m in everything.sent] == ["spread_update", "order_update"]
+    assert other_bot.sent == []
+
+    manager.unsubscribe(spread_only, [1])
+    assert manager.get_subscriptions(spread_only) == {2: ["spread_update"]}
+
+    await manager.disconnect(everything)
+    assert set(manager.subscriptions) == {2, 3}
+    for ws in (spread_only, other_bot):
+        await manager.disconnect(ws)
+    assert manager.subscriptions == {}
+
+
+@pytest.fixture
+def seeded_db(tmp_path, monkeypatch):
+    """文件数据库: 用户1拥有机器人1、2, 用户2拥有机器人3; 统计 bot_instances 查询次数"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ws.db'}", poolclass=NullPool)
+
+    async def seed():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with factory() as db:
+            for user_id in (1, 2):
+                db.add(User(id=user_id, username=f"u{user_id}", email=f"u{user_id}@x.com", password_hash="x"))
+                db.add(ExchangeAccount(id=user_id, user_id=user_id, exchange_name="mock", api_key="k", api_secret="s"))
+            for bot_id, user_id in ((1, 1), (2, 1), (3, 2)):
+                db.add(BotInstance(
+                    id=bot_id, user_id=user_id, exchange_account_id=user_id, bot_name=f"bot{bot_id}",
+                    market1_symbol="BTC-USDT", market2_symbol="ETH-USDT", start_time=datetime.utcnow(),
+                    investment_per_order=Decimal("10"), max_position_value=Decimal("100"), dca_config=[]
+                ))
+            await db.commit()
+
+    asyncio.run(seed())
+
+    queries = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_bot_queries(conn, cursor, statement, parameters, context, executemany):
+        if "FROM bot_instances" in statement:
+            queries.append(statement)
+
+    monkeypatch.setattr(
+        db_session, "AsyncSessionLocal",
+        async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    )
+    monkeypatch.setattr(ws_module, "manager", ConnectionManager())
+    yield queries
+
+
+def test_stream_endpoint_batches_ownership_check(seeded_db):
+    """认证一次,一次查询校验多个机器人, 无权访问的机器人被拒绝"""
+    app = FastAPI()
+    app.include_router(ws_module.router, prefix="/ws")
+    token = create_access_token({"sub": "1"})
+
+    with TestClient(app) as client:
+        with client.websocket_connect(f"/ws/stream?token={token}") as ws:
+            ws.send_json({"type": "subscribe", "bot_ids": [1, 2, 3], "events": ["spread_update"]})
+            reply = ws.receive_json()
+            assert reply["type"] == "subscribed"
+            assert reply["data"]["bot_ids"] == [1, 2]
+            assert reply["data"]["denied"] == [3]
+            assert len(seeded_db) == 1
+
+            # 已校验过的机器人不再查询
+            ws.send_json({"type": "subscribe", "bot_ids": [1], "events": ["order_update"]})
+            reply = ws.receive_json()
+            assert reply["data"]["subscriptions"] == {"1": ["order_update", "spread_update"], "2": ["spread_update"]}
+            assert len(seeded_db) == 1
+
+            ws.send_json({"type": "subscribe", "bot_ids": [1], "events": ["bogus"]})
+            assert ws.receive_json()["type"] == "error"
+
+            ws.send_json({"type": "unsubscribe", "bot_ids": [2]})
+            assert ws.receive_json()["data"]["subscriptions"] == {"1": ["order_update", "spread_update"]}
+
+
+def test_stream_endpoint_rejects_invalid_token(seeded_db):
+    """无效令牌直接关闭连接"""
+    from starlette.websockets import WebSocketDisconnect
+
+    app = FastAPI()
+    app.include_router(ws_module.router, prefix="/ws")
+    with TestClient(app) as client:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect("/ws/stream?token=bad") as ws:
+                ws.receive_json()
+        assert exc.value.code == 4002
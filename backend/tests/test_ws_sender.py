@@ -0,0 +1,155 @@
+"""
+WebSocket发送队列测试(合并、丢弃最旧、驱逐慢速连接)
+"""
+import asyncio
+import json
+import pytest
+
+from app.api.v1.websocket import ConnectionManager
+from app.core.ws_sender import CLOSE_SLOW_CONSUMER, ConnectionSender, encode_message
+
+
+class FakeWebSocket:
+    """替身连接: 可以阻塞发送来模拟慢速客户端"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self.closed_code = None
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await self.gate.wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=""):
+        self.closed_code = code
+
+
+def spread(bot_id, value):
+    return {"type": "spread_update", "data": {"bot_instance_id": bot_id, "spread_percentage": value}}
+
+
+def order(order_id):
+    return {"type": "order_update", "data": {"bot_instance_id": 1, "id": order_id}}
+
+
+@pytest.mark.asyncio
+async def test_conflates_latest_value_and_keeps_orders():
+    """积压时价差只保留最新值,订单消息按顺序全部保留"""
+    ws = FakeWebSocket()
+    ws.gate.clear()
+    sender = ConnectionSender(ws, max_queue=10, send_timeout=5, max_lag=5)
+    sender.start()
+
+    sender.enqueue(spread(1, 1.0))
+    await asyncio.sleep(0.01)  # 第一条已被写任务取出,阻塞在发送中
+    for i in range(5):
+        sender.enqueue(spread(1, float(i)))
+    sender.enqueue(order(1))
+    sender.enqueue(order(2))
+
+    assert sender.get_stats()["queue_depth"] == 3
+    ws.gate.set()
+    await asyncio.sleep(0.05)
+
+    assert [m["type"] for m in ws.sent] == ["spread_update", "spread_update", "order_update", "order_update"]
+    assert ws.sent[1]["data"]["spread_percentage"] == 4.0
+    assert sender.conflated == 4
+    await sender.close()
+
+
+@pytest.mark.asyncio
+async def test_drops_oldest_when_full():
+    """队列写满时丢弃最旧的消息"""
+    ws = FakeWebSocket()
+    ws.gate.clear()
+    sender = ConnectionSender(ws, max_queue=3, send_timeout=5, max_lag=5)
+
+    for i in range(5):
+        sender.enqueue(order(i))
+    sender.start()
+    ws.gate.set()
+    await asyncio.sleep(0.05)
+
+    assert [m["data"]["id"] for m in ws.sent] == [2, 3, 4]
+    assert sender.dropped == 2
+    await sender.close()
+
+
+@pytest.mark.asyncio
+async def test_broadcast_does_not_wait_for_slow_client_and_evicts_it():
+    """慢速连接不阻塞广播,发送超时后被驱逐; 其他连接正常接收"""
+    manager = ConnectionManager()
+    slow = FakeWebSocket()
+    slow.gate.clear()
+    fast = FakeWebSocket()
+    await manager.connect(slow, 1, 1)
+    await manager.connect(fast, 1, 2)
+    manager.senders[slow].send_timeout = 0.05
+
+    started = asyncio.get_running_loop().time()
+    for i in range(20):
+        await manager.broadcast_to_bot(1, order(i))
+    assert asyncio.get_running_loop().time() - started < 0.05
+
+    await asyncio.sleep(0.2)
+
+    assert len(fast.sent) == 20
+    assert slow.closed_code == CLOSE_SLOW_CONSUMER
+    assert slow not in manager.senders
+    assert manager.active_connections[1] == [fast]
+    assert manager.evictions == 1
+    await manager.disconnect(fast)
+
+
+@pytest.mark.asyncio
+async def test_evicts_on_lag():
+    """队首积压超过最大延迟时驱逐"""
+    ws = FakeWebSocket()
+    ws.gate.clear()
+    sender = ConnectionSender(ws, max_queue=100, send_timeout=5, max_lag=0.05)
+    sender.start()
+
+    sender.enqueue(order(0))
+    await asyncio.sleep(0.01)
+    sender.enqueue(order(1))
+    await asyncio.sleep(0.08)
+    sender.enqueue(order(2))
+    await asyncio.sleep(0.02)
+
+    assert sender.evicted_reason is not None
+    assert ws.closed_code == CLOSE_SLOW_CONSUMER
+    assert sender.enqueue(order(3)) is False
+
+
+@pytest.mark.asyncio
+async def test_broadcast_encodes_once(monkeypatch):
+    """广播只编码一次,所有连接收到相同的文本帧"""
+    import app.core.ws_sender as ws_sender
+
+    calls = []
+
+    def counting_encode(message):
+        calls.append(message)
+        return encode_message(message)
+
+    monkeypatch.setattr(ws_sender, "encode_message", counting_encode)
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(5)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws, 1, i)
+
+    await manager.broadcast_to_bot(1, order(7))
+    await asyncio.sleep(0.02)
+
+    assert len(calls) == 1
+    assert all(ws.sent == [order(7)] for ws in sockets)
+    for ws in sockets:
+        await manager.disconnect(ws)